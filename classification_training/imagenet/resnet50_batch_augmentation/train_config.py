@@ -0,0 +1,123 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
+from tools.path import ILSVRC2012_path
+
+from simpleAICV.classification import backbones
+from simpleAICV.classification import losses
+from simpleAICV.classification.datasets.ilsvrc2012dataset import ILSVRC2012Dataset
+from simpleAICV.classification.common import Opencv2PIL, TorchResize, TorchCenterCrop, PIL2OpencvUint8, Uint8ResizeWithOriginSize, TorchUint8MeanStdNormalize, ClassificationUint8Collater, BatchCompose, BatchRandomResizedCrop, BatchRandomHorizontalFlip, BatchMeanStdNormalize, load_state_dict
+
+import torch
+import torchvision.transforms as transforms
+
+
+class config:
+    '''
+    for resnet,input_image_size = 224;for darknet,input_image_size = 256
+    '''
+    network = 'resnet50'
+    num_classes = 1000
+    input_image_size = 224
+    scale = 256 / 224
+
+    model = backbones.__dict__[network](**{
+        'num_classes': num_classes,
+    })
+
+    # load pretrained model or not
+    trained_model_path = ''
+    load_state_dict(trained_model_path, model)
+
+    train_criterion = losses.__dict__['CELoss']()
+    test_criterion = losses.__dict__['CELoss']()
+
+    # every train image is resized to fixed size without center crop and keeps its origin size,
+    # BatchRandomResizedCrop samples crop boxes on origin sizes,same crop box distribution as TorchRandomResizedCrop.
+    # only deviation:crops are resampled from 256x256 resized images instead of origin images,
+    # small crops of large images have lower resolution before resizing to 224.
+    train_dataset = ILSVRC2012Dataset(
+        root_dir=ILSVRC2012_path,
+        set_name='train',
+        transform=transforms.Compose([
+            Uint8ResizeWithOriginSize(resize=input_image_size * scale),
+        ]))
+
+    test_dataset = ILSVRC2012Dataset(
+        root_dir=ILSVRC2012_path,
+        set_name='val',
+        transform=transforms.Compose([
+            Opencv2PIL(),
+            TorchResize(resize=input_image_size * scale),
+            TorchCenterCrop(resize=input_image_size),
+            PIL2OpencvUint8(),
+        ]))
+    train_collater = ClassificationUint8Collater()
+    test_collater = ClassificationUint8Collater()
+
+    # uint8 images batch is normalized on device,model and input images use channels last memory format
+    channels_last = True
+    uint8_image_normalize = TorchUint8MeanStdNormalize(
+        mean=[0.485, 0.456, 0.406],
+        std=[0.229, 0.224, 0.225],
+        channels_last=channels_last)
+
+    # fixed size uint8 train images batch is augmented on device after collate,
+    # each sample has its own random crop box on its origin size and flip
+    train_batch_transform = BatchCompose([
+        BatchRandomResizedCrop(resize=input_image_size),
+        BatchRandomHorizontalFlip(prob=0.5),
+        BatchMeanStdNormalize(mean=[0.485, 0.456, 0.406],
+                              std=[0.229, 0.224, 0.225]),
+    ],
+                                         channels_last=channels_last)
+
+    seed = 0
+    # batch_size is total size
+    batch_size = 256
+    # num_workers is total workers
+    num_workers = 20
+    accumulation_steps = 1
+
+    optimizer = (
+        'SGD',
+        {
+            'lr': 0.1,
+            'momentum': 0.9,
+            'global_weight_decay': False,
+            # if global_weight_decay = False
+            # all bias, bn and other 1d params weight set to 0 weight decay
+            'weight_decay': 1e-4,
+            'no_weight_decay_layer_name_list': [],
+        },
+    )
+
+    scheduler = (
+        'MultiStepLR',
+        {
+            'warm_up_epochs': 0,
+            'gamma': 0.1,
+            'milestones': [30, 60, 90],
+        },
+    )
+
+    epochs = 100
+    print_interval = 100
+
+    sync_bn = False
+    use_amp = True
+    use_compile = False
+    compile_params = {
+        # 'default': optimizes for large models, low compile-time and no extra memory usage.
+        # 'reduce-overhead': optimizes to reduce the framework overhead and uses some extra memory, helps speed up small models, model update may not correct.
+        # 'max-autotune': optimizes to produce the fastest model, but takes a very long time to compile and may failed.
+        'mode': 'default',
+    }
+
+    use_ema_model = False
+    ema_model_decay = 0.9999
\ No newline at end of file
@@ -0,0 +1 @@
+CUDA_VISIBLE_DEVICES=0,1 python -m torch.distributed.run --nproc_per_node=2 --master_addr 127.0.1.0 --master_port 10000 ../../../tools/train_interactive_segmentation_model.py --work-dir ./
\ No newline at end of file
@@ -43,8 +43,12 @@ class config:
         ]),
         broken_list_path=accv2022_broken_list_path)
 
+    # patch labels are computed on device in train loop
     train_collater = MAESelfSupervisedPretrainCollater(
-        image_size=input_image_size, patch_size=16, norm_label=True)
+        image_size=input_image_size,
+        patch_size=16,
+        norm_label=True,
+        label_on_device=True)
 
     seed = 0
     # batch_size is total size
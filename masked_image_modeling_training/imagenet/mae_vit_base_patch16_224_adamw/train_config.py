@@ -42,8 +42,12 @@ class config:
                                   std=[0.229, 0.224, 0.225]),
         ]))
 
+    # patch labels are computed on device in train loop
     train_collater = MAESelfSupervisedPretrainCollater(
-        image_size=input_image_size, patch_size=16, norm_label=True)
+        image_size=input_image_size,
+        patch_size=16,
+        norm_label=True,
+        label_on_device=True)
 
     seed = 0
     # batch_size is total size
@@ -0,0 +1,47 @@
+import os
+import fcntl
+import shutil
+
+
+def get_temp_cache_dir(cache_dir):
+    # per process temporary dir next to cache_dir,rename to cache_dir is atomic on same file system
+    return f'{os.path.normpath(cache_dir)}.tmp{os.getpid()}'
+
+
+def replace_cache_dir(temp_cache_dir, cache_dir):
+    '''
+    move fully written temp_cache_dir to cache_dir,old cache_dir is renamed away first and deleted last,
+    so processes never see a half written or half deleted cache_dir
+    '''
+    cache_dir = os.path.normpath(cache_dir)
+    stale_cache_dir = f'{cache_dir}.stale{os.getpid()}'
+    if os.path.exists(cache_dir):
+        os.rename(cache_dir, stale_cache_dir)
+    os.rename(temp_cache_dir, cache_dir)
+    if os.path.exists(stale_cache_dir):
+        shutil.rmtree(stale_cache_dir, ignore_errors=True)
+
+
+def build_cache_dir_if_stale(cache_dir, is_stale_func, build_func):
+    '''
+    datasets are created on all ranks/processes at the same time(before init_process_group),
+    so is_stale_func and build_func run under an exclusive file lock next to cache_dir:
+    first process builds a stale cache,others wait for lock then find a fresh cache and skip building.
+    build_func must write to get_temp_cache_dir(cache_dir) then call replace_cache_dir.
+    return True if cache is built by this process
+    '''
+    cache_dir = os.path.normpath(cache_dir)
+    parent_dir = os.path.dirname(cache_dir)
+    if parent_dir:
+        os.makedirs(parent_dir, exist_ok=True)
+
+    with open(f'{cache_dir}.lock', 'w') as lock_f:
+        fcntl.flock(lock_f, fcntl.LOCK_EX)
+        try:
+            if not is_stale_func():
+                return False
+            build_func()
+        finally:
+            fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+    return True
@@ -0,0 +1,812 @@
+import math
+
+import torch
+import torch.nn.functional as F
+
+
+def batch_uniform(low, high, size, device):
+    return torch.rand(size, device=device) * (high - low) + low
+
+
+def batch_randint(high, device):
+    # high:[B] int tensor,sample [0,high) for every element
+    return torch.floor(torch.rand(high.shape, device=device) *
+                       high.float()).long()
+
+
+def rgb_to_grayscale(images):
+    # images:B 3 H W ->B 1 H W,same weights as torchvision
+    grayscale_images = torch.mul(images[:, 0:1], 0.2989)
+    grayscale_images.add_(images[:, 1:2], alpha=0.587)
+    grayscale_images.add_(images[:, 2:3], alpha=0.114)
+
+    return grayscale_images
+
+
+def rgb_to_hsv(images):
+    # images:B 3 H W float in [0,1],same as torchvision _rgb2hsv
+    r, g, b = images.unbind(dim=1)
+    maxc = torch.max(images, dim=1)[0]
+    minc = torch.min(images, dim=1)[0]
+    eqc = maxc == minc
+
+    cr = maxc - minc
+    ones = torch.ones_like(maxc)
+    s = cr / torch.where(eqc, ones, maxc)
+    cr_divisor = torch.where(eqc, ones, cr)
+    rc = (maxc - r) / cr_divisor
+    gc = (maxc - g) / cr_divisor
+    bc = (maxc - b) / cr_divisor
+
+    hr = (maxc == r) * (bc - gc)
+    hg = ((maxc == g) & (maxc != r)) * (2.0 + rc - bc)
+    hb = ((maxc != g) & (maxc != r)) * (4.0 + gc - rc)
+    h = hr + hg + hb
+    h = torch.fmod((h / 6.0 + 1.0), 1.0)
+
+    return torch.stack((h, s, maxc), dim=1)
+
+
+def hsv_to_rgb(images):
+    # images:B 3 H W hsv,same as torchvision _hsv2rgb
+    h, s, v = images.unbind(dim=1)
+    i = torch.floor(h * 6.0)
+    f = (h * 6.0) - i
+    i = i.to(dtype=torch.int32)
+
+    p = torch.clamp((v * (1.0 - s)), 0.0, 1.0)
+    q = torch.clamp((v * (1.0 - s * f)), 0.0, 1.0)
+    t = torch.clamp((v * (1.0 - s * (1.0 - f))), 0.0, 1.0)
+    i = i % 6
+
+    mask = i.unsqueeze(dim=1) == torch.arange(6, device=i.device).view(
+        1, -1, 1, 1)
+
+    a1 = torch.stack((v, q, p, p, t, v), dim=1)
+    a2 = torch.stack((t, v, v, q, p, p), dim=1)
+    a3 = torch.stack((p, p, t, v, v, q), dim=1)
+    a4 = torch.stack((a1, a2, a3), dim=1)
+
+    return torch.einsum('...ijk, ...xijk -> ...xjk', mask.to(dtype=h.dtype),
+                        a4)
+
+
+class BatchCompose:
+    '''
+    post-collate batch augmentation stage,apply Batch* transforms on a whole images batch with per-sample random parameters
+    on the device of images batch(call it after images.cuda() in train loop).
+    input:B H W 3 uint8 images from ClassificationUint8Collater or B 3 H W float images(value 0-255,not normalized) from ClassificationCollater.
+    output:B 3 H W float32 images.
+    Batch* transforms may modify their input images in place,BatchCompose copies input images batch once first.
+    all images in a batch must have same size,use Uint8ResizeWithOriginSize in dataset transform to resize every image to
+    a fixed size and pass collated origin sizes,then BatchRandomResizedCrop samples crop boxes on origin image size
+    same as TorchRandomResizedCrop on un-resized images.
+    channels_last:if True,output images in channels last memory format.
+    '''
+
+    def __init__(self, transform_list, channels_last=False):
+        self.transform_list = transform_list
+        self.channels_last = channels_last
+
+    def __call__(self, images, sizes=None):
+        '''
+        sizes:None or B 2 [origin_h,origin_w] of images before fixed size resize,only used by BatchRandomResizedCrop
+        '''
+        if images.dtype == torch.uint8:
+            # B H W 3 ->B 3 H W
+            images = images.permute(0, 3, 1, 2)
+            images = images.float().contiguous()
+        else:
+            # Batch* transforms may modify images in place,keep input batch unchanged
+            images = images.float().clone(
+                memory_format=torch.contiguous_format)
+
+        for per_transform in self.transform_list:
+            if isinstance(per_transform, BatchRandomResizedCrop):
+                images = per_transform(images, sizes)
+            else:
+                images = per_transform(images)
+
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        else:
+            images = images.contiguous()
+
+        return images
+
+
+class BatchRandomResizedCrop:
+    '''
+    batch version of TorchRandomResizedCrop,crop box is sampled per sample same as torchvision RandomResizedCrop.get_params,
+    crop and bilinear resize of all samples are done by a single grid_sample(no antialias when crop box is larger than resize).
+    sizes:if not None,images are resized to fixed size from origin sizes(see Uint8ResizeWithOriginSize),
+    crop boxes are sampled on origin size of every sample and mapped to resized images,
+    so crop box distribution is same as RandomResizedCrop on origin images,only sampled pixels come from resized images.
+    '''
+
+    def __init__(self,
+                 resize=224,
+                 scale=(0.08, 1.0),
+                 ratio=(3.0 / 4.0, 4.0 / 3.0),
+                 max_try_num=10):
+        self.resize = int(resize)
+        self.scale = scale
+        self.ratio = ratio
+        self.max_try_num = max_try_num
+
+    def get_crop_params(self, image_h, image_w):
+        '''
+        image_h,image_w:B long tensor,image size of every sample
+        '''
+        batch_size, device = image_h.shape[0], image_h.device
+        area = (image_h * image_w).float().view(-1, 1)
+        log_ratio = (math.log(self.ratio[0]), math.log(self.ratio[1]))
+
+        target_area = area * batch_uniform(
+            self.scale[0], self.scale[1], (batch_size, self.max_try_num),
+            device)
+        aspect_ratio = torch.exp(
+            batch_uniform(log_ratio[0], log_ratio[1],
+                          (batch_size, self.max_try_num), device))
+        w = torch.round(torch.sqrt(target_area * aspect_ratio)).long()
+        h = torch.round(torch.sqrt(target_area / aspect_ratio)).long()
+
+        # use first legal try of each sample
+        legal_flag = (w > 0) & (w <= image_w.view(-1, 1)) & (h > 0) & (
+            h <= image_h.view(-1, 1))
+        first_legal_idx = torch.argmax(legal_flag.int(), dim=1, keepdim=True)
+        has_legal_flag = torch.any(legal_flag, dim=1)
+        w = torch.gather(w, 1, first_legal_idx).squeeze(1)
+        h = torch.gather(h, 1, first_legal_idx).squeeze(1)
+
+        # fallback to central crop
+        in_ratio = image_w.float() / image_h.float()
+        fallback_w = torch.where(
+            in_ratio > max(self.ratio),
+            torch.round(image_h.float() * max(self.ratio)).long(), image_w)
+        fallback_h = torch.where(
+            in_ratio < min(self.ratio),
+            torch.round(image_w.float() / min(self.ratio)).long(), image_h)
+
+        w = torch.where(has_legal_flag, w, fallback_w)
+        h = torch.where(has_legal_flag, h, fallback_h)
+        top = torch.where(has_legal_flag, batch_randint(image_h - h + 1,
+                                                        device),
+                          (image_h - h) // 2)
+        left = torch.where(has_legal_flag,
+                           batch_randint(image_w - w + 1, device),
+                           (image_w - w) // 2)
+
+        return top, left, h, w
+
+    def crop_and_resize(self, images, top, left, h, w, image_h, image_w):
+        '''
+        top,left,h,w:crop boxes in origin image coords
+        image_h,image_w:B tensor,origin image size of every sample
+        '''
+        batch_size = images.shape[0]
+        top, left, h, w = top.float(), left.float(), h.float(), w.float()
+        image_h, image_w = image_h.float(), image_w.float()
+
+        # sample coords of output pixel centers in origin image,clamped inside crop box,
+        # same as cropping then resizing with F.interpolate(mode='bilinear',align_corners=False)
+        resize_coords = torch.arange(
+            self.resize, dtype=images.dtype, device=images.device) + 0.5
+        x = left.view(-1, 1) + resize_coords.view(1, -1) * (
+            w / self.resize).view(-1, 1) - 0.5
+        x = torch.max(torch.min(x, (left + w - 1).view(-1, 1)),
+                      left.view(-1, 1))
+        y = top.view(-1, 1) + resize_coords.view(1, -1) * (
+            h / self.resize).view(-1, 1) - 0.5
+        y = torch.max(torch.min(y, (top + h - 1).view(-1, 1)),
+                      top.view(-1, 1))
+
+        # origin pixel coords ->normalized coords(align_corners=False),
+        # normalized coords are same for origin image and its fixed size resized image
+        x = (2. * x + 1.) / image_w.view(-1, 1) - 1.
+        y = (2. * y + 1.) / image_h.view(-1, 1) - 1.
+        grid = torch.stack([
+            x.view(batch_size, 1, self.resize).expand(-1, self.resize, -1),
+            y.view(batch_size, self.resize, 1).expand(-1, -1, self.resize),
+        ],
+                           dim=3)
+        images = F.grid_sample(images,
+                               grid,
+                               mode='bilinear',
+                               padding_mode='border',
+                               align_corners=False)
+
+        return images
+
+    def __call__(self, images, sizes=None):
+        batch_size, _, image_h, image_w = images.shape
+        if sizes is None:
+            image_h = torch.full((batch_size, ),
+                                 image_h,
+                                 dtype=torch.long,
+                                 device=images.device)
+            image_w = torch.full((batch_size, ),
+                                 image_w,
+                                 dtype=torch.long,
+                                 device=images.device)
+        else:
+            sizes = sizes.to(images.device).long()
+            image_h, image_w = sizes[:, 0], sizes[:, 1]
+
+        top, left, h, w = self.get_crop_params(image_h, image_w)
+        images = self.crop_and_resize(images, top, left, h, w, image_h,
+                                      image_w)
+
+        return images
+
+
+class BatchRandomHorizontalFlip:
+
+    def __init__(self, prob=0.5):
+        self.prob = prob
+
+    def __call__(self, images):
+        flip_flag = torch.rand(images.shape[0],
+                               device=images.device) < self.prob
+        # only flipped samples are written in place
+        flip_idxs = torch.nonzero(flip_flag, as_tuple=True)[0]
+        images[flip_idxs] = images[flip_idxs].flip(3)
+
+        return images
+
+
+class BatchColorJitter:
+    '''
+    batch version of TorchColorJitter(torchvision ColorJitter) on 0-255 float images,
+    every sample has its own brightness/contrast/saturation/hue factors and its own random op order,
+    factors are sampled from same ranges as ColorJitter and ops with zero jitter value are skipped same as ColorJitter.
+    single_op:if True,every sample applies only one op chosen uniformly from all four ops(op with zero jitter value is identity),
+    this is a cheaper variant and not same as ColorJitter,which applies all ops with non zero jitter value in random order.
+    '''
+
+    def __init__(self,
+                 brightness=0.4,
+                 contrast=0.4,
+                 saturation=0.4,
+                 hue=0,
+                 single_op=False):
+        assert brightness >= 0 and contrast >= 0 and saturation >= 0 and hue >= 0, 'brightness/contrast/saturation/hue value must be non negative!'
+        assert 0.0 <= hue <= 0.5, 'hue value should >=0.0 and <=0.5!'
+        self.brightness_range = [
+            max(0.0, 1 - float(brightness)), 1 + float(brightness)
+        ]
+        self.contrast_range = [
+            max(0.0, 1 - float(contrast)), 1 + float(contrast)
+        ]
+        self.saturation_range = [
+            max(0.0, 1 - float(saturation)), 1 + float(saturation)
+        ]
+        self.hue_range = [-float(hue), float(hue)]
+        self.single_op = single_op
+
+        # op idx:0 brightness,1 contrast,2 saturation,3 hue
+        self.op_list = [
+            self.adjust_brightness,
+            self.adjust_contrast,
+            self.adjust_saturation,
+            self.adjust_hue,
+        ]
+        if self.single_op:
+            self.use_op_idxs = [0, 1, 2, 3]
+        else:
+            # same as torchvision,skip op with zero jitter value
+            self.use_op_idxs = [
+                op_idx for op_idx, jitter_value in enumerate(
+                    [brightness, contrast, saturation, hue])
+                if jitter_value > 0
+            ]
+
+    def adjust_brightness(self, images, factors):
+        images = torch.mul(images, factors.view(-1, 1, 1, 1))
+
+        return images.clamp_(0, 255)
+
+    def adjust_contrast(self, images, factors):
+        factors = factors.view(-1, 1, 1, 1)
+        # mean of grayscale image is grayscale of per channel means
+        mean_values = rgb_to_grayscale(
+            torch.mean(images, dim=(2, 3), keepdim=True))
+        images = torch.addcmul((1. - factors) * mean_values, images, factors)
+
+        return images.clamp_(0, 255)
+
+    def adjust_saturation(self, images, factors):
+        factors = factors.view(-1, 1, 1, 1)
+        images = torch.addcmul((1. - factors) * rgb_to_grayscale(images),
+                               images, factors)
+
+        return images.clamp_(0, 255)
+
+    def adjust_hue(self, images, factors):
+        hsv_images = rgb_to_hsv(images / 255.)
+        hue = torch.remainder(hsv_images[:, 0] + factors.view(-1, 1, 1), 1.0)
+        hsv_images = torch.stack((hue, hsv_images[:, 1], hsv_images[:, 2]),
+                                 dim=1)
+        images = hsv_to_rgb(hsv_images) * 255.
+
+        return images
+
+    def get_factors(self, batch_size, device):
+        factors = torch.stack([
+            batch_uniform(per_range[0], per_range[1], (batch_size), device)
+            for per_range in [
+                self.brightness_range,
+                self.contrast_range,
+                self.saturation_range,
+                self.hue_range,
+            ]
+        ],
+                              dim=1)
+
+        return factors
+
+    def __call__(self, images):
+        batch_size = images.shape[0]
+        if len(self.use_op_idxs) == 0 or batch_size == 0:
+            return images
+
+        factors = self.get_factors(batch_size, images.device)
+
+        # per sample random op order,op_orders[i,k] is the k-th op of sample i
+        use_op_idxs = torch.tensor(self.use_op_idxs, device=images.device)
+        op_orders = use_op_idxs[torch.argsort(torch.rand(
+            (batch_size, len(self.use_op_idxs)), device=images.device),
+                                              dim=1)]
+        step_num = 1 if self.single_op else len(self.use_op_idxs)
+
+        for step in range(step_num):
+            for op_idx in self.use_op_idxs:
+                sample_idxs = torch.nonzero(op_orders[:, step] == op_idx,
+                                            as_tuple=True)[0]
+                if sample_idxs.numel() == 0:
+                    continue
+                images[sample_idxs] = self.op_list[op_idx](
+                    images[sample_idxs], factors[sample_idxs, op_idx])
+
+        return images
+
+
+class BatchPCAJitter:
+    '''
+    batch version of PCAJitter,every sample has its own alpha.
+    '''
+
+    def __init__(self,
+                 pca_std=0.1,
+                 vals=[[0.2175, 0.0188, 0.0045]],
+                 vecs=[[-0.5675, 0.7192, 0.4009], [-0.5808, -0.0045, -0.8140],
+                       [-0.5836, -0.6948, 0.4203]]):
+        self.pca_std = pca_std
+        self.vals = torch.tensor(vals, dtype=torch.float32).view(1, 3)
+        self.vecs = torch.tensor(vecs, dtype=torch.float32)
+
+    def __call__(self, images):
+        if self.vals.device != images.device:
+            self.vals = self.vals.to(images.device)
+            self.vecs = self.vecs.to(images.device)
+
+        alpha = torch.randn(
+            (images.shape[0], 3), device=images.device) * self.pca_std
+        # rgb[b,i] = sum_j vecs[i,j] * alpha[b,j] * vals[j]
+        rgb = torch.matmul(alpha * self.vals, self.vecs.t())
+        images = images + rgb.to(images.dtype).view(-1, 3, 1, 1)
+
+        return images
+
+
+class BatchRandomErasing:
+    '''
+    batch version of RandomErasing,erase box of every sample is sampled on device and all boxes are erased by one masked fill.
+    use it after BatchMeanStdNormalize,same as RandomErasing after TorchMeanStdNormalize.
+    '''
+
+    def __init__(self,
+                 prob=0.25,
+                 min_area=0.02,
+                 max_area=1 / 3,
+                 min_aspect=0.3,
+                 max_aspect=None,
+                 mode='pixel',
+                 min_count=1,
+                 max_count=None,
+                 max_try_num=10):
+        self.prob = prob
+        self.min_area = min_area
+        self.max_area = max_area
+        max_aspect = max_aspect if max_aspect else 1 / min_aspect
+        self.log_aspect_ratio = (math.log(min_aspect), math.log(max_aspect))
+
+        assert mode in ['const', 'rand', 'pixel']
+        self.mode = mode
+        self.min_count = min_count
+        self.max_count = max_count if max_count else min_count
+        self.max_try_num = max_try_num
+
+    def get_erase_masks(self, batch_size, image_h, image_w, device):
+        area = image_h * image_w
+        if self.min_count == self.max_count:
+            counts = torch.full((batch_size, ),
+                                self.min_count,
+                                dtype=torch.long,
+                                device=device)
+        else:
+            # same as np.random.randint(min_count,max_count)
+            counts = self.min_count + batch_randint(
+                torch.full((batch_size, ),
+                           self.max_count - self.min_count,
+                           dtype=torch.long,
+                           device=device), device)
+        erase_flag = torch.rand(batch_size, device=device) < self.prob
+
+        rows = torch.arange(image_h, device=device).view(1, image_h, 1)
+        cols = torch.arange(image_w, device=device).view(1, 1, image_w)
+        erase_masks = torch.zeros((batch_size, image_h, image_w),
+                                  dtype=torch.bool,
+                                  device=device)
+        for count_idx in range(self.max_count):
+            target_area = batch_uniform(
+                self.min_area, self.max_area,
+                (batch_size, self.max_try_num), device) * area / counts.view(
+                    -1, 1).float()
+            aspect_ratio = torch.exp(
+                batch_uniform(self.log_aspect_ratio[0],
+                              self.log_aspect_ratio[1],
+                              (batch_size, self.max_try_num), device))
+            h = torch.round(torch.sqrt(target_area * aspect_ratio)).long()
+            w = torch.round(torch.sqrt(target_area / aspect_ratio)).long()
+
+            # use first legal try of each sample
+            legal_flag = (w < image_w) & (h < image_h)
+            first_legal_idx = torch.argmax(legal_flag.int(),
+                                           dim=1,
+                                           keepdim=True)
+            has_legal_flag = torch.any(legal_flag, dim=1)
+            h = torch.gather(h, 1, first_legal_idx).squeeze(1)
+            w = torch.gather(w, 1, first_legal_idx).squeeze(1)
+            h = torch.where(has_legal_flag, h, torch.zeros_like(h))
+            w = torch.where(has_legal_flag, w, torch.zeros_like(w))
+
+            # same as np.random.randint(0,image_h - h)
+            top = batch_randint(image_h - h, device).view(-1, 1, 1)
+            left = batch_randint(image_w - w, device).view(-1, 1, 1)
+            per_masks = (rows >= top) & (rows < top + h.view(-1, 1, 1)) & (
+                cols >= left) & (cols < left + w.view(-1, 1, 1))
+            per_masks = per_masks & (erase_flag &
+                                     (count_idx < counts)).view(-1, 1, 1)
+            erase_masks = erase_masks | per_masks
+
+        return erase_masks
+
+    def __call__(self, images):
+        batch_size, channel_num, image_h, image_w = images.shape
+        erase_masks = self.get_erase_masks(batch_size, image_h, image_w,
+                                           images.device).unsqueeze(1)
+
+        # only fill erased samples
+        erase_idxs = torch.nonzero(torch.any(erase_masks.flatten(1), dim=1),
+                                   as_tuple=True)[0]
+        erase_masks = erase_masks[erase_idxs]
+        if self.mode == 'pixel':
+            fill_values = torch.randn(
+                (erase_idxs.shape[0], channel_num, image_h, image_w),
+                dtype=images.dtype,
+                device=images.device)
+        elif self.mode == 'rand':
+            fill_values = torch.randn((erase_idxs.shape[0], channel_num, 1, 1),
+                                      dtype=images.dtype,
+                                      device=images.device)
+        else:
+            fill_values = torch.zeros((1),
+                                      dtype=images.dtype,
+                                      device=images.device)
+
+        images[erase_idxs] = torch.where(erase_masks, fill_values,
+                                         images[erase_idxs])
+
+        return images
+
+
+class BatchMeanStdNormalize:
+    '''
+    normalize B 3 H W 0-255 float images batch,same result as TorchMeanStdNormalize up to float rounding.
+    (x / 255 - mean) / std is computed as a single fused x * scale + bias.
+    '''
+
+    def __init__(self, mean, std):
+        mean = torch.tensor(mean, dtype=torch.float64).view(1, 3, 1, 1)
+        std = torch.tensor(std, dtype=torch.float64).view(1, 3, 1, 1)
+        self.scale = (1. / (255. * std)).float()
+        self.bias = (-mean / std).float()
+
+    def __call__(self, images):
+        if self.scale.device != images.device:
+            self.scale = self.scale.to(images.device)
+            self.bias = self.bias.to(images.device)
+
+        images = torch.addcmul(self.bias, images, self.scale)
+
+        return images
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.path.append(BASE_DIR)
+
+    import time
+    import torchvision.transforms as transforms
+    import torchvision.transforms.functional as TF
+
+    from simpleAICV.classification.common import Opencv2PIL, TorchRandomResizedCrop, TorchRandomHorizontalFlip, TorchColorJitter, PIL2Opencv, PCAJitter, TorchMeanStdNormalize, RandomErasing, Uint8ResizeWithOriginSize
+
+    sample_num = 4000
+    image_size = 256
+    images = torch.from_numpy(
+        np.random.randint(0, 256, (64, image_size, image_size, 3),
+                          dtype=np.uint8))
+    float_images = images.permute(0, 3, 1, 2).float().contiguous()
+
+    def check_same_distribution(name, per_sample_value, batch_value, max_z=4.):
+        # z score of mean difference between per sample and batch outputs
+        per_sample_value = np.array(per_sample_value, dtype=np.float64)
+        batch_value = np.array(batch_value, dtype=np.float64)
+        z = abs(per_sample_value.mean() - batch_value.mean()) / max(
+            math.sqrt(per_sample_value.var() / len(per_sample_value) +
+                      batch_value.var() / len(batch_value)), 1e-12)
+        print(
+            f'{name},per sample mean/std:{per_sample_value.mean():.4f}/{per_sample_value.std():.4f},batch mean/std:{batch_value.mean():.4f}/{batch_value.std():.4f},z:{z:.2f}'
+        )
+        assert z < max_z, f'{name} distribution mismatch,z:{z:.2f}'
+
+    # crop/resize:same output as torchvision resized_crop(bilinear,no antialias) for same crop box
+    batch_random_resized_crop = BatchRandomResizedCrop(resize=224)
+    sizes = torch.full((float_images.shape[0], 2), image_size)
+    top, left, h, w = batch_random_resized_crop.get_crop_params(
+        sizes[:, 0], sizes[:, 1])
+    batch_outputs = batch_random_resized_crop.crop_and_resize(
+        float_images, top, left, h, w, sizes[:, 0], sizes[:, 1])
+    max_diff = 0
+    for i in range(float_images.shape[0]):
+        per_output = TF.resized_crop(float_images[i],
+                                     int(top[i]),
+                                     int(left[i]),
+                                     int(h[i]),
+                                     int(w[i]), [224, 224],
+                                     antialias=False)
+        max_diff = max(max_diff,
+                       (per_output - batch_outputs[i]).abs().max().item())
+    print(f'random resized crop,max diff with resized_crop:{max_diff:.6f}')
+    assert max_diff < 1e-2, 'random resized crop output mismatch!'
+
+    # crop on fixed size resized image with origin size:close to resized_crop on smooth origin image
+    origin_h, origin_w = 300, 500
+    grid_x, grid_y = np.meshgrid(np.linspace(0, 255, origin_w),
+                                 np.linspace(0, 255, origin_h))
+    origin_image = np.stack(
+        [grid_x, grid_y, np.full((origin_h, origin_w), 128.)],
+        axis=2).astype(np.float32)
+    resized_image = Uint8ResizeWithOriginSize(resize=image_size)({
+        'image': origin_image,
+        'label': 0,
+    })['image']
+    resized_images = torch.from_numpy(resized_image).permute(
+        2, 0, 1).float().unsqueeze(0).repeat(64, 1, 1, 1)
+    origin_sizes = torch.tensor([[origin_h, origin_w]]).repeat(64, 1)
+    top, left, h, w = batch_random_resized_crop.get_crop_params(
+        origin_sizes[:, 0], origin_sizes[:, 1])
+    batch_outputs = batch_random_resized_crop.crop_and_resize(
+        resized_images, top, left, h, w, origin_sizes[:, 0], origin_sizes[:,
+                                                                          1])
+    origin_tensor = torch.from_numpy(origin_image).permute(2, 0, 1)
+    max_diff = 0
+    for i in range(resized_images.shape[0]):
+        per_output = TF.resized_crop(origin_tensor,
+                                     int(top[i]),
+                                     int(left[i]),
+                                     int(h[i]),
+                                     int(w[i]), [224, 224],
+                                     antialias=False)
+        max_diff = max(max_diff,
+                       (per_output - batch_outputs[i]).abs().max().item())
+    print(
+        f'random resized crop with origin size,max diff with resized_crop on smooth origin image:{max_diff:.6f}'
+    )
+    assert max_diff < 2., 'random resized crop with origin size mismatch!'
+
+    # crop box distribution:same as torchvision RandomResizedCrop.get_params,
+    # also on non square origin sizes(3:1 origin size uses central crop fallback when no try is legal)
+    for origin_h, origin_w in [(image_size, image_size), (300, 500),
+                               (600, 200)]:
+        per_sample_params = np.array([
+            transforms.RandomResizedCrop.get_params(torch.empty(
+                (3, origin_h, origin_w)),
+                                                    scale=(0.08, 1.0),
+                                                    ratio=(3. / 4., 4. / 3.))
+            for _ in range(sample_num)
+        ],
+                                     dtype=np.float32)
+        top, left, h, w = batch_random_resized_crop.get_crop_params(
+            torch.full((sample_num, ), origin_h),
+            torch.full((sample_num, ), origin_w))
+        batch_params = torch.stack([top, left, h, w], dim=1).float().numpy()
+        for name, per_sample_value, batch_value in [
+            ('area ratio', per_sample_params[:, 2] * per_sample_params[:, 3] /
+             (origin_h * origin_w), batch_params[:, 2] * batch_params[:, 3] /
+             (origin_h * origin_w)),
+            ('log aspect ratio',
+             np.log(per_sample_params[:, 3] / per_sample_params[:, 2]),
+             np.log(batch_params[:, 3] / batch_params[:, 2])),
+            ('center x', per_sample_params[:, 1] + per_sample_params[:, 3] / 2,
+             batch_params[:, 1] + batch_params[:, 3] / 2),
+            ('center y', per_sample_params[:, 0] + per_sample_params[:, 2] / 2,
+             batch_params[:, 0] + batch_params[:, 2] / 2),
+        ]:
+            check_same_distribution(
+                f'random resized crop {origin_h}x{origin_w} {name}',
+                per_sample_value, batch_value)
+
+    # flip prob
+    ones_images = torch.arange(2, dtype=torch.float32).view(1, 1, 1, 2).repeat(
+        sample_num, 1, 1, 1)
+    flip_flags = (BatchRandomHorizontalFlip(prob=0.5)(ones_images)[:, 0, 0, 0]
+                  == 1).float().numpy()
+    check_same_distribution('random horizontal flip ratio',
+                            np.random.uniform(0, 1, sample_num) < 0.5,
+                            flip_flags)
+
+    # color jitter single op:same output as torchvision adjust ops for same factor
+    batch_color_jitter = BatchColorJitter(brightness=0.4,
+                                          contrast=0.4,
+                                          saturation=0.4,
+                                          hue=0.1)
+    factors = batch_color_jitter.get_factors(float_images.shape[0],
+                                             float_images.device)
+    for op_idx, adjust_func in enumerate([
+            TF.adjust_brightness, TF.adjust_contrast, TF.adjust_saturation,
+            TF.adjust_hue
+    ]):
+        batch_outputs = batch_color_jitter.op_list[op_idx](
+            float_images, factors[:, op_idx])
+        max_diff = 0
+        for i in range(float_images.shape[0]):
+            per_output = adjust_func(float_images[i] / 255.,
+                                     factors[i, op_idx].item()) * 255.
+            max_diff = max(max_diff,
+                           (per_output - batch_outputs[i]).abs().max().item())
+        print(
+            f'color jitter op {adjust_func.__name__},max diff with torchvision:{max_diff:.6f}'
+        )
+        assert max_diff < 1e-2, f'color jitter op {adjust_func.__name__} output mismatch!'
+
+    # color jitter output distribution:same as torchvision ColorJitter(used by TorchColorJitter) on float images,
+    # TorchColorJitter on PIL uint8 images rounds after every op,its image mean is about 1 lower
+    torch_color_jitter = transforms.ColorJitter(brightness=0.4,
+                                                contrast=0.4,
+                                                saturation=0.4,
+                                                hue=0.1)
+    jitter_images = float_images[:8, :, :64, :64].repeat(
+        sample_num // 8, 1, 1, 1)
+    per_sample_outputs = torch.stack([
+        torch_color_jitter(per_image / 255.) * 255.
+        for per_image in jitter_images
+    ],
+                                     dim=0)
+    batch_outputs = batch_color_jitter(jitter_images.clone())
+    for name, func in [
+        ('image mean', lambda x: x.mean(dim=(1, 2, 3))),
+        ('image std', lambda x: x.std(dim=(1, 2, 3))),
+        ('channel 0 mean', lambda x: x[:, 0].mean(dim=(1, 2))),
+    ]:
+        check_same_distribution(f'color jitter {name}',
+                                func(per_sample_outputs).numpy(),
+                                func(batch_outputs).numpy())
+
+    # pca jitter rgb shift distribution
+    pca_jitter = PCAJitter()
+    per_sample_shift = np.stack([
+        pca_jitter({
+            'image': np.zeros((1, 1, 3), dtype=np.float32),
+            'label': 0,
+        })['image'][0, 0] for _ in range(sample_num)
+    ],
+                                axis=0)
+    batch_shift = BatchPCAJitter()(torch.zeros(
+        (sample_num, 3, 1, 1))).view(sample_num, 3).numpy()
+    std_ratio = batch_shift.std(axis=0) / per_sample_shift.std(axis=0)
+    print(
+        f'pca jitter rgb shift,per sample std:{per_sample_shift.std(axis=0)},batch std:{batch_shift.std(axis=0)}'
+    )
+    assert np.all(np.abs(std_ratio - 1) < 0.1), 'pca jitter std mismatch!'
+    for channel_idx in range(3):
+        check_same_distribution(f'pca jitter channel {channel_idx} shift',
+                                per_sample_shift[:, channel_idx],
+                                batch_shift[:, channel_idx])
+
+    # random erasing erase ratio distribution
+    for mode, max_count in [('pixel', 1), ('const', 3)]:
+        random_erasing = RandomErasing(prob=0.25,
+                                       mode=mode,
+                                       min_count=1,
+                                       max_count=max_count)
+        per_sample_masks = np.stack([
+            random_erasing({
+                'image': np.full((64, 64, 3), 100., dtype=np.float32),
+                'label': 0,
+            })['image'][:, :, 0] != 100. for _ in range(sample_num)
+        ],
+                                    axis=0)
+        batch_masks = BatchRandomErasing(prob=0.25,
+                                         mode=mode,
+                                         min_count=1,
+                                         max_count=max_count)(torch.full(
+                                             (sample_num, 3, 64, 64),
+                                             100.))[:, 0] != 100.
+        batch_masks = batch_masks.numpy()
+        check_same_distribution(
+            f'random erasing mode {mode} max_count {max_count} erase prob',
+            per_sample_masks.any(axis=(1, 2)), batch_masks.any(axis=(1, 2)))
+        check_same_distribution(
+            f'random erasing mode {mode} max_count {max_count} area ratio',
+            per_sample_masks.mean(axis=(1, 2)), batch_masks.mean(axis=(1,
+                                                                       2)))
+
+    # cpu throughput:per sample transforms in dataset vs post-collate batch transforms
+    mean, std = [0.485, 0.456, 0.406], [0.229, 0.224, 0.225]
+    per_sample_transform = transforms.Compose([
+        Opencv2PIL(),
+        TorchRandomResizedCrop(resize=224),
+        TorchRandomHorizontalFlip(prob=0.5),
+        TorchColorJitter(brightness=0.4, contrast=0.4, saturation=0.4, hue=0),
+        PIL2Opencv(),
+        PCAJitter(),
+        TorchMeanStdNormalize(mean=mean, std=std),
+        RandomErasing(prob=0.25, mode='pixel', max_count=1),
+    ])
+    batch_transform = BatchCompose([
+        BatchRandomResizedCrop(resize=224),
+        BatchRandomHorizontalFlip(prob=0.5),
+        BatchColorJitter(brightness=0.4, contrast=0.4, saturation=0.4, hue=0),
+        BatchPCAJitter(),
+        BatchMeanStdNormalize(mean=mean, std=std),
+        BatchRandomErasing(prob=0.25, mode='pixel', max_count=1),
+    ])
+
+    start_time = time.time()
+    for per_image in images:
+        _ = per_sample_transform({
+            'image': per_image.numpy(),
+            'label': 0,
+        })
+    per_sample_speed = images.shape[0] / (time.time() - start_time)
+
+    batch_transform(images)
+    start_time = time.time()
+    for _ in range(5):
+        batch_outputs = batch_transform(images)
+    batch_speed = images.shape[0] * 5 / (time.time() - start_time)
+    print(
+        f'cpu throughput,batch size:{images.shape[0]},torch threads:{torch.get_num_threads()},per sample:{per_sample_speed:.1f} images/s,batch:{batch_speed:.1f} images/s,output:{batch_outputs.shape} {batch_outputs.dtype}'
+    )
@@ -0,0 +1,772 @@
+'''
+batch version of AutoAugment/RandAugment in auto_rand_augment.py,all ops work on B 3 H W float images(value 0-255) on cpu or gpu.
+every sample has its own op,apply prob and magnitude,op args use the same magnitude schedule as LEVEL_TO_ARG.
+ops follow PIL uint8 semantics(lut/rounding/fill),so point ops are exactly same as PIL ops,
+affine ops(bilinear grid_sample,PIL a=-1 bicubic by gather) differ from PIL by 1 on <5% pixels(see __main__ for per op comparison).
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import torch
+import torch.nn.functional as F
+
+from simpleAICV.classification.auto_rand_augment import _LEVEL_DENOM, _FILL, _RAND_TRANSFORMS, _RAND_INCREASING_TRANSFORMS, _select_rand_weights, auto_augment_policy
+
+_BATCH_RANDOM_INTERPOLATION = ('bilinear', 'bicubic')
+
+
+def apply_lut(images, luts):
+    # images:N 3 H W float 0-255 integer values,luts:N 3 256
+    n, c, h, w = images.shape
+    images = torch.gather(luts.to(images.dtype), 2,
+                          images.long().view(n, c, h * w))
+
+    return images.view(n, c, h, w)
+
+
+def rgb_to_pil_grayscale(images):
+    # same as PIL convert('L'):L = (R*19595 + G*38470 + B*7471 + 0x8000) >> 16
+    images = images.int()
+    grayscale_images = (images[:, 0:1] * 19595 + images[:, 1:2] * 38470 +
+                        images[:, 2:3] * 7471 + 32768) >> 16
+
+    return grayscale_images.float()
+
+
+def blend(degenerate_images, images, factors):
+    # same as PIL Image.blend(degenerate,image,factor) on uint8 images,float32 blend then truncate
+    factors = factors.float().view(-1, 1, 1, 1)
+    images = degenerate_images + factors * (images - degenerate_images)
+
+    return torch.floor(images.clamp_(0, 255))
+
+
+def pil_bicubic_sample(images, x_in, y_in):
+    # same as PIL affine bicubic filter:cubic convolution with a=-1,edge pixels clamped
+    n, c, h, w = images.shape
+    x_in, y_in = x_in - 0.5, y_in - 0.5
+    x0, y0 = torch.floor(x_in), torch.floor(y_in)
+    dx, dy = (x_in - x0).view(n, 1, -1), (y_in - y0).view(n, 1, -1)
+
+    def cubic_weights(d):
+        # v = v2 + d*(v3-v1) + d^2*(2*v1-2*v2+v3-v4) + d^3*(v2-v1+v4-v3)
+        d2 = d * d
+        d3 = d2 * d
+        return [
+            -d + 2. * d2 - d3,
+            1. - 2. * d2 + d3,
+            d + d2 - d3,
+            -d2 + d3,
+        ]
+
+    # replicate pad 2 pixels,taps -1~+2 around any inside point are in padded images,no per tap clamp
+    padded_images = F.pad(images, (2, 2, 2, 2), mode='replicate')
+    padded_w = w + 4
+    padded_images = padded_images.view(n, c, -1)
+    x0 = torch.clamp(x0.long(), -1, w - 1)
+    y0 = torch.clamp(y0.long(), -1, h - 1)
+    base_idxs = ((y0 + 1) * padded_w + (x0 + 1)).view(n, 1, -1)
+    wxs, wys = cubic_weights(dx), cubic_weights(dy)
+
+    outs = torch.zeros((n, c, base_idxs.shape[2]),
+                       dtype=images.dtype,
+                       device=images.device)
+    for i, wy in enumerate(wys):
+        row_outs = torch.zeros_like(outs)
+        for j, wx in enumerate(wxs):
+            values = torch.gather(
+                padded_images, 2,
+                (base_idxs + (i * padded_w + j)).expand(-1, c, -1))
+            row_outs.addcmul_(values, wx)
+        outs.addcmul_(row_outs, wy)
+
+    return outs.view(n, c, *x_in.shape[1:])
+
+
+def batch_affine(images, matrixs, fill, interpolation):
+    '''
+    same as PIL img.transform(img.size,Image.AFFINE,matrix,resample,fillcolor=fill) with per sample matrix.
+    matrixs:N 6,(a,b,c,d,e,f) maps output pixel center (x+0.5,y+0.5) to input point (a*x+b*y+c,d*x+e*y+f).
+    interpolation:'bilinear'/'bicubic' or a tuple of them,tuple means random choice per sample.
+    '''
+    n, _, h, w = images.shape
+    matrixs = matrixs.to(images.dtype)
+    xs = torch.arange(w, dtype=images.dtype, device=images.device) + 0.5
+    ys = torch.arange(h, dtype=images.dtype, device=images.device) + 0.5
+    a, b, c, d, e, f = [matrixs[:, i].view(n, 1, 1) for i in range(6)]
+    x_in = a * xs.view(1, 1, w) + b * ys.view(1, h, 1) + c
+    y_in = d * xs.view(1, 1, w) + e * ys.view(1, h, 1) + f
+
+    if isinstance(interpolation, (list, tuple)):
+        modes = torch.randint(len(interpolation), (n, ),
+                              device=images.device)
+        outs = torch.empty_like(images)
+        for mode_idx, mode in enumerate(interpolation):
+            sample_idxs = torch.nonzero(modes == mode_idx, as_tuple=True)[0]
+            if sample_idxs.numel() == 0:
+                continue
+            outs[sample_idxs] = affine_sample(images[sample_idxs],
+                                              x_in[sample_idxs],
+                                              y_in[sample_idxs], mode)
+    else:
+        outs = affine_sample(images, x_in, y_in, interpolation)
+
+    # PIL fills output pixels whose sample point is outside input image
+    inside_masks = (x_in >= 0) & (x_in < w) & (y_in >= 0) & (y_in < h)
+    fill = torch.tensor(fill, dtype=images.dtype,
+                        device=images.device).view(1, -1, 1, 1)
+    # PIL truncates interpolated values,small eps for float32 coords error
+    outs = torch.where(inside_masks.unsqueeze(1),
+                       torch.floor(outs + 1e-3).clamp_(0, 255), fill)
+
+    return outs
+
+
+def affine_sample(images, x_in, y_in, mode):
+    assert mode in ['bilinear', 'bicubic']
+    _, _, h, w = images.shape
+    if mode == 'bicubic':
+        return pil_bicubic_sample(images, x_in, y_in)
+
+    # bilinear same as PIL,inside points are interpolated with edge pixels clamped(padding_mode='border')
+    grid = torch.stack([2. * x_in / w - 1., 2. * y_in / h - 1.], dim=3)
+
+    return F.grid_sample(images,
+                         grid,
+                         mode='bilinear',
+                         padding_mode='border',
+                         align_corners=False)
+
+
+def batch_shear_x(images, factors, **kwargs):
+    ones, zeros = torch.ones_like(factors), torch.zeros_like(factors)
+    matrixs = torch.stack([ones, factors, zeros, zeros, ones, zeros], dim=1)
+
+    return batch_affine(images, matrixs, **kwargs)
+
+
+def batch_shear_y(images, factors, **kwargs):
+    ones, zeros = torch.ones_like(factors), torch.zeros_like(factors)
+    matrixs = torch.stack([ones, zeros, zeros, factors, ones, zeros], dim=1)
+
+    return batch_affine(images, matrixs, **kwargs)
+
+
+def batch_translate_x_rel(images, pcts, **kwargs):
+    return batch_translate_x_abs(images, pcts * images.shape[3], **kwargs)
+
+
+def batch_translate_y_rel(images, pcts, **kwargs):
+    return batch_translate_y_abs(images, pcts * images.shape[2], **kwargs)
+
+
+def batch_translate_x_abs(images, pixels, **kwargs):
+    ones, zeros = torch.ones_like(pixels), torch.zeros_like(pixels)
+    matrixs = torch.stack([ones, zeros, pixels, zeros, ones, zeros], dim=1)
+
+    return batch_affine(images, matrixs, **kwargs)
+
+
+def batch_translate_y_abs(images, pixels, **kwargs):
+    ones, zeros = torch.ones_like(pixels), torch.zeros_like(pixels)
+    matrixs = torch.stack([ones, zeros, zeros, zeros, ones, pixels], dim=1)
+
+    return batch_affine(images, matrixs, **kwargs)
+
+
+def batch_rotate(images, degrees, **kwargs):
+    # same matrix as PIL img.rotate(degrees),rotate around image center
+    _, _, h, w = images.shape
+    center_x, center_y = w / 2.0, h / 2.0
+    angles = -torch.deg2rad(degrees.double())
+    cos, sin = torch.cos(angles), torch.sin(angles)
+    c = cos * (-center_x) + sin * (-center_y) + center_x
+    f = -sin * (-center_x) + cos * (-center_y) + center_y
+    matrixs = torch.stack([cos, sin, c, -sin, cos, f], dim=1)
+
+    return batch_affine(images, matrixs, **kwargs)
+
+
+def batch_auto_contrast(images, *_, **__):
+    # same as ImageOps.autocontrast(img),per sample per channel lut from min/max value
+    n, c = images.shape[0:2]
+    lo = torch.amin(images, dim=(2, 3)).double().view(n, c, 1)
+    hi = torch.amax(images, dim=(2, 3)).double().view(n, c, 1)
+    values = torch.arange(256, dtype=torch.float64,
+                          device=images.device).view(1, 1, 256)
+    scale = 255.0 / (hi - lo).clamp(min=1)
+    luts = torch.floor(values * scale - lo * scale).clamp_(0, 255)
+    luts = torch.where(hi > lo, luts, values)
+
+    return apply_lut(images, luts)
+
+
+def batch_invert(images, *_, **__):
+    return 255. - images
+
+
+def batch_equalize(images, *_, **__):
+    # same as ImageOps.equalize(img),per sample per channel histogram and lut
+    n, c, h, w = images.shape
+    offsets = torch.arange(n * c, device=images.device).view(n, c, 1) * 256
+    hists = torch.bincount(
+        (images.long().view(n, c, h * w) + offsets).view(-1),
+        minlength=n * c * 256).view(n, c, 256)
+
+    nonzero_flags = hists > 0
+    values = torch.arange(256, device=images.device).view(1, 1, 256)
+    last_idxs = torch.amax(torch.where(nonzero_flags, values,
+                                       torch.zeros_like(values)),
+                           dim=2,
+                           keepdim=True)
+    last_nums = torch.gather(hists, 2, last_idxs)
+    steps = (h * w - last_nums) // 255
+
+    cumsum_hists = torch.cumsum(hists, dim=2) - hists
+    luts = (steps // 2 + cumsum_hists) // steps.clamp(min=1)
+    identity_flags = (nonzero_flags.sum(dim=2, keepdim=True) <= 1) | (steps
+                                                                      == 0)
+    luts = torch.where(identity_flags, values, luts.clamp_(0, 255))
+
+    return apply_lut(images, luts)
+
+
+def batch_solarize(images, threshs, **__):
+    threshs = threshs.to(images.dtype).view(-1, 1, 1, 1)
+
+    return torch.where(images < threshs, images, 255. - images)
+
+
+def batch_solarize_add(images, adds, thresh=128, **__):
+    adds = adds.to(images.dtype).view(-1, 1, 1, 1)
+
+    return torch.where(images < thresh, torch.clamp(images + adds, max=255),
+                       images)
+
+
+def batch_posterize(images, bits_to_keep, **__):
+    # same as ImageOps.posterize,keep bits_to_keep MSB,bits_to_keep>=8 keeps image unchanged
+    steps = torch.pow(2., 8 - bits_to_keep.clamp(max=8).to(
+        images.dtype)).view(-1, 1, 1, 1)
+
+    return torch.floor(images / steps) * steps
+
+
+def batch_contrast(images, factors, **__):
+    # same as ImageEnhance.Contrast,degenerate image is mean value of grayscale image
+    means = torch.mean(rgb_to_pil_grayscale(images).double(),
+                       dim=(1, 2, 3),
+                       keepdim=True)
+    degenerate_images = torch.floor(means + 0.5).to(images.dtype)
+
+    return blend(degenerate_images, images, factors)
+
+
+def batch_color(images, factors, **__):
+    # same as ImageEnhance.Color,degenerate image is grayscale image
+    return blend(rgb_to_pil_grayscale(images), images, factors)
+
+
+def batch_brightness(images, factors, **__):
+    # same as ImageEnhance.Brightness,degenerate image is black image,blend(0,image,factor)=image*factor
+    images = images * factors.float().view(-1, 1, 1, 1)
+
+    return torch.floor(images.clamp_(0, 255))
+
+
+def batch_sharpness(images, factors, **__):
+    # same as ImageEnhance.Sharpness,degenerate image is ImageFilter.SMOOTH filtered image
+    # SMOOTH kernel is [[1,1,1],[1,5,1],[1,1,1]]/13,border pixels are not filtered
+    # integer 3x3 box sums are exact in float32,so rounding is same as PIL
+    row_sums = images[:, :, :-2] + images[:, :, 1:-1] + images[:, :, 2:]
+    box_sums = row_sums[:, :, :, :-2] + row_sums[:, :, :, 1:-1] + row_sums[:, :, :,
+                                                                       2:]
+    centers = images[:, :, 1:-1, 1:-1]
+    degenerate_images = images.clone()
+    degenerate_images[:, :, 1:-1, 1:-1] = torch.floor(
+        (box_sums + 4. * centers) / 13. + 0.5)
+
+    return blend(degenerate_images, images, factors)
+
+
+def _batch_randomly_negate(levels):
+    """With 50% prob, negate the value"""
+    return torch.where(
+        torch.rand(levels.shape, device=levels.device) > 0.5, -levels,
+        levels)
+
+
+def _batch_rotate_level_to_arg(levels, _hparams):
+    # range [-30, 30]
+    levels = (levels / _LEVEL_DENOM) * 30.
+    return _batch_randomly_negate(levels)
+
+
+def _batch_enhance_level_to_arg(levels, _hparams):
+    # range [0.1, 1.9]
+    return (levels / _LEVEL_DENOM) * 1.8 + 0.1
+
+
+def _batch_enhance_increasing_level_to_arg(levels, _hparams):
+    # range [0.1, 1.9] if level <= _LEVEL_DENOM
+    levels = (levels / _LEVEL_DENOM) * .9
+    return torch.clamp(1.0 + _batch_randomly_negate(levels), min=0.1)
+
+
+def _batch_shear_level_to_arg(levels, _hparams):
+    # range [-0.3, 0.3]
+    levels = (levels / _LEVEL_DENOM) * 0.3
+    return _batch_randomly_negate(levels)
+
+
+def _batch_translate_abs_level_to_arg(levels, hparams):
+    translate_const = hparams['translate_const']
+    levels = (levels / _LEVEL_DENOM) * float(translate_const)
+    return _batch_randomly_negate(levels)
+
+
+def _batch_translate_rel_level_to_arg(levels, hparams):
+    # default range [-0.45, 0.45]
+    translate_pct = hparams.get('translate_pct', 0.45)
+    levels = (levels / _LEVEL_DENOM) * translate_pct
+    return _batch_randomly_negate(levels)
+
+
+def _batch_posterize_level_to_arg(levels, _hparams):
+    # range [0, 4]
+    return torch.floor((levels / _LEVEL_DENOM) * 4)
+
+
+def _batch_posterize_increasing_level_to_arg(levels, hparams):
+    # range [4, 0]
+    return 4 - _batch_posterize_level_to_arg(levels, hparams)
+
+
+def _batch_posterize_original_level_to_arg(levels, _hparams):
+    # range [4, 8]
+    return torch.floor((levels / _LEVEL_DENOM) * 4) + 4
+
+
+def _batch_solarize_level_to_arg(levels, _hparams):
+    # range [0, 256]
+    return torch.floor((levels / _LEVEL_DENOM) * 256)
+
+
+def _batch_solarize_increasing_level_to_arg(levels, hparams):
+    # range [0, 256]
+    return 256 - _batch_solarize_level_to_arg(levels, hparams)
+
+
+def _batch_solarize_add_level_to_arg(levels, _hparams):
+    # range [0, 110]
+    return torch.floor((levels / _LEVEL_DENOM) * 110)
+
+
+BATCH_LEVEL_TO_ARG = {
+    'AutoContrast': None,
+    'Equalize': None,
+    'Invert': None,
+    'Rotate': _batch_rotate_level_to_arg,
+    'Posterize': _batch_posterize_level_to_arg,
+    'PosterizeIncreasing': _batch_posterize_increasing_level_to_arg,
+    'PosterizeOriginal': _batch_posterize_original_level_to_arg,
+    'Solarize': _batch_solarize_level_to_arg,
+    'SolarizeIncreasing': _batch_solarize_increasing_level_to_arg,
+    'SolarizeAdd': _batch_solarize_add_level_to_arg,
+    'Color': _batch_enhance_level_to_arg,
+    'ColorIncreasing': _batch_enhance_increasing_level_to_arg,
+    'Contrast': _batch_enhance_level_to_arg,
+    'ContrastIncreasing': _batch_enhance_increasing_level_to_arg,
+    'Brightness': _batch_enhance_level_to_arg,
+    'BrightnessIncreasing': _batch_enhance_increasing_level_to_arg,
+    'Sharpness': _batch_enhance_level_to_arg,
+    'SharpnessIncreasing': _batch_enhance_increasing_level_to_arg,
+    'ShearX': _batch_shear_level_to_arg,
+    'ShearY': _batch_shear_level_to_arg,
+    'TranslateX': _batch_translate_abs_level_to_arg,
+    'TranslateY': _batch_translate_abs_level_to_arg,
+    'TranslateXRel': _batch_translate_rel_level_to_arg,
+    'TranslateYRel': _batch_translate_rel_level_to_arg,
+}
+
+BATCH_NAME_TO_OP = {
+    'AutoContrast': batch_auto_contrast,
+    'Equalize': batch_equalize,
+    'Invert': batch_invert,
+    'Rotate': batch_rotate,
+    'Posterize': batch_posterize,
+    'PosterizeIncreasing': batch_posterize,
+    'PosterizeOriginal': batch_posterize,
+    'Solarize': batch_solarize,
+    'SolarizeIncreasing': batch_solarize,
+    'SolarizeAdd': batch_solarize_add,
+    'Color': batch_color,
+    'ColorIncreasing': batch_color,
+    'Contrast': batch_contrast,
+    'ContrastIncreasing': batch_contrast,
+    'Brightness': batch_brightness,
+    'BrightnessIncreasing': batch_brightness,
+    'Sharpness': batch_sharpness,
+    'SharpnessIncreasing': batch_sharpness,
+    'ShearX': batch_shear_x,
+    'ShearY': batch_shear_y,
+    'TranslateX': batch_translate_x_abs,
+    'TranslateY': batch_translate_y_abs,
+    'TranslateXRel': batch_translate_x_rel,
+    'TranslateYRel': batch_translate_y_rel,
+}
+
+_BATCH_AFFINE_OPS = [
+    'Rotate',
+    'ShearX',
+    'ShearY',
+    'TranslateX',
+    'TranslateY',
+    'TranslateXRel',
+    'TranslateYRel',
+]
+
+
+class BatchAugmentOps:
+    '''
+    batch version of AugmentOp list,apply op_names[op_idxs[i]] on sample i with probs[i] and magnitudes[i].
+    magnitude randomization(magnitude_std/magnitude_max in hparams) is same as AugmentOp but per sample.
+    '''
+
+    def __init__(self, op_names, hparams):
+        self.op_names = op_names
+        self.aug_fn_list = [BATCH_NAME_TO_OP[name] for name in op_names]
+        self.level_fn_list = [BATCH_LEVEL_TO_ARG[name] for name in op_names]
+        self.hparams = hparams.copy()
+        self.fill = hparams['img_mean'] if 'img_mean' in hparams else _FILL
+        self.interpolation = hparams[
+            'interpolation'] if 'interpolation' in hparams else _BATCH_RANDOM_INTERPOLATION
+
+        self.magnitude_std = self.hparams.get('magnitude_std', 0)
+        self.magnitude_max = self.hparams.get('magnitude_max', None)
+
+    def get_magnitudes(self, magnitudes):
+        if self.magnitude_std > 0:
+            if self.magnitude_std == float('inf'):
+                magnitudes = torch.rand_like(magnitudes) * magnitudes
+            else:
+                magnitudes = magnitudes + torch.randn_like(
+                    magnitudes) * self.magnitude_std
+        upper_bound = self.magnitude_max or _LEVEL_DENOM
+
+        return torch.clamp(magnitudes, 0., upper_bound)
+
+    def __call__(self, images, op_idxs, probs, magnitudes):
+        apply_flag = torch.rand(images.shape[0],
+                                device=images.device) <= probs
+        magnitudes = self.get_magnitudes(magnitudes)
+
+        for op_idx, (name, aug_fn, level_fn) in enumerate(
+                zip(self.op_names, self.aug_fn_list, self.level_fn_list)):
+            sample_idxs = torch.nonzero((op_idxs == op_idx) & apply_flag,
+                                        as_tuple=True)[0]
+            if sample_idxs.numel() == 0:
+                continue
+
+            args = level_fn(magnitudes[sample_idxs],
+                            self.hparams) if level_fn is not None else None
+            if name in _BATCH_AFFINE_OPS:
+                images[sample_idxs] = aug_fn(images[sample_idxs],
+                                             args,
+                                             fill=self.fill,
+                                             interpolation=self.interpolation)
+            else:
+                images[sample_idxs] = aug_fn(images[sample_idxs], args)
+
+        return images
+
+
+class BatchAutoAugment:
+    '''
+    batch version of AutoAugment,every sample chooses its own sub policy,use it in BatchCompose before BatchMeanStdNormalize.
+    input images are rounded to integer values 0-255 first(same as PIL uint8 images),images are modified in place.
+    '''
+
+    def __init__(self,
+                 policy_name,
+                 resize=224,
+                 mean=[0.485, 0.456, 0.406],
+                 magnitude_std=None):
+        assert policy_name in ['original', 'originalr', 'v0', 'v0r']
+        hparams = dict(
+            translate_const=int(resize * 0.45),
+            img_mean=tuple([min(255, round(255 * x)) for x in mean]),
+        )
+        if magnitude_std:
+            hparams.setdefault('magnitude_std', float(magnitude_std))
+        policy = auto_augment_policy(policy_name, hparams=hparams)
+
+        op_names = []
+        for sub_policy in policy:
+            for op in sub_policy:
+                if op.name not in op_names:
+                    op_names.append(op.name)
+        self.ops = BatchAugmentOps(op_names, hparams)
+
+        # sub policy tables:[sub_policy_num,op_num_per_sub_policy]
+        self.policy_op_idxs = torch.tensor(
+            [[op_names.index(op.name) for op in sub_policy]
+             for sub_policy in policy],
+            dtype=torch.long)
+        self.policy_probs = torch.tensor(
+            [[op.prob for op in sub_policy] for sub_policy in policy],
+            dtype=torch.float32)
+        self.policy_magnitudes = torch.tensor(
+            [[op.magnitude for op in sub_policy] for sub_policy in policy],
+            dtype=torch.float32)
+
+    def __call__(self, images):
+        if self.policy_op_idxs.device != images.device:
+            self.policy_op_idxs = self.policy_op_idxs.to(images.device)
+            self.policy_probs = self.policy_probs.to(images.device)
+            self.policy_magnitudes = self.policy_magnitudes.to(images.device)
+
+        images = images.round_().clamp_(0, 255)
+        sub_policy_idxs = torch.randint(self.policy_op_idxs.shape[0],
+                                        (images.shape[0], ),
+                                        device=images.device)
+        for step in range(self.policy_op_idxs.shape[1]):
+            images = self.ops(images, self.policy_op_idxs[sub_policy_idxs,
+                                                          step],
+                              self.policy_probs[sub_policy_idxs, step],
+                              self.policy_magnitudes[sub_policy_idxs, step])
+
+        return images
+
+
+class BatchRandAugment:
+    '''
+    batch version of RandAugment,every sample chooses its own num_layers ops,use it in BatchCompose before BatchMeanStdNormalize.
+    input images are rounded to integer values 0-255 first(same as PIL uint8 images),images are modified in place.
+    '''
+
+    def __init__(self,
+                 magnitude=9,
+                 num_layers=2,
+                 resize=224,
+                 mean=[0.485, 0.456, 0.406],
+                 integer=True,
+                 weight_idx=None,
+                 magnitude_std=0.5,
+                 magnitude_max=None):
+        transforms = _RAND_INCREASING_TRANSFORMS if integer else _RAND_TRANSFORMS
+        hparams = dict(
+            translate_const=int(resize * 0.45),
+            img_mean=tuple([min(255, round(255 * x)) for x in mean]),
+        )
+        if magnitude_std:
+            hparams.setdefault('magnitude_std', float(magnitude_std))
+        if magnitude_max:
+            hparams.setdefault('magnitude_max', int(magnitude_max))
+
+        self.ops = BatchAugmentOps(transforms, hparams)
+        self.magnitude = magnitude
+        self.num_layers = num_layers
+        self.choice_weights = None if weight_idx is None else torch.tensor(
+            _select_rand_weights(weight_idx), dtype=torch.float32)
+
+    def __call__(self, images):
+        batch_size, device = images.shape[0], images.device
+        images = images.round_().clamp_(0, 255)
+
+        if self.choice_weights is None:
+            op_idxs = torch.randint(len(self.ops.op_names),
+                                    (batch_size, self.num_layers),
+                                    device=device)
+        else:
+            # no replacement when using weighted choice
+            if self.choice_weights.device != device:
+                self.choice_weights = self.choice_weights.to(device)
+            op_idxs = torch.multinomial(self.choice_weights.expand(
+                batch_size, -1),
+                                        self.num_layers,
+                                        replacement=False)
+
+        probs = torch.full((batch_size, ), 0.5, device=device)
+        magnitudes = torch.full((batch_size, ),
+                                float(self.magnitude),
+                                device=device)
+        for layer_idx in range(self.num_layers):
+            images = self.ops(images, op_idxs[:, layer_idx], probs, magnitudes)
+
+        return images
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.path.append(BASE_DIR)
+
+    import time
+
+    from PIL import Image
+
+    from simpleAICV.classification.auto_rand_augment import LEVEL_TO_ARG, NAME_TO_OP
+
+    # natural-like test images:upsampled noise,uint8
+    image_num, image_h, image_w = 8, 96, 80
+    images = torch.rand((image_num, 3, image_h // 8, image_w // 8)) * 255.
+    images = F.interpolate(images,
+                           size=(image_h, image_w),
+                           mode='bicubic',
+                           align_corners=False)
+    images = (images + torch.randn_like(images) * 8.).round().clamp(0, 255)
+    # make one sample single color for AutoContrast/Equalize corner case
+    images[-1] = 77.
+    pil_images = [
+        Image.fromarray(per_image.permute(1, 2, 0).numpy().astype(np.uint8))
+        for per_image in images
+    ]
+    fill = (124, 116, 104)
+
+    # per op numeric comparison with PIL op,same op args for all samples
+    test_op_args = {
+        'AutoContrast': [None],
+        'Equalize': [None],
+        'Invert': [None],
+        'Rotate': [-27.5, 0., 9.3],
+        'Posterize': [0, 2, 4, 8],
+        'Solarize': [0, 100, 256],
+        'SolarizeAdd': [0, 55, 110],
+        'Color': [0.1, 0.73, 1.9],
+        'Contrast': [0.1, 0.73, 1.9],
+        'Brightness': [0.1, 0.73, 1.9],
+        'Sharpness': [0.1, 0.73, 1.9],
+        'ShearX': [-0.3, 0.12],
+        'ShearY': [-0.21, 0.3],
+        'TranslateX': [-37.4, 20.],
+        'TranslateY': [-11., 28.6],
+        'TranslateXRel': [-0.45, 0.2],
+        'TranslateYRel': [-0.17, 0.45],
+    }
+    for name, arg_list in test_op_args.items():
+        interpolation_list = [
+            'bilinear', 'bicubic'
+        ] if name in _BATCH_AFFINE_OPS else [None]
+        for arg in arg_list:
+            for interpolation in interpolation_list:
+                pil_args = tuple() if arg is None else (arg, )
+                pil_kwargs = dict(fillcolor=fill)
+                if interpolation is not None:
+                    pil_kwargs['resample'] = Image.Resampling.BILINEAR if interpolation == 'bilinear' else Image.Resampling.BICUBIC
+                pil_outs = torch.stack([
+                    torch.from_numpy(
+                        np.array(NAME_TO_OP[name](per_image, *pil_args,
+                                                  **pil_kwargs))).permute(
+                                                      2, 0, 1).float()
+                    for per_image in pil_images
+                ],
+                                       dim=0)
+
+                args = None if arg is None else torch.full((image_num, ),
+                                                           float(arg))
+                if interpolation is not None:
+                    outs = BATCH_NAME_TO_OP[name](images.clone(),
+                                                  args,
+                                                  fill=fill,
+                                                  interpolation=interpolation)
+                else:
+                    outs = BATCH_NAME_TO_OP[name](images.clone(), args)
+
+                diff = torch.abs(outs - pil_outs)
+                print(
+                    f'{name:<14s} arg:{str(arg):<6s} {str(interpolation):<8s} max_diff:{diff.max().item():.0f}, mean_diff:{diff.mean().item():.4f}, equal_pixel_ratio:{(diff == 0).float().mean().item():.4f}, diff<=1_pixel_ratio:{(diff <= 1).float().mean().item():.4f}'
+                )
+
+    # magnitude schedule is same as LEVEL_TO_ARG(abs value,ignore random negate)
+    hparams = dict(translate_const=100, img_mean=fill)
+    levels = torch.linspace(0, 10, 41, dtype=torch.float64)
+    max_level_diff = 0.
+    for name, level_fn in BATCH_LEVEL_TO_ARG.items():
+        if level_fn is None:
+            continue
+        batch_args = torch.abs(level_fn(levels, hparams))
+        args = torch.tensor([
+            abs(LEVEL_TO_ARG[name](level, hparams)[0])
+            for level in levels.tolist()
+        ],
+                            dtype=torch.float64)
+        # increasing enhance args are 1-x or 1+x after random negate
+        if 'Increasing' in name and name.startswith(
+            ('Color', 'Contrast', 'Brightness', 'Sharpness')):
+            batch_args, args = torch.abs(batch_args - 1), torch.abs(args - 1)
+        max_level_diff = max(max_level_diff,
+                             torch.abs(batch_args - args).max().item())
+    print(f'max level to arg diff:{max_level_diff:.6f}')
+
+    # per sample op selection
+    batch_images = images.repeat(4, 1, 1, 1)
+    rand_augment = BatchRandAugment(magnitude=9,
+                                    num_layers=2,
+                                    resize=image_h,
+                                    mean=[0.485, 0.456, 0.406],
+                                    integer=True,
+                                    weight_idx=None,
+                                    magnitude_std=0.5,
+                                    magnitude_max=10)
+    outs = rand_augment(batch_images.clone())
+    print('1111', outs.shape, outs.dtype, outs.min().item(),
+          outs.max().item(), torch.equal(outs, outs.round()))
+    rand_augment = BatchRandAugment(weight_idx=0)
+    outs = rand_augment(batch_images.clone())
+    print('2222', outs.shape, outs.min().item(), outs.max().item())
+    for policy_name in ['original', 'originalr', 'v0', 'v0r']:
+        auto_augment = BatchAutoAugment(policy_name,
+                                        resize=image_h,
+                                        magnitude_std=0.5)
+        outs = auto_augment(batch_images.clone())
+        print('3333', policy_name, outs.shape, outs.min().item(),
+              outs.max().item())
+
+    # cpu speed,batch ops vs per sample PIL ops
+    from simpleAICV.classification.auto_rand_augment import RandAugment
+    bench_num, bench_size = 64, 224
+    bench_images = torch.randint(0, 256, (bench_num, 3, bench_size,
+                                          bench_size)).float()
+    bench_pil_images = [
+        Image.fromarray(per_image.permute(1, 2, 0).numpy().astype(np.uint8))
+        for per_image in bench_images
+    ]
+    pil_rand_augment = RandAugment(magnitude=9, num_layers=2, resize=224)
+    batch_rand_augment = BatchRandAugment(magnitude=9,
+                                          num_layers=2,
+                                          resize=224)
+    start_time = time.time()
+    for _ in range(3):
+        for per_image in bench_pil_images:
+            pil_rand_augment({'image': per_image, 'label': 0})
+    pil_time = (time.time() - start_time) / 3
+    start_time = time.time()
+    for _ in range(3):
+        batch_rand_augment(bench_images.clone())
+    batch_time = (time.time() - start_time) / 3
+    print(
+        f'{bench_num} images {bench_size}x{bench_size},pil RandAugment:{pil_time*1000:.1f}ms,BatchRandAugment:{batch_time*1000:.1f}ms'
+    )
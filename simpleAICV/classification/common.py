@@ -6,6 +6,7 @@ BASE_DIR = os.path.dirname(
 sys.path.append(BASE_DIR)
 
 import cv2
+import io
 import math
 import numpy as np
 
@@ -16,7 +17,67 @@ import torch.nn.functional as F
 import torchvision.transforms as transforms
 
 from simpleAICV.classification.auto_rand_augment import AutoAugment, RandAugment
-from simpleAICV.classification.mixupcutmixclassificationcollator import MixupCutmixClassificationCollater
+from simpleAICV.classification.batch_augment import BatchCompose, BatchRandomResizedCrop, BatchRandomHorizontalFlip, BatchColorJitter, BatchPCAJitter, BatchRandomErasing, BatchMeanStdNormalize
+from simpleAICV.classification.batch_auto_rand_augment import BatchAutoAugment, BatchRandAugment
+from simpleAICV.classification.mixupcutmixclassificationcollator import MixupCutmixClassificationCollater, MixupCutmixBatchTransform
+
+
+# image downscale factor:cv2 reduced resolution decode flag,jpeg is decoded at 1/2,1/4,1/8 scale by libjpeg dct scaling
+reduced_decode_flag_dict = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    1: cv2.IMREAD_COLOR,
+}
+
+
+def get_transform_reduced_decode_factor(transform, image_h, image_w):
+    '''
+    max image downscale factor declared by first resize transform(transform has get_reduced_decode_factor method),
+    transforms before it must not depend on image resolution.
+    return 1. if no transform declares it.
+    '''
+    per_transform_list = transform.transforms if hasattr(
+        transform, 'transforms') else [transform]
+    for per_transform in per_transform_list:
+        if hasattr(per_transform, 'get_reduced_decode_factor'):
+            return per_transform.get_reduced_decode_factor(image_h, image_w)
+
+    return 1.
+
+
+def decode_image_with_reduced_resolution(image_bytes, transform):
+    '''
+    image_bytes:np.uint8 encoded image bytes
+    decode image at 1/2,1/4,1/8 resolution when first resize transform downsizes image at least 2,4,8 times.
+    return RGB np.float32 image,decode scale np.float32 [scale_h,scale_w] and original image size np.float32 [h,w].
+    annotations must be multiplied by decode scale.
+    decoded image is ceil(h/reduce)xceil(w/reduce),every decoded pixel covers reducexreduce original pixels,
+    so decode scale is exactly 1/reduce on both axes and keeps aspect ratio.
+    '''
+    # only read image header
+    image_w, image_h = Image.open(io.BytesIO(image_bytes)).size
+    factor = get_transform_reduced_decode_factor(transform, image_h, image_w)
+
+    reduce = 1
+    for per_reduce in [8, 4, 2]:
+        if factor >= per_reduce:
+            reduce = per_reduce
+            break
+
+    image = cv2.imdecode(image_bytes, reduced_decode_flag_dict[reduce])
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    # cv2 applies exif orientation,header size is before rotation
+    if image_h != image_w and (image.shape[0] > image.shape[1]) != (image_h
+                                                                    >
+                                                                    image_w):
+        image_h, image_w = image_w, image_h
+
+    decode_scale = np.array([1. / reduce, 1. / reduce], dtype=np.float32)
+    image_size = np.array([image_h, image_w], dtype=np.float32)
+
+    return image.astype(np.float32), decode_scale, image_size
 
 
 class Opencv2PIL:
@@ -57,11 +118,45 @@ class PIL2Opencv:
         }
 
 
+class PIL2OpencvUint8:
+    '''
+    keep uint8 image for ClassificationUint8Collater,
+    image is normalized on device by TorchUint8MeanStdNormalize.
+    '''
+
+    def __init__(self):
+        pass
+
+    def __call__(self, sample):
+        '''
+        sample must be a dict,contains 'image'、'label' keys.
+        '''
+        image, label = sample['image'], sample['label']
+
+        image = np.asarray(image, dtype=np.uint8)
+
+        return {
+            'image': image,
+            'label': label,
+        }
+
+
 class TorchRandomResizedCrop:
 
     def __init__(self, resize=224, scale=(0.08, 1.0)):
         self.RandomResizedCrop = transforms.RandomResizedCrop(int(resize),
                                                               scale=scale)
+        self.resize = int(resize)
+        self.scale = scale
+        self.ratio = self.RandomResizedCrop.ratio
+
+    def get_reduced_decode_factor(self, image_h, image_w):
+        # smallest possible crop side must still be resized up to resize
+        min_crop_area = self.scale[0] * image_h * image_w
+        min_crop_side = min(math.sqrt(min_crop_area * self.ratio[0]),
+                            math.sqrt(min_crop_area / self.ratio[1]))
+
+        return min_crop_side / self.resize
 
     def __call__(self, sample):
         '''
@@ -162,6 +257,11 @@ class TorchResize:
 
     def __init__(self, resize=224):
         self.Resize = transforms.Resize(int(resize))
+        self.resize = int(resize)
+
+    def get_reduced_decode_factor(self, image_h, image_w):
+        # shorter side is resized to resize
+        return min(image_h, image_w) / self.resize
 
     def __call__(self, sample):
         '''
@@ -284,6 +384,35 @@ class TorchMeanStdNormalize:
         }
 
 
+class TorchUint8MeanStdNormalize:
+    '''
+    normalize B H W 3 uint8 images batch from ClassificationUint8Collater on device.
+    same result as TorchMeanStdNormalize on float32 images.
+    channels_last:if True,output B 3 H W images in channels last memory format.
+    '''
+
+    def __init__(self, mean, std, channels_last=False):
+        self.mean = torch.tensor(mean, dtype=torch.float32).view(1, 3, 1, 1)
+        self.std = torch.tensor(std, dtype=torch.float32).view(1, 3, 1, 1)
+        self.channels_last = channels_last
+
+    def __call__(self, images):
+        if self.mean.device != images.device:
+            self.mean = self.mean.to(images.device)
+            self.std = self.std.to(images.device)
+
+        # B H W 3 ->B 3 H W,permuted view of B H W 3 is already channels last memory format
+        images = images.permute(0, 3, 1, 2).float()
+        images = images.div(255.).sub(self.mean).div(self.std)
+
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        else:
+            images = images.contiguous()
+
+        return images
+
+
 class ReflectPad:
 
     def __init__(self, pad=4):
@@ -599,6 +728,42 @@ class Resize:
         }
 
 
+class Uint8ResizeWithOriginSize:
+    '''
+    resize opencv image to fixed resize x resize uint8 image(aspect ratio is not kept) and keep origin image size in 'size' key,
+    ClassificationUint8Collater collates origin sizes,BatchRandomResizedCrop samples crop boxes on origin sizes
+    and maps them to fixed size images,so images of different sizes are batched without center crop.
+    '''
+
+    def __init__(self, resize=256):
+        self.resize = int(resize)
+
+    def get_reduced_decode_factor(self, image_h, image_w):
+        # both sides are resized to resize
+        return min(image_h, image_w) / self.resize
+
+    def __call__(self, sample):
+        '''
+        sample must be a dict,contains 'image'、'label' keys.
+        '''
+        image, label = sample['image'], sample['label']
+
+        origin_h, origin_w = image.shape[0], image.shape[1]
+        # resize uint8 image,area interpolation when downsizing to avoid aliasing
+        interpolation = cv2.INTER_LINEAR
+        if origin_h * origin_w > self.resize**2:
+            interpolation = cv2.INTER_AREA
+        image = cv2.resize(np.uint8(image), (self.resize, self.resize),
+                           interpolation=interpolation)
+        size = np.array([origin_h, origin_w], dtype=np.float32)
+
+        return {
+            'image': image,
+            'label': label,
+            'size': size,
+        }
+
+
 class RandomErasing:
     """ Random Erasing Data Augmentation: Randomly selects a rectangle region in an image and erases its pixels.
         Paper: https://arxiv.org/pdf/1708.04896.pdf
@@ -707,6 +872,40 @@ class ClassificationCollater:
         }
 
 
+class ClassificationUint8Collater:
+    '''
+    collate uint8 images from PIL2OpencvUint8 into a B H W 3 uint8 batch,1/4 bytes of float32 batch
+    for worker to main process ipc and host to device copy.
+    DataLoader with pin_memory=True pins this batch,normalize it on device by TorchUint8MeanStdNormalize.
+    '''
+
+    def __init__(self):
+        pass
+
+    def __call__(self, data):
+        images = [s['image'] for s in data]
+        labels = [s['label'] for s in data]
+
+        images = np.stack(images, axis=0).astype(np.uint8)
+        labels = np.array(labels).astype(np.float32)
+
+        # B H W 3
+        images = torch.from_numpy(images)
+        labels = torch.from_numpy(labels).long()
+
+        batch_data = {
+            'image': images,
+            'label': labels,
+        }
+
+        # origin sizes from Uint8ResizeWithOriginSize for BatchRandomResizedCrop
+        if 'size' in data[0].keys():
+            sizes = np.array([s['size'] for s in data]).astype(np.float32)
+            batch_data['size'] = torch.from_numpy(sizes)
+
+        return batch_data
+
+
 class AverageMeter:
     '''Computes and stores the average and current value'''
 
@@ -1,16 +1,30 @@
 import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
 import cv2
 import numpy as np
 
 from torch.utils.data import Dataset
 
+from simpleAICV.classification.common import decode_image_with_reduced_resolution
+
 
 class ILSVRC2012Dataset(Dataset):
     '''
     ILSVRC2012 Dataset:https://image-net.org/ 
+    reduced_resolution_decode:if True,decode image at 1/2,1/4,1/8 resolution when first resize transform allows it.
     '''
 
-    def __init__(self, root_dir, set_name='train', transform=None):
+    def __init__(self,
+                 root_dir,
+                 set_name='train',
+                 transform=None,
+                 reduced_resolution_decode=False):
         assert set_name in ['train', 'val'], 'Wrong set name!'
         # make sure all directories in set_dir directory are sub-categories directory and no other files
         set_dir = os.path.join(root_dir, set_name)
@@ -39,6 +53,7 @@ class ILSVRC2012Dataset(Dataset):
         }
 
         self.transform = transform
+        self.reduced_resolution_decode = reduced_resolution_decode
 
         print(f'Dataset Size:{len(self.image_path_list)}')
         print(f'Dataset Class Num:{len(self.class_name_to_label)}')
@@ -61,6 +76,13 @@ class ILSVRC2012Dataset(Dataset):
         return sample
 
     def load_image(self, idx):
+        if self.reduced_resolution_decode:
+            image, _, _ = decode_image_with_reduced_resolution(
+                np.fromfile(self.image_path_list[idx], dtype=np.uint8),
+                self.transform)
+
+            return image
+
         image = cv2.imdecode(
             np.fromfile(self.image_path_list[idx], dtype=np.uint8),
             cv2.IMREAD_COLOR)
@@ -338,4 +360,78 @@ if __name__ == '__main__':
         if i < 1:
             i += 1
         else:
-            break
\ No newline at end of file
+            break
+    # float32 pipeline vs uint8 pipeline with on device normalization:
+    # worker to main process ipc bytes per batch and cpu toy model accuracy parity
+    import copy
+    from simpleAICV.classification import backbones
+    from simpleAICV.classification.common import TorchMeanStdNormalize, PIL2OpencvUint8, TorchUint8MeanStdNormalize, ClassificationUint8Collater
+
+    float_valdataset = ILSVRC2012Dataset(
+        root_dir=ILSVRC2012_path,
+        set_name='val',
+        transform=transforms.Compose([
+            Opencv2PIL(),
+            TorchResize(resize=256),
+            TorchCenterCrop(resize=224),
+            TorchMeanStdNormalize(mean=[0.485, 0.456, 0.406],
+                                  std=[0.229, 0.224, 0.225]),
+        ]))
+    uint8_valdataset = ILSVRC2012Dataset(root_dir=ILSVRC2012_path,
+                                         set_name='val',
+                                         transform=transforms.Compose([
+                                             Opencv2PIL(),
+                                             TorchResize(resize=256),
+                                             TorchCenterCrop(resize=224),
+                                             PIL2OpencvUint8(),
+                                         ]))
+    float_val_loader = DataLoader(float_valdataset,
+                                  batch_size=32,
+                                  shuffle=False,
+                                  num_workers=4,
+                                  collate_fn=ClassificationCollater())
+    uint8_val_loader = DataLoader(uint8_valdataset,
+                                  batch_size=32,
+                                  shuffle=False,
+                                  num_workers=4,
+                                  collate_fn=ClassificationUint8Collater())
+    uint8_image_normalize = TorchUint8MeanStdNormalize(
+        mean=[0.485, 0.456, 0.406],
+        std=[0.229, 0.224, 0.225],
+        channels_last=True)
+
+    toy_model = backbones.__dict__['resnet18'](**{'num_classes': 1000})
+    toy_model.eval()
+    channels_last_toy_model = copy.deepcopy(toy_model).to(
+        memory_format=torch.channels_last)
+
+    float_correct_num, uint8_correct_num, sample_num = 0, 0, 0
+    max_image_diff = 0.
+    with torch.no_grad():
+        for batch_idx, (float_data, uint8_data) in enumerate(
+                zip(float_val_loader, uint8_val_loader)):
+            float_images, labels = float_data['image'], float_data['label']
+            uint8_images = uint8_data['image']
+            print(
+                f'ipc bytes per batch, float32:{float_images.element_size() * float_images.nelement()}, uint8:{uint8_images.element_size() * uint8_images.nelement()}'
+            )
+
+            uint8_normalize_images = uint8_image_normalize(uint8_images)
+            max_image_diff = max(
+                max_image_diff,
+                float((float_images - uint8_normalize_images).abs().max()))
+
+            float_outputs = toy_model(float_images)
+            uint8_outputs = channels_last_toy_model(uint8_normalize_images)
+            float_correct_num += int(
+                (float_outputs.argmax(dim=1) == labels).sum())
+            uint8_correct_num += int(
+                (uint8_outputs.argmax(dim=1) == labels).sum())
+            sample_num += labels.shape[0]
+
+            if batch_idx >= 9:
+                break
+
+    print(
+        f'max image diff:{max_image_diff}, float32 acc1:{float_correct_num / sample_num:.4f}, uint8 acc1:{uint8_correct_num / sample_num:.4f}'
+    )
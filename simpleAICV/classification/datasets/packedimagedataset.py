@@ -0,0 +1,313 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
+import cv2
+import json
+import numpy as np
+
+from tqdm import tqdm
+
+from torch.utils.data import Dataset
+
+from simpleAICV.classification.common import decode_image_with_reduced_resolution
+
+# one record per image:shard file id,byte offset in shard file,byte length,class index
+packed_index_dtype = np.dtype([
+    ('shard_id', np.uint32),
+    ('offset', np.uint64),
+    ('length', np.uint32),
+    ('label', np.uint32),
+])
+
+
+def get_packed_dataset_file_path(packed_dir, set_name):
+    index_path = os.path.join(packed_dir, f'{set_name}_index.npy')
+    class_name_path = os.path.join(packed_dir, f'{set_name}_class_name.json')
+
+    return index_path, class_name_path
+
+
+def get_packed_shard_file_path(packed_dir, set_name, shard_id):
+    return os.path.join(packed_dir, f'{set_name}_shard_{shard_id:05d}.bin')
+
+
+def pack_image_folder_dataset(root_dir,
+                              packed_dir,
+                              set_name='train',
+                              shard_size=1024 * 1024 * 1024,
+                              filter_image_name_list=[]):
+    '''
+    pack root_dir/set_name/class_name/image_name images(ILSVRC2012/ImageNet21K layout) into shard files.
+    raw encoded image bytes are copied without decoding,so decode result is same as loose image files.
+    packed_dir/{set_name}_shard_{shard_id:05d}.bin:contiguous raw image bytes
+    packed_dir/{set_name}_index.npy:packed_index_dtype array,one record per image
+    packed_dir/{set_name}_class_name.json:sorted sub class name list,label is index in this list
+    shard_size:max bytes per shard file,a shard file contains at least one image
+    '''
+    # make sure all directories in set_dir directory are sub-categories directory and no other files
+    set_dir = os.path.join(root_dir, set_name)
+
+    sub_class_name_list = []
+    for per_sub_class_name in os.listdir(set_dir):
+        sub_class_name_list.append(per_sub_class_name)
+    sub_class_name_list = sorted(sub_class_name_list)
+
+    filter_image_name_list = set(filter_image_name_list)
+    image_path_label_list = []
+    for label, per_sub_class_name in enumerate(tqdm(sub_class_name_list)):
+        per_sub_class_dir = os.path.join(set_dir, per_sub_class_name)
+        for per_image_name in sorted(os.listdir(per_sub_class_dir)):
+            if per_image_name in filter_image_name_list:
+                continue
+            per_image_path = os.path.join(per_sub_class_dir, per_image_name)
+            image_path_label_list.append([per_image_path, label])
+
+    os.makedirs(packed_dir) if not os.path.exists(packed_dir) else None
+
+    index = np.zeros(len(image_path_label_list), dtype=packed_index_dtype)
+    shard_id, shard_offset, shard_file = 0, 0, None
+    for idx, (per_image_path,
+              label) in enumerate(tqdm(image_path_label_list)):
+        with open(per_image_path, 'rb') as f:
+            per_image_bytes = f.read()
+
+        if shard_file is not None and shard_offset + len(
+                per_image_bytes) > shard_size:
+            shard_file.close()
+            shard_file = None
+            shard_id += 1
+            shard_offset = 0
+
+        if shard_file is None:
+            shard_file = open(
+                get_packed_shard_file_path(packed_dir, set_name, shard_id),
+                'wb')
+
+        shard_file.write(per_image_bytes)
+        index[idx] = (shard_id, shard_offset, len(per_image_bytes), label)
+        shard_offset += len(per_image_bytes)
+
+    if shard_file is not None:
+        shard_file.close()
+
+    index_path, class_name_path = get_packed_dataset_file_path(
+        packed_dir, set_name)
+    np.save(index_path, index)
+    with open(class_name_path, 'w') as f:
+        json.dump(sub_class_name_list, f)
+
+    print(f'Packed Image Num:{len(index)}, Shard Num:{shard_id + 1}')
+
+    return index
+
+
+class PackedImageDataset(Dataset):
+    '''
+    read images packed by pack_image_folder_dataset.
+    index file is loaded by mmap and shard files are opened by mmap lazily in each dataloader worker,
+    so dataset init and per sample reading don't touch per image file metadata.
+    return same sample dict as ILSVRC2012Dataset/ImageNet21KSingleLabelDataset.
+    reduced_resolution_decode:if True,decode image at 1/2,1/4,1/8 resolution when first resize transform allows it.
+    '''
+
+    def __init__(self,
+                 root_dir,
+                 set_name='train',
+                 transform=None,
+                 reduced_resolution_decode=False):
+        assert set_name in ['train', 'val'], 'Wrong set name!'
+        self.root_dir = root_dir
+        self.set_name = set_name
+
+        index_path, class_name_path = get_packed_dataset_file_path(
+            root_dir, set_name)
+        self.index = np.load(index_path, mmap_mode='r')
+        with open(class_name_path, 'r') as f:
+            sub_class_name_list = json.load(f)
+
+        self.class_name_to_label = {
+            sub_class_name: i
+            for i, sub_class_name in enumerate(sub_class_name_list)
+        }
+
+        self.label_to_class_name = {
+            i: sub_class_name
+            for i, sub_class_name in enumerate(sub_class_name_list)
+        }
+
+        # opened lazily,so forked/spawned workers create their own mmap
+        self.shard_dict = {}
+
+        self.transform = transform
+        self.reduced_resolution_decode = reduced_resolution_decode
+
+        print(f'Dataset Size:{len(self.index)}')
+        print(f'Dataset Class Num:{len(self.class_name_to_label)}')
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, idx):
+        image = self.load_image(idx)
+        label = self.load_label(idx)
+
+        sample = {
+            'image': image,
+            'label': label,
+        }
+
+        if self.transform:
+            sample = self.transform(sample)
+
+        return sample
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['shard_dict'] = {}
+
+        return state
+
+    def get_shard(self, shard_id):
+        if shard_id not in self.shard_dict:
+            self.shard_dict[shard_id] = np.memmap(get_packed_shard_file_path(
+                self.root_dir, self.set_name, shard_id),
+                                                  dtype=np.uint8,
+                                                  mode='r')
+
+        return self.shard_dict[shard_id]
+
+    def load_image_bytes(self, idx):
+        per_record = self.index[idx]
+        shard = self.get_shard(int(per_record['shard_id']))
+        offset, length = int(per_record['offset']), int(per_record['length'])
+
+        return np.asarray(shard[offset:offset + length])
+
+    def load_image(self, idx):
+        if self.reduced_resolution_decode:
+            image, _, _ = decode_image_with_reduced_resolution(
+                self.load_image_bytes(idx), self.transform)
+
+            return image
+
+        image = cv2.imdecode(self.load_image_bytes(idx), cv2.IMREAD_COLOR)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+        return image.astype(np.float32)
+
+    def load_label(self, idx):
+        label = np.array(self.index[idx]['label'])
+
+        return label.astype(np.float32)
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    sys.path.append(BASE_DIR)
+
+    from tools.path import ILSVRC2012_path, ILSVRC2012_packed_path
+
+    import time
+    from torch.utils.data import DataLoader
+
+    from simpleAICV.classification.datasets.ilsvrc2012dataset import ILSVRC2012Dataset
+
+    index_path, _ = get_packed_dataset_file_path(ILSVRC2012_packed_path,
+                                                 'val')
+    if not os.path.exists(index_path):
+        pack_image_folder_dataset(ILSVRC2012_path,
+                                  ILSVRC2012_packed_path,
+                                  set_name='val')
+
+    def count_collater(samples):
+        return len(samples)
+
+    # read throughput benchmark:one epoch of read+decode,no transform
+    def benchmark_epoch_read_throughput(dataset, num_workers=8,
+                                        batch_size=64):
+        loader = DataLoader(dataset,
+                            batch_size=batch_size,
+                            shuffle=True,
+                            num_workers=num_workers,
+                            collate_fn=count_collater)
+        start_time = time.time()
+        sample_num = 0
+        for per_batch_sample_num in loader:
+            sample_num += per_batch_sample_num
+        used_time = time.time() - start_time
+
+        return sample_num / used_time
+
+    for num_workers in [0, 4, 8, 16]:
+        start_time = time.time()
+        loose_dataset = ILSVRC2012Dataset(root_dir=ILSVRC2012_path,
+                                          set_name='val',
+                                          transform=None)
+        loose_init_time = time.time() - start_time
+        loose_throughput = benchmark_epoch_read_throughput(
+            loose_dataset, num_workers=num_workers)
+
+        start_time = time.time()
+        packed_dataset = PackedImageDataset(root_dir=ILSVRC2012_packed_path,
+                                            set_name='val',
+                                            transform=None)
+        packed_init_time = time.time() - start_time
+        packed_throughput = benchmark_epoch_read_throughput(
+            packed_dataset, num_workers=num_workers)
+
+        print(
+            f'num_workers:{num_workers}, loose init:{loose_init_time:.3f}s, loose read:{loose_throughput:.1f} images/s, packed init:{packed_init_time:.3f}s, packed read:{packed_throughput:.1f} images/s'
+        )
+
+    # check packed samples are same as loose samples
+    loose_dataset = ILSVRC2012Dataset(root_dir=ILSVRC2012_path,
+                                      set_name='val',
+                                      transform=None)
+    loose_path_to_idx = {
+        per_image_path: idx
+        for idx, per_image_path in enumerate(loose_dataset.image_path_list)
+    }
+    packed_dataset = PackedImageDataset(root_dir=ILSVRC2012_packed_path,
+                                        set_name='val',
+                                        transform=None)
+    packed_image_path_list = []
+    for per_sub_class_name in sorted(
+            loose_dataset.class_name_to_label.keys()):
+        per_sub_class_dir = os.path.join(ILSVRC2012_path, 'val',
+                                         per_sub_class_name)
+        for per_image_name in sorted(os.listdir(per_sub_class_dir)):
+            packed_image_path_list.append(
+                os.path.join(per_sub_class_dir, per_image_name))
+
+    for idx in range(10):
+        loose_sample = loose_dataset[loose_path_to_idx[
+            packed_image_path_list[idx]]]
+        packed_sample = packed_dataset[idx]
+        print(idx, np.array_equal(loose_sample['image'],
+                                  packed_sample['image']),
+              loose_sample['label'] == packed_sample['label'])
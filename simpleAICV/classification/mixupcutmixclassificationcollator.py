@@ -282,3 +282,330 @@ class MixupCutmixClassificationCollater:
             x.mul_(lam).add_(x_flipped)
 
         return lam
+
+
+def mixup_soft_label(labels, num_classes, lam=1., smoothing=0.0):
+    """ Same soft targets as mixup_label, built on labels device by scatter without one-hot arrays.
+    Args:
+        labels (tensor): [B] class index labels
+        lam (float or tensor): per batch lambda or [B] per sample lambda
+    """
+    off_value = smoothing / num_classes
+    on_value = 1. - smoothing + off_value
+
+    labels = labels.long().view(-1, 1)
+    flipped_labels = labels.flip(0)
+    if torch.is_tensor(lam):
+        lam = lam.float().view(-1, 1)
+    lam_other = 1. - lam
+
+    # y1 * lam + y2 * (1 - lam) for every (y1,y2) value pair,same float ops as mixup_label
+    values = torch.tensor([[off_value, on_value]],
+                          dtype=torch.float32,
+                          device=labels.device)
+    values_lam, values_lam_other = values * lam, values * lam_other
+    off_off_value = values_lam[:, 0:1] + values_lam_other[:, 0:1]
+    on_off_value = values_lam[:, 1:2] + values_lam_other[:, 0:1]
+    off_on_value = values_lam[:, 0:1] + values_lam_other[:, 1:2]
+    on_on_value = values_lam[:, 1:2] + values_lam_other[:, 1:2]
+
+    targets = off_off_value.expand(labels.shape[0], num_classes).contiguous()
+    targets.scatter_(1, labels, on_off_value.expand(labels.shape[0], 1))
+    targets.scatter_(
+        1, flipped_labels,
+        torch.where(labels == flipped_labels,
+                    on_on_value.expand(labels.shape[0], 1),
+                    off_on_value.expand(labels.shape[0], 1)))
+
+    return targets
+
+
+class MixupCutmixBatchTransform(MixupCutmixClassificationCollater):
+    """ Mixup/Cutmix on images batch already on device,used in train loop after images.cuda() instead of MixupCutmixClassificationCollater
+    set train_collater = ClassificationCollater() and train_mixup_cutmix = MixupCutmixBatchTransform(...) in train_config.py
+    Args:
+        same as MixupCutmixClassificationCollater
+        mode (str): 'batch':one lambda/box for whole batch,params are sampled by numpy same as MixupCutmixClassificationCollater,
+                    so images and soft labels are numerically equal to MixupCutmixClassificationCollater with same numpy random state.
+                    'pair'/'elem':per pair/per element lambda,cutmix box and mixup/cutmix switch,sampled on device and applied
+                    to whole batch at once without python loop.
+    """
+
+    def __call__(self, images, labels):
+        '''
+        images:[B,3,H,W] float images,labels:[B] class index labels,both on same device.
+        return mixed images and [B,num_classes] soft labels.
+        '''
+        if not self.use_mixup:
+            return images, labels
+
+        b, _, _, _ = images.shape
+        assert b % 2 == 0, 'Batch size should be even when using this'
+        if self.mode == 'elem':
+            lam = self._mix_elem_on_device(images, pair=False)
+        elif self.mode == 'pair':
+            lam = self._mix_elem_on_device(images, pair=True)
+        else:
+            lam = self._mix_batch(images)
+        labels = mixup_soft_label(labels, self.num_classes, lam,
+                                  self.label_smoothing)
+
+        return images, labels
+
+    def _sample_beta(self, alpha, size, device):
+        alpha = torch.full((size, ), float(alpha), device=device)
+
+        return torch.distributions.Beta(alpha, alpha).sample()
+
+    def _params_per_elem_on_device(self, batch_size, device):
+        lam = torch.ones(batch_size, device=device)
+        use_cutmix = torch.zeros(batch_size, dtype=torch.bool, device=device)
+
+        if self.mixup_alpha > 0. and self.cutmix_alpha > 0.:
+            use_cutmix = torch.rand(batch_size,
+                                    device=device) < self.switch_to_cutmix_prob
+            lam_mix = torch.where(
+                use_cutmix,
+                self._sample_beta(self.cutmix_alpha, batch_size, device),
+                self._sample_beta(self.mixup_alpha, batch_size, device))
+        elif self.mixup_alpha > 0.:
+            lam_mix = self._sample_beta(self.mixup_alpha, batch_size, device)
+        elif self.cutmix_alpha > 0.:
+            use_cutmix = torch.ones(batch_size,
+                                    dtype=torch.bool,
+                                    device=device)
+            lam_mix = self._sample_beta(self.cutmix_alpha, batch_size, device)
+        else:
+            assert False, "One of mixup_alpha > 0., cutmix_alpha > 0., cutmix_minmax not None should be true."
+        lam = torch.where(
+            torch.rand(batch_size, device=device) < self.mixup_cutmix_prob,
+            lam_mix, lam)
+
+        return lam, use_cutmix
+
+    def _cutmix_bbox_and_lam_on_device(self, img_shape, lam):
+        # vectorized cutmix_bbox_and_lam,lam:[N]
+        img_h, img_w = img_shape[-2:]
+        device = lam.device
+        if self.cutmix_minmax is not None:
+            min_cut_h, max_cut_h = int(img_h * self.cutmix_minmax[0]), int(
+                img_h * self.cutmix_minmax[1])
+            min_cut_w, max_cut_w = int(img_w * self.cutmix_minmax[0]), int(
+                img_w * self.cutmix_minmax[1])
+            cut_h = min_cut_h + torch.floor(
+                torch.rand(lam.shape, device=device) *
+                (max_cut_h - min_cut_h)).long()
+            cut_w = min_cut_w + torch.floor(
+                torch.rand(lam.shape, device=device) *
+                (max_cut_w - min_cut_w)).long()
+            yl = torch.floor(
+                torch.rand(lam.shape, device=device) *
+                (img_h - cut_h).float()).long()
+            xl = torch.floor(
+                torch.rand(lam.shape, device=device) *
+                (img_w - cut_w).float()).long()
+            yh, xh = yl + cut_h, xl + cut_w
+        else:
+            ratio = torch.sqrt(1. - lam)
+            cut_h = (img_h * ratio).long()
+            cut_w = (img_w * ratio).long()
+            cy = torch.floor(torch.rand(lam.shape, device=device) *
+                             img_h).long()
+            cx = torch.floor(torch.rand(lam.shape, device=device) *
+                             img_w).long()
+            yl = torch.clamp(cy - cut_h // 2, 0, img_h)
+            yh = torch.clamp(cy + cut_h // 2, 0, img_h)
+            xl = torch.clamp(cx - cut_w // 2, 0, img_w)
+            xh = torch.clamp(cx + cut_w // 2, 0, img_w)
+
+        if self.correct_lam or self.cutmix_minmax is not None:
+            bbox_area = (yh - yl) * (xh - xl)
+            lam = 1. - bbox_area.float() / float(img_h * img_w)
+
+        return (yl, yh, xl, xh), lam
+
+    def _mix_elem_on_device(self, x, pair=False):
+        batch_size, _, img_h, img_w = x.shape
+        param_num = batch_size // 2 if pair else batch_size
+        lam, use_cutmix = self._params_per_elem_on_device(param_num, x.device)
+        (yl, yh, xl, xh), cutmix_lam = self._cutmix_bbox_and_lam_on_device(
+            x.shape, lam)
+        use_cutmix = use_cutmix & (lam != 1.)
+        lam = torch.where(use_cutmix, cutmix_lam, lam)
+
+        if pair:
+            # element j = batch_size - i - 1 uses same params as element i
+            lam, use_cutmix = torch.cat((lam, lam.flip(0))), torch.cat(
+                (use_cutmix, use_cutmix.flip(0)))
+            yl, yh, xl, xh = [
+                torch.cat((per_value, per_value.flip(0)))
+                for per_value in [yl, yh, xl, xh]
+            ]
+
+        # mixup elements are blended,cutmix elements paste box from flipped batch,x is modified in place
+        x_flipped = x.flip(0)
+        mixup_weight = torch.where(use_cutmix, torch.zeros_like(lam),
+                                   1. - lam).to(x.dtype).view(-1, 1, 1, 1)
+        x.lerp_(x_flipped, mixup_weight)
+
+        rows = torch.arange(img_h, device=x.device).view(1, img_h, 1)
+        cols = torch.arange(img_w, device=x.device).view(1, 1, img_w)
+        box_masks = (rows >= yl.view(-1, 1, 1)) & (rows < yh.view(
+            -1, 1, 1)) & (cols >= xl.view(-1, 1, 1)) & (cols < xh.view(
+                -1, 1, 1)) & use_cutmix.view(-1, 1, 1)
+        torch.where(box_masks.unsqueeze(1), x_flipped, x, out=x)
+
+        return lam
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.path.append(BASE_DIR)
+
+    import time
+
+    from simpleAICV.classification.common import ClassificationCollater
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    batch_size, image_size, num_classes = 32, 64, 10
+    data = [{
+        'image':
+        np.random.randn(image_size, image_size, 3).astype(np.float32),
+        'label':
+        np.random.randint(0, num_classes),
+    } for _ in range(batch_size)]
+    collater = ClassificationCollater()
+
+    # batch mode:same images and soft labels as collater with same numpy random state
+    for mixup_params in [
+        {
+            'mixup_alpha': 0.8,
+            'cutmix_alpha': 1.0,
+        },
+        {
+            'mixup_alpha': 0.,
+            'cutmix_alpha': 1.0,
+            'cutmix_minmax': [0.2, 0.8],
+        },
+        {
+            'mixup_alpha': 0.8,
+            'cutmix_alpha': 0.,
+            'mixup_cutmix_prob': 0.5,
+        },
+    ]:
+        mixup_collater = MixupCutmixClassificationCollater(
+            mode='batch', num_classes=num_classes, **mixup_params)
+        mixup_batch_transform = MixupCutmixBatchTransform(
+            mode='batch', num_classes=num_classes, **mixup_params)
+        equal_num = 0
+        for per_seed in range(20):
+            np.random.seed(per_seed)
+            collater_outputs = mixup_collater(data)
+            np.random.seed(per_seed)
+            batch = collater(data)
+            images, labels = mixup_batch_transform(
+                batch['image'].to(device), batch['label'].to(device))
+            if torch.equal(collater_outputs['image'],
+                           images.cpu()) and torch.equal(
+                               collater_outputs['label'], labels.cpu()):
+                equal_num += 1
+        print(
+            f'batch mode {mixup_params},equal with collater:{equal_num}/20')
+
+    # pair/elem mode:every sample k is constant value k,so lambda of each sample can be recovered from mixed image,
+    # and it must be same as lambda in soft label
+    constant_data = [{
+        'image': np.full((image_size, image_size, 3), i, dtype=np.float32),
+        'label': i % num_classes,
+    } for i in range(batch_size)]
+    for mode in ['pair', 'elem']:
+        lam_list = {'collater': [], 'batch transform': []}
+        max_diff = {'collater': 0., 'batch transform': 0.}
+        for per_seed in range(50):
+            mixup_collater = MixupCutmixClassificationCollater(
+                mode=mode, label_smoothing=0., num_classes=batch_size)
+            mixup_batch_transform = MixupCutmixBatchTransform(
+                mode=mode, label_smoothing=0., num_classes=batch_size)
+            np.random.seed(per_seed)
+            collater_outputs = mixup_collater([{
+                'image': per_sample['image'],
+                'label': idx,
+            } for idx, per_sample in enumerate(constant_data)])
+            batch = collater([{
+                'image': per_sample['image'],
+                'label': idx,
+            } for idx, per_sample in enumerate(constant_data)])
+            images, labels = mixup_batch_transform(
+                batch['image'].to(device), batch['label'].to(device))
+            for name, per_images, per_labels in [
+                ('collater', collater_outputs['image'],
+                 collater_outputs['label']),
+                ('batch transform', images.cpu(), labels.cpu()),
+            ]:
+                idxs = torch.arange(batch_size).float()
+                flipped_idxs = idxs.flip(0)
+                image_lam = (per_images.mean(dim=(1, 2, 3)) -
+                             flipped_idxs) / (idxs - flipped_idxs)
+                label_lam = per_labels[torch.arange(batch_size),
+                                       torch.arange(batch_size)]
+                max_diff[name] = max(
+                    max_diff[name],
+                    (image_lam - label_lam).abs().max().item())
+                lam_list[name].append(label_lam)
+        for name in ['collater', 'batch transform']:
+            per_lam = torch.cat(lam_list[name])
+            print(
+                f'{mode} mode {name},lambda mean/std:{per_lam.mean():.4f}/{per_lam.std():.4f},mixed ratio:{(per_lam < 1).float().mean():.4f},max diff between image lambda and label lambda:{max_diff[name]:.6f}'
+            )
+
+    # throughput:mixup/cutmix in collater vs after collate on device
+    batch_size, image_size = 128, 224
+    data = [{
+        'image':
+        np.random.randn(image_size, image_size, 3).astype(np.float32),
+        'label':
+        np.random.randint(0, 1000),
+    } for _ in range(batch_size)]
+    for mode in ['batch', 'elem']:
+        mixup_collater = MixupCutmixClassificationCollater(mode=mode)
+        mixup_batch_transform = MixupCutmixBatchTransform(mode=mode)
+        start_time = time.time()
+        for _ in range(5):
+            _ = mixup_collater(data)
+        collater_time = (time.time() - start_time) / 5 * 1000
+
+        batch = collater(data)
+        images_list = [batch['image'].to(device) for _ in range(5)]
+        labels = batch['label'].to(device)
+        start_time = time.time()
+        for images in images_list:
+            _ = mixup_batch_transform(images, labels)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        batch_transform_time = (time.time() - start_time) / 5 * 1000
+        start_time = time.time()
+        for _ in range(5):
+            _ = collater(data)
+        collate_time = (time.time() - start_time) / 5 * 1000
+        print(
+            f'{mode} mode,batch size:{batch_size},device:{device},mixup collater:{collater_time:.3f}ms,plain collater:{collate_time:.3f}ms + batch transform:{batch_transform_time:.3f}ms'
+        )
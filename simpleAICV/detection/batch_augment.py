@@ -0,0 +1,687 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import numpy as np
+
+import torch
+import torch.nn.functional as F
+
+
+def get_batch_max_bboxes(annots, annots_valid):
+    '''
+    annots:[B,N,5],annots_valid:[B,N]
+    max bbox of every image:[x_min of all x_min,y_min of all y_min,x_max of all x_max,y_max of all y_max],0 for image without annots
+    '''
+    inf = torch.finfo(annots.dtype).max
+    valid = annots_valid.unsqueeze(-1)
+    xymin = torch.where(valid, annots[:, :, 0:2],
+                        torch.full_like(annots[:, :, 0:2], inf)).amin(dim=1)
+    xymax = torch.where(valid, annots[:, :, 2:4],
+                        torch.full_like(annots[:, :, 2:4], -inf)).amax(dim=1)
+    max_bboxes = torch.cat([xymin, xymax], dim=1)
+    max_bboxes = torch.where(
+        annots_valid.any(dim=1, keepdim=True), max_bboxes,
+        torch.zeros_like(max_bboxes))
+
+    return max_bboxes
+
+
+def batch_valid_region_mask(images, scaled_sizes):
+    # True inside valid h,w region of every image:[B,1,H,W]
+    _, _, h, w = images.shape
+    ys = torch.arange(h, device=images.device).view(1, h, 1)
+    xs = torch.arange(w, device=images.device).view(1, 1, w)
+    valid_mask = (ys < scaled_sizes[:, 0].view(-1, 1, 1)) & (
+        xs < scaled_sizes[:, 1].view(-1, 1, 1))
+
+    return valid_mask.unsqueeze(1)
+
+
+def batch_sample_images(images, xs, ys, mode='bilinear'):
+    '''
+    sample images at pixel coords,xs:[B,W_out],ys:[B,H_out],zero outside images
+    '''
+    batch_size, _, h, w = images.shape
+    xs = (2. * xs + 1.) / w - 1.
+    ys = (2. * ys + 1.) / h - 1.
+    grid = torch.stack([
+        xs.view(batch_size, 1, -1).expand(-1, ys.shape[1], -1),
+        ys.view(batch_size, -1, 1).expand(-1, -1, xs.shape[1]),
+    ],
+                       dim=3)
+    images = F.grid_sample(images,
+                           grid.to(images.dtype),
+                           mode=mode,
+                           padding_mode='zeros',
+                           align_corners=False)
+
+    return images
+
+
+class BatchDetectionCompose:
+    '''
+    post-collate detection batch augmentation stage,apply BatchDetection* transforms on a padded images batch and padded annots
+    with per-sample random parameters on the device of images batch(call it after images.cuda() in train loop).
+    input:images:B 3 H W float images(value 0-255,not normalized) from DetectionCollater/DETRDetectionCollater,
+    every image is at top left and padded with 0;annots:B N 5 padded with -1;scaled_sizes:B 2 valid h,w of every image.
+    dataset transform should only keep a fixed DetectionResize(no multi_scale) so every image fits the collater canvas,
+    flip/crop/translate/multi scale resize/normalize are done here in same order and box semantics as per sample transforms
+    (boxes never leave image,so they are not clipped or filtered).
+    output dict:'image','annots','scaled_size',and DETR targets 'mask'(True on padding) and 'scaled_annots'(x_center,y_center,w,h
+    normalized by valid image size).
+    '''
+
+    def __init__(self, transform_list):
+        self.transform_list = transform_list
+
+    def __call__(self, images, annots, scaled_sizes):
+        # transforms are out of place,inputs are not modified
+        sample = {
+            'image': images.float(),
+            'annots': annots.float(),
+            'scaled_size': scaled_sizes.to(images.device).float(),
+        }
+
+        for per_transform in self.transform_list:
+            sample = per_transform(sample)
+
+        sample['image'] = sample['image'].contiguous()
+        sample['mask'] = ~batch_valid_region_mask(sample['image'],
+                                                  sample['scaled_size'])[:, 0]
+        sample['scaled_annots'] = self.get_scaled_annots(
+            sample['annots'], sample['scaled_size'])
+
+        return sample
+
+    def get_scaled_annots(self, annots, scaled_sizes):
+        # same as DETRDetectionCollater scaled_annots
+        annots_valid = (annots[:, :, 4] >= 0).unsqueeze(-1)
+        per_image_size = torch.stack([
+            scaled_sizes[:, 1], scaled_sizes[:, 0], scaled_sizes[:, 1],
+            scaled_sizes[:, 0]
+        ],
+                                     dim=1).unsqueeze(1)
+        annots_center = (annots[:, :, 0:2] + annots[:, :, 2:4]) / 2
+        annots_wh = annots[:, :, 2:4] - annots[:, :, 0:2]
+        annots_cxcywh = torch.cat([annots_center, annots_wh],
+                                  dim=2) / per_image_size
+        scaled_annots = torch.cat([annots_cxcywh, annots[:, :, 4:5]], dim=2)
+        scaled_annots = torch.where(annots_valid, scaled_annots,
+                                    -torch.ones_like(scaled_annots))
+
+        return scaled_annots
+
+
+class BatchDetectionRandomHorizontalFlip:
+    '''
+    batch version of RandomHorizontalFlip,images without annots are not flipped.
+    '''
+
+    def __init__(self, prob=0.5):
+        self.prob = prob
+
+    def get_params(self, sample):
+        annots = sample['annots']
+        # uniforms:[B,1],same order as np.random.uniform calls in RandomHorizontalFlip
+        uniforms = torch.rand((annots.shape[0], 1),
+                              dtype=torch.float64,
+                              device=annots.device)
+        flip_flag = (uniforms[:, 0] < self.prob) & (annots[:, :, 4] >=
+                                                    0).any(dim=1)
+
+        return {
+            'uniforms': uniforms,
+            'flip_flag': flip_flag,
+        }
+
+    def __call__(self, sample):
+        return self.apply(sample, self.get_params(sample))
+
+    def apply(self, sample, params):
+        images, annots, scaled_sizes = sample['image'], sample[
+            'annots'], sample['scaled_size']
+        flip_flag = params['flip_flag']
+
+        # only flipped samples are gathered and copied back
+        flip_idxs = torch.nonzero(flip_flag).view(-1)
+        if flip_idxs.shape[0] > 0:
+            w = scaled_sizes[flip_idxs, 1].long().view(-1, 1)
+            xs = torch.arange(images.shape[3],
+                              device=images.device).view(1, -1)
+            src_xs = torch.where(xs < w, w - 1 - xs, xs)
+            flip_images = torch.gather(
+                images[flip_idxs], 3,
+                src_xs.view(-1, 1, 1, images.shape[3]).expand(
+                    -1, images.shape[1], images.shape[2], -1))
+            images = images.index_copy(0, flip_idxs, flip_images)
+
+        flip_annots_flag = flip_flag.view(-1, 1) & (annots[:, :, 4] >= 0)
+        w = scaled_sizes[:, 1].view(-1, 1)
+        x1 = torch.where(flip_annots_flag, w - annots[:, :, 2], annots[:, :,
+                                                                       0])
+        x2 = torch.where(flip_annots_flag, w - annots[:, :, 0], annots[:, :,
+                                                                       2])
+        annots = torch.stack(
+            [x1, annots[:, :, 1], x2, annots[:, :, 3], annots[:, :, 4]],
+            dim=2)
+
+        sample['image'], sample['annots'] = images, annots
+
+        return sample
+
+
+class BatchDetectionRandomCrop:
+    '''
+    batch version of RandomCrop,crop box keeps all annots,cropped image is moved to top left and padded with 0.
+    '''
+
+    def __init__(self, prob=0.5):
+        self.prob = prob
+
+    def get_params(self, sample):
+        annots, scaled_sizes = sample['annots'], sample['scaled_size']
+        annots_valid = annots[:, :, 4] >= 0
+        # uniforms:[B,5],same order as np.random.uniform calls in RandomCrop
+        uniforms = torch.rand((annots.shape[0], 5),
+                              dtype=torch.float64,
+                              device=annots.device)
+        crop_flag = (uniforms[:, 0] < self.prob) & annots_valid.any(dim=1)
+
+        h, w = scaled_sizes[:, 0], scaled_sizes[:, 1]
+        # same float32 max translate as RandomCrop,uniform sampling in float64 as numpy
+        max_bboxes = get_batch_max_bboxes(annots, annots_valid)
+        max_left_trans, max_up_trans = max_bboxes[:, 0], max_bboxes[:, 1]
+        max_right_trans, max_down_trans = w - max_bboxes[:, 2], h - max_bboxes[:, 3]
+        max_bboxes = max_bboxes.double()
+        crop_xmin = torch.clamp(torch.trunc(
+            max_bboxes[:, 0] - uniforms[:, 1] * max_left_trans.double()),
+                                min=0)
+        crop_ymin = torch.clamp(torch.trunc(
+            max_bboxes[:, 1] - uniforms[:, 2] * max_up_trans.double()),
+                                min=0)
+        crop_xmax = torch.min(
+            w.double(),
+            torch.trunc(max_bboxes[:, 2] +
+                        uniforms[:, 3] * max_right_trans.double()))
+        crop_ymax = torch.min(
+            h.double(),
+            torch.trunc(max_bboxes[:, 3] +
+                        uniforms[:, 4] * max_down_trans.double()))
+
+        # crop box:[B,4],x_min,y_min,x_max,y_max,whole image if not crop
+        crop_boxes = torch.stack([crop_xmin, crop_ymin, crop_xmax, crop_ymax],
+                                 dim=1).long()
+        whole_boxes = torch.stack([
+            torch.zeros_like(w),
+            torch.zeros_like(h),
+            w,
+            h,
+        ],
+                                  dim=1).long()
+        crop_boxes = torch.where(crop_flag.view(-1, 1), crop_boxes,
+                                 whole_boxes)
+
+        return {
+            'uniforms': uniforms,
+            'crop_flag': crop_flag,
+            'crop_boxes': crop_boxes,
+        }
+
+    def __call__(self, sample):
+        return self.apply(sample, self.get_params(sample))
+
+    def apply(self, sample, params):
+        images, annots = sample['image'], sample['annots']
+        crop_boxes = params['crop_boxes']
+        batch_size, channels, h, w = images.shape
+
+        scaled_sizes = torch.stack([
+            crop_boxes[:, 3] - crop_boxes[:, 1],
+            crop_boxes[:, 2] - crop_boxes[:, 0]
+        ],
+                                   dim=1).float()
+
+        # only cropped samples are shifted by one flat gather,out[y,x]=in[y+crop_ymin,x+crop_xmin],0 outside crop box
+        crop_idxs = torch.nonzero(params['crop_flag']).view(-1)
+        if crop_idxs.shape[0] > 0:
+            crop_xymin = crop_boxes[crop_idxs, 0:2]
+            xs = torch.arange(w, device=images.device).view(1, 1, -1)
+            ys = torch.arange(h, device=images.device).view(1, -1, 1)
+            src_idxs = torch.clamp(
+                ys + crop_xymin[:, 1].view(-1, 1, 1), max=h - 1) * w + torch.clamp(
+                    xs + crop_xymin[:, 0].view(-1, 1, 1), max=w - 1)
+            crop_images = torch.gather(
+                images[crop_idxs].view(-1, channels, h * w), 2,
+                src_idxs.view(-1, 1, h * w).expand(-1, channels,
+                                                   -1)).view(-1, channels, h, w)
+            crop_images = crop_images * batch_valid_region_mask(
+                crop_images, scaled_sizes[crop_idxs])
+            images = images.index_copy(0, crop_idxs, crop_images)
+
+        crop_annots_flag = (params['crop_flag'].view(-1, 1) &
+                            (annots[:, :, 4] >= 0)).unsqueeze(-1)
+        crop_xymin = crop_boxes[:, 0:2].float().repeat(1, 2).unsqueeze(1)
+        annots = torch.cat([
+            torch.where(crop_annots_flag, annots[:, :, 0:4] - crop_xymin,
+                        annots[:, :, 0:4]), annots[:, :, 4:5]
+        ],
+                           dim=2)
+
+        sample['image'], sample['annots'], sample[
+            'scaled_size'] = images, annots, scaled_sizes
+
+        return sample
+
+
+class BatchDetectionRandomTranslate:
+    '''
+    batch version of RandomTranslate,bilinear translate of all samples is done by a single grid_sample.
+    '''
+
+    def __init__(self, prob=0.5):
+        self.prob = prob
+
+    def get_params(self, sample):
+        annots, scaled_sizes = sample['annots'], sample['scaled_size']
+        annots_valid = annots[:, :, 4] >= 0
+        # uniforms:[B,3],same order as np.random.uniform calls in RandomTranslate
+        uniforms = torch.rand((annots.shape[0], 3),
+                              dtype=torch.float64,
+                              device=annots.device)
+        translate_flag = (uniforms[:, 0] < self.prob) & annots_valid.any(dim=1)
+
+        h, w = scaled_sizes[:, 0], scaled_sizes[:, 1]
+        max_bboxes = get_batch_max_bboxes(annots, annots_valid)
+        max_left_trans, max_up_trans = max_bboxes[:, 0], max_bboxes[:, 1]
+        max_right_trans, max_down_trans = w - max_bboxes[:, 2], h - max_bboxes[:, 3]
+        tx_low, tx_high = (-(max_left_trans - 1)).double(), (max_right_trans -
+                                                             1).double()
+        ty_low, ty_high = (-(max_up_trans - 1)).double(), (max_down_trans -
+                                                           1).double()
+        tx = tx_low + (tx_high - tx_low) * uniforms[:, 1]
+        ty = ty_low + (ty_high - ty_low) * uniforms[:, 2]
+        tx = torch.where(translate_flag, tx, torch.zeros_like(tx))
+        ty = torch.where(translate_flag, ty, torch.zeros_like(ty))
+
+        return {
+            'uniforms': uniforms,
+            'translate_flag': translate_flag,
+            'tx': tx,
+            'ty': ty,
+        }
+
+    def __call__(self, sample):
+        return self.apply(sample, self.get_params(sample))
+
+    def apply(self, sample, params):
+        images, annots, scaled_sizes = sample['image'], sample[
+            'annots'], sample['scaled_size']
+        translate_flag, tx, ty = params['translate_flag'], params[
+            'tx'], params['ty']
+
+        # only translated samples are sampled and copied back
+        translate_idxs = torch.nonzero(translate_flag).view(-1)
+        if translate_idxs.shape[0] > 0:
+            _, _, h, w = images.shape
+            # same as cv2.warpAffine with [[1,0,tx],[0,1,ty]],out[y,x]=in[y-ty,x-tx],0 outside image
+            xs = torch.arange(w, device=images.device,
+                              dtype=torch.float64).view(
+                                  1, -1) - tx[translate_idxs].view(-1, 1)
+            ys = torch.arange(h, device=images.device,
+                              dtype=torch.float64).view(
+                                  1, -1) - ty[translate_idxs].view(-1, 1)
+            translate_images = batch_sample_images(images[translate_idxs], xs,
+                                                   ys)
+            translate_images = translate_images * batch_valid_region_mask(
+                translate_images, scaled_sizes[translate_idxs])
+            images = images.index_copy(0, translate_idxs, translate_images)
+
+        translate_annots_flag = (translate_flag.view(-1, 1) &
+                                 (annots[:, :, 4] >= 0)).unsqueeze(-1)
+        txty = torch.stack([tx, ty, tx, ty], dim=1).float().unsqueeze(1)
+        annots = torch.cat([
+            torch.where(translate_annots_flag, annots[:, :, 0:4] + txty,
+                        annots[:, :, 0:4]), annots[:, :, 4:5]
+        ],
+                           dim=2)
+
+        sample['image'], sample['annots'] = images, annots
+
+        return sample
+
+
+class BatchDetectionResize:
+    '''
+    batch version of DetectionResize,resize factor of every sample is computed from its valid size,
+    multi scale resize is sampled per sample,bilinear resize of all samples is done by a single grid_sample.
+    resized images must fit the collater canvas,so resize/resize_type must be same as collater.
+    '''
+
+    def __init__(self,
+                 resize=800,
+                 stride=32,
+                 resize_type='retina_style',
+                 multi_scale=False,
+                 multi_scale_range=[0.8, 1.0]):
+        assert resize_type in ['retina_style', 'yolo_style']
+
+        self.resize = resize
+        self.stride = stride
+        self.multi_scale = multi_scale
+        self.multi_scale_range = multi_scale_range
+        self.resize_type = resize_type
+
+        self.ratio = 1333. / 800
+
+        assert 0.0 < self.multi_scale_range[0] <= 1.0
+        assert 0.0 < self.multi_scale_range[1] <= 1.0
+        assert self.multi_scale_range[0] <= self.multi_scale_range[1]
+
+        # same resize list as DetectionResize
+        scale_range = [
+            int(self.multi_scale_range[0] * self.resize),
+            int(self.multi_scale_range[1] * self.resize)
+        ]
+        resize_list = [
+            i // self.stride * self.stride
+            for i in range(scale_range[0], scale_range[1] + self.stride)
+        ]
+        self.resize_list = list(set(resize_list))
+
+    def get_params(self, sample):
+        scaled_sizes = sample['scaled_size']
+        device = scaled_sizes.device
+        batch_size = scaled_sizes.shape[0]
+        h, w = scaled_sizes[:, 0].double(), scaled_sizes[:, 1].double()
+
+        if self.multi_scale:
+            random_idxs = torch.randint(0,
+                                        len(self.resize_list), (batch_size, ),
+                                        device=device)
+            final_resizes = torch.tensor(self.resize_list,
+                                         dtype=torch.float64,
+                                         device=device)[random_idxs]
+        else:
+            random_idxs = None
+            final_resizes = torch.full((batch_size, ),
+                                       float(self.resize),
+                                       dtype=torch.float64,
+                                       device=device)
+
+        if self.resize_type == 'retina_style':
+            scales_short = torch.full_like(
+                final_resizes, float(int(round(self.resize * self.ratio))))
+            max_long_edge = torch.max(final_resizes, scales_short)
+            max_short_edge = torch.min(final_resizes, scales_short)
+            factors = torch.min(max_long_edge / torch.max(h, w),
+                                max_short_edge / torch.min(h, w))
+        else:
+            factors = final_resizes / torch.max(h, w)
+
+        return {
+            'random_idxs': random_idxs,
+            'factors': factors,
+        }
+
+    def __call__(self, sample):
+        return self.apply(sample, self.get_params(sample))
+
+    def apply(self, sample, params):
+        images, annots, scaled_sizes = sample['image'], sample[
+            'annots'], sample['scaled_size']
+        factors = params['factors']
+        _, _, h, w = images.shape
+
+        resize_h = torch.round(scaled_sizes[:, 0].double() * factors)
+        resize_w = torch.round(scaled_sizes[:, 1].double() * factors)
+        assert resize_h.max() <= h and resize_w.max(
+        ) <= w, 'resized images must fit collater canvas!'
+
+        # same as cv2.resize INTER_LINEAR:src=(dst+0.5)*src_size/dst_size-0.5,clamped inside valid image
+        src_h, src_w = scaled_sizes[:, 0].double(), scaled_sizes[:,
+                                                                  1].double()
+        xs = (torch.arange(w, device=images.device, dtype=torch.float64).view(
+            1, -1) + 0.5) * (src_w / resize_w).view(-1, 1) - 0.5
+        xs = torch.max(torch.min(xs, (src_w - 1).view(-1, 1)),
+                       torch.zeros_like(xs))
+        ys = (torch.arange(h, device=images.device, dtype=torch.float64).view(
+            1, -1) + 0.5) * (src_h / resize_h).view(-1, 1) - 0.5
+        ys = torch.max(torch.min(ys, (src_h - 1).view(-1, 1)),
+                       torch.zeros_like(ys))
+        scaled_sizes = torch.stack([resize_h, resize_w], dim=1).float()
+        images = batch_sample_images(images, xs, ys)
+        images = images * batch_valid_region_mask(images, scaled_sizes)
+
+        resize_annots_flag = (annots[:, :, 4] >= 0).unsqueeze(-1)
+        annots = torch.cat([
+            torch.where(resize_annots_flag,
+                        annots[:, :, 0:4] * factors.float().view(-1, 1, 1),
+                        annots[:, :, 0:4]), annots[:, :, 4:5]
+        ],
+                           dim=2)
+
+        sample['image'], sample['annots'], sample[
+            'scaled_size'] = images, annots, scaled_sizes
+
+        return sample
+
+
+class BatchDetectionNormalize:
+
+    def __init__(self):
+        pass
+
+    def __call__(self, sample):
+        sample['image'] = sample['image'] / 255.
+
+        return sample
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.path.append(BASE_DIR)
+
+    import copy
+    import time
+
+    from simpleAICV.detection.common import DetectionResize, RandomHorizontalFlip, RandomCrop, RandomTranslate, Normalize, DetectionCollater, DETRDetectionCollater
+
+    class ReplayRandom:
+        # replay batch transform uniforms/random idxs for np.random calls in per sample transforms
+        def __init__(self, uniforms, randints):
+            self.uniforms = list(uniforms)
+            self.randints = list(randints)
+
+        def uniform(self, low=0.0, high=1.0):
+            return low + (high - low) * self.uniforms.pop(0)
+
+        def randint(self, low, high=None):
+            return self.randints.pop(0)
+
+    resize, batch_size = 640, 8
+    pre_resize = DetectionResize(resize=resize,
+                                 stride=32,
+                                 resize_type='yolo_style',
+                                 multi_scale=False)
+    samples = []
+    for i in range(batch_size):
+        h, w = np.random.randint(300, 900), np.random.randint(300, 900)
+        image = np.random.uniform(0, 255, (h, w, 3)).astype(np.float32)
+        object_num = 0 if i == batch_size - 1 else np.random.randint(1, 20)
+        wh = np.random.uniform(8, min(h, w) / 2, (object_num, 2))
+        x1y1 = np.random.uniform(0, 1, (object_num, 2)) * ([w, h] - wh)
+        annots = np.concatenate(
+            [x1y1, x1y1 + wh,
+             np.random.randint(0, 80, (object_num, 1))],
+            axis=1).astype(np.float32)
+        samples.append(
+            pre_resize({
+                'image': image,
+                'annots': annots,
+                'scale': np.array(1.).astype(np.float32),
+                'size': np.array([h, w]).astype(np.float32),
+            }))
+
+    batch_transform = BatchDetectionCompose([
+        BatchDetectionRandomHorizontalFlip(prob=0.5),
+        BatchDetectionRandomCrop(prob=0.5),
+        BatchDetectionRandomTranslate(prob=0.5),
+        BatchDetectionResize(resize=resize,
+                             stride=32,
+                             resize_type='yolo_style',
+                             multi_scale=True,
+                             multi_scale_range=[0.8, 1.0]),
+        BatchDetectionNormalize(),
+    ])
+
+    for collater in [
+            DetectionCollater(resize=resize,
+                              resize_type='yolo_style',
+                              max_annots_num=100),
+            DETRDetectionCollater(resize=resize,
+                                  resize_type='yolo_style',
+                                  max_annots_num=100)
+    ]:
+        data = collater(copy.deepcopy(samples))
+        images, annots, scaled_sizes = data['image'], data['annots'], torch.from_numpy(
+            data['scaled_size'])
+
+        # run batch transforms step by step and keep params for replay
+        sample = {
+            'image': images.float().clone(),
+            'annots': annots.float().clone(),
+            'scaled_size': scaled_sizes.float().clone(),
+        }
+        all_params = []
+        for per_transform in batch_transform.transform_list[0:4]:
+            params = per_transform.get_params(sample)
+            sample = per_transform.apply(sample, params)
+            all_params.append(params)
+        sample = batch_transform.transform_list[4](sample)
+
+        # per sample transforms with same random values
+        per_sample_transforms = [
+            RandomHorizontalFlip(prob=0.5),
+            RandomCrop(prob=0.5),
+            RandomTranslate(prob=0.5),
+            DetectionResize(resize=resize,
+                            stride=32,
+                            resize_type='yolo_style',
+                            multi_scale=True,
+                            multi_scale_range=[0.8, 1.0]),
+            Normalize(),
+        ]
+        max_box_diff, max_size_diff, image_diffs = 0., 0., []
+        np_random_uniform, np_random_randint = np.random.uniform, np.random.randint
+        for i in range(batch_size):
+            per_sample = copy.deepcopy(samples[i])
+            has_annots = per_sample['annots'].shape[0] > 0
+            flip_params, crop_params, translate_params, resize_params = all_params
+            uniforms = []
+            if has_annots:
+                uniforms += flip_params['uniforms'][i, 0:1].tolist()
+                uniforms += crop_params['uniforms'][i, 0:1].tolist()
+                if crop_params['crop_flag'][i]:
+                    uniforms += crop_params['uniforms'][i, 1:5].tolist()
+                uniforms += translate_params['uniforms'][i, 0:1].tolist()
+                if translate_params['translate_flag'][i]:
+                    uniforms += translate_params['uniforms'][i, 1:3].tolist()
+            replay = ReplayRandom(uniforms,
+                                  [int(resize_params['random_idxs'][i])])
+            np.random.uniform, np.random.randint = replay.uniform, replay.randint
+            for per_transform in per_sample_transforms:
+                per_sample = per_transform(per_sample)
+            np.random.uniform, np.random.randint = np_random_uniform, np_random_randint
+
+            object_num = per_sample['annots'].shape[0]
+            if object_num > 0:
+                max_box_diff = max(
+                    max_box_diff,
+                    np.abs(sample['annots'][i, 0:object_num].numpy() -
+                           per_sample['annots']).max())
+            assert (sample['annots'][i, object_num:] == -1).all()
+            image_h, image_w = per_sample['image'].shape[0:2]
+            max_size_diff = max(
+                max_size_diff,
+                np.abs(sample['scaled_size'][i].numpy() -
+                       np.array([image_h, image_w])).max())
+            image_diffs.append(
+                np.abs(sample['image'][i, :, 0:image_h, 0:image_w].permute(
+                    1, 2, 0).numpy() - per_sample['image']).mean())
+
+        flip_params, crop_params, translate_params, _ = all_params
+        print('1111', collater.__class__.__name__, 'flip/crop/translate num:', [
+            flip_params['flip_flag'].sum().item(),
+            crop_params['crop_flag'].sum().item(),
+            translate_params['translate_flag'].sum().item()
+        ], 'box max diff:',
+              max_box_diff, 'size max diff:', max_size_diff,
+              'image mean abs diff:', np.mean(image_diffs))
+        # boxes are float32 on both paths,measured max diff is about 3e-5
+        assert max_box_diff < 1e-3, f'box max diff {max_box_diff} too large!'
+        assert max_size_diff == 0, f'size max diff {max_size_diff} is not 0!'
+        assert np.mean(
+            image_diffs
+        ) < 1e-3, f'image mean abs diff {np.mean(image_diffs)} too large!'
+
+    outs = batch_transform(images, annots, scaled_sizes)
+    print('2222', outs['image'].shape, outs['annots'].shape,
+          outs['mask'].shape, outs['scaled_annots'].shape,
+          outs['scaled_size'][0:2])
+
+    # per batch time,per sample numpy transforms+collater vs collater+batch transforms
+    per_sample_transforms = [
+        RandomHorizontalFlip(prob=0.5),
+        RandomCrop(prob=0.5),
+        RandomTranslate(prob=0.5),
+        DetectionResize(resize=resize,
+                        stride=32,
+                        resize_type='yolo_style',
+                        multi_scale=True,
+                        multi_scale_range=[0.8, 1.0]),
+        Normalize(),
+    ]
+    collater = DetectionCollater(resize=resize,
+                                 resize_type='yolo_style',
+                                 max_annots_num=100)
+    repeat_num = 3
+    start_time = time.time()
+    for _ in range(repeat_num):
+        per_batch_samples = []
+        for per_sample in copy.deepcopy(samples):
+            for per_transform in per_sample_transforms:
+                per_sample = per_transform(per_sample)
+            per_batch_samples.append(per_sample)
+        collater(per_batch_samples)
+    per_sample_time = (time.time() - start_time) / repeat_num
+    start_time = time.time()
+    for _ in range(repeat_num):
+        data = collater(copy.deepcopy(samples))
+        batch_transform(data['image'], data['annots'],
+                        torch.from_numpy(data['scaled_size']))
+    batch_time = (time.time() - start_time) / repeat_num
+    print('3333', f'per sample:{per_sample_time*1000:.2f}ms',
+          f'batch:{batch_time*1000:.2f}ms')
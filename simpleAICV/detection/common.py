@@ -11,6 +11,7 @@ import numpy as np
 import torch
 
 from simpleAICV.classification.common import load_state_dict
+from simpleAICV.detection.batch_augment import BatchDetectionCompose, BatchDetectionRandomHorizontalFlip, BatchDetectionRandomCrop, BatchDetectionRandomTranslate, BatchDetectionResize, BatchDetectionNormalize
 
 
 class DetectionResize:
@@ -35,6 +36,21 @@ class DetectionResize:
         assert 0.0 < self.multi_scale_range[1] <= 1.0
         assert self.multi_scale_range[0] <= self.multi_scale_range[1]
 
+    def get_reduced_decode_factor(self, image_h, image_w):
+        # use largest possible resize so image is never decoded smaller than resized image
+        max_resize = int(self.multi_scale_range[1] * self.resize
+                         ) + self.stride if self.multi_scale else self.resize
+
+        if self.resize_type == 'retina_style':
+            scales = (max_resize, int(round(self.resize * self.ratio)))
+            max_long_edge, max_short_edge = max(scales), min(scales)
+            factor = min(max_long_edge / max(image_h, image_w),
+                         max_short_edge / min(image_h, image_w))
+        else:
+            factor = max_resize / max(image_h, image_w)
+
+        return 1. / factor
+
     def __call__(self, sample):
         '''
         sample must be a dict,contains 'image'、'annots'、'scale' keys.
@@ -260,8 +276,11 @@ class DetectionCollater:
 
         input_images = np.zeros((len(images), self.resize, self.resize, 3),
                                 dtype=np.float32)
+        # valid h,w of every image in padded images,for post-collate batch transforms
+        scaled_sizes = []
         for i, image in enumerate(images):
             input_images[i, 0:image.shape[0], 0:image.shape[1], :] = image
+            scaled_sizes.append([image.shape[0], image.shape[1]])
         input_images = torch.from_numpy(input_images)
         # B H W 3 ->B 3 H W
         input_images = input_images.permute(0, 3, 1, 2)
@@ -276,12 +295,14 @@ class DetectionCollater:
 
         scales = np.array(scales, dtype=np.float32)
         sizes = np.array(sizes, dtype=np.float32)
+        scaled_sizes = np.array(scaled_sizes, dtype=np.float32)
 
         return {
             'image': input_images,
             'annots': input_annots,
             'scale': scales,
             'size': sizes,
+            'scaled_size': scaled_sizes,
         }
 
 
@@ -305,8 +326,11 @@ class BatchAlignDetectionCollater:
 
         input_images = np.zeros((len(images), max_h + pad_h, max_w + pad_w, 3),
                                 dtype=np.float32)
+        # valid h,w of every image in padded images,for post-collate batch transforms
+        scaled_sizes = []
         for i, image in enumerate(images):
             input_images[i, 0:image.shape[0], 0:image.shape[1], :] = image
+            scaled_sizes.append([image.shape[0], image.shape[1]])
         input_images = torch.from_numpy(input_images)
         # B H W 3 ->B 3 H W
         input_images = input_images.permute(0, 3, 1, 2)
@@ -321,12 +345,14 @@ class BatchAlignDetectionCollater:
 
         scales = np.array(scales, dtype=np.float32)
         sizes = np.array(sizes, dtype=np.float32)
+        scaled_sizes = np.array(scaled_sizes, dtype=np.float32)
 
         return {
             'image': input_images,
             'annots': input_annots,
             'scale': scales,
             'size': sizes,
+            'scaled_size': scaled_sizes,
         }
 
 
@@ -0,0 +1,442 @@
+import os
+import json
+import numpy as np
+
+from multiprocessing import Pool
+from tqdm import tqdm
+from pycocotools import mask as mask_utils
+
+from simpleAICV.cache_dir import get_temp_cache_dir, replace_cache_dir, build_cache_dir_if_stale
+
+# every array is saved as a single .npy file and loaded by mmap,so all dataloader workers share same pages
+# and no per image/per annotation python object is created.
+# image table(one row per image,same order as COCO.getImgIds()):
+#   image_id:coco image id
+#   image_h/image_w:image size in json
+#   image_file_name_blob/image_file_name_offset:utf-8 bytes of image file names
+#   image_annot_offset:annots of image i are annot rows image_annot_offset[i]:image_annot_offset[i+1]
+# annot table(one row per annotation,grouped by image,same order as COCO.getAnnIds(imgIds=image_id)):
+#   annot_image_row:image row of annot
+#   annot_id/annot_category_id/annot_area/annot_iscrowd:values in json
+#   annot_ignore:1 if annot has 'ignore' key
+#   annot_bbox:[x_min, y_min, w, h] bbox in json
+#   annot_rle_offset:annot compressed rle counts bytes are rle_blob[annot_rle_offset[i]:annot_rle_offset[i+1]],
+#   polygon and uncompressed rle segmentations are converted to compressed rle same as COCO.annToRLE,
+#   annot without segmentation has empty rle counts
+# rle_blob:compressed rle counts bytes of all annots
+coco_annotation_store_array_name_list = [
+    'image_id',
+    'image_h',
+    'image_w',
+    'image_file_name_blob',
+    'image_file_name_offset',
+    'image_annot_offset',
+    'annot_image_row',
+    'annot_id',
+    'annot_category_id',
+    'annot_area',
+    'annot_iscrowd',
+    'annot_ignore',
+    'annot_bbox',
+    'annot_rle_offset',
+]
+
+
+def get_annotation_file_fingerprint(annot_path):
+    '''
+    fingerprint changes when annotation json file is replaced or modified
+    '''
+    annot_stat = os.stat(annot_path)
+    fingerprint = f'{annot_stat.st_size}_{annot_stat.st_mtime_ns}'
+
+    return fingerprint
+
+
+def get_coco_annotation_store_dir(store_dir, annot_path):
+    annot_name = os.path.splitext(os.path.basename(annot_path))[0]
+
+    return os.path.join(store_dir, annot_name)
+
+
+def convert_segmentation_to_rle_counts(args):
+    segmentation_list, image_h_list, image_w_list = args
+
+    rle_counts_list = []
+    for segmentation, image_h, image_w in zip(segmentation_list, image_h_list,
+                                              image_w_list):
+        if segmentation is None or len(segmentation) == 0:
+            rle_counts_list.append(b'')
+            continue
+
+        # same as pycocotools COCO.annToRLE
+        if isinstance(segmentation, list):
+            rle = mask_utils.merge(
+                mask_utils.frPyObjects(segmentation, image_h, image_w))
+        elif isinstance(segmentation['counts'], list):
+            rle = mask_utils.frPyObjects(segmentation, image_h, image_w)
+        else:
+            rle = segmentation
+
+        rle_counts = rle['counts']
+        if isinstance(rle_counts, str):
+            rle_counts = rle_counts.encode('utf-8')
+        rle_counts_list.append(rle_counts)
+
+    return rle_counts_list
+
+
+def build_coco_annotation_store(annot_path,
+                                store_dir,
+                                num_processes=16,
+                                chunk_size=10000):
+    '''
+    parse COCO style annotation json once and save image table/annot table/rle blob.
+    polygon to rle conversion is run in num_processes processes.
+    store is written to a temporary dir then renamed,so a half-written store is never loaded.
+    call it by build_coco_annotation_store_if_stale when several processes may build same store.
+    '''
+    fingerprint = get_annotation_file_fingerprint(annot_path)
+
+    with open(annot_path, 'r') as f:
+        annot_json_data = json.load(f)
+
+    images = annot_json_data['images']
+    annots = annot_json_data.get('annotations', [])
+    categories = annot_json_data.get('categories', [])
+
+    # same image order as pycocotools COCO.imgs dict
+    image_id_to_image = {}
+    for per_image in images:
+        image_id_to_image[per_image['id']] = per_image
+    images = list(image_id_to_image.values())
+    image_id_to_row = {
+        per_image['id']: image_row
+        for image_row, per_image in enumerate(images)
+    }
+
+    image_h = np.array([per_image['height'] for per_image in images],
+                       dtype=np.int32)
+    image_w = np.array([per_image['width'] for per_image in images],
+                       dtype=np.int32)
+
+    # stable sort keeps annotation order of each image same as COCO.getAnnIds
+    annot_image_row = np.array(
+        [image_id_to_row[per_annot['image_id']] for per_annot in annots],
+        dtype=np.int32)
+    annot_order = np.argsort(annot_image_row, kind='stable')
+    annots = [annots[i] for i in annot_order]
+    annot_image_row = annot_image_row[annot_order]
+
+    image_annot_offset = np.zeros(len(images) + 1, dtype=np.int64)
+    image_annot_offset[1:] = np.cumsum(
+        np.bincount(annot_image_row, minlength=len(images)))
+
+    image_file_name_bytes_list = [
+        per_image['file_name'].encode('utf-8') for per_image in images
+    ]
+    image_file_name_offset = np.zeros(len(images) + 1, dtype=np.int64)
+    image_file_name_offset[1:] = np.cumsum([
+        len(per_image_file_name)
+        for per_image_file_name in image_file_name_bytes_list
+    ])
+
+    per_store_dir = get_coco_annotation_store_dir(store_dir, annot_path)
+    temp_store_dir = get_temp_cache_dir(per_store_dir)
+    os.makedirs(temp_store_dir) if not os.path.exists(temp_store_dir) else None
+
+    annot_h_list = image_h[annot_image_row].tolist()
+    annot_w_list = image_w[annot_image_row].tolist()
+    chunk_list = [([
+        per_annot.get('segmentation', None)
+        for per_annot in annots[i:i + chunk_size]
+    ], annot_h_list[i:i + chunk_size], annot_w_list[i:i + chunk_size])
+                  for i in range(0, len(annots), chunk_size)]
+
+    rle_length_list = []
+    with open(os.path.join(temp_store_dir, 'rle_blob.bin'),
+              'wb') as rle_blob_f, Pool(processes=num_processes) as pool:
+        for per_rle_counts_list in tqdm(pool.imap(
+                convert_segmentation_to_rle_counts, chunk_list),
+                                        total=len(chunk_list)):
+            for per_rle_counts in per_rle_counts_list:
+                rle_blob_f.write(per_rle_counts)
+                rle_length_list.append(len(per_rle_counts))
+
+    annot_rle_offset = np.zeros(len(annots) + 1, dtype=np.int64)
+    annot_rle_offset[1:] = np.cumsum(rle_length_list)
+
+    coco_annotation_store = {
+        'image_id':
+        np.array([per_image['id'] for per_image in images], dtype=np.int64),
+        'image_h':
+        image_h,
+        'image_w':
+        image_w,
+        'image_file_name_blob':
+        np.frombuffer(b''.join(image_file_name_bytes_list), dtype=np.uint8),
+        'image_file_name_offset':
+        image_file_name_offset,
+        'image_annot_offset':
+        image_annot_offset,
+        'annot_image_row':
+        annot_image_row,
+        'annot_id':
+        np.array([per_annot['id'] for per_annot in annots], dtype=np.int64),
+        'annot_category_id':
+        np.array([per_annot['category_id'] for per_annot in annots],
+                 dtype=np.int64),
+        'annot_area':
+        np.array([per_annot.get('area', 0) for per_annot in annots],
+                 dtype=np.float64),
+        'annot_iscrowd':
+        np.array([per_annot.get('iscrowd', 0) for per_annot in annots],
+                 dtype=np.uint8),
+        'annot_ignore':
+        np.array([1 if 'ignore' in per_annot.keys() else 0
+                  for per_annot in annots],
+                 dtype=np.uint8),
+        'annot_bbox':
+        np.array([per_annot['bbox'] for per_annot in annots],
+                 dtype=np.float64).reshape(-1, 4),
+        'annot_rle_offset':
+        annot_rle_offset,
+    }
+    for per_array_name in coco_annotation_store_array_name_list:
+        np.save(os.path.join(temp_store_dir, f'{per_array_name}.npy'),
+                coco_annotation_store[per_array_name])
+
+    with open(os.path.join(temp_store_dir, 'meta.json'), 'w') as f:
+        json.dump(
+            {
+                'annot_path': annot_path,
+                'fingerprint': fingerprint,
+                'categories': categories,
+                'image_num': len(images),
+                'annot_num': len(annots),
+            }, f)
+
+    replace_cache_dir(temp_store_dir, per_store_dir)
+
+    print(
+        f'Build COCO Annotation Store:{per_store_dir}, Image Num:{len(images)}, Annot Num:{len(annots)}'
+    )
+
+    return per_store_dir
+
+
+def is_coco_annotation_store_stale(annot_path, store_dir):
+    meta_path = os.path.join(
+        get_coco_annotation_store_dir(store_dir, annot_path), 'meta.json')
+    if not os.path.exists(meta_path):
+        return True
+
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+
+    return meta['fingerprint'] != get_annotation_file_fingerprint(annot_path)
+
+
+def build_coco_annotation_store_if_stale(annot_path,
+                                         store_dir,
+                                         num_processes=16):
+    # check and build under file lock,see build_cache_dir_if_stale
+    return build_cache_dir_if_stale(
+        get_coco_annotation_store_dir(store_dir, annot_path),
+        lambda: is_coco_annotation_store_stale(annot_path, store_dir),
+        lambda: build_coco_annotation_store(
+            annot_path, store_dir, num_processes=num_processes))
+
+
+class CocoAnnotationStore:
+    '''
+    mmap loaded COCO image/annot tables and rle blob store,built by build_coco_annotation_store.
+    replace pycocotools COCO object lookups in COCO style datasets,stale store is rebuilt automatically.
+    '''
+
+    def __init__(self, annot_path, store_dir, num_processes=16):
+        if is_coco_annotation_store_stale(annot_path, store_dir):
+            build_coco_annotation_store_if_stale(annot_path,
+                                                 store_dir,
+                                                 num_processes=num_processes)
+
+        per_store_dir = get_coco_annotation_store_dir(store_dir, annot_path)
+        for per_array_name in coco_annotation_store_array_name_list:
+            setattr(
+                self, per_array_name,
+                np.load(os.path.join(per_store_dir, f'{per_array_name}.npy'),
+                        mmap_mode='r'))
+
+        rle_blob_path = os.path.join(per_store_dir, 'rle_blob.bin')
+        self.rle_blob = np.memmap(
+            rle_blob_path, dtype=np.uint8,
+            mode='r') if os.path.getsize(rle_blob_path) > 0 else np.zeros(
+                (0), dtype=np.uint8)
+
+        with open(os.path.join(per_store_dir, 'meta.json'), 'r') as f:
+            self.categories = json.load(f)['categories']
+
+        self.image_annot_num = np.diff(self.image_annot_offset)
+
+    def get_image_num(self):
+        return len(self.image_id)
+
+    def get_cat_ids(self):
+        # same order as COCO.getCatIds()
+        return [per_category['id'] for per_category in self.categories]
+
+    def get_image_file_name(self, image_row):
+        file_name = self.image_file_name_blob[
+            self.image_file_name_offset[image_row]:self.
+            image_file_name_offset[image_row + 1]]
+        file_name = file_name.tobytes().decode('utf-8')
+
+        return file_name
+
+    def get_image_size(self, image_row):
+        return int(self.image_h[image_row]), int(self.image_w[image_row])
+
+    def get_image_annot_rows(self, image_row):
+        return np.arange(self.image_annot_offset[image_row],
+                         self.image_annot_offset[image_row + 1])
+
+    def get_keep_annot_mask(self, annot_rows, cat_ids):
+        '''
+        same annot filter rules as COCO datasets loops,vectorized on annot table:
+        drop annot with 'ignore' key,bbox outside image,bbox w/h/area < 1 or category not in cat_ids.
+        '''
+        annot_bbox = np.asarray(self.annot_bbox[annot_rows])
+        annot_image_row = np.asarray(self.annot_image_row[annot_rows])
+        image_h = np.asarray(self.image_h)[annot_image_row].astype(np.float64)
+        image_w = np.asarray(self.image_w)[annot_image_row].astype(np.float64)
+
+        inter_w = np.maximum(
+            0,
+            np.minimum(annot_bbox[:, 0] + annot_bbox[:, 2], image_w) -
+            np.maximum(annot_bbox[:, 0], 0))
+        inter_h = np.maximum(
+            0,
+            np.minimum(annot_bbox[:, 1] + annot_bbox[:, 3], image_h) -
+            np.maximum(annot_bbox[:, 1], 0))
+
+        keep_mask = np.asarray(self.annot_ignore[annot_rows]) == 0
+        keep_mask &= (inter_w * inter_h != 0)
+        keep_mask &= ~((annot_bbox[:, 2] * annot_bbox[:, 3] < 1) |
+                       (annot_bbox[:, 2] < 1) | (annot_bbox[:, 3] < 1))
+        keep_mask &= np.isin(np.asarray(self.annot_category_id[annot_rows]),
+                             cat_ids)
+
+        return keep_mask
+
+    def get_rle(self, annot_row):
+        image_row = self.annot_image_row[annot_row]
+        rle_counts = self.rle_blob[self.annot_rle_offset[annot_row]:self.
+                                   annot_rle_offset[annot_row + 1]].tobytes()
+        rle = {
+            'size': [int(self.image_h[image_row]),
+                     int(self.image_w[image_row])],
+            'counts': rle_counts,
+        }
+
+        return rle
+
+    def get_masks(self, annot_rows):
+        '''
+        decode annot masks in one call,return [H,W,N] np.uint8 masks,same as COCO.annToMask for every annot.
+        '''
+        rles = [self.get_rle(per_annot_row) for per_annot_row in annot_rows]
+
+        return mask_utils.decode(rles)
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    sys.path.append(BASE_DIR)
+
+    from tools.path import COCO2017_path, coco_annotation_store_path
+
+    import time
+    from torch.utils.data import DataLoader
+
+    from simpleAICV.detection.datasets.cocodataset import CocoDetection
+    from simpleAICV.instance_segmentation.datasets.cocodataset import CocoInstanceSegmentation
+    from simpleAICV.semantic_segmentation.datasets.cocosemanticsegmentationdataset import CocoSemanticSegmentation
+
+    def get_private_memory_mb():
+        # private pages of this process,copy-on-write duplicated pages are counted here
+        private_memory = 0
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for per_line in f:
+                if per_line.startswith('Private_Clean') or per_line.startswith(
+                        'Private_Dirty'):
+                    private_memory += int(per_line.split()[1])
+
+        return private_memory / 1024
+
+    class LoadAnnotationBenchmarkDataset:
+
+        def __init__(self, dataset, load_func_name):
+            self.dataset = dataset
+            self.load_func_name = load_func_name
+
+        def __len__(self):
+            return len(self.dataset)
+
+        def __getitem__(self, idx):
+            _ = getattr(self.dataset, self.load_func_name)(idx)
+
+            return idx
+
+    def memory_collater(data):
+        return len(data), get_private_memory_mb()
+
+    # benchmark on val2017 json:init time,per worker private memory after one pass and annotation loading samples/sec
+    for dataset_class, load_func_name in [
+        (CocoDetection, 'load_annots'),
+        (CocoInstanceSegmentation, 'load_mask'),
+        (CocoSemanticSegmentation, 'load_mask'),
+    ]:
+        for annotation_store_dir in [None, coco_annotation_store_path]:
+            start_time = time.time()
+            dataset = dataset_class(COCO2017_path,
+                                    set_name='val2017',
+                                    transform=None,
+                                    annotation_store_dir=annotation_store_dir)
+            init_time = time.time() - start_time
+            main_process_memory = get_private_memory_mb()
+
+            loader = DataLoader(LoadAnnotationBenchmarkDataset(
+                dataset, load_func_name),
+                                batch_size=64,
+                                shuffle=True,
+                                num_workers=4,
+                                collate_fn=memory_collater)
+            start_time = time.time()
+            sample_num, max_worker_memory = 0, 0
+            for per_batch_sample_num, per_worker_memory in loader:
+                sample_num += per_batch_sample_num
+                max_worker_memory = max(max_worker_memory, per_worker_memory)
+            used_time = time.time() - start_time
+
+            print(
+                f'{dataset_class.__name__}, annotation_store_dir:{annotation_store_dir}, init:{init_time:.3f}s, main process private memory:{main_process_memory:.1f}MB, max worker private memory:{max_worker_memory:.1f}MB, {load_func_name}:{sample_num / used_time:.1f} samples/s'
+            )
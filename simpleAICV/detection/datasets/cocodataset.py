@@ -1,4 +1,11 @@
 import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
 import cv2
 import math
 import numpy as np
@@ -6,6 +13,9 @@ import numpy as np
 from pycocotools.coco import COCO
 from torch.utils.data import Dataset
 
+from simpleAICV.classification.common import decode_image_with_reduced_resolution
+from simpleAICV.detection.datasets.coco_annotation_store import CocoAnnotationStore
+
 COCO_CLASSES = [
     'person',
     'bicycle',
@@ -174,31 +184,65 @@ COCO_CLASSES_COLOR = [
 
 
 class CocoDetection(Dataset):
+    '''
+    reduced_resolution_decode:if True,decode image at 1/2,1/4,1/8 resolution when first resize transform allows it,
+    annots and scale are multiplied by decode scale.
+    annotation_store_dir:if not None,use mmap loaded CocoAnnotationStore instead of pycocotools COCO object,
+    store is built in annotation_store_dir on first use,self.coco is None.
+    '''
 
-    def __init__(self, root_dir, set_name='train2017', transform=None):
+    def __init__(self,
+                 root_dir,
+                 set_name='train2017',
+                 transform=None,
+                 reduced_resolution_decode=False,
+                 annotation_store_dir=None,
+                 annotation_store_num_processes=16):
         assert set_name in ['train2017', 'val2017'], 'Wrong set name!'
 
         self.image_dir = os.path.join(root_dir, 'images', set_name)
         self.annot_dir = os.path.join(root_dir, 'annotations',
                                       f'instances_{set_name}.json')
-        self.coco = COCO(self.annot_dir)
-
-        self.image_ids = self.coco.getImgIds()
-
-        if 'train' in set_name:
-            # filter image id without annotation,from 118287 ids to 117266 ids
-            ids = []
-            for image_id in self.image_ids:
-                annot_ids = self.coco.getAnnIds(imgIds=image_id)
-                annots = self.coco.loadAnns(annot_ids)
-                if len(annots) == 0:
-                    continue
-                ids.append(image_id)
-            self.image_ids = ids
 
-        self.cat_ids = self.coco.getCatIds()
-        self.cats = sorted(self.coco.loadCats(self.cat_ids),
-                           key=lambda x: x['id'])
+        if annotation_store_dir:
+            self.coco = None
+            self.annotation_store = CocoAnnotationStore(
+                self.annot_dir,
+                annotation_store_dir,
+                num_processes=annotation_store_num_processes)
+
+            self.image_rows = np.arange(
+                self.annotation_store.get_image_num())
+            if 'train' in set_name:
+                # filter image id without annotation,from 118287 ids to 117266 ids
+                self.image_rows = self.image_rows[
+                    self.annotation_store.image_annot_num > 0]
+            self.image_ids = self.annotation_store.image_id[
+                self.image_rows].tolist()
+
+            self.cat_ids = self.annotation_store.get_cat_ids()
+            self.cats = sorted(self.annotation_store.categories,
+                               key=lambda x: x['id'])
+        else:
+            self.coco = COCO(self.annot_dir)
+            self.annotation_store = None
+
+            self.image_ids = self.coco.getImgIds()
+
+            if 'train' in set_name:
+                # filter image id without annotation,from 118287 ids to 117266 ids
+                ids = []
+                for image_id in self.image_ids:
+                    annot_ids = self.coco.getAnnIds(imgIds=image_id)
+                    annots = self.coco.loadAnns(annot_ids)
+                    if len(annots) == 0:
+                        continue
+                    ids.append(image_id)
+                self.image_ids = ids
+
+            self.cat_ids = self.coco.getCatIds()
+            self.cats = sorted(self.coco.loadCats(self.cat_ids),
+                               key=lambda x: x['id'])
         self.num_classes = len(self.cats)
 
         # cat_id is an original cat id,coco_label is set from 0 to 79
@@ -217,6 +261,7 @@ class CocoDetection(Dataset):
         }
 
         self.transform = transform
+        self.reduced_resolution_decode = reduced_resolution_decode
 
         print(f'Dataset Size:{len(self.image_ids)}')
         print(f'Dataset Class Num:{self.num_classes}')
@@ -225,11 +270,25 @@ class CocoDetection(Dataset):
         return len(self.image_ids)
 
     def __getitem__(self, idx):
-        image = self.load_image(idx)
-        annots = self.load_annots(idx)
+        if self.reduced_resolution_decode:
+            image, decode_scale, size = self.load_reduced_resolution_image(
+                idx)
+            annots = self.load_annots(idx)
+            # decode_scale:[scale_h,scale_w],same value on both axes
+            annots[:, 0:4] *= np.array([
+                decode_scale[1], decode_scale[0], decode_scale[1],
+                decode_scale[0]
+            ],
+                                       dtype=np.float32)
+            # boxes / scale are in original image,size is original image size for clip boxes
+            scale = np.array(decode_scale[0]).astype(np.float32)
+        else:
+            image = self.load_image(idx)
+            annots = self.load_annots(idx)
 
-        scale = np.array(1.).astype(np.float32)
-        size = np.array([image.shape[0], image.shape[1]]).astype(np.float32)
+            scale = np.array(1.).astype(np.float32)
+            size = np.array([image.shape[0],
+                             image.shape[1]]).astype(np.float32)
 
         sample = {
             'image': image,
@@ -243,8 +302,15 @@ class CocoDetection(Dataset):
 
         return sample
 
+    def get_image_file_name(self, idx):
+        if self.annotation_store:
+            return self.annotation_store.get_image_file_name(
+                self.image_rows[idx])
+
+        return self.coco.loadImgs(self.image_ids[idx])[0]['file_name']
+
     def load_image(self, idx):
-        file_name = self.coco.loadImgs(self.image_ids[idx])[0]['file_name']
+        file_name = self.get_image_file_name(idx)
         image = cv2.imdecode(
             np.fromfile(os.path.join(self.image_dir, file_name),
                         dtype=np.uint8), cv2.IMREAD_COLOR)
@@ -252,7 +318,18 @@ class CocoDetection(Dataset):
 
         return image.astype(np.float32)
 
+    def load_reduced_resolution_image(self, idx):
+        file_name = self.get_image_file_name(idx)
+        image, decode_scale, image_size = decode_image_with_reduced_resolution(
+            np.fromfile(os.path.join(self.image_dir, file_name),
+                        dtype=np.uint8), self.transform)
+
+        return image, decode_scale, image_size
+
     def load_annots(self, idx):
+        if self.annotation_store:
+            return self.load_store_annots(idx)
+
         annot_ids = self.coco.getAnnIds(imgIds=self.image_ids[idx])
         annots = self.coco.loadAnns(annot_ids)
 
@@ -290,6 +367,29 @@ class CocoDetection(Dataset):
 
         return targets.astype(np.float32)
 
+    def load_store_annots(self, idx):
+        # same filter rules and outputs as load_annots,vectorized on annotation store arrays
+        annot_rows = self.annotation_store.get_image_annot_rows(
+            self.image_rows[idx])
+        annot_rows = annot_rows[self.annotation_store.get_keep_annot_mask(
+            annot_rows, self.cat_ids)]
+
+        targets = np.zeros((annot_rows.shape[0], 5))
+        if annot_rows.shape[0] == 0:
+            return targets.astype(np.float32)
+
+        targets[:, :4] = self.annotation_store.annot_bbox[annot_rows]
+        targets[:, 4] = [
+            self.cat_id_to_coco_label[per_cat_id] for per_cat_id in
+            self.annotation_store.annot_category_id[annot_rows].tolist()
+        ]
+
+        # transform bbox targets from [x_min, y_min, w, h] to [x_min, y_min, x_max, y_max]
+        targets[:, 2] = targets[:, 0] + targets[:, 2]
+        targets[:, 3] = targets[:, 1] + targets[:, 3]
+
+        return targets.astype(np.float32)
+
 
 class MosaicResizeCocoDetection(CocoDetection):
     '''
@@ -312,7 +412,9 @@ class MosaicResizeCocoDetection(CocoDetection):
                  mixup_ratio=[0.5, 0.5],
                  current_epoch=1,
                  stop_mosaic_epoch=100,
-                 transform=None):
+                 transform=None,
+                 annotation_store_dir=None,
+                 annotation_store_num_processes=16):
         assert set_name in ['train2017', 'val2017'], 'Wrong set name!'
 
         self.resize = resize
@@ -339,24 +441,46 @@ class MosaicResizeCocoDetection(CocoDetection):
         self.image_dir = os.path.join(root_dir, 'images', set_name)
         self.annot_dir = os.path.join(root_dir, 'annotations',
                                       f'instances_{set_name}.json')
-        self.coco = COCO(self.annot_dir)
 
-        self.image_ids = self.coco.getImgIds()
-
-        if 'train' in set_name:
-            # filter image id without annotation,from 118287 ids to 117266 ids
-            ids = []
-            for image_id in self.image_ids:
-                annot_ids = self.coco.getAnnIds(imgIds=image_id)
-                annots = self.coco.loadAnns(annot_ids)
-                if len(annots) == 0:
-                    continue
-                ids.append(image_id)
-            self.image_ids = ids
-
-        self.cat_ids = self.coco.getCatIds()
-        self.cats = sorted(self.coco.loadCats(self.cat_ids),
-                           key=lambda x: x['id'])
+        if annotation_store_dir:
+            self.coco = None
+            self.annotation_store = CocoAnnotationStore(
+                self.annot_dir,
+                annotation_store_dir,
+                num_processes=annotation_store_num_processes)
+
+            self.image_rows = np.arange(
+                self.annotation_store.get_image_num())
+            if 'train' in set_name:
+                # filter image id without annotation,from 118287 ids to 117266 ids
+                self.image_rows = self.image_rows[
+                    self.annotation_store.image_annot_num > 0]
+            self.image_ids = self.annotation_store.image_id[
+                self.image_rows].tolist()
+
+            self.cat_ids = self.annotation_store.get_cat_ids()
+            self.cats = sorted(self.annotation_store.categories,
+                               key=lambda x: x['id'])
+        else:
+            self.coco = COCO(self.annot_dir)
+            self.annotation_store = None
+
+            self.image_ids = self.coco.getImgIds()
+
+            if 'train' in set_name:
+                # filter image id without annotation,from 118287 ids to 117266 ids
+                ids = []
+                for image_id in self.image_ids:
+                    annot_ids = self.coco.getAnnIds(imgIds=image_id)
+                    annots = self.coco.loadAnns(annot_ids)
+                    if len(annots) == 0:
+                        continue
+                    ids.append(image_id)
+                self.image_ids = ids
+
+            self.cat_ids = self.coco.getCatIds()
+            self.cats = sorted(self.coco.loadCats(self.cat_ids),
+                               key=lambda x: x['id'])
         self.num_classes = len(self.cats)
 
         # cat_id is an original cat id,coco_label is set from 0 to 79
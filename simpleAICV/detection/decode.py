@@ -27,11 +27,23 @@ __all__ = [
 
 class DetNMSMethod:
 
-    def __init__(self, nms_type='python_nms', nms_threshold=0.5):
+    def __init__(self,
+                 nms_type='python_nms',
+                 nms_threshold=0.5,
+                 nms_block_size=512,
+                 matrix_nms_max_box_num=200,
+                 per_image_nms_block_size=128):
         assert nms_type in ['torch_nms', 'python_nms',
                             'diou_python_nms'], 'wrong nms type!'
         self.nms_type = nms_type
         self.nms_threshold = nms_threshold
+        # batch_nms matrix size,larger box nums are processed block by block
+        self.nms_block_size = nms_block_size
+        # matrix nms cost grows with box_nums^2*iterations,more valid boxes per image use greedy nms(python_nms)
+        # or per image chunked cluster nms(diou_python_nms)
+        self.matrix_nms_max_box_num = matrix_nms_max_box_num
+        # chunk size of per image cluster nms,small chunks converge in few iterations and bound memory to chunk*box_nums
+        self.per_image_nms_block_size = per_image_nms_block_size
 
     def __call__(self, sorted_bboxes, sorted_scores):
         '''
@@ -105,6 +117,267 @@ class DetNMSMethod:
 
         return keep
 
+    def batch_nms(self,
+                  batch_bboxes,
+                  batch_scores,
+                  batch_classes=None,
+                  valid_mask=None,
+                  class_aware=False):
+        '''
+        tensor nms for padded batch boxes,all images(and classes) in one pass on boxes device
+        batch_bboxes:[batch_size,box_nums,4],4:x_min,y_min,x_max,y_max
+        batch_scores:[batch_size,box_nums]
+        batch_classes:[batch_size,box_nums],only used by class aware nms
+        valid_mask:[batch_size,box_nums],False for padded boxes
+        return per image keep indexes,descending sort by scores
+        '''
+        sorted_scores, sorted_indexes = torch.sort(batch_scores,
+                                                   dim=1,
+                                                   descending=True,
+                                                   stable=True)
+        sorted_bboxes = torch.gather(
+            batch_bboxes, 1,
+            sorted_indexes.unsqueeze(-1).expand(-1, -1, 4))
+        sorted_classes = torch.gather(
+            batch_classes, 1,
+            sorted_indexes) if batch_classes is not None else None
+        if valid_mask is None:
+            valid_mask = torch.ones_like(sorted_scores, dtype=torch.bool)
+        else:
+            valid_mask = torch.gather(valid_mask, 1, sorted_indexes)
+
+        keep_mask = self.get_batch_keep_mask(sorted_bboxes,
+                                             sorted_scores,
+                                             sorted_classes=sorted_classes,
+                                             valid_mask=valid_mask,
+                                             class_aware=class_aware)
+
+        return [
+            per_image_sorted_indexes[per_image_keep_mask]
+            for per_image_sorted_indexes, per_image_keep_mask in zip(
+                sorted_indexes, keep_mask)
+        ]
+
+    def get_batch_keep_mask(self,
+                            sorted_bboxes,
+                            sorted_scores,
+                            sorted_classes=None,
+                            valid_mask=None,
+                            class_aware=False):
+        '''
+        sorted_bboxes:[batch_size,box_nums,4],per image descending sort by scores
+        sorted_scores:[batch_size,box_nums]
+        sorted_classes:[batch_size,box_nums]
+        valid_mask:[batch_size,box_nums]
+        return keep_mask:[batch_size,box_nums]
+        '''
+        if valid_mask is None:
+            valid_mask = torch.ones_like(sorted_scores, dtype=torch.bool)
+        if class_aware:
+            assert sorted_classes is not None, 'class aware nms need classes!'
+
+        if self.nms_type == 'torch_nms':
+            return self.get_torch_nms_keep_mask(sorted_bboxes, sorted_scores,
+                                                sorted_classes, valid_mask,
+                                                class_aware)
+
+        if valid_mask.sum(dim=1).max() > self.matrix_nms_max_box_num:
+            if self.nms_type == 'python_nms':
+                # python_nms suppresses iou>=nms_threshold,torchvision nms suppresses iou>nms_threshold
+                return self.get_torch_nms_keep_mask(
+                    sorted_bboxes,
+                    sorted_scores,
+                    sorted_classes,
+                    valid_mask,
+                    class_aware,
+                    nms_threshold=float(
+                        np.nextafter(np.float32(self.nms_threshold),
+                                     np.float32(-np.inf))))
+            else:
+                # torchvision has no diou nms,valid boxes of every image run chunked cluster nms on boxes device
+                return self.get_per_image_matrix_nms_keep_mask(
+                    sorted_bboxes, sorted_classes, valid_mask, class_aware)
+
+        return self.get_matrix_nms_keep_mask(sorted_bboxes, sorted_classes,
+                                             valid_mask, class_aware,
+                                             self.nms_block_size)
+
+    def get_matrix_nms_keep_mask(self, sorted_bboxes, sorted_classes,
+                                 valid_mask, class_aware, nms_block_size):
+        sorted_bboxes = sorted_bboxes.float()
+        box_nums = sorted_bboxes.shape[1]
+        keep_mask = valid_mask.clone()
+        # box_nums<=nms_block_size:one matrix for all boxes
+        # box_nums>nms_block_size:blockwise matrix,blocks keep suppressing later boxes
+        for start in range(0, box_nums, nms_block_size):
+            end = min(start + nms_block_size, box_nums)
+            block_bboxes = sorted_bboxes[:, start:end]
+            block_suppress = self.get_suppress_matrix(
+                block_bboxes, sorted_bboxes[:, start:])
+            if class_aware:
+                block_suppress = block_suppress & (
+                    sorted_classes[:, start:end].unsqueeze(-1)
+                    == sorted_classes[:, start:].unsqueeze(1))
+
+            block_keep_mask = self.cluster_nms(
+                keep_mask[:, start:end], block_suppress[:, :,
+                                                         0:end - start])
+            keep_mask[:, start:end] = block_keep_mask
+            if end < box_nums:
+                keep_mask[:, end:] &= ~(block_suppress[:, :, end - start:]
+                                        & block_keep_mask.unsqueeze(-1)).any(
+                                            dim=1)
+
+        return keep_mask
+
+    def get_per_image_matrix_nms_keep_mask(self, sorted_bboxes,
+                                           sorted_classes, valid_mask,
+                                           class_aware):
+        # only valid boxes of one image in matrix,chunk by chunk,memory is per_image_nms_block_size*valid box nums
+        keep_mask = torch.zeros_like(valid_mask)
+        for i in range(sorted_bboxes.shape[0]):
+            valid_indexes = torch.nonzero(valid_mask[i]).squeeze(-1)
+            if valid_indexes.shape[0] == 0:
+                continue
+            per_image_classes = sorted_classes[i][valid_indexes].unsqueeze(
+                0) if class_aware else None
+            per_image_keep_mask = self.get_matrix_nms_keep_mask(
+                sorted_bboxes[i][valid_indexes].unsqueeze(0),
+                per_image_classes,
+                torch.ones_like(valid_indexes, dtype=torch.bool).unsqueeze(0),
+                class_aware, self.per_image_nms_block_size)
+            keep_mask[i, valid_indexes[per_image_keep_mask[0]]] = True
+
+        return keep_mask
+
+    def get_suppress_matrix(self, bboxes1, bboxes2):
+        '''
+        same ops as python_nms/diou_python_nms loop,bboxes1 is keep boxes,bboxes2 is other boxes
+        bboxes1:[batch_size,n1,4],bboxes2:[batch_size,n2,4]
+        suppress matrix shape:[batch_size,n1,n2]
+        '''
+        # split coords to [batch_size,n1,1]/[batch_size,1,n2],broadcast ops on contiguous coords are much faster
+        x1_min, y1_min, x1_max, y1_max = [
+            bboxes1[:, :, i].unsqueeze(2).contiguous() for i in range(4)
+        ]
+        x2_min, y2_min, x2_max, y2_max = [
+            bboxes2[:, :, i].unsqueeze(1).contiguous() for i in range(4)
+        ]
+        bboxes1_areas = torch.clamp((x1_max - x1_min) * (y1_max - y1_min),
+                                    min=0)
+        bboxes2_areas = torch.clamp((x2_max - x2_min) * (y2_max - y2_min),
+                                    min=0)
+
+        overlap_area_w = torch.clamp(torch.minimum(x1_max, x2_max) -
+                                     torch.maximum(x1_min, x2_min),
+                                     min=0)
+        overlap_area_h = torch.clamp(torch.minimum(y1_max, y2_max) -
+                                     torch.maximum(y1_min, y2_min),
+                                     min=0)
+        overlap_area = overlap_area_w * overlap_area_h
+
+        union_area = bboxes1_areas + bboxes2_areas - overlap_area
+        union_area = torch.clamp(union_area, min=1e-4)
+        ious = overlap_area / union_area
+
+        if self.nms_type == 'diou_python_nms':
+            enclose_area_w = torch.clamp(torch.maximum(x1_max, x2_max) -
+                                         torch.minimum(x1_min, x2_min),
+                                         min=0)
+            enclose_area_h = torch.clamp(torch.maximum(y1_max, y2_max) -
+                                         torch.minimum(y1_min, y2_min),
+                                         min=0)
+            # c2:convex diagonal squared
+            c2 = enclose_area_w**2 + enclose_area_h**2
+            c2 = torch.clamp(c2, min=1e-4)
+            # p2:center distance squared
+            p2 = ((x1_max + x1_min) / 2 - (x2_max + x2_min) / 2)**2 + (
+                (y1_max + y1_min) / 2 - (y2_max + y2_min) / 2)**2
+            ious = ious - p2 / c2
+
+        # only higher score box can suppress lower score box
+        suppress_matrix = torch.triu(ious >= self.nms_threshold,
+                                     diagonal=1)
+
+        return suppress_matrix
+
+    def cluster_nms(self, keep_mask, suppress_matrix):
+        '''
+        matrix version of greedy nms(cluster-nms),fixed point of keep=valid&~any(keep_i&suppress_ij)
+        is same as greedy nms result,usually converge in a few iterations
+        keep_mask:[batch_size,box_nums],valid boxes
+        suppress_matrix:[batch_size,box_nums,box_nums]
+        '''
+        valid_mask = keep_mask
+        suppress_matrix = suppress_matrix.float()
+        for _ in range(keep_mask.shape[1]):
+            suppressed = torch.bmm(keep_mask.float().unsqueeze(1),
+                                   suppress_matrix).squeeze(1) > 0
+            new_keep_mask = valid_mask & ~suppressed
+            if torch.equal(new_keep_mask, keep_mask):
+                break
+            keep_mask = new_keep_mask
+
+        return keep_mask
+
+    def get_torch_nms_keep_mask(self,
+                                sorted_bboxes,
+                                sorted_scores,
+                                sorted_classes,
+                                valid_mask,
+                                class_aware,
+                                nms_threshold=None):
+        batch_size, box_nums = sorted_scores.shape
+        keep_mask = torch.zeros_like(valid_mask)
+        sorted_bboxes, sorted_scores = sorted_bboxes.float(
+        ), sorted_scores.float()
+
+        if sorted_scores.device.type == 'cpu':
+            # cpu nms kernel compares all boxes pairs,so nms per image avoids comparing boxes of different images
+            for i in range(batch_size):
+                valid_indexes = torch.nonzero(valid_mask[i]).squeeze(-1)
+                nms_groups = sorted_classes[i][
+                    valid_indexes] if class_aware else None
+                keep = self.offset_nms(sorted_bboxes[i][valid_indexes],
+                                       sorted_scores[i][valid_indexes],
+                                       nms_groups, nms_threshold)
+                keep_mask[i, valid_indexes[keep]] = True
+        else:
+            valid_indexes = torch.nonzero(valid_mask.view(-1)).squeeze(-1)
+            nms_groups = torch.arange(batch_size,
+                                      device=sorted_scores.device).view(
+                                          -1, 1).expand(-1, box_nums)
+            if class_aware:
+                nms_groups = nms_groups * (sorted_classes.max().long() +
+                                           1) + sorted_classes.long()
+            keep = self.offset_nms(sorted_bboxes[valid_mask],
+                                   sorted_scores[valid_mask],
+                                   nms_groups[valid_mask], nms_threshold)
+            keep_mask.view(-1)[valid_indexes[keep]] = True
+
+        return keep_mask
+
+    def offset_nms(self, bboxes, scores, groups=None, nms_threshold=None):
+        '''
+        bboxes:[box_nums,4],4:x_min,y_min,x_max,y_max
+        scores:[box_nums]
+        groups:[box_nums] or None,boxes in different groups don't suppress each other
+        nms_threshold:None for self.nms_threshold
+        '''
+        if bboxes.shape[0] == 0:
+            return torch.zeros((0), dtype=torch.int64, device=bboxes.device)
+
+        if groups is not None:
+            # move every group boxes to disjoint coordinates,one nms call for all groups
+            offsets = groups.to(bboxes.dtype) * (bboxes.max() - bboxes.min() +
+                                                 1)
+            bboxes = bboxes + offsets.unsqueeze(-1)
+
+        nms_threshold = self.nms_threshold if nms_threshold is None else nms_threshold
+        keep = nms(bboxes, scores, nms_threshold)
+
+        return keep
+
 
 class DecodeMethod:
 
@@ -174,6 +447,109 @@ class DecodeMethod:
         return [batch_scores, batch_classes, batch_bboxes]
 
 
+class BatchDecodeMethod:
+    '''
+    batched tensor version of DecodeMethod,all images are decoded together on preds device.
+    per level topn+merged topn gets same candidates as DecodeMethod global score threshold+topn,
+    so only topn candidates per image need box decoding and nms.
+    '''
+
+    def __init__(self,
+                 max_object_num=100,
+                 min_score_threshold=0.05,
+                 topn=1000,
+                 nms_type='python_nms',
+                 nms_threshold=0.5,
+                 class_aware_nms=False):
+        assert nms_type in ['torch_nms', 'python_nms',
+                            'diou_python_nms'], 'wrong nms type!'
+        self.max_object_num = max_object_num
+        self.min_score_threshold = min_score_threshold
+        self.topn = topn
+        self.class_aware_nms = class_aware_nms
+        self.nms_function = DetNMSMethod(nms_type=nms_type,
+                                         nms_threshold=nms_threshold)
+
+    def get_topn_candidates(self, per_level_scores):
+        '''
+        per_level_scores:[[batch_size,per_level_point_nums],...]
+        sorted_indexes are indexes of all levels concatenated points
+        '''
+        per_level_topn_scores, per_level_topn_indexes = [], []
+        level_start_index = 0
+        for per_level_score in per_level_scores:
+            level_topn = min(self.topn, per_level_score.shape[1])
+            topn_scores, topn_indexes = torch.topk(per_level_score,
+                                                   level_topn,
+                                                   dim=1)
+            per_level_topn_scores.append(topn_scores)
+            per_level_topn_indexes.append(topn_indexes + level_start_index)
+            level_start_index += per_level_score.shape[1]
+
+        topn_scores = torch.cat(per_level_topn_scores, dim=1)
+        topn_indexes = torch.cat(per_level_topn_indexes, dim=1)
+
+        topn = min(self.topn, topn_scores.shape[1])
+        sorted_scores, sorted_order = torch.topk(topn_scores, topn, dim=1)
+        sorted_indexes = torch.gather(topn_indexes, 1, sorted_order)
+
+        # sorted_scores shape:[batch_size,topn],descending sort
+        # sorted_indexes shape:[batch_size,topn]
+        return sorted_scores, sorted_indexes
+
+    def __call__(self, sorted_scores, sorted_classes, sorted_bboxes):
+        '''
+        sorted_scores:[batch_size,topn],descending sort
+        sorted_classes:[batch_size,topn]
+        sorted_bboxes:[batch_size,topn,4],4:x_min,y_min,x_max,y_max
+        '''
+        batch_size = sorted_scores.shape[0]
+        device = sorted_scores.device
+        batch_scores = torch.ones((batch_size, self.max_object_num),
+                                  dtype=torch.float32,
+                                  device=device) * (-1)
+        batch_classes = torch.ones((batch_size, self.max_object_num),
+                                   dtype=torch.float32,
+                                   device=device) * (-1)
+        batch_bboxes = torch.zeros((batch_size, self.max_object_num, 4),
+                                   dtype=torch.float32,
+                                   device=device)
+
+        sorted_scores = sorted_scores.float()
+        sorted_bboxes = sorted_bboxes.float()
+        valid_mask = sorted_scores > self.min_score_threshold
+        keep_mask = self.nms_function.get_batch_keep_mask(
+            sorted_bboxes,
+            sorted_scores,
+            sorted_classes=sorted_classes,
+            valid_mask=valid_mask,
+            class_aware=self.class_aware_nms)
+
+        # candidates are sorted,so keep rank is output position
+        keep_ranks = torch.cumsum(keep_mask.long(), dim=1) - 1
+        keep_mask = keep_mask & (keep_ranks < self.max_object_num)
+        image_indexes, candidate_indexes = torch.nonzero(keep_mask,
+                                                         as_tuple=True)
+        object_indexes = keep_ranks[image_indexes, candidate_indexes]
+
+        batch_scores[image_indexes,
+                     object_indexes] = sorted_scores[image_indexes,
+                                                     candidate_indexes]
+        batch_classes[image_indexes,
+                      object_indexes] = sorted_classes[
+                          image_indexes, candidate_indexes].float()
+        batch_bboxes[image_indexes,
+                     object_indexes] = sorted_bboxes[image_indexes,
+                                                     candidate_indexes]
+        valid_nums = keep_mask.sum(dim=1)
+
+        # batch_scores shape:[batch_size,max_object_num]
+        # batch_classes shape:[batch_size,max_object_num]
+        # batch_bboxes shape[batch_size,max_object_num,4]
+        # valid_nums shape:[batch_size],valid object num of each image
+        return [batch_scores, batch_classes, batch_bboxes, valid_nums]
+
+
 class RetinaDecoder:
 
     def __init__(self,
@@ -186,9 +562,12 @@ class RetinaDecoder:
                  min_score_threshold=0.05,
                  topn=1000,
                  nms_type='python_nms',
-                 nms_threshold=0.5):
+                 nms_threshold=0.5,
+                 use_batch_decode=False,
+                 class_aware_nms=False):
         assert nms_type in ['torch_nms', 'python_nms',
                             'diou_python_nms'], 'wrong nms type!'
+        self.use_batch_decode = use_batch_decode
         self.anchors = RetinaAnchors(areas=areas,
                                      ratios=ratios,
                                      scales=scales,
@@ -199,8 +578,25 @@ class RetinaDecoder:
             topn=topn,
             nms_type=nms_type,
             nms_threshold=nms_threshold)
+        self.batch_decode_function = BatchDecodeMethod(
+            max_object_num=max_object_num,
+            min_score_threshold=min_score_threshold,
+            topn=topn,
+            nms_type=nms_type,
+            nms_threshold=nms_threshold,
+            class_aware_nms=class_aware_nms)
 
     def __call__(self, preds):
+        if self.use_batch_decode:
+            batch_scores, batch_classes, batch_bboxes, _ = self.batch_decode(
+                preds)
+
+            return [
+                batch_scores.cpu().numpy(),
+                batch_classes.cpu().numpy(),
+                batch_bboxes.cpu().numpy()
+            ]
+
         cls_preds, reg_preds = preds
         feature_size = [[
             per_level_cls_pred.shape[2], per_level_cls_pred.shape[1]
@@ -250,6 +646,59 @@ class RetinaDecoder:
         # batch_bboxes shape[batch_size,max_object_num,4]
         return [batch_scores, batch_classes, batch_bboxes]
 
+    def batch_decode(self, preds):
+        '''
+        decode all images as batched tensors on preds device
+        '''
+        with torch.no_grad():
+            cls_preds, reg_preds = preds
+            batch_size, device = cls_preds[0].shape[0], cls_preds[0].device
+            feature_size = [[
+                per_level_cls_pred.shape[2], per_level_cls_pred.shape[1]
+            ] for per_level_cls_pred in cls_preds]
+            one_image_anchors = self.anchors.get_device_anchors(
+                feature_size, device)
+            one_image_anchors = torch.cat([
+                per_level_anchor.view(-1, per_level_anchor.shape[-1])
+                for per_level_anchor in one_image_anchors
+            ],
+                                          dim=0)
+
+            per_level_scores, per_level_classes = [], []
+            for per_level_cls_pred in cls_preds:
+                per_level_cls_pred = per_level_cls_pred.reshape(
+                    batch_size, -1, per_level_cls_pred.shape[-1])
+                per_level_score, per_level_class = torch.max(
+                    per_level_cls_pred, dim=2)
+                per_level_scores.append(per_level_score)
+                per_level_classes.append(per_level_class)
+
+            sorted_scores, sorted_indexes = self.batch_decode_function.get_topn_candidates(
+                per_level_scores)
+            sorted_classes = torch.gather(
+                torch.cat(per_level_classes, dim=1), 1, sorted_indexes)
+
+            reg_preds = torch.cat([
+                per_reg_pred.reshape(batch_size, -1, per_reg_pred.shape[-1])
+                for per_reg_pred in reg_preds
+            ],
+                                  dim=1)
+            sorted_reg_preds = torch.gather(
+                reg_preds, 1,
+                sorted_indexes.unsqueeze(-1).expand(-1, -1,
+                                                    reg_preds.shape[-1]))
+            sorted_anchors = one_image_anchors[sorted_indexes]
+
+            sorted_bboxes = self.snap_tensor_txtytwth_to_x1y1x2y2(
+                sorted_reg_preds, sorted_anchors)
+
+            # batch_scores shape:[batch_size,max_object_num]
+            # batch_classes shape:[batch_size,max_object_num]
+            # batch_bboxes shape[batch_size,max_object_num,4]
+            # valid_nums shape:[batch_size]
+            return self.batch_decode_function(sorted_scores, sorted_classes,
+                                              sorted_bboxes)
+
     def snap_txtytwth_to_x1y1x2y2(self, reg_preds, anchors):
         '''
         snap reg heads to pred bboxes
@@ -272,6 +721,29 @@ class RetinaDecoder:
         # pred bboxes shape:[batch,anchor_nums,4]
         return pred_bboxes
 
+    def snap_tensor_txtytwth_to_x1y1x2y2(self, reg_preds, anchors):
+        '''
+        tensor version of snap_txtytwth_to_x1y1x2y2,same ops order
+        reg_preds:[batch_size,anchor_nums,4],4:[tx,ty,tw,th]
+        anchors:[batch_size,anchor_nums,4],4:[x_min,y_min,x_max,y_max]
+        '''
+        anchors_wh = anchors[:, :, 2:4] - anchors[:, :, 0:2]
+        anchors_ctr = anchors[:, :, 0:2] + 0.5 * anchors_wh
+
+        pred_bboxes_wh = torch.exp(reg_preds[:, :, 2:4]) * anchors_wh
+        pred_bboxes_ctr = reg_preds[:, :, :2] * anchors_wh + anchors_ctr
+
+        pred_bboxes_x_min_y_min = pred_bboxes_ctr - 0.5 * pred_bboxes_wh
+        pred_bboxes_x_max_y_max = pred_bboxes_ctr + 0.5 * pred_bboxes_wh
+
+        # trunc is same as numpy astype(np.int32)
+        pred_bboxes = torch.cat(
+            [pred_bboxes_x_min_y_min, pred_bboxes_x_max_y_max],
+            dim=2).trunc()
+
+        # pred bboxes shape:[batch,anchor_nums,4]
+        return pred_bboxes
+
 
 class FCOSDecoder:
 
@@ -281,9 +753,12 @@ class FCOSDecoder:
                  min_score_threshold=0.05,
                  topn=1000,
                  nms_type='python_nms',
-                 nms_threshold=0.6):
+                 nms_threshold=0.6,
+                 use_batch_decode=False,
+                 class_aware_nms=False):
         assert nms_type in ['torch_nms', 'python_nms',
                             'diou_python_nms'], 'wrong nms type!'
+        self.use_batch_decode = use_batch_decode
         self.positions = FCOSPositions(strides=strides)
         self.decode_function = DecodeMethod(
             max_object_num=max_object_num,
@@ -291,8 +766,25 @@ class FCOSDecoder:
             topn=topn,
             nms_type=nms_type,
             nms_threshold=nms_threshold)
+        self.batch_decode_function = BatchDecodeMethod(
+            max_object_num=max_object_num,
+            min_score_threshold=min_score_threshold,
+            topn=topn,
+            nms_type=nms_type,
+            nms_threshold=nms_threshold,
+            class_aware_nms=class_aware_nms)
 
     def __call__(self, preds):
+        if self.use_batch_decode:
+            batch_scores, batch_classes, batch_bboxes, _ = self.batch_decode(
+                preds)
+
+            return [
+                batch_scores.cpu().numpy(),
+                batch_classes.cpu().numpy(),
+                batch_bboxes.cpu().numpy()
+            ]
+
         cls_preds, reg_preds, center_preds = preds
         feature_size = [[
             per_level_cls_pred.shape[2], per_level_cls_pred.shape[1]
@@ -349,6 +841,65 @@ class FCOSDecoder:
         # batch_bboxes shape[batch_size,max_object_num,4]
         return [batch_scores, batch_classes, batch_bboxes]
 
+    def batch_decode(self, preds):
+        '''
+        decode all images as batched tensors on preds device
+        '''
+        with torch.no_grad():
+            cls_preds, reg_preds, center_preds = preds
+            batch_size, device = cls_preds[0].shape[0], cls_preds[0].device
+            feature_size = [[
+                per_level_cls_pred.shape[2], per_level_cls_pred.shape[1]
+            ] for per_level_cls_pred in cls_preds]
+            one_image_positions = self.positions.get_device_positions(
+                feature_size, device)
+            one_image_positions = torch.cat([
+                per_level_position.view(-1, per_level_position.shape[-1])
+                for per_level_position in one_image_positions
+            ],
+                                            dim=0)
+
+            per_level_scores, per_level_classes = [], []
+            for per_level_cls_pred, per_level_center_pred in zip(
+                    cls_preds, center_preds):
+                per_level_cls_pred = per_level_cls_pred.reshape(
+                    batch_size, -1, per_level_cls_pred.shape[-1])
+                per_level_score, per_level_class = torch.max(
+                    per_level_cls_pred, dim=2)
+                # sqrt is monotonic,only topn candidates need sqrt
+                per_level_score = per_level_score * per_level_center_pred.reshape(
+                    batch_size, -1)
+                per_level_scores.append(per_level_score)
+                per_level_classes.append(per_level_class)
+
+            sorted_scores, sorted_indexes = self.batch_decode_function.get_topn_candidates(
+                per_level_scores)
+            # float64 sqrt then cast to float32 is same as numpy float32 sqrt
+            sorted_scores = torch.sqrt(sorted_scores.double()).float()
+            sorted_classes = torch.gather(
+                torch.cat(per_level_classes, dim=1), 1, sorted_indexes)
+
+            reg_preds = torch.cat([
+                per_reg_pred.reshape(batch_size, -1, per_reg_pred.shape[-1])
+                for per_reg_pred in reg_preds
+            ],
+                                  dim=1)
+            sorted_reg_preds = torch.gather(
+                reg_preds, 1,
+                sorted_indexes.unsqueeze(-1).expand(-1, -1,
+                                                    reg_preds.shape[-1]))
+            sorted_positions = one_image_positions[sorted_indexes]
+
+            sorted_bboxes = self.snap_tensor_ltrb_to_x1y1x2y2(
+                sorted_reg_preds, sorted_positions)
+
+            # batch_scores shape:[batch_size,max_object_num]
+            # batch_classes shape:[batch_size,max_object_num]
+            # batch_bboxes shape[batch_size,max_object_num,4]
+            # valid_nums shape:[batch_size]
+            return self.batch_decode_function(sorted_scores, sorted_classes,
+                                              sorted_bboxes)
+
     def snap_ltrb_to_x1y1x2y2(self, reg_preds, points_position):
         '''
         snap reg preds to pred bboxes
@@ -365,6 +916,22 @@ class FCOSDecoder:
         # pred bboxes shape:[batch,points_num,4]
         return pred_bboxes
 
+    def snap_tensor_ltrb_to_x1y1x2y2(self, reg_preds, points_position):
+        '''
+        tensor version of snap_ltrb_to_x1y1x2y2,same ops order
+        reg_preds:[batch_size,point_nums,4],4:[l,t,r,b]
+        points_position:[batch_size,point_nums,2],2:[point_ctr_x,point_ctr_y]
+        '''
+        reg_preds = torch.exp(reg_preds)
+        pred_bboxes_xy_min = points_position - reg_preds[:, :, 0:2]
+        pred_bboxes_xy_max = points_position + reg_preds[:, :, 2:4]
+        # trunc is same as numpy astype(np.int32)
+        pred_bboxes = torch.cat([pred_bboxes_xy_min, pred_bboxes_xy_max],
+                                dim=2).trunc()
+
+        # pred bboxes shape:[batch,points_num,4]
+        return pred_bboxes
+
 
 class CenterNetDecoder(nn.Module):
 
@@ -513,9 +1080,11 @@ class TTFNetDecoder(nn.Module):
             batch_size = heatmap_heads.shape[0]
 
             feature_map_size = [heatmap_heads.shape[3], heatmap_heads.shape[2]]
-            one_image_positions = self.positions(feature_map_size)
-            batch_positions = torch.tensor(one_image_positions).unsqueeze(
-                0).repeat(batch_size, 1, 1, 1).to(device)
+            # cached device positions,not regenerated and copied to device every iteration
+            one_image_positions = self.positions.get_device_positions(
+                feature_map_size, device)
+            batch_positions = one_image_positions.unsqueeze(0).repeat(
+                batch_size, 1, 1, 1)
 
             batch_scores = torch.ones((batch_size, self.max_object_num),
                                       dtype=torch.float32,
@@ -0,0 +1,285 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import multiprocessing
+import numpy as np
+import scipy
+
+from multiprocessing import shared_memory
+
+import torch
+
+# shared memory cost buffers attached in pool workers,key:shared memory name
+worker_shared_memory_dict = {}
+
+
+def linear_sum_assignment_with_inf(cost_matrix):
+    cost_matrix = np.asarray(cost_matrix)
+
+    nan = np.isnan(cost_matrix).any()
+    if nan:
+        cost_matrix[np.isnan(cost_matrix)] = 1e5
+
+    min_inf = np.isneginf(cost_matrix).any()
+    max_inf = np.isposinf(cost_matrix).any()
+    if min_inf and max_inf:
+        raise ValueError("matrix contains both inf and -inf")
+
+    if min_inf or max_inf:
+        values = cost_matrix[~np.isinf(cost_matrix)]
+        min_values = values.min()
+        max_values = values.max()
+        m = min(cost_matrix.shape)
+
+        positive = m * (max_values - min_values + np.abs(max_values) +
+                        np.abs(min_values) + 1)
+        if max_inf:
+            place_holder = (max_values + (m - 1) *
+                            (max_values - min_values)) + positive
+        elif min_inf:
+            place_holder = (min_values + (m - 1) *
+                            (min_values - max_values)) - positive
+
+        cost_matrix[np.isinf(cost_matrix)] = place_holder
+
+    results = scipy.optimize.linear_sum_assignment(cost_matrix)
+
+    return results
+
+
+def solve_shared_cost_matrices(args):
+    '''
+    pool worker:solve cost matrices in shared memory buffer,only indexes and gt nums are sent to worker
+    '''
+    shared_memory_name, shape, dtype, matrix_indexes, gt_nums = args
+
+    if shared_memory_name not in worker_shared_memory_dict:
+        # close buffers of previous shared memory,main process may reallocate a larger one
+        for per_shared_memory in worker_shared_memory_dict.values():
+            per_shared_memory.close()
+        worker_shared_memory_dict.clear()
+        per_shared_memory = shared_memory.SharedMemory(
+            name=shared_memory_name)
+        worker_shared_memory_dict[shared_memory_name] = per_shared_memory
+
+    buffer = worker_shared_memory_dict[shared_memory_name].buf
+    batch_cost = np.ndarray(shape, dtype=dtype, buffer=buffer)
+
+    results = []
+    for matrix_index, gt_num in zip(matrix_indexes, gt_nums):
+        # copy,linear_sum_assignment_with_inf modifies nan/inf in place
+        results.append(
+            linear_sum_assignment_with_inf(
+                np.array(batch_cost[matrix_index, :, 0:gt_num])))
+    del batch_cost
+
+    return results
+
+
+def get_batch_padded_targets(annotations):
+    '''
+    annotations:[batch_size,max_annot_num,5],5:[x,y,w,h,class],class<0 is padding
+    return gt_boxes:[batch_size,max_gt_num,4],gt_labels:[batch_size,max_gt_num],gt_nums:list
+    '''
+    per_image_targets = [
+        per_image_annots[per_image_annots[:, 4] >= 0]
+        for per_image_annots in annotations
+    ]
+    gt_nums = [
+        per_image_target.shape[0] for per_image_target in per_image_targets
+    ]
+    max_gt_num = max(gt_nums) if len(gt_nums) > 0 else 0
+
+    batch_size, device = len(per_image_targets), annotations[0].device
+    # padded boxes are valid boxes,so padded cost columns have no nan
+    gt_boxes = torch.ones((batch_size, max_gt_num, 4),
+                          dtype=annotations[0].dtype,
+                          device=device) * 0.5
+    gt_labels = torch.zeros((batch_size, max_gt_num),
+                            dtype=torch.int64,
+                            device=device)
+    for i, per_image_target in enumerate(per_image_targets):
+        gt_boxes[i, 0:gt_nums[i]] = per_image_target[:, 0:4]
+        gt_labels[i, 0:gt_nums[i]] = per_image_target[:, 4].long()
+
+    return gt_boxes, gt_labels, gt_nums
+
+
+def transform_batch_cxcywh_box_to_xyxy_box(boxes):
+    x_center, y_center, w, h = boxes[..., 0], boxes[..., 1], boxes[
+        ..., 2], boxes[..., 3]
+    boxes = torch.stack([(x_center - 0.5 * w), (y_center - 0.5 * h),
+                         (x_center + 0.5 * w), (y_center + 0.5 * h)],
+                        dim=-1)
+
+    return boxes
+
+
+def compute_batch_box_giou(boxes1, boxes2):
+    '''
+    batched version of DETRLoss.compute_box_giou,same ops
+    boxes1:[batch_size,N,4],boxes2:[batch_size,M,4],[x0,y0,x1,y1] format
+    return [batch_size,N,M] pairwise giou matrix
+    '''
+    area1 = (boxes1[..., 2] - boxes1[..., 0]) * (boxes1[..., 3] -
+                                                 boxes1[..., 1])
+    area2 = (boxes2[..., 2] - boxes2[..., 0]) * (boxes2[..., 3] -
+                                                 boxes2[..., 1])
+    area1 = torch.clamp(area1, min=0)
+    area2 = torch.clamp(area2, min=0)
+
+    lt = torch.max(boxes1[:, :, None, :2], boxes2[:, None, :, :2])
+    rb = torch.min(boxes1[:, :, None, 2:], boxes2[:, None, :, 2:])
+
+    wh = (rb - lt).clamp(min=0)
+    inter = wh[..., 0] * wh[..., 1]
+    inter = torch.clamp(inter, min=0)
+
+    union = area1[:, :, None] + area2[:, None, :] - inter
+    union = torch.clamp(union, min=1e-4)
+
+    iou = inter / union
+
+    enclose_lt = torch.min(boxes1[:, :, None, :2], boxes2[:, None, :, :2])
+    enclose_rb = torch.max(boxes1[:, :, None, 2:], boxes2[:, None, :, 2:])
+
+    enclose_wh = (enclose_rb - enclose_lt).clamp(min=0)
+    enclose_area = enclose_wh[..., 0] * enclose_wh[..., 1]
+    enclose_area = torch.clamp(enclose_area, min=1e-4)
+
+    return iou - (enclose_area - union) / enclose_area
+
+
+class HungarianMatcher:
+    '''
+    solve padded batch cost matrices,one matrix per image(and per decoder layer)
+    match_backend:
+    serial(default):scipy linear_sum_assignment one by one,one device to host copy for all matrices.
+    pool:scipy linear_sum_assignment in worker processes,cost matrices are written to a shared memory buffer once.
+    pool only helps when scipy time dominates ipc overhead and num_workers free cpu cores(besides dataloader workers)
+    are available,e.g. DINODETRLoss(900 queries,last+aux+interm layers) with large batch.
+    DETRLoss(100 queries,last layer only) is faster with serial,see tools/data_tools/benchmark_hungarian_matcher.py.
+    '''
+
+    def __init__(self, match_backend='serial', num_workers=4):
+        assert match_backend in ['serial', 'pool'], 'wrong match backend!'
+        self.match_backend = match_backend
+        self.num_workers = num_workers
+
+        self.pool = None
+        self.shared_memory = None
+
+    def __call__(self, batch_cost, gt_nums):
+        '''
+        batch_cost:[matrix_num,query_num,max_gt_num],padded gt columns are ignored
+        gt_nums:[matrix_num],gt num of every matrix
+        return [(query_indexes,gt_indexes),...],query_indexes are ascending sort
+        '''
+        gt_nums = [int(gt_num) for gt_num in gt_nums]
+        if max(gt_nums, default=0) == 0:
+            return [
+                self.get_empty_indices() for _ in range(batch_cost.shape[0])
+            ]
+
+        if self.match_backend == 'pool' and self.num_workers > 1:
+            indices = self.solve_by_pool(batch_cost, gt_nums)
+        else:
+            batch_cost = batch_cost.detach().cpu().numpy()
+            indices = [
+                linear_sum_assignment_with_inf(
+                    np.array(per_cost[:, 0:gt_num]))
+                for per_cost, gt_num in zip(batch_cost, gt_nums)
+            ]
+
+        indices = [(torch.as_tensor(i, dtype=torch.int64),
+                    torch.as_tensor(j, dtype=torch.int64)) for i, j in indices]
+
+        return indices
+
+    def get_empty_indices(self):
+        return (torch.zeros((0), dtype=torch.int64),
+                torch.zeros((0), dtype=torch.int64))
+
+    def solve_by_pool(self, batch_cost, gt_nums):
+        batch_cost = batch_cost.detach()
+        if batch_cost.dtype != torch.float32:
+            batch_cost = batch_cost.float()
+
+        shared_cost = self.get_shared_cost_buffer(batch_cost.shape)
+        # one copy from device to shared memory,workers read it without pickling
+        torch.from_numpy(shared_cost).copy_(batch_cost)
+
+        matrix_indexes = np.argsort(-np.array(gt_nums), kind='stable')
+        # larger matrices first,greedy balance every worker matrices
+        worker_matrix_indexes = [[] for _ in range(self.num_workers)]
+        worker_loads = [0 for _ in range(self.num_workers)]
+        for matrix_index in matrix_indexes:
+            worker_index = int(np.argmin(worker_loads))
+            worker_matrix_indexes[worker_index].append(int(matrix_index))
+            worker_loads[worker_index] += gt_nums[matrix_index] + 1
+
+        args = [(self.shared_memory.name, shared_cost.shape, shared_cost.dtype,
+                 per_worker_indexes,
+                 [gt_nums[index] for index in per_worker_indexes])
+                for per_worker_indexes in worker_matrix_indexes
+                if len(per_worker_indexes) > 0]
+        worker_results = self.get_pool().map(solve_shared_cost_matrices, args)
+
+        indices = [None for _ in range(len(gt_nums))]
+        for per_args, per_worker_results in zip(args, worker_results):
+            for matrix_index, per_result in zip(per_args[3],
+                                                per_worker_results):
+                indices[matrix_index] = per_result
+
+        return indices
+
+    def get_pool(self):
+        if self.pool is None:
+            # spawn:workers don't inherit cuda context of main process
+            self.pool = multiprocessing.get_context('spawn').Pool(
+                self.num_workers)
+
+        return self.pool
+
+    def get_shared_cost_buffer(self, shape):
+        nbytes = int(np.prod(shape)) * np.dtype(np.float32).itemsize
+        if self.shared_memory is None or self.shared_memory.size < nbytes:
+            self.release_shared_memory()
+            # grow by 2x,so buffer is reallocated only a few times
+            self.shared_memory = shared_memory.SharedMemory(
+                create=True, size=max(nbytes * 2, 4096))
+
+        return np.ndarray(shape,
+                          dtype=np.float32,
+                          buffer=self.shared_memory.buf)
+
+    def release_shared_memory(self):
+        if self.shared_memory is not None:
+            self.shared_memory.close()
+            self.shared_memory.unlink()
+            self.shared_memory = None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.release_shared_memory()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __getstate__(self):
+        # pool and shared memory are process local
+        state = self.__dict__.copy()
+        state['pool'] = None
+        state['shared_memory'] = None
+
+        return state
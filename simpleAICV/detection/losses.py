@@ -14,6 +14,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from simpleAICV.detection.models.anchor import RetinaAnchors, FCOSPositions, TTFNetPositions
+from simpleAICV.detection.hungarian_matcher import HungarianMatcher, linear_sum_assignment_with_inf, get_batch_padded_targets, transform_batch_cxcywh_box_to_xyxy_box, compute_batch_box_giou
 
 __all__ = [
     'RetinaLoss',
@@ -137,7 +138,8 @@ class RetinaLoss(nn.Module):
                  focal_eiou_gamma=0.5,
                  cls_loss_weight=1.,
                  box_loss_weight=1.,
-                 box_loss_type='CIoU'):
+                 box_loss_type='CIoU',
+                 assign_max_chunk_elements=2**22):
         super(RetinaLoss, self).__init__()
         assert box_loss_type in [
             'SmoothL1', 'IoU', 'GIoU', 'DIoU', 'CIoU', 'EIoU', 'Focal_EIoU'
@@ -153,6 +155,8 @@ class RetinaLoss(nn.Module):
         self.cls_loss_weight = cls_loss_weight
         self.box_loss_weight = box_loss_weight
         self.box_loss_type = box_loss_type
+        # max element num of a [batch_size,annotation_num,chunk_anchors_num] iou tensor,None for no chunking
+        self.assign_max_chunk_elements = assign_max_chunk_elements
         self.iou_function = IoUMethod()
 
     def forward(self, preds, annotations):
@@ -166,14 +170,18 @@ class RetinaLoss(nn.Module):
         feature_size = [[
             per_level_cls_pred.shape[2], per_level_cls_pred.shape[1]
         ] for per_level_cls_pred in cls_preds]
-        one_image_anchors = self.anchors(feature_size)
+        # cached device anchors,not regenerated and copied to device every iteration
+        one_image_anchors = self.anchors.get_device_anchors(
+            feature_size, device)
         one_image_anchors = torch.cat([
-            torch.tensor(per_level_anchor).view(-1, per_level_anchor.shape[-1])
+            per_level_anchor.view(-1, per_level_anchor.shape[-1])
             for per_level_anchor in one_image_anchors
         ],
                                       dim=0)
         batch_anchors = one_image_anchors.unsqueeze(0).repeat(
-            batch_size, 1, 1).to(device)
+            batch_size, 1, 1)
+        # batched assign,same targets as per image loop and 1.3x-1.9x faster on cpu for 10-100 objects per image
+        # with default assign_max_chunk_elements(see tools/data_tools/benchmark_detection_loss_targets.py)
         batch_anchors_annotations = self.get_batch_anchors_annotations(
             batch_anchors, annotations)
 
@@ -333,6 +341,132 @@ class RetinaLoss(nn.Module):
         if anchor gt_class index = 0,this anchor is a background class anchor and used in calculate cls loss
         if anchor gt_class index > 0,this anchor is a object class anchor and used in
         calculate cls loss and reg loss
+        all images share same anchors(batch_anchors is one image anchors repeated),so ious are only computed
+        between anchors and valid annotations of all images,then copied into padded [B*annotation_num,chunk]
+        ious(padded annotations iou=-1) for per image max/argmax.anchors are split into chunks,
+        so peak memory is [batch_size,annotation_num,chunk_anchors_num].
+        assignments are same as get_batch_anchors_annotations_per_image.
+        '''
+        assert batch_anchors.shape[0] == annotations.shape[0]
+        device = annotations.device
+        batch_size, one_image_anchor_nums = batch_anchors.shape[
+            0], batch_anchors.shape[1]
+        annotation_num = annotations.shape[1]
+
+        batch_anchors_annotations = torch.ones(
+            [batch_size, one_image_anchor_nums, 5],
+            dtype=torch.float32,
+            device=device) * (-1)
+
+        # valid annotations mask shape:[B,A]
+        annotations_valid = annotations[:, :, 4] >= 0
+        # images without any annotation keep all anchors gt class -1
+        images_valid = annotations_valid.any(dim=1)
+        if annotation_num == 0 or not images_valid.any():
+            return batch_anchors_annotations
+
+        images_all_valid = bool(images_valid.all())
+
+        one_image_anchors = batch_anchors[0]
+        batch_gt_bboxes = annotations[:, :, 0:4]
+        batch_gt_class = annotations[:, :, 4]
+        # valid annotations of all images,flat index in [B*A]
+        valid_idxs = torch.nonzero(annotations_valid.view(-1),
+                                   as_tuple=True)[0]
+        valid_gt_bboxes = batch_gt_bboxes.reshape(-1, 4)[valid_idxs]
+
+        if self.assign_max_chunk_elements:
+            chunk_anchors_num = max(
+                1,
+                self.assign_max_chunk_elements // (batch_size * annotation_num))
+        else:
+            chunk_anchors_num = one_image_anchor_nums
+
+        for start in range(0, one_image_anchor_nums, chunk_anchors_num):
+            end = min(start + chunk_anchors_num, one_image_anchor_nums)
+            per_chunk_anchors = one_image_anchors[start:end]
+
+            # valid ious shape:[valid_num,chunk]
+            per_chunk_valid_ious = self.compute_anchors_gt_bboxes_ious(
+                per_chunk_anchors, valid_gt_bboxes)
+            # padded ious shape:[B,A,chunk],padded annotations iou=-1 so they are never the max iou annotation
+            per_chunk_ious = per_chunk_valid_ious.new_full(
+                (batch_size * annotation_num, end - start), -1)
+            per_chunk_ious.index_copy_(0, valid_idxs, per_chunk_valid_ious)
+            del per_chunk_valid_ious
+
+            # snap per gt bboxes to the best iou anchor
+            overlap, indices = per_chunk_ious.view(batch_size, annotation_num,
+                                                   -1).max(dim=1)
+            del per_chunk_ious
+
+            per_chunk_anchors_gt_class = torch.ones_like(overlap) * -1
+            # if iou <0.4,assign anchors gt class as 0:background
+            per_chunk_anchors_gt_class[overlap < 0.4] = 0
+            # if iou >=0.5,assign anchors gt class as same as the max iou annotation class:80 classes index from 1 to 80
+            per_chunk_anchors_gt_class = torch.where(
+                overlap >= 0.5,
+                torch.gather(batch_gt_class, 1, indices) + 1,
+                per_chunk_anchors_gt_class)
+
+            # assgin each anchor gt bboxes for max iou annotation
+            per_chunk_anchors_gt_bboxes = torch.gather(
+                batch_gt_bboxes, 1,
+                indices.unsqueeze(-1).expand(-1, -1, 4))
+            if self.box_loss_type == 'SmoothL1':
+                # transform gt bboxes to [tx,ty,tw,th] format for each anchor
+                per_chunk_anchors_gt_bboxes = self.snap_annotations_to_txtytwth(
+                    per_chunk_anchors_gt_bboxes.reshape(-1, 4),
+                    per_chunk_anchors.repeat(batch_size, 1)).view(
+                        batch_size, -1, 4)
+
+            per_chunk_anchors_annotations = torch.cat([
+                per_chunk_anchors_gt_bboxes,
+                per_chunk_anchors_gt_class.unsqueeze(-1)
+            ],
+                                                      dim=2)
+            if images_all_valid:
+                batch_anchors_annotations[:,
+                                          start:end] = per_chunk_anchors_annotations
+            else:
+                batch_anchors_annotations[:, start:end] = torch.where(
+                    images_valid.view(-1, 1, 1),
+                    per_chunk_anchors_annotations,
+                    batch_anchors_annotations[:, start:end])
+
+        # batch anchors annotations shape:[batch_size, anchor_nums, 5]
+        return batch_anchors_annotations
+
+    def compute_anchors_gt_bboxes_ious(self, anchors, gt_bboxes):
+        '''
+        anchors:[anchor_num,4],gt_bboxes:[gt_num,4],xyxy type
+        return ious shape:[gt_num,anchor_num],same values as IoUMethod(iou_type='IoU',box_type='xyxy'),
+        but every op works on contiguous [gt_num,anchor_num] tensors in place instead of broadcast [...,2] tensors.
+        '''
+        anchors, gt_bboxes = anchors.t().unsqueeze(1), gt_bboxes.unsqueeze(2)
+        overlap_w = torch.minimum(anchors[2], gt_bboxes[:, 2]).sub_(
+            torch.maximum(anchors[0], gt_bboxes[:, 0])).clamp_(min=0)
+        overlap_h = torch.minimum(anchors[3], gt_bboxes[:, 3]).sub_(
+            torch.maximum(anchors[1], gt_bboxes[:, 1])).clamp_(min=0)
+        overlap_area = overlap_w.mul_(overlap_h)
+        del overlap_h
+
+        anchors_area = torch.clamp(anchors[2] - anchors[0], min=0) * torch.clamp(
+            anchors[3] - anchors[1], min=0)
+        gt_bboxes_area = torch.clamp(gt_bboxes[:, 2] - gt_bboxes[:, 0],
+                                     min=0) * torch.clamp(
+                                         gt_bboxes[:, 3] - gt_bboxes[:, 1],
+                                         min=0)
+        union_area = torch.add(anchors_area, gt_bboxes_area).sub_(
+            overlap_area).clamp_(min=1e-4)
+        ious = overlap_area.div_(union_area)
+
+        return ious
+
+    def get_batch_anchors_annotations_per_image(self, batch_anchors,
+                                                annotations):
+        '''
+        per image loop version of get_batch_anchors_annotations,used as reference.
         '''
         assert batch_anchors.shape[0] == annotations.shape[0]
         device = annotations.device
@@ -449,7 +583,8 @@ class FCOSLoss(nn.Module):
                  center_ness_loss_weight=1.,
                  box_loss_iou_type='CIoU',
                  center_sample_radius=1.5,
-                 use_center_sample=True):
+                 use_center_sample=True,
+                 assign_max_chunk_elements=2**22):
         super(FCOSLoss, self).__init__()
         assert box_loss_iou_type in ['IoU', 'GIoU', 'DIoU', 'CIoU',
                                      'EIoU'], 'wrong IoU type!'
@@ -464,6 +599,8 @@ class FCOSLoss(nn.Module):
         self.box_loss_iou_type = box_loss_iou_type
         self.center_sample_radius = center_sample_radius
         self.use_center_sample = use_center_sample
+        # max element num of a [batch_size,chunk_points_num,annotation_num] assign tensor,None for no chunking
+        self.assign_max_chunk_elements = assign_max_chunk_elements
         self.iou_function = IoUMethod()
 
     def forward(self, preds, annotations):
@@ -477,10 +614,11 @@ class FCOSLoss(nn.Module):
         feature_size = [[
             per_level_cls_pred.shape[2], per_level_cls_pred.shape[1]
         ] for per_level_cls_pred in cls_preds]
-        one_image_positions = self.positions(feature_size)
+        # cached device positions,not regenerated and copied to device every iteration
+        one_image_positions = self.positions.get_device_positions(
+            feature_size, device)
         batch_positions = [
-            torch.tensor(per_level_position).unsqueeze(0).repeat(
-                batch_size, 1, 1, 1).to(device)
+            per_level_position.unsqueeze(0).repeat(batch_size, 1, 1, 1)
             for per_level_position in one_image_positions
         ]
 
@@ -625,6 +763,137 @@ class FCOSLoss(nn.Module):
                                        use_center_sample=True):
         '''
         Assign a ground truth target for each position on feature map
+        all images are assigned together on padded annotations,points are split into chunks so peak memory is
+        [batch_size,chunk_points_num,annotation_num] instead of [points_num,annotation_num,4] per image.
+        assignments are same as get_batch_position_annotations_per_image.
+        '''
+        device = annotations.device
+        cls_preds,reg_preds,center_preds,all_points_position,all_points_mi,all_points_stride=[],[],[],[],[],[]
+        for cls_pred, reg_pred, center_pred, per_level_position, mi, stride in zip(
+                cls_heads, reg_heads, center_heads, batch_positions, self.mi,
+                self.strides):
+            B, H, W, _ = reg_pred.shape
+            cls_preds.append(cls_pred.view(B, -1, cls_pred.shape[-1]))
+            reg_preds.append(reg_pred.view(B, -1, reg_pred.shape[-1]))
+            center_preds.append(center_pred.view(B, -1, center_pred.shape[-1]))
+            all_points_position.append(
+                per_level_position.view(B, -1, per_level_position.shape[-1]))
+            # same float32 values as per image assign
+            per_level_mi = torch.zeros(H * W, 2).to(device)
+            all_points_mi.append(per_level_mi + torch.tensor(mi).to(device))
+            per_level_stride = torch.zeros(H * W).to(device)
+            all_points_stride.append(per_level_stride + stride)
+
+        cls_preds = torch.cat(cls_preds, dim=1)
+        reg_preds = torch.cat(reg_preds, dim=1)
+        center_preds = torch.cat(center_preds, dim=1)
+        all_points_position = torch.cat(all_points_position, dim=1)
+        all_points_mi = torch.cat(all_points_mi, dim=0)
+        all_points_stride = torch.cat(all_points_stride, dim=0)
+
+        batch_size, points_num = all_points_position.shape[
+            0], all_points_position.shape[1]
+        annotation_num = annotations.shape[1]
+
+        # 6:l,t,r,b,class_index,center-ness_gt
+        batch_targets = torch.zeros([batch_size, points_num, 6],
+                                    dtype=torch.float32,
+                                    device=device)
+
+        if annotation_num > 0 and (annotations[:, :, 4] >= 0).any():
+            # annotations shape:[B,1,A],padded annotations class_index=-1
+            gt_x1, gt_y1, gt_x2, gt_y2 = [
+                annotations[:, :, i].unsqueeze(1) for i in range(4)
+            ]
+            gt_valid = (annotations[:, :, 4] >= 0).unsqueeze(1)
+            gt_ctr_x, gt_ctr_y = (gt_x2 + gt_x1) / 2, (gt_y2 + gt_y1) / 2
+            gt_area = (gt_x2 - gt_x1) * (gt_y2 - gt_y1)
+
+            if self.assign_max_chunk_elements:
+                chunk_points_num = max(
+                    1, self.assign_max_chunk_elements //
+                    (batch_size * annotation_num))
+            else:
+                chunk_points_num = points_num
+
+            INF = 100000000
+            for start in range(0, points_num, chunk_points_num):
+                end = min(start + chunk_points_num, points_num)
+                # point_x,point_y shape:[B,chunk,1]
+                point_x = all_points_position[:, start:end, 0:1]
+                point_y = all_points_position[:, start:end, 1:2]
+
+                # l,t,r,b shape:[B,chunk,A]
+                l, t = point_x - gt_x1, point_y - gt_y1
+                r, b = gt_x2 - point_x, gt_y2 - point_y
+                # points ctr in gt box
+                positive_flag = (l > 0) & (t > 0) & (r > 0) & (b > 0)
+                positive_flag = positive_flag & gt_valid
+
+                # points in center circle
+                if use_center_sample:
+                    compute_distance = torch.sqrt((point_x - gt_ctr_x)**2 +
+                                                  (point_y - gt_ctr_y)**2)
+                    judge_distance = all_points_stride[
+                        start:end] * self.center_sample_radius
+                    positive_flag = positive_flag & (
+                        compute_distance < judge_distance.view(1, -1, 1))
+
+                # assign ground turth in range of mi
+                max_value = torch.max(torch.max(l, r), torch.max(t, b))
+                per_chunk_mi = all_points_mi[start:end]
+                positive_flag = positive_flag & (
+                    max_value > per_chunk_mi[:, 0].view(1, -1, 1)) & (
+                        max_value < per_chunk_mi[:, 1].view(1, -1, 1))
+
+                del l, t, r, b, max_value
+
+                # if a positive point sample have serveral object candidates,then choose the smallest area object candidate
+                candidate_area = torch.where(
+                    positive_flag, gt_area,
+                    torch.ones_like(gt_area) * INF)
+                _, min_index = candidate_area.min(dim=2)
+                point_positive_flag = positive_flag.any(dim=2)
+
+                del positive_flag, candidate_area
+
+                # per point assigned annotation shape:[B,chunk,5]
+                assigned_annotations = torch.gather(
+                    annotations, 1,
+                    min_index.unsqueeze(-1).expand(-1, -1,
+                                                   annotations.shape[-1]))
+                l = point_x[:, :, 0] - assigned_annotations[:, :, 0]
+                t = point_y[:, :, 0] - assigned_annotations[:, :, 1]
+                r = assigned_annotations[:, :, 2] - point_x[:, :, 0]
+                b = assigned_annotations[:, :, 3] - point_y[:, :, 0]
+                center_ness = torch.sqrt(
+                    (torch.min(l, r) / torch.max(l, r)) *
+                    (torch.min(t, b) / torch.max(t, b)))
+
+                # class_index value from 1 to 80 represent 80 positive classes,class_index value 0 represenet negative class
+                per_chunk_targets = torch.stack([
+                    l, t, r, b, assigned_annotations[:, :, 4] + 1, center_ness
+                ],
+                                                dim=-1)
+                batch_targets[:, start:end] = torch.where(
+                    point_positive_flag.unsqueeze(-1), per_chunk_targets,
+                    batch_targets[:, start:end])
+
+        batch_targets = torch.cat([batch_targets, all_points_position], dim=2)
+
+        # batch_targets shape:[batch_size, points_num, 8],8:l,t,r,b,class_index,center-ness_gt,point_ctr_x,point_ctr_y
+        return cls_preds, reg_preds, center_preds, batch_targets
+
+    def get_batch_position_annotations_per_image(self,
+                                                 cls_heads,
+                                                 reg_heads,
+                                                 center_heads,
+                                                 batch_positions,
+                                                 annotations,
+                                                 use_center_sample=True):
+        '''
+        Assign a ground truth target for each position on feature map
+        per image loop version of get_batch_position_annotations,used as reference.
         '''
         device = annotations.device
         batch_mi, batch_stride = [], []
@@ -838,6 +1107,88 @@ class FCOSLoss(nn.Module):
         return cls_preds, reg_preds, center_preds, batch_targets
 
 
+def get_batch_gaussian_window_points(centers_int,
+                                     h_radius,
+                                     w_radius,
+                                     height,
+                                     width,
+                                     max_chunk_elements=2**22):
+    '''
+    render gaussian windows of all objects in a batch with a few tensor ops.
+    centers_int:[M,2] int x,y,h_radius/w_radius:[M] int radius,gaussian sigma_x=(2*w_radius+1)/6,sigma_y=(2*h_radius+1)/6.
+    same values as gaussian_2d/draw_truncate_gaussian:float64 gaussian,values < eps set to 0,points outside image removed.
+    objects are sorted by radius and rendered in chunks,every chunk pads windows to its max radius and has at most
+    max_chunk_elements window points.
+    return object_idxs,point_idxs(y*width+x),values(float32) of all nonzero gaussian points.
+    '''
+    device = centers_int.device
+    object_nums = centers_int.shape[0]
+    if object_nums == 0:
+        return torch.zeros((0, ), dtype=torch.long,
+                           device=device), torch.zeros(
+                               (0, ), dtype=torch.long,
+                               device=device), torch.zeros(
+                                   (0, ), dtype=torch.float32, device=device)
+
+    centers_int = centers_int.long()
+    h_radius, w_radius = h_radius.long(), w_radius.long()
+    sigma_x = (2. * w_radius.double() + 1.) / 6.
+    sigma_y = (2. * h_radius.double() + 1.) / 6.
+    eps = np.finfo(np.float64).eps
+
+    max_radius = torch.max(h_radius, w_radius)
+    sorted_max_radius, sorted_object_idxs = torch.sort(max_radius)
+    sorted_max_radius = sorted_max_radius.tolist()
+
+    all_object_idxs, all_point_idxs, all_values = [], [], []
+    start = 0
+    while start < object_nums:
+        # objects are sorted by radius,last object of chunk has max window
+        end = start + 1
+        while end < object_nums and (end + 1 - start) * (
+                2 * sorted_max_radius[end] + 1)**2 <= max_chunk_elements:
+            end += 1
+        chunk_radius = sorted_max_radius[end - 1]
+        chunk_object_idxs = sorted_object_idxs[start:end]
+        start = end
+
+        offsets = torch.arange(-chunk_radius,
+                               chunk_radius + 1,
+                               dtype=torch.long,
+                               device=device)
+        # [chunk,window,window]
+        dx = offsets.view(1, 1, -1)
+        dy = offsets.view(1, -1, 1)
+        window_size = offsets.shape[0]
+        x = (centers_int[chunk_object_idxs, 0].view(-1, 1, 1) + dx).expand(
+            -1, window_size, -1)
+        y = (centers_int[chunk_object_idxs, 1].view(-1, 1, 1) + dy).expand(
+            -1, -1, window_size)
+        chunk_sigma_x = sigma_x[chunk_object_idxs].view(-1, 1, 1)
+        chunk_sigma_y = sigma_y[chunk_object_idxs].view(-1, 1, 1)
+        dx, dy = dx.double(), dy.double()
+        values = torch.exp(-(dx * dx / (2 * chunk_sigma_x * chunk_sigma_x) +
+                             dy * dy / (2 * chunk_sigma_y * chunk_sigma_y)))
+
+        valid_masks = (torch.abs(offsets).view(1, 1, -1)
+                       <= w_radius[chunk_object_idxs].view(-1, 1, 1)) & (
+                           torch.abs(offsets).view(1, -1, 1)
+                           <= h_radius[chunk_object_idxs].view(-1, 1, 1))
+        valid_masks = valid_masks & (x >= 0) & (x < width) & (y >= 0) & (
+            y < height) & (values >= eps)
+
+        valid_idxs = torch.nonzero(valid_masks, as_tuple=True)
+        all_object_idxs.append(chunk_object_idxs[valid_idxs[0]])
+        all_point_idxs.append(y[valid_idxs] * width + x[valid_idxs])
+        all_values.append(values[valid_idxs].float())
+
+    all_object_idxs = torch.cat(all_object_idxs, dim=0)
+    all_point_idxs = torch.cat(all_point_idxs, dim=0)
+    all_values = torch.cat(all_values, dim=0)
+
+    return all_object_idxs, all_point_idxs, all_values
+
+
 class CenterNetLoss(nn.Module):
 
     def __init__(self,
@@ -982,6 +1333,84 @@ class CenterNetLoss(nn.Module):
         return loss
 
     def get_batch_targets(self, heatmap_heads, annotations):
+        '''
+        batched version of get_batch_targets_per_image,all objects of a batch are rendered together.
+        '''
+        B, num_classes, H, W = heatmap_heads.shape[0], heatmap_heads.shape[
+            1], heatmap_heads.shape[2], heatmap_heads.shape[3]
+        device = annotations.device
+
+        annotations = annotations.float()
+        valid_masks = annotations[:, :, 4] >= 0
+        # slot of every object in its image targets,same order as per image loop
+        object_slots = torch.cumsum(valid_masks.long(), dim=1) - 1
+
+        image_idxs, annot_idxs = torch.nonzero(valid_masks, as_tuple=True)
+        object_annots = annotations[image_idxs, annot_idxs]
+        object_slots = object_slots[image_idxs, annot_idxs]
+
+        gt_bboxes, gt_classes = object_annots[:, 0:4], object_annots[:, 4]
+        # gt_bboxes divided by 4 to get downsample bboxes
+        gt_bboxes = gt_bboxes / 4.
+        gt_bboxes[:, [0, 2]] = torch.clamp(gt_bboxes[:, [0, 2]],
+                                           min=0,
+                                           max=W - 1)
+        gt_bboxes[:, [1, 3]] = torch.clamp(gt_bboxes[:, [1, 3]],
+                                           min=0,
+                                           max=H - 1)
+        all_h, all_w = gt_bboxes[:, 3] - gt_bboxes[:, 1], gt_bboxes[:,
+                                                                    2] - gt_bboxes[:,
+                                                                                   0]
+
+        centers = torch.cat(
+            [((gt_bboxes[:, 0] + gt_bboxes[:, 2]) / 2).unsqueeze(-1),
+             ((gt_bboxes[:, 1] + gt_bboxes[:, 3]) / 2).unsqueeze(-1)],
+            axis=1)
+        centers_int = torch.trunc(centers)
+        centers_decimal = torch.frac(centers)
+
+        # limit max object num for per image
+        keep_masks = object_slots < self.max_object_num
+        keep_image_idxs = image_idxs[keep_masks]
+        keep_slots = object_slots[keep_masks]
+
+        batch_wh_targets = torch.zeros((B, self.max_object_num, 2),
+                                       device=device)
+        batch_offset_targets = torch.zeros((B, self.max_object_num, 2),
+                                           device=device)
+        batch_positive_targets_mask = torch.zeros((B, self.max_object_num),
+                                                  device=device)
+        batch_reg_to_heatmap_index = torch.zeros((B, self.max_object_num),
+                                                 device=device)
+        batch_wh_targets[keep_image_idxs, keep_slots] = torch.stack(
+            [all_w, all_h], dim=1)[keep_masks]
+        batch_offset_targets[keep_image_idxs,
+                             keep_slots] = centers_decimal[keep_masks]
+        batch_positive_targets_mask[keep_image_idxs, keep_slots] = 1
+        batch_reg_to_heatmap_index[keep_image_idxs, keep_slots] = (
+            centers_int[:, 1] * W + centers_int[:, 0])[keep_masks]
+
+        # gaussian of all objects are max merged into heatmap by one scatter
+        all_radius = self.compute_objects_gaussian_radius((all_h, all_w))
+        object_idxs, point_idxs, values = get_batch_gaussian_window_points(
+            centers_int, all_radius, all_radius, H, W)
+        heatmap_idxs = (image_idxs[object_idxs] * num_classes +
+                        gt_classes[object_idxs].long()) * H * W + point_idxs
+        batch_heatmap_targets = torch.zeros((B * num_classes * H * W, ),
+                                            device=device)
+        batch_heatmap_targets.scatter_reduce_(0,
+                                              heatmap_idxs,
+                                              values,
+                                              reduce='amax')
+        batch_heatmap_targets = batch_heatmap_targets.view(
+            B, num_classes, H, W)
+
+        return batch_heatmap_targets, batch_wh_targets, batch_offset_targets, batch_reg_to_heatmap_index, batch_positive_targets_mask
+
+    def get_batch_targets_per_image(self, heatmap_heads, annotations):
+        '''
+        per image and per object loop version of get_batch_targets,used as reference.
+        '''
         B, num_classes, H, W = heatmap_heads.shape[0], heatmap_heads.shape[
             1], heatmap_heads.shape[2], heatmap_heads.shape[3]
         device = annotations.device
@@ -1180,9 +1609,11 @@ class TTFNetLoss(nn.Module):
         batch_size = heatmap_heads.shape[0]
 
         feature_map_size = [heatmap_heads.shape[3], heatmap_heads.shape[2]]
-        one_image_positions = self.positions(feature_map_size)
-        batch_positions = torch.tensor(one_image_positions).unsqueeze(
-            0).repeat(batch_size, 1, 1, 1).to(device)
+        # cached device positions,not regenerated and copied to device every iteration
+        one_image_positions = self.positions.get_device_positions(
+            feature_map_size, device)
+        batch_positions = one_image_positions.unsqueeze(0).repeat(
+            batch_size, 1, 1, 1)
 
         batch_heatmap_targets, batch_reg_targets = self.get_batch_targets(
             heatmap_heads, annotations)
@@ -1273,6 +1704,108 @@ class TTFNetLoss(nn.Module):
         return ious_loss
 
     def get_batch_targets(self, heatmap_heads, annotations):
+        '''
+        batched version of get_batch_targets_per_image,all objects of a batch are rendered together.
+        '''
+        B, num_classes, H, W = heatmap_heads.shape[0], heatmap_heads.shape[
+            1], heatmap_heads.shape[2], heatmap_heads.shape[3]
+        device = annotations.device
+
+        annotations = annotations.float()
+        image_idxs, annot_idxs = torch.nonzero(annotations[:, :, 4] >= 0,
+                                               as_tuple=True)
+        object_annots = annotations[image_idxs, annot_idxs]
+
+        object_annots_box_wh = object_annots[:, 2:4] - object_annots[:, 0:2]
+        object_annots_box_area = torch.log(
+            torch.clamp(object_annots_box_wh[:, 0] * object_annots_box_wh[:, 1],
+                        min=1e-4))
+
+        gt_boxes = object_annots[:, 0:4] / 4.
+        gt_boxes[:, [0, 2]] = torch.clamp(gt_boxes[:, [0, 2]], min=0, max=W - 1)
+        gt_boxes[:, [1, 3]] = torch.clamp(gt_boxes[:, [1, 3]], min=0, max=H - 1)
+        all_h = gt_boxes[:, 3] - gt_boxes[:, 1]
+        all_w = gt_boxes[:, 2] - gt_boxes[:, 0]
+
+        centers = torch.cat([((gt_boxes[:, 0] + gt_boxes[:, 2]) /
+                              2).unsqueeze(-1),
+                             ((gt_boxes[:, 1] + gt_boxes[:, 3]) /
+                              2).unsqueeze(-1)],
+                            axis=1)
+        centers_int = torch.trunc(centers)
+
+        h_radius_alpha = torch.trunc((all_h / 2. * self.gaussian_alpha))
+        w_radius_alpha = torch.trunc((all_w / 2. * self.gaussian_alpha))
+        h_radius_beta = torch.trunc((all_h / 2. * self.gaussian_beta))
+        w_radius_beta = torch.trunc((all_w / 2. * self.gaussian_beta))
+
+        # heatmap:gaussian of all objects are max merged by one scatter
+        object_idxs, point_idxs, values = get_batch_gaussian_window_points(
+            centers_int, h_radius_alpha, w_radius_alpha, H, W)
+        heatmap_idxs = (image_idxs[object_idxs] * num_classes +
+                        object_annots[object_idxs, 4].long()) * H * W + point_idxs
+        batch_heatmap_targets = torch.zeros((B * num_classes * H * W, ),
+                                            dtype=torch.float32,
+                                            device=device)
+        batch_heatmap_targets.scatter_reduce_(0,
+                                              heatmap_idxs,
+                                              values,
+                                              reduce='amax')
+        batch_heatmap_targets = batch_heatmap_targets.view(
+            B, num_classes, H, W)
+
+        if self.gaussian_alpha != self.gaussian_beta:
+            object_idxs, point_idxs, values = get_batch_gaussian_window_points(
+                centers_int, h_radius_beta, w_radius_beta, H, W)
+
+        # larger boxes have lower priority than small boxes,every point keeps the box with max priority
+        object_priority = torch.zeros_like(object_annots_box_area,
+                                           dtype=torch.long)
+        object_priority[torch.argsort(object_annots_box_area,
+                                      descending=True,
+                                      stable=True)] = torch.arange(
+                                          object_annots.shape[0],
+                                          device=device)
+        point_priority = object_priority[object_idxs]
+        batch_point_idxs = image_idxs[object_idxs] * H * W + point_idxs
+        batch_point_owners = torch.full((B * H * W, ),
+                                        -1,
+                                        dtype=torch.long,
+                                        device=device)
+        batch_point_owners.scatter_reduce_(0,
+                                           batch_point_idxs,
+                                           point_priority,
+                                           reduce='amax')
+        owner_masks = batch_point_owners[batch_point_idxs] == point_priority
+
+        # box weight is normalized by sum of whole gaussian of the box
+        center_divs = torch.zeros((object_annots.shape[0], ),
+                                  dtype=torch.float32,
+                                  device=device).index_add_(
+                                      0, object_idxs, values)
+        point_weights = values * object_annots_box_area[
+            object_idxs] / center_divs[object_idxs]
+
+        # gt box has been downsampled by stride
+        batch_reg_targets = torch.ones(
+            (B * H * W, 5), dtype=torch.float32, device=device) * (-1)
+        owner_object_idxs = object_idxs[owner_masks]
+        batch_reg_targets[batch_point_idxs[owner_masks]] = torch.cat(
+            [
+                object_annots[owner_object_idxs, 0:4],
+                point_weights[owner_masks].unsqueeze(-1)
+            ],
+            dim=1)
+        batch_reg_targets = batch_reg_targets.view(B, H, W,
+                                                   5).permute(0, 3, 1,
+                                                              2).contiguous()
+
+        return batch_heatmap_targets, batch_reg_targets
+
+    def get_batch_targets_per_image(self, heatmap_heads, annotations):
+        '''
+        per image and per object loop version of get_batch_targets,used as reference.
+        '''
         B, num_classes, H, W = heatmap_heads.shape[0], heatmap_heads.shape[
             1], heatmap_heads.shape[2], heatmap_heads.shape[3]
         device = annotations.device
@@ -1417,7 +1950,9 @@ class DETRLoss(nn.Module):
                  box_l1_loss_weight=5.0,
                  iou_loss_weight=2.0,
                  no_object_cls_weight=0.1,
-                 num_classes=80):
+                 num_classes=80,
+                 match_backend='serial',
+                 match_num_workers=4):
         super(DETRLoss, self).__init__()
         self.cls_match_cost = cls_match_cost
         self.box_match_cost = box_match_cost
@@ -1434,6 +1969,9 @@ class DETRLoss(nn.Module):
 
         assert self.cls_match_cost != 0 or self.box_match_cost != 0 or self.giou_match_cost != 0, "all costs cant be 0"
 
+        self.matcher = HungarianMatcher(match_backend=match_backend,
+                                        num_workers=match_num_workers)
+
     def forward(self, preds, annotations):
         cls_preds, reg_preds = preds
         reg_preds = torch.clamp(reg_preds, min=1e-4, max=1. - 1e-4)
@@ -1570,89 +2108,51 @@ class DETRLoss(nn.Module):
 
     @torch.no_grad()
     def get_matched_pred_target_idxs(self, cls_preds, reg_preds, annotations):
-        batch_size, query_nums = cls_preds.shape[0], cls_preds.shape[1]
+        gt_boxes, gt_labels, gt_nums = get_batch_padded_targets(annotations)
+        if max(gt_nums) == 0:
+            return [self.matcher.get_empty_indices() for _ in gt_nums]
 
-        # [b*query_nums,num_classes]
-        cls_preds = cls_preds.flatten(0, 1)
-        cls_preds = F.softmax(cls_preds, dim=-1)
-        cls_preds = torch.clamp(cls_preds, min=1e-4, max=1. - 1e-4)
+        # [b,query_nums,max_gt_nums]
+        total_cost = self.get_batch_match_cost(cls_preds, reg_preds, gt_boxes,
+                                               gt_labels)
 
-        # [b*query_nums,4]
-        reg_preds = reg_preds.flatten(0, 1)
+        # for per image,assign one pred box to one GT box
+        indices = self.matcher(total_cost, gt_nums)
 
-        batch_gt_boxes_annot = []
-        per_image_gt_boxes_num = []
-        for per_image_boxes_annot in annotations:
-            per_image_boxes_annot = per_image_boxes_annot[
-                per_image_boxes_annot[:, 4] >= 0]
-            batch_gt_boxes_annot.append(per_image_boxes_annot)
-            per_image_gt_boxes_num.append(per_image_boxes_annot.shape[0])
-        batch_gt_boxes_annot = torch.cat(batch_gt_boxes_annot, dim=0)
-        batch_gt_boxes = batch_gt_boxes_annot[:, 0:4]
-        batch_gt_boxes_label = batch_gt_boxes_annot[:, 4]
+        return indices
+
+    def get_batch_match_cost(self, cls_preds, reg_preds, gt_boxes, gt_labels):
+        '''
+        cls_preds:[b,query_nums,num_classes+1],reg_preds:[b,query_nums,4]
+        gt_boxes:[b,max_gt_nums,4],gt_labels:[b,max_gt_nums],padded
+        only costs between queries and gts of same image are computed
+        '''
+        query_nums = cls_preds.shape[1]
+        cls_preds = F.softmax(cls_preds, dim=-1)
+        cls_preds = torch.clamp(cls_preds, min=1e-4, max=1. - 1e-4)
 
         # Compute the classification cost. Contrary to the loss, we don't use the NLL,
         # but approximate it in 1 - proba[target class].
         # The 1 is a constant that doesn't change the matching, it can be ommitted.
-        cls_cost = -cls_preds[:, batch_gt_boxes_label.long()]
+        cls_cost = -torch.gather(
+            cls_preds, 2,
+            gt_labels.unsqueeze(1).expand(-1, query_nums, -1))
 
         # Compute the L1 cost between boxes
-        box_cost = torch.cdist(reg_preds, batch_gt_boxes, p=1)
+        box_cost = torch.cdist(reg_preds, gt_boxes, p=1)
 
-        reg_preds = self.transform_cxcywh_box_to_xyxy_box(reg_preds)
-        batch_gt_boxes = self.transform_cxcywh_box_to_xyxy_box(batch_gt_boxes)
+        reg_preds = transform_batch_cxcywh_box_to_xyxy_box(reg_preds)
+        gt_boxes = transform_batch_cxcywh_box_to_xyxy_box(gt_boxes)
 
         # Compute the giou cost betwen boxes
-        giou_cost = -self.compute_box_giou(reg_preds, batch_gt_boxes)
+        giou_cost = -compute_batch_box_giou(reg_preds, gt_boxes)
         # Final cost matrix
         total_cost = self.cls_match_cost * cls_cost + self.box_match_cost * box_cost + self.giou_match_cost * giou_cost
-        total_cost = total_cost.view(batch_size, query_nums, -1)
-
-        # for per image,assign one pred box to one GT box
-        indices = []
-        for idx, per_image_cost in enumerate(
-                total_cost.split(per_image_gt_boxes_num, -1)):
-            indices.append(
-                self.linear_sum_assignment_with_inf(
-                    per_image_cost[idx].cpu().numpy()))
 
-        indices = [(torch.as_tensor(i, dtype=torch.int64),
-                    torch.as_tensor(j, dtype=torch.int64)) for i, j in indices]
-
-        return indices
+        return total_cost
 
     def linear_sum_assignment_with_inf(self, cost_matrix):
-        cost_matrix = np.asarray(cost_matrix)
-
-        nan = np.isnan(cost_matrix).any()
-        if nan:
-            cost_matrix[np.isnan(cost_matrix)] = 1e5
-
-        min_inf = np.isneginf(cost_matrix).any()
-        max_inf = np.isposinf(cost_matrix).any()
-        if min_inf and max_inf:
-            raise ValueError("matrix contains both inf and -inf")
-
-        if min_inf or max_inf:
-            values = cost_matrix[~np.isinf(cost_matrix)]
-            min_values = values.min()
-            max_values = values.max()
-            m = min(cost_matrix.shape)
-
-            positive = m * (max_values - min_values + np.abs(max_values) +
-                            np.abs(min_values) + 1)
-            if max_inf:
-                place_holder = (max_values + (m - 1) *
-                                (max_values - min_values)) + positive
-            elif min_inf:
-                place_holder = (min_values + (m - 1) *
-                                (min_values - max_values)) - positive
-
-            cost_matrix[np.isinf(cost_matrix)] = place_holder
-
-        results = scipy.optimize.linear_sum_assignment(cost_matrix)
-
-        return results
+        return linear_sum_assignment_with_inf(cost_matrix)
 
 
 class DINODETRLoss(nn.Module):
@@ -1666,7 +2166,9 @@ class DINODETRLoss(nn.Module):
                  iou_loss_weight=2.0,
                  alpha=0.25,
                  gamma=2.0,
-                 num_classes=80):
+                 num_classes=80,
+                 match_backend='serial',
+                 match_num_workers=4):
         super(DINODETRLoss, self).__init__()
         self.cls_match_cost = cls_match_cost
         self.box_match_cost = box_match_cost
@@ -1684,13 +2186,28 @@ class DINODETRLoss(nn.Module):
 
         assert self.cls_match_cost != 0 or self.box_match_cost != 0 or self.giou_match_cost != 0, "all costs cant be 0"
 
+        self.matcher = HungarianMatcher(match_backend=match_backend,
+                                        num_workers=match_num_workers)
+
     def forward(self, preds, annotations):
         last_cls_preds, last_reg_preds = preds['pred_logits'], preds[
             'pred_boxes']
 
-        # Retrieve the matching between the outputs of the last layer and the targets
-        last_indices = self.get_matched_pred_target_idxs(
-            last_cls_preds, last_reg_preds, annotations)
+        # Retrieve the matching between the outputs of all layers and the targets in one batch
+        match_preds_list = [[last_cls_preds, last_reg_preds]]
+        if 'aux_outputs' in preds:
+            match_preds_list += [[
+                per_level_aux_outputs['pred_logits'],
+                per_level_aux_outputs['pred_boxes']
+            ] for per_level_aux_outputs in preds['aux_outputs']]
+        if 'interm_outputs' in preds:
+            match_preds_list.append([
+                preds['interm_outputs']['pred_logits'],
+                preds['interm_outputs']['pred_boxes']
+            ])
+        all_indices = self.get_all_matched_pred_target_idxs(
+            match_preds_list, annotations)
+        last_indices = all_indices[0]
 
         # Compute all the requested loss_dict
         loss_dict = {}
@@ -1767,9 +2284,7 @@ class DINODETRLoss(nn.Module):
                 per_level_aux_cls_preds, per_level_aux_reg_preds = per_level_aux_outputs[
                     'pred_logits'], per_level_aux_outputs['pred_boxes']
 
-                per_level_indices = self.get_matched_pred_target_idxs(
-                    per_level_aux_cls_preds, per_level_aux_reg_preds,
-                    annotations)
+                per_level_indices = all_indices[1 + idx]
 
                 per_level_cls_loss = self.compute_batch_cls_loss(
                     per_level_aux_cls_preds, annotations, per_level_indices)
@@ -1823,8 +2338,7 @@ class DINODETRLoss(nn.Module):
             interm_cls_preds, interm_reg_preds = interm_outputs[
                 'pred_logits'], interm_outputs['pred_boxes']
 
-            interm_indices = self.get_matched_pred_target_idxs(
-                interm_cls_preds, interm_reg_preds, annotations)
+            interm_indices = all_indices[-1]
 
             interm_cls_loss = self.compute_batch_cls_loss(
                 interm_cls_preds, annotations, interm_indices)
@@ -1977,93 +2491,84 @@ class DINODETRLoss(nn.Module):
 
     @torch.no_grad()
     def get_matched_pred_target_idxs(self, cls_preds, reg_preds, annotations):
-        batch_size, query_nums = cls_preds.shape[0], cls_preds.shape[1]
+        return self.get_all_matched_pred_target_idxs([[cls_preds, reg_preds]],
+                                                     annotations)[0]
 
-        # [b*query_nums,num_classes]
-        cls_preds = cls_preds.flatten(0, 1)
+    @torch.no_grad()
+    def get_all_matched_pred_target_idxs(self, preds_list, annotations):
+        '''
+        preds_list:[[cls_preds,reg_preds],...],last/aux/interm outputs
+        outputs with same query nums build cost matrices in one batched op and are solved together
+        '''
+        gt_boxes, gt_labels, gt_nums = get_batch_padded_targets(annotations)
+        if max(gt_nums) == 0:
+            return [[self.matcher.get_empty_indices() for _ in gt_nums]
+                    for _ in preds_list]
+
+        batch_size = len(gt_nums)
+        all_indices = [None for _ in preds_list]
+        query_nums_list = [cls_preds.shape[1] for cls_preds, _ in preds_list]
+        for query_nums in sorted(set(query_nums_list)):
+            preds_indexes = [
+                i for i, per_query_nums in enumerate(query_nums_list)
+                if per_query_nums == query_nums
+            ]
+            cls_preds = torch.cat(
+                [preds_list[i][0] for i in preds_indexes], dim=0)
+            reg_preds = torch.cat(
+                [preds_list[i][1] for i in preds_indexes], dim=0)
+
+            # [len(preds_indexes)*b,query_nums,max_gt_nums]
+            total_cost = self.get_batch_match_cost(
+                cls_preds, reg_preds,
+                gt_boxes.repeat(len(preds_indexes), 1, 1),
+                gt_labels.repeat(len(preds_indexes), 1))
+
+            # for per image,assign one pred box to one GT box
+            indices = self.matcher(total_cost,
+                                   gt_nums * len(preds_indexes))
+            for j, preds_index in enumerate(preds_indexes):
+                all_indices[preds_index] = indices[j * batch_size:(j + 1) *
+                                                   batch_size]
+
+        return all_indices
+
+    def get_batch_match_cost(self, cls_preds, reg_preds, gt_boxes, gt_labels):
+        '''
+        cls_preds:[b,query_nums,num_classes],reg_preds:[b,query_nums,4]
+        gt_boxes:[b,max_gt_nums,4],gt_labels:[b,max_gt_nums],padded
+        only costs between queries and gts of same image are computed
+        '''
+        query_nums = cls_preds.shape[1]
         cls_preds = torch.sigmoid(cls_preds)
         cls_preds = torch.clamp(cls_preds, min=1e-4, max=1. - 1e-4)
 
-        # [b*query_nums,4]
-        reg_preds = reg_preds.flatten(0, 1)
         reg_preds = torch.clamp(reg_preds, min=1e-4, max=1. - 1e-4)
 
-        batch_gt_boxes_annot = []
-        per_image_gt_boxes_num = []
-        for per_image_boxes_annot in annotations:
-            per_image_boxes_annot = per_image_boxes_annot[
-                per_image_boxes_annot[:, 4] >= 0]
-            batch_gt_boxes_annot.append(per_image_boxes_annot)
-            per_image_gt_boxes_num.append(per_image_boxes_annot.shape[0])
-        batch_gt_boxes_annot = torch.cat(batch_gt_boxes_annot, dim=0)
-        batch_gt_boxes = batch_gt_boxes_annot[:, 0:4]
-        batch_gt_boxes_label = batch_gt_boxes_annot[:, 4]
-
+        gt_labels = gt_labels.unsqueeze(1).expand(-1, query_nums, -1)
         # Compute the classification cost.
         neg_cls_cost = (1 - self.alpha) * (cls_preds**self.gamma) * (
             -torch.log(1 - cls_preds + 1e-4))
         pos_cls_cost = self.alpha * (
             (1 - cls_preds)**self.gamma) * (-torch.log(cls_preds + 1e-4))
-        cls_cost = pos_cls_cost[:, batch_gt_boxes_label.long(
-        )] - neg_cls_cost[:, batch_gt_boxes_label.long()]
+        cls_cost = torch.gather(pos_cls_cost, 2, gt_labels) - torch.gather(
+            neg_cls_cost, 2, gt_labels)
 
         # Compute the L1 cost between boxes
-        box_cost = torch.cdist(reg_preds, batch_gt_boxes, p=1)
+        box_cost = torch.cdist(reg_preds, gt_boxes, p=1)
 
-        reg_preds = self.transform_cxcywh_box_to_xyxy_box(reg_preds)
-        batch_gt_boxes = self.transform_cxcywh_box_to_xyxy_box(batch_gt_boxes)
+        reg_preds = transform_batch_cxcywh_box_to_xyxy_box(reg_preds)
+        gt_boxes = transform_batch_cxcywh_box_to_xyxy_box(gt_boxes)
 
         # Compute the giou cost betwen boxes
-        giou_cost = -self.compute_box_giou(reg_preds, batch_gt_boxes)
+        giou_cost = -compute_batch_box_giou(reg_preds, gt_boxes)
         # Final cost matrix
         total_cost = self.cls_match_cost * cls_cost + self.box_match_cost * box_cost + self.giou_match_cost * giou_cost
-        total_cost = total_cost.view(batch_size, query_nums, -1)
-
-        # for per image,assign one pred box to one GT box
-        indices = []
-        for idx, per_image_cost in enumerate(
-                total_cost.split(per_image_gt_boxes_num, -1)):
-            indices.append(
-                self.linear_sum_assignment_with_inf(
-                    per_image_cost[idx].cpu().numpy()))
 
-        indices = [(torch.as_tensor(i, dtype=torch.int64),
-                    torch.as_tensor(j, dtype=torch.int64)) for i, j in indices]
-
-        return indices
+        return total_cost
 
     def linear_sum_assignment_with_inf(self, cost_matrix):
-        cost_matrix = np.asarray(cost_matrix)
-
-        nan = np.isnan(cost_matrix).any()
-        if nan:
-            cost_matrix[np.isnan(cost_matrix)] = 1e5
-
-        min_inf = np.isneginf(cost_matrix).any()
-        max_inf = np.isposinf(cost_matrix).any()
-        if min_inf and max_inf:
-            raise ValueError("matrix contains both inf and -inf")
-
-        if min_inf or max_inf:
-            values = cost_matrix[~np.isinf(cost_matrix)]
-            min_values = values.min()
-            max_values = values.max()
-            m = min(cost_matrix.shape)
-
-            positive = m * (max_values - min_values + np.abs(max_values) +
-                            np.abs(min_values) + 1)
-            if max_inf:
-                place_holder = (max_values + (m - 1) *
-                                (max_values - min_values)) + positive
-            elif min_inf:
-                place_holder = (min_values + (m - 1) *
-                                (min_values - max_values)) - positive
-
-            cost_matrix[np.isinf(cost_matrix)] = place_holder
-
-        results = scipy.optimize.linear_sum_assignment(cost_matrix)
-
-        return results
+        return linear_sum_assignment_with_inf(cost_matrix)
 
     def prep_for_dn(self, dn_meta):
         output_known_lbs_bboxes = dn_meta['output_known_lbs_bboxes']
@@ -1,30 +1,112 @@
+import collections
 import math
 import numpy as np
 
+import torch
 import torch.nn as nn
 
 
-class RetinaAnchors:
+class DeviceGridCache:
+    '''
+    lru cache of generated device grids,key:(feature sizes tuple,dtype,device).
+    grids only depend on feature sizes,so losses/decoders get same tensors every iteration without regenerating
+    and copying them to device again.
+    '''
+
+    def __init__(self, max_cache_size=32):
+        self.max_cache_size = max_cache_size
+        self.grid_cache = collections.OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def get_cached_grids(self, key, generate_func):
+        if key in self.grid_cache:
+            self.cache_hits += 1
+            self.grid_cache.move_to_end(key)
+            return self.grid_cache[key]
+
+        self.cache_misses += 1
+        grids = generate_func()
+        self.grid_cache[key] = grids
+        if len(self.grid_cache) > self.max_cache_size:
+            self.grid_cache.popitem(last=False)
+
+        return grids
+
+    def get_cache_info(self):
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'size': len(self.grid_cache),
+            'max_size': self.max_cache_size,
+        }
+
+    def clear_cache(self):
+        self.grid_cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def get_feature_sizes_key(feature_sizes):
+    return tuple(
+        tuple(int(per_size) for per_size in per_level_size)
+        for per_level_size in feature_sizes)
+
+
+def generate_shifts(feature_map_size, stride, device):
+    # shift_x:[w],shift_y:[h],same float64 values as numpy (np.arange(0,size)+0.5)*stride
+    shifts_x = (torch.arange(feature_map_size[0],
+                             dtype=torch.float64,
+                             device=device) + 0.5) * float(stride)
+    shifts_y = (torch.arange(feature_map_size[1],
+                             dtype=torch.float64,
+                             device=device) + 0.5) * float(stride)
+    # shifts shape:[h,w,2],2:[shift_x,shift_y]
+    shifts = torch.stack([
+        shifts_x.view(1, -1).expand(shifts_y.shape[0], -1),
+        shifts_y.view(-1, 1).expand(-1, shifts_x.shape[0]),
+    ],
+                         dim=2).float()
+
+    return shifts
+
+
+def generate_numpy_shifts(feature_map_size, stride):
+    # shifts shape:[h,w,2],2:[shift_x,shift_y]
+    shifts_x = (np.arange(0, feature_map_size[0]) + 0.5) * stride
+    shifts_y = (np.arange(0, feature_map_size[1]) + 0.5) * stride
+    shifts_x, shifts_y = np.meshgrid(shifts_x, shifts_y)
+    shifts = np.stack([shifts_x, shifts_y], axis=2).astype(np.float32)
+
+    return shifts
+
+
+class RetinaAnchors(DeviceGridCache):
 
     def __init__(self,
                  areas=[[32, 32], [64, 64], [128, 128], [256, 256], [512,
                                                                      512]],
                  ratios=[0.5, 1, 2],
                  scales=[2**0, 2**(1.0 / 3.0), 2**(2.0 / 3.0)],
-                 strides=[8, 16, 32, 64, 128]):
+                 strides=[8, 16, 32, 64, 128],
+                 max_cache_size=32):
+        super(RetinaAnchors, self).__init__(max_cache_size=max_cache_size)
         self.areas = np.array(areas, dtype=np.float32)
         self.ratios = np.array(ratios, dtype=np.float32)
         self.scales = np.array(scales, dtype=np.float32)
         self.strides = np.array(strides, dtype=np.float32)
 
+        self.base_anchors = [
+            self.generate_base_anchors(area, self.scales, self.ratios)
+            for area in self.areas
+        ]
+
     def __call__(self, fpn_feature_sizes):
         '''
         generate one image anchors
         '''
         one_image_anchors = []
-        for index, area in enumerate(self.areas):
-            base_anchors = self.generate_base_anchors(area, self.scales,
-                                                      self.ratios)
+        for index, base_anchors in enumerate(self.base_anchors):
             feature_anchors = self.generate_anchors_on_feature_map(
                 base_anchors, fpn_feature_sizes[index], self.strides[index])
             one_image_anchors.append(feature_anchors)
@@ -34,6 +116,32 @@ class RetinaAnchors:
         # per anchor format:[x_min,y_min,x_max,y_max]
         return one_image_anchors
 
+    def get_device_anchors(self,
+                           fpn_feature_sizes,
+                           device,
+                           dtype=torch.float32):
+        '''
+        generate one image anchors as tensors on device,same values as __call__,cached by feature sizes,dtype and device.
+        returned tensors are shared by all calls,don't modify them in place.
+        '''
+        device = torch.device(device)
+        key = (get_feature_sizes_key(fpn_feature_sizes), dtype, str(device))
+
+        def generate_func():
+            one_image_anchors = []
+            for index, base_anchors in enumerate(self.base_anchors):
+                shifts = generate_shifts(fpn_feature_sizes[index],
+                                         self.strides[index], device)
+                base_anchors = torch.from_numpy(base_anchors).to(device)
+                # [h,w,1,4]+[1,1,9,4]->[h,w,9,4]
+                feature_anchors = shifts.repeat(1, 1, 2).unsqueeze(
+                    2) + base_anchors.view(1, 1, -1, 4)
+                one_image_anchors.append(feature_anchors.to(dtype))
+
+            return one_image_anchors
+
+        return self.get_cached_grids(key, generate_func)
+
     def generate_base_anchors(self, area, scales, ratios):
         '''
         generate base anchor
@@ -63,14 +171,8 @@ class RetinaAnchors:
         '''
         generate one feature map anchors
         '''
-        # shifts_x shape:[w],shifts_y shape:[h]
-        shifts_x = (np.arange(0, feature_map_size[0]) + 0.5) * stride
-        shifts_y = (np.arange(0, feature_map_size[1]) + 0.5) * stride
-
-        # shifts shape:[w,h,2] -> [w,h,4] -> [w,h,1,4]
-        shifts = np.array([[[shift_x, shift_y] for shift_y in shifts_y]
-                           for shift_x in shifts_x],
-                          dtype=np.float32)
+        # shifts shape:[h,w,2] -> [h,w,4] -> [h,w,1,4]
+        shifts = generate_numpy_shifts(feature_map_size, stride)
         shifts = np.expand_dims(np.tile(shifts, (1, 1, 2)), axis=2)
 
         # base anchors shape:[9,4] -> [1,1,9,4]
@@ -78,19 +180,18 @@ class RetinaAnchors:
         base_anchors = np.expand_dims(base_anchors, axis=0)
 
         # generate all featrue map anchors on each feature map points
-        # featrue map anchors shape:[w,h,9,4] -> [h,w,9,4]
-        feature_map_anchors = np.transpose(base_anchors + shifts,
-                                           axes=(1, 0, 2, 3))
-        feature_map_anchors = np.ascontiguousarray(feature_map_anchors,
+        # featrue map anchors shape:[h,w,9,4]
+        feature_map_anchors = np.ascontiguousarray(base_anchors + shifts,
                                                    dtype=np.float32)
 
         # feature_map_anchors format: [h,w,9,4],4:[x_min,y_min,x_max,y_max]
         return feature_map_anchors
 
 
-class FCOSPositions:
+class FCOSPositions(DeviceGridCache):
 
-    def __init__(self, strides=[8, 16, 32, 64, 128]):
+    def __init__(self, strides=[8, 16, 32, 64, 128], max_cache_size=32):
+        super(FCOSPositions, self).__init__(max_cache_size=max_cache_size)
         self.strides = np.array(strides, dtype=np.float32)
 
     def __call__(self, fpn_feature_sizes):
@@ -109,22 +210,33 @@ class FCOSPositions:
         # per position format:[x_center,y_center]
         return one_image_positions
 
-    def generate_positions_on_feature_map(self, feature_map_size, stride):
+    def get_device_positions(self,
+                             fpn_feature_sizes,
+                             device,
+                             dtype=torch.float32):
         '''
-        generate one feature map positions
+        generate one image positions as tensors on device,same values as __call__,cached by feature sizes,dtype and device.
+        returned tensors are shared by all calls,don't modify them in place.
         '''
+        device = torch.device(device)
+        key = (get_feature_sizes_key(fpn_feature_sizes), dtype, str(device))
+
+        def generate_func():
+            return [
+                generate_shifts(fpn_feature_size, stride, device).to(dtype)
+                for stride, fpn_feature_size in zip(self.strides,
+                                                    fpn_feature_sizes)
+            ]
 
-        # shifts_x shape:[w],shifts_x shape:[h]
-        shifts_x = (np.arange(0, feature_map_size[0]) + 0.5) * stride
-        shifts_y = (np.arange(0, feature_map_size[1]) + 0.5) * stride
+        return self.get_cached_grids(key, generate_func)
 
-        # feature_map_positions shape:[w,h,2] -> [h,w,2]
-        feature_map_positions = np.array([[[shift_x, shift_y]
-                                           for shift_y in shifts_y]
-                                          for shift_x in shifts_x],
-                                         dtype=np.float32)
-        feature_map_positions = np.transpose(feature_map_positions,
-                                             axes=(1, 0, 2))
+    def generate_positions_on_feature_map(self, feature_map_size, stride):
+        '''
+        generate one feature map positions
+        '''
+        # feature_map_positions shape:[h,w,2]
+        feature_map_positions = generate_numpy_shifts(feature_map_size,
+                                                      stride)
         feature_map_positions = np.ascontiguousarray(feature_map_positions,
                                                      dtype=np.float32)
 
@@ -132,10 +244,10 @@ class FCOSPositions:
         return feature_map_positions
 
 
-class TTFNetPositions:
+class TTFNetPositions(DeviceGridCache):
 
-    def __init__(self):
-        pass
+    def __init__(self, max_cache_size=32):
+        super(TTFNetPositions, self).__init__(max_cache_size=max_cache_size)
 
     def __call__(self, feature_map_size):
         '''
@@ -150,21 +262,28 @@ class TTFNetPositions:
         # per position format:[x_center,y_center]
         return one_image_positions
 
+    def get_device_positions(self,
+                             feature_map_size,
+                             device,
+                             dtype=torch.float32):
+        '''
+        generate one image positions as tensor on device,same values as __call__,cached by feature size,dtype and device.
+        returned tensor is shared by all calls,don't modify it in place.
+        '''
+        device = torch.device(device)
+        key = (get_feature_sizes_key([feature_map_size]), dtype, str(device))
+
+        def generate_func():
+            return generate_shifts(feature_map_size, 1, device).to(dtype)
+
+        return self.get_cached_grids(key, generate_func)
+
     def generate_positions_on_feature_map(self, feature_map_size):
         '''
         generate one feature map positions
         '''
-        # shifts_x shape:[w],shifts_x shape:[h]
-        shifts_x = (np.arange(0, feature_map_size[0]) + 0.5)
-        shifts_y = (np.arange(0, feature_map_size[1]) + 0.5)
-
-        # feature_map_positions shape:[w,h,2] -> [h,w,2]
-        feature_map_positions = np.array([[[shift_x, shift_y]
-                                           for shift_y in shifts_y]
-                                          for shift_x in shifts_x],
-                                         dtype=np.float32)
-        feature_map_positions = np.transpose(feature_map_positions,
-                                             axes=(1, 0, 2))
+        # feature_map_positions shape:[h,w,2]
+        feature_map_positions = generate_numpy_shifts(feature_map_size, 1)
         feature_map_positions = np.ascontiguousarray(feature_map_positions,
                                                      dtype=np.float32)
 
@@ -227,15 +346,18 @@ if __name__ == '__main__':
     one_image_positions = positions(feature_map_size)
     print('3333', one_image_positions.shape)
 
-    strides = [8, 16, 32]
-    image_w, image_h = 640, 640
-    fpn_feature_sizes = [[
-        math.ceil(image_w / stride),
-        math.ceil(image_h / stride)
-    ] for stride in strides]
-
-    grid_strides = YoloxAnchors(strides)
-    one_image_grid_center_strides = grid_strides(fpn_feature_sizes)
-
-    for per_level_grid_center_strides in one_image_grid_center_strides:
-        print('4444', per_level_grid_center_strides.shape)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    positions = FCOSPositions(strides)
+    for image_size in [512, 640, 640, 800]:
+        fpn_feature_sizes = [[
+            math.ceil(image_size / stride),
+            math.ceil(image_size / stride)
+        ] for stride in strides]
+        device_positions = positions.get_device_positions(
+            fpn_feature_sizes, device)
+        is_equal = all(
+            np.array_equal(per_device_positions.cpu().numpy(),
+                           per_positions)
+            for per_device_positions, per_positions in zip(
+                device_positions, positions(fpn_feature_sizes)))
+        print('4444', image_size, is_equal, positions.get_cache_info())
@@ -10,9 +10,9 @@ from torch.autograd.function import once_differentiable
 try:
     import MultiScaleDeformableAttention
 except ImportError:
-    raise Exception(
-        'MultiScaleDeformableAttention packge is not installed correctly! If you want to use DNIO-DETR model, compile MultiScaleDeformableAttention packge.'
-    )
+    # without compiled MultiScaleDeformableAttention packge,use pytorch version ms_deform_attn_core_pytorch instead:
+    # per level grid_sample version for training/jit trace,level-fused version for eager inference/onnx export
+    MultiScaleDeformableAttention = None
 
 
 class MSDeformAttnFunction(Function):
@@ -40,10 +40,10 @@ class MSDeformAttnFunction(Function):
         return grad_value, None, None, grad_sampling_loc, grad_attn_weight, None
 
 
-def ms_deform_attn_core_pytorch(value, value_spatial_shapes,
-                                sampling_locations, attention_weights):
-    # for debug and test only,
-    # need to use cuda version instead
+def ms_deform_attn_core_pytorch_grid_sample(value, value_spatial_shapes,
+                                            sampling_locations,
+                                            attention_weights):
+    # per level grid_sample version,grid_sample backward is faster than gather backward on cpu,use for training
     N_, S_, M_, D_ = value.shape
     _, Lq_, M_, L_, P_, _ = sampling_locations.shape
     value_list = value.split([H_ * W_ for H_, W_ in value_spatial_shapes],
@@ -72,6 +72,132 @@ def ms_deform_attn_core_pytorch(value, value_spatial_shapes,
     return output.transpose(1, 2).contiguous()
 
 
+def get_ms_deform_attn_bilinear_index_and_weight(value_shape,
+                                                 value_spatial_shapes,
+                                                 sampling_locations,
+                                                 attention_weights):
+    # 4 bilinear corners of all levels and points for each query and head,index on flattened N_*S_*M_ value,
+    # same sampling as grid_sample(mode='bilinear',padding_mode='zeros',align_corners=False) per level
+    N_, S_, M_, D_ = value_shape
+    _, Lq_, M_, L_, P_, _ = sampling_locations.shape
+
+    value_spatial_shapes = value_spatial_shapes.to(torch.int64)
+    # L_ -> 1, 1, 1, L_, 1
+    level_h = value_spatial_shapes[:, 0].view(1, 1, 1, L_, 1)
+    level_w = value_spatial_shapes[:, 1].view(1, 1, 1, L_, 1)
+    level_hw = value_spatial_shapes[:, 0] * value_spatial_shapes[:, 1]
+    level_start_index = torch.cat(
+        [level_hw.new_zeros(1),
+         level_hw.cumsum(0)[:-1]]).view(1, 1, 1, L_, 1)
+    batch_start_index = torch.arange(
+        N_, dtype=torch.int64,
+        device=sampling_locations.device).view(N_, 1, 1, 1, 1) * S_
+    head_index = torch.arange(M_,
+                              dtype=torch.int64,
+                              device=sampling_locations.device).view(
+                                  1, 1, M_, 1, 1)
+    # N_, 1, M_, L_, 1
+    base_index = (batch_start_index + level_start_index) * M_ + head_index
+    level_w, level_h = level_w.to(sampling_locations.dtype), level_h.to(
+        sampling_locations.dtype)
+
+    # unnormalize as grid_sample with align_corners=False
+    sampling_grids = 2 * sampling_locations - 1
+    x = ((sampling_grids[..., 0] + 1) * level_w - 1) / 2
+    y = ((sampling_grids[..., 1] + 1) * level_h - 1) / 2
+    x0, y0 = x.floor(), y.floor()
+    x1, y1 = x0 + 1, y0 + 1
+
+    # out of feature map corners are zero padding,their weights are 0 and index are clamped into feature map
+    weight_x0 = (x1 - x) * ((x0 >= 0) & (x0 < level_w)).to(x.dtype)
+    weight_x1 = (x - x0) * ((x1 >= 0) & (x1 < level_w)).to(x.dtype)
+    weight_y0 = (y1 - y) * ((y0 >= 0) & (y0 < level_h)).to(
+        y.dtype) * attention_weights
+    weight_y1 = (y - y0) * ((y1 >= 0) & (y1 < level_h)).to(
+        y.dtype) * attention_weights
+    index_x0 = torch.minimum(x0.clamp(min=0), level_w - 1).to(
+        torch.int64) * M_
+    index_x1 = torch.minimum(x1.clamp(min=0), level_w - 1).to(
+        torch.int64) * M_
+    index_y0 = torch.minimum(y0.clamp(min=0), level_h - 1).to(
+        torch.int64) * (level_w.to(torch.int64) * M_) + base_index
+    index_y1 = torch.minimum(y1.clamp(min=0), level_h - 1).to(
+        torch.int64) * (level_w.to(torch.int64) * M_) + base_index
+
+    # nw,ne,sw,se corners:N_, Lq_, M_, 4, L_, P_ -> N_*Lq_*M_, 4*L_*P_
+    index = torch.stack([
+        index_y0 + index_x0, index_y0 + index_x1, index_y1 + index_x0,
+        index_y1 + index_x1
+    ],
+                        dim=3).reshape(N_ * Lq_ * M_, 4 * L_ * P_)
+    weight = torch.stack([
+        weight_y0 * weight_x0, weight_y0 * weight_x1, weight_y1 * weight_x0,
+        weight_y1 * weight_x1
+    ],
+                         dim=3).reshape(N_ * Lq_ * M_, 4 * L_ * P_)
+
+    return index, weight
+
+
+def ms_deform_attn_core_pytorch_gather(value, value_spatial_shapes,
+                                       sampling_locations, attention_weights):
+    # onnx export only:index_select+weighted sum exports with Gather ops for opset<16 which has no GridSample,
+    # it builds N_*Lq_*M_*4*L_*P_*D_ sampling value tensor and is slower than grid_sample,so not for trace/inference
+    N_, S_, M_, D_ = value.shape
+    _, Lq_, M_, L_, P_, _ = sampling_locations.shape
+    index, weight = get_ms_deform_attn_bilinear_index_and_weight(
+        value.shape, value_spatial_shapes, sampling_locations,
+        attention_weights)
+    # N_, S_, M_, D_ -> N_*S_*M_, D_
+    value = value.reshape(N_ * S_ * M_, D_)
+    # N_*Lq_*M_*4*L_*P_, D_ -> N_*Lq_*M_, 4*L_*P_, D_
+    sampling_value = value.index_select(0, index.reshape(-1)).view(
+        N_ * Lq_ * M_, 4 * L_ * P_, D_)
+    # N_*Lq_*M_, 4*L_*P_, D_ -> N_*Lq_*M_, D_
+    output = (sampling_value * weight.unsqueeze(-1)).sum(dim=1)
+    # N_*Lq_*M_, D_ -> N_, Lq_, M_*D_
+    output = output.view(N_, Lq_, M_ * D_)
+
+    return output
+
+
+def ms_deform_attn_core_pytorch(value, value_spatial_shapes,
+                                sampling_locations, attention_weights):
+    # pytorch version,use when cuda version is unavailable(cpu/onnx export)
+    # onnx export:level-fused gather version
+    # training and jit trace:per level grid_sample version
+    # eager inference:all levels are sampled by one embedding_bag on flattened value
+    if torch.onnx.is_in_onnx_export():
+        return ms_deform_attn_core_pytorch_gather(value, value_spatial_shapes,
+                                                  sampling_locations,
+                                                  attention_weights)
+
+    if torch.jit.is_tracing() or (torch.is_grad_enabled() and
+                                  (value.requires_grad
+                                   or sampling_locations.requires_grad
+                                   or attention_weights.requires_grad)):
+        return ms_deform_attn_core_pytorch_grid_sample(
+            value, value_spatial_shapes, sampling_locations,
+            attention_weights)
+
+    N_, S_, M_, D_ = value.shape
+    _, Lq_, M_, L_, P_, _ = sampling_locations.shape
+    index, weight = get_ms_deform_attn_bilinear_index_and_weight(
+        value.shape, value_spatial_shapes, sampling_locations,
+        attention_weights)
+    # N_, S_, M_, D_ -> N_*S_*M_, D_
+    value = value.reshape(N_ * S_ * M_, D_)
+    # gather and weighted sum in one kernel,no N_*Lq_*M_*4*L_*P_*D_ sampling value tensor
+    output = F.embedding_bag(index,
+                             value,
+                             mode='sum',
+                             per_sample_weights=weight)
+    # N_*Lq_*M_, D_ -> N_, Lq_, M_*D_
+    output = output.view(N_, Lq_, M_ * D_)
+
+    return output
+
+
 class MSDeformAttn(nn.Module):
 
     def __init__(self, d_model=256, n_levels=4, n_heads=8, n_points=4):
@@ -183,6 +309,18 @@ class MSDeformAttn(nn.Module):
                 'Last dim of reference_points must be 2 or 4, but get {} instead.'
                 .format(reference_points.shape[-1]))
 
+        # without cuda version or on cpu or in jit trace/onnx export,use pytorch version
+        if MultiScaleDeformableAttention is None or (
+                not value.is_cuda) or torch.jit.is_tracing(
+                ) or torch.onnx.is_in_onnx_export():
+            output = ms_deform_attn_core_pytorch(
+                value.to(torch.float32), input_spatial_shapes,
+                sampling_locations.to(torch.float32),
+                attention_weights.to(torch.float32))
+            output = output.to(value.dtype)
+            output = self.output_proj(output)
+            return output
+
         # for amp
         if value.dtype == torch.float16:
             # for mixed precision
@@ -203,3 +341,79 @@ class MSDeformAttn(nn.Module):
         output = self.output_proj(output)
 
         return output
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import io
+
+    model = MSDeformAttn(d_model=256, n_levels=4, n_heads=8, n_points=4)
+    # random sampling offsets and attention weights,so sampling locations cover all levels and out of feature map
+    nn.init.normal_(model.sampling_offsets.weight.data, std=0.1)
+    nn.init.normal_(model.attention_weights.weight.data, std=0.1)
+    model.eval()
+
+    input_spatial_shapes = torch.tensor([[80, 80], [40, 40], [20, 20],
+                                         [10, 10]],
+                                        dtype=torch.int64)
+    level_token_nums = input_spatial_shapes[:, 0] * input_spatial_shapes[:, 1]
+    input_level_start_index = torch.cat(
+        (level_token_nums.new_zeros((1, )), level_token_nums.cumsum(0)[:-1]))
+    input_flatten = torch.randn(2, int(level_token_nums.sum()), 256)
+    query = torch.randn(2, 300, 256)
+    reference_points = torch.rand(2, 300, 4, 2)
+    inputs = (query, reference_points, input_flatten, input_spatial_shapes,
+              input_level_start_index)
+
+    # eager inference:level-fused embedding_bag version
+    with torch.no_grad():
+        out = model(*inputs)
+    # training:per level grid_sample version
+    train_out = model(*inputs)
+    train_out.sum().backward()
+    # jit trace:per level grid_sample version
+    with torch.no_grad():
+        traced_out = torch.jit.trace(model, inputs)(*inputs)
+    print('1111', out.shape, (out - train_out).abs().max().item(),
+          (out - traced_out).abs().max().item())
+    assert (out - train_out).abs().max() < 1e-4
+    assert (out - traced_out).abs().max() < 1e-4
+
+    # onnx export dry-run:level-fused gather version,torch.onnx.export needs onnx package
+    try:
+        import onnx
+    except ImportError:
+        onnx = None
+
+    if onnx is None:
+        print('2222', 'onnx export skip,onnx is not installed')
+    else:
+        onnx_file = io.BytesIO()
+        torch.onnx.export(model,
+                          inputs,
+                          onnx_file,
+                          opset_version=16,
+                          dynamo=False,
+                          input_names=[
+                              'query', 'reference_points', 'input_flatten',
+                              'input_spatial_shapes',
+                              'input_level_start_index'
+                          ],
+                          output_names=['output'])
+        onnx.checker.check_model(onnx.load_from_string(
+            onnx_file.getvalue()))
+        print('2222', 'onnx export ok', len(onnx_file.getvalue()))
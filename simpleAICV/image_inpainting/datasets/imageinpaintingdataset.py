@@ -1,11 +1,28 @@
 import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
 import cv2
 import numpy as np
 
 from torch.utils.data import Dataset
 
+from simpleAICV.image_inpainting.datasets.mask_bank import MaskBank
+
 
 class ImageInpaintingDataset(Dataset):
+    '''
+    mask_bank_dir:if not None,decode all mask pngs once into a mmap bit packed MaskBank shared by all
+    dataloader workers,and read masks from bank instead of decoding mask png for every sample.
+    bank is built in mask_bank_dir when it doesn't exist or mask files changed.
+    free_form_mask_generator:if not None,generate procedural free-form masks(e.g. FreeFormMaskGenerator)
+    instead of reading mask pngs,mask_root_dir is not used.with mask_choice='inorder',
+    mask of sample idx is generated with seed idx,so test masks are reproducible.
+    '''
 
     def __init__(self,
                  image_root_dir,
@@ -14,7 +31,10 @@ class ImageInpaintingDataset(Dataset):
                  mask_set_name=None,
                  image_transform=None,
                  mask_transform=None,
-                 mask_choice='random'):
+                 mask_choice='random',
+                 mask_bank_dir=None,
+                 mask_bank_num_processes=16,
+                 free_form_mask_generator=None):
         assert mask_choice in ['random', 'inorder']
         # if image_set_name is None,read all images in image_root_dir
         # if mask_set_name is None,read all masks in mask_root_dir
@@ -30,23 +50,36 @@ class ImageInpaintingDataset(Dataset):
                     self.image_path_list.append(per_image_path)
         self.image_path_list = sorted(self.image_path_list)
 
-        mask_dir = os.path.join(
-            mask_root_dir,
-            mask_set_name) if mask_set_name is not None else mask_root_dir
+        self.free_form_mask_generator = free_form_mask_generator
+        self.mask_bank_dir = mask_bank_dir
         self.mask_path_list = []
-        for root, folders, files in os.walk(mask_dir):
-            for file_name in files:
-                if '.png' in file_name:
-                    per_mask_path = os.path.join(root, file_name)
-                    self.mask_path_list.append(per_mask_path)
-        self.mask_path_list = sorted(self.mask_path_list)
+        if not self.free_form_mask_generator:
+            mask_dir = os.path.join(
+                mask_root_dir,
+                mask_set_name) if mask_set_name is not None else mask_root_dir
+            for root, folders, files in os.walk(mask_dir):
+                for file_name in files:
+                    if '.png' in file_name:
+                        per_mask_path = os.path.join(root, file_name)
+                        self.mask_path_list.append(per_mask_path)
+            self.mask_path_list = sorted(self.mask_path_list)
+
+            if self.mask_bank_dir:
+                self.mask_bank = MaskBank(
+                    self.mask_path_list,
+                    mask_dir,
+                    self.mask_bank_dir,
+                    num_processes=mask_bank_num_processes)
 
         self.image_transform = image_transform
         self.mask_transform = mask_transform
         self.mask_choice = mask_choice
 
         print(f'Image Dataset Size:{len(self.image_path_list)}')
-        print(f'Mask Dataset Size:{len(self.mask_path_list)}')
+        if self.free_form_mask_generator:
+            print(f'Mask Dataset:free-form mask generator')
+        else:
+            print(f'Mask Dataset Size:{len(self.mask_path_list)}')
 
     def __len__(self):
         return len(self.image_path_list)
@@ -77,11 +110,22 @@ class ImageInpaintingDataset(Dataset):
         return image.astype(np.float32)
 
     def load_mask(self, idx):
+        if self.free_form_mask_generator:
+            if self.mask_choice == 'random':
+                mask = self.free_form_mask_generator()
+            elif self.mask_choice == 'inorder':
+                mask = self.free_form_mask_generator(seed=idx)
+
+            return mask
+
         if self.mask_choice == 'random':
             idx = np.random.randint(0, len(self.mask_path_list))
         elif self.mask_choice == 'inorder':
             idx = idx % len(self.mask_path_list)
 
+        if self.mask_bank_dir:
+            return self.mask_bank.get_mask(idx)
+
         mask = cv2.imdecode(
             np.fromfile(self.mask_path_list[idx], dtype=np.uint8),
             cv2.IMREAD_GRAYSCALE)
@@ -0,0 +1,363 @@
+import os
+import cv2
+import json
+import math
+import hashlib
+import numpy as np
+
+from multiprocessing import Pool
+from tqdm import tqdm
+
+from simpleAICV.cache_dir import get_temp_cache_dir, replace_cache_dir, build_cache_dir_if_stale
+
+# every array is saved as a single .npy file and loaded by mmap,so all dataloader workers attach to same
+# page cache pages without copying(put mask_bank_dir on /dev/shm to keep whole bank in shared memory).
+# mask table(one row per mask,same order as sorted mask path list):
+#   mask_h/mask_w:mask size
+#   mask_bit_offset:bit packed mask bytes are mask_bit_blob[mask_bit_offset[i]:mask_bit_offset[i+1]]
+# mask_bit_blob:np.packbits bytes of all binarized masks(pixel value>127 is 1),row major,8 pixels per byte
+mask_bank_array_name_list = [
+    'mask_h',
+    'mask_w',
+    'mask_bit_offset',
+]
+
+
+def get_mask_path_list_fingerprint(mask_path_list):
+    '''
+    fingerprint changes when any mask file is added,removed,replaced or modified
+    '''
+    fingerprint = hashlib.sha1()
+    for per_mask_path in mask_path_list:
+        per_mask_stat = os.stat(per_mask_path)
+        fingerprint.update(
+            f'{per_mask_path}_{per_mask_stat.st_size}_{per_mask_stat.st_mtime_ns}\n'
+            .encode('utf-8'))
+
+    return fingerprint.hexdigest()
+
+
+def get_mask_bank_dir(bank_dir, mask_dir):
+    mask_dir = os.path.abspath(mask_dir)
+    mask_dir_name = os.path.basename(os.path.normpath(mask_dir))
+    mask_dir_hash = hashlib.sha1(mask_dir.encode('utf-8')).hexdigest()[:8]
+
+    return os.path.join(bank_dir, f'{mask_dir_name}_{mask_dir_hash}')
+
+
+def pack_mask(per_mask_path):
+    mask = cv2.imdecode(np.fromfile(per_mask_path, dtype=np.uint8),
+                        cv2.IMREAD_GRAYSCALE)
+    non_binary_pixel_num = int(
+        np.count_nonzero((mask != 0) & (mask != 255)))
+    mask_bits = np.packbits(mask > 127, axis=None)
+
+    return mask.shape[0], mask.shape[1], non_binary_pixel_num, mask_bits.tobytes(
+    )
+
+
+def build_mask_bank(mask_path_list, mask_dir, bank_dir, num_processes=16):
+    '''
+    decode every mask png once and save bit packed masks to bank_dir.
+    bank is written to a temporary dir then renamed,so a half-written bank is never loaded.
+    call it by build_mask_bank_if_stale when several processes may build same bank.
+    '''
+    fingerprint = get_mask_path_list_fingerprint(mask_path_list)
+
+    per_bank_dir = get_mask_bank_dir(bank_dir, mask_dir)
+    temp_bank_dir = get_temp_cache_dir(per_bank_dir)
+    os.makedirs(temp_bank_dir) if not os.path.exists(temp_bank_dir) else None
+
+    mask_h_list, mask_w_list, mask_bit_length_list = [], [], []
+    non_binary_pixel_num = 0
+    with open(os.path.join(temp_bank_dir, 'mask_bit_blob.bin'),
+              'wb') as mask_bit_blob_f, Pool(processes=num_processes) as pool:
+        for per_mask_h, per_mask_w, per_non_binary_pixel_num, per_mask_bits in tqdm(
+                pool.imap(pack_mask, mask_path_list, chunksize=16),
+                total=len(mask_path_list)):
+            mask_bit_blob_f.write(per_mask_bits)
+            mask_h_list.append(per_mask_h)
+            mask_w_list.append(per_mask_w)
+            mask_bit_length_list.append(len(per_mask_bits))
+            non_binary_pixel_num += per_non_binary_pixel_num
+
+    mask_bit_offset = np.zeros(len(mask_bit_length_list) + 1, dtype=np.int64)
+    mask_bit_offset[1:] = np.cumsum(mask_bit_length_list)
+
+    mask_bank = {
+        'mask_h': np.array(mask_h_list, dtype=np.int32),
+        'mask_w': np.array(mask_w_list, dtype=np.int32),
+        'mask_bit_offset': mask_bit_offset,
+    }
+    for per_array_name in mask_bank_array_name_list:
+        np.save(os.path.join(temp_bank_dir, f'{per_array_name}.npy'),
+                mask_bank[per_array_name])
+
+    with open(os.path.join(temp_bank_dir, 'meta.json'), 'w') as f:
+        json.dump(
+            {
+                'mask_dir': mask_dir,
+                'fingerprint': fingerprint,
+                'mask_num': len(mask_path_list),
+                'non_binary_pixel_num': non_binary_pixel_num,
+            }, f)
+
+    replace_cache_dir(temp_bank_dir, per_bank_dir)
+
+    print(
+        f'Build Mask Bank:{per_bank_dir}, Mask Num:{len(mask_path_list)}, Mask Bytes:{mask_bit_offset[-1]}, Non Binary Pixel Num:{non_binary_pixel_num}'
+    )
+
+    return per_bank_dir
+
+
+def is_mask_bank_stale(mask_path_list, mask_dir, bank_dir):
+    meta_path = os.path.join(get_mask_bank_dir(bank_dir, mask_dir),
+                             'meta.json')
+    if not os.path.exists(meta_path):
+        return True
+
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+
+    return meta['fingerprint'] != get_mask_path_list_fingerprint(
+        mask_path_list)
+
+
+def build_mask_bank_if_stale(mask_path_list,
+                             mask_dir,
+                             bank_dir,
+                             num_processes=16):
+    # check and build under file lock,see build_cache_dir_if_stale
+    return build_cache_dir_if_stale(
+        get_mask_bank_dir(bank_dir, mask_dir),
+        lambda: is_mask_bank_stale(mask_path_list, mask_dir, bank_dir),
+        lambda: build_mask_bank(mask_path_list,
+                                mask_dir,
+                                bank_dir,
+                                num_processes=num_processes))
+
+
+class MaskBank:
+    '''
+    mmap loaded bit packed mask bank,built by build_mask_bank,stale bank is rebuilt automatically.
+    get_mask returns float32 mask with value 0/255 same as binary mask png decode,
+    non binary mask png pixels are binarized with threshold 127.
+    '''
+
+    def __init__(self, mask_path_list, mask_dir, bank_dir, num_processes=16):
+        if is_mask_bank_stale(mask_path_list, mask_dir, bank_dir):
+            build_mask_bank_if_stale(mask_path_list,
+                                     mask_dir,
+                                     bank_dir,
+                                     num_processes=num_processes)
+
+        self.per_bank_dir = get_mask_bank_dir(bank_dir, mask_dir)
+        self.load_bank()
+
+    def load_bank(self):
+        for per_array_name in mask_bank_array_name_list:
+            setattr(
+                self, per_array_name,
+                np.load(os.path.join(self.per_bank_dir,
+                                     f'{per_array_name}.npy'),
+                        mmap_mode='r'))
+
+        mask_bit_blob_path = os.path.join(self.per_bank_dir,
+                                          'mask_bit_blob.bin')
+        self.mask_bit_blob = np.memmap(
+            mask_bit_blob_path, dtype=np.uint8,
+            mode='r') if os.path.getsize(mask_bit_blob_path) > 0 else np.zeros(
+                (0), dtype=np.uint8)
+
+    def __getstate__(self):
+        # pickled memmap is copied as ndarray,spawned workers reopen mmap instead
+        return {'per_bank_dir': self.per_bank_dir}
+
+    def __setstate__(self, state):
+        self.per_bank_dir = state['per_bank_dir']
+        self.load_bank()
+
+    def get_mask_num(self):
+        return len(self.mask_h)
+
+    def get_mask(self, mask_idx):
+        mask_h, mask_w = int(self.mask_h[mask_idx]), int(self.mask_w[mask_idx])
+        mask_bits = self.mask_bit_blob[self.mask_bit_offset[mask_idx]:self.
+                                       mask_bit_offset[mask_idx + 1]]
+        mask = np.unpackbits(mask_bits, count=mask_h * mask_w)
+        # scale in uint8 then convert,much faster than float32 multiply
+        mask = (mask.reshape(mask_h, mask_w) * np.uint8(255)).astype(
+            np.float32)
+
+        return mask
+
+
+class FreeFormMaskGenerator:
+    '''
+    procedural free-form brush stroke mask generator(DeepFillv2 style),used as mask source instead of mask png files.
+    stroke length/brush width are scaled with mask size,mask ratio is limited to [min_mask_ratio,max_mask_ratio].
+    __call__ returns float32 mask with value 0/255,seed is used for reproducible masks,e.g. in test dataset.
+    '''
+
+    def __init__(self,
+                 mask_h=512,
+                 mask_w=512,
+                 min_stroke_num=1,
+                 max_stroke_num=4,
+                 max_vertex_num=12,
+                 max_angle=4.0,
+                 max_length_ratio=0.2,
+                 min_brush_width_ratio=0.02,
+                 max_brush_width_ratio=0.08,
+                 min_mask_ratio=0.01,
+                 max_mask_ratio=0.6,
+                 max_try_num=10):
+        assert 1 <= min_stroke_num <= max_stroke_num
+        assert 0. <= min_mask_ratio < max_mask_ratio <= 1.
+        self.mask_h = mask_h
+        self.mask_w = mask_w
+        self.min_stroke_num = min_stroke_num
+        self.max_stroke_num = max_stroke_num
+        self.max_vertex_num = max_vertex_num
+        self.max_angle = max_angle
+        self.max_length = max_length_ratio * math.sqrt(mask_h * mask_w)
+        self.min_brush_width = max(
+            1, int(min_brush_width_ratio * math.sqrt(mask_h * mask_w)))
+        self.max_brush_width = max(
+            self.min_brush_width + 1,
+            int(max_brush_width_ratio * math.sqrt(mask_h * mask_w)))
+        self.min_mask_ratio = min_mask_ratio
+        self.max_mask_ratio = max_mask_ratio
+        self.max_try_num = max_try_num
+
+    def __call__(self, seed=None):
+        random_state = np.random.RandomState(
+            seed) if seed is not None else np.random
+
+        for _ in range(self.max_try_num):
+            mask = self.generate_mask(random_state)
+            mask_ratio = np.count_nonzero(mask) / float(mask.size)
+            if self.min_mask_ratio <= mask_ratio <= self.max_mask_ratio:
+                break
+
+        return (mask * np.uint8(255)).astype(np.float32)
+
+    def generate_mask(self, random_state):
+        mask = np.zeros((self.mask_h, self.mask_w), dtype=np.uint8)
+        stroke_num = random_state.randint(self.min_stroke_num,
+                                          self.max_stroke_num + 1)
+        for _ in range(stroke_num):
+            start_x = random_state.randint(0, self.mask_w)
+            start_y = random_state.randint(0, self.mask_h)
+            vertex_num = random_state.randint(1, self.max_vertex_num + 1)
+            brush_width = random_state.randint(self.min_brush_width,
+                                               self.max_brush_width + 1)
+            for i in range(vertex_num):
+                angle = 0.01 + random_state.uniform(0, self.max_angle)
+                # zigzag stroke
+                if i % 2 == 0:
+                    angle = 2 * math.pi - angle
+                length = 10 + random_state.uniform(0, self.max_length)
+                end_x = int(
+                    np.clip(start_x + length * math.sin(angle), 0,
+                            self.mask_w - 1))
+                end_y = int(
+                    np.clip(start_y + length * math.cos(angle), 0,
+                            self.mask_h - 1))
+                cv2.line(mask, (start_x, start_y), (end_x, end_y), 1,
+                         brush_width)
+                cv2.circle(mask, (end_x, end_y), brush_width // 2, 1, -1)
+                start_x, start_y = end_x, end_y
+
+        if random_state.rand() > 0.5:
+            mask = np.ascontiguousarray(mask[:, ::-1])
+        if random_state.rand() > 0.5:
+            mask = np.ascontiguousarray(mask[::-1, :])
+
+        return mask
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    sys.path.append(BASE_DIR)
+
+    from tools.path import NVIDIA_Irregular_Mask_Dataset_test_mask_path, mask_bank_path
+
+    import time
+
+    mask_dir = NVIDIA_Irregular_Mask_Dataset_test_mask_path
+    mask_path_list = []
+    for root, folders, files in os.walk(mask_dir):
+        for file_name in files:
+            if '.png' in file_name:
+                per_mask_path = os.path.join(root, file_name)
+                mask_path_list.append(per_mask_path)
+    mask_path_list = sorted(mask_path_list)
+
+    start_time = time.time()
+    mask_bank = MaskBank(mask_path_list, mask_dir, mask_bank_path)
+    print(f'mask bank init time:{time.time() - start_time:.3f}s')
+
+    # bank masks must be same as binarized png decode masks
+    for mask_idx in range(0, len(mask_path_list),
+                          max(1,
+                              len(mask_path_list) // 200)):
+        png_mask = cv2.imdecode(
+            np.fromfile(mask_path_list[mask_idx], dtype=np.uint8),
+            cv2.IMREAD_GRAYSCALE)
+        png_mask = (png_mask > 127).astype(np.float32) * 255.
+        assert np.array_equal(png_mask, mask_bank.get_mask(mask_idx))
+
+    # benchmark mask fetch latency:png read+decode vs bit packed mask bank vs free-form generator
+    benchmark_mask_num = min(2000, len(mask_path_list))
+    sample_mask_idxs = np.random.randint(0, len(mask_path_list),
+                                         benchmark_mask_num)
+
+    start_time = time.time()
+    for mask_idx in sample_mask_idxs:
+        mask = cv2.imdecode(
+            np.fromfile(mask_path_list[mask_idx], dtype=np.uint8),
+            cv2.IMREAD_GRAYSCALE)
+        mask = mask.astype(np.float32)
+    png_decode_time = (time.time() - start_time) / benchmark_mask_num * 1000
+
+    start_time = time.time()
+    for mask_idx in sample_mask_idxs:
+        mask = mask_bank.get_mask(mask_idx)
+    mask_bank_time = (time.time() - start_time) / benchmark_mask_num * 1000
+
+    free_form_mask_generator = FreeFormMaskGenerator(mask_h=512, mask_w=512)
+    start_time = time.time()
+    for _ in range(benchmark_mask_num):
+        mask = free_form_mask_generator()
+    free_form_time = (time.time() - start_time) / benchmark_mask_num * 1000
+
+    png_bytes = sum(os.path.getsize(per_mask_path)
+                    for per_mask_path in mask_path_list)
+    print(
+        f'mask num:{len(mask_path_list)}, png bytes:{png_bytes}, mask bank bytes:{mask_bank.mask_bit_offset[-1]}'
+    )
+    print(
+        f'png decode:{png_decode_time:.3f}ms/mask, mask bank:{mask_bank_time:.3f}ms/mask, free-form generator:{free_form_time:.3f}ms/mask'
+    )
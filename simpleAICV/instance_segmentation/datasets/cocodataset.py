@@ -1,4 +1,11 @@
 import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
 import copy
 import cv2
 import numpy as np
@@ -6,6 +13,8 @@ import numpy as np
 from pycocotools.coco import COCO
 from torch.utils.data import Dataset
 
+from simpleAICV.detection.datasets.coco_annotation_store import CocoAnnotationStore
+
 COCO_CLASSES = [
     'person',
     'bicycle',
@@ -174,64 +183,100 @@ COCO_CLASSES_COLOR = [
 
 
 class CocoInstanceSegmentation(Dataset):
-
-    def __init__(self, root_dir, set_name='train2017', transform=None):
+    '''
+    annotation_store_dir:if not None,use mmap loaded CocoAnnotationStore instead of pycocotools COCO object,
+    store is built in annotation_store_dir on first use,self.coco is None.
+    '''
+
+    def __init__(self,
+                 root_dir,
+                 set_name='train2017',
+                 transform=None,
+                 annotation_store_dir=None,
+                 annotation_store_num_processes=16):
         assert set_name in ['train2017', 'val2017'], 'Wrong set name!'
 
         self.image_dir = os.path.join(root_dir, 'images', set_name)
         self.annot_dir = os.path.join(root_dir, 'annotations',
                                       f'instances_{set_name}.json')
-        self.coco = COCO(self.annot_dir)
-
-        self.image_ids = self.coco.getImgIds()
-        self.cat_ids = self.coco.getCatIds()
-
-        # filter image id without annotation,from 118287 ids to 117266 ids
-        ids = []
-        for image_id in self.image_ids:
-            annot_ids = self.coco.getAnnIds(imgIds=image_id)
-            annots = self.coco.loadAnns(annot_ids)
-            if len(annots) == 0:
-                continue
-
-            image_info = self.coco.loadImgs(image_id)[0]
-            image_h, image_w = image_info['height'], image_info['width']
-
-            illegal_flag = False
-            for annot in annots:
-                if 'ignore' in annot.keys():
-                    illegal_flag = True
-                    continue
-
-                # bbox format:[x_min, y_min, w, h]
-                bbox = annot['bbox']
-
-                inter_w = max(
-                    0,
-                    min(bbox[0] + bbox[2], image_w) - max(bbox[0], 0))
-                inter_h = max(
-                    0,
-                    min(bbox[1] + bbox[3], image_h) - max(bbox[1], 0))
-                if inter_w * inter_h == 0:
-                    illegal_flag = True
+        if annotation_store_dir:
+            self.coco = None
+            self.annotation_store = CocoAnnotationStore(
+                self.annot_dir,
+                annotation_store_dir,
+                num_processes=annotation_store_num_processes)
+
+            self.cat_ids = self.annotation_store.get_cat_ids()
+
+            # filter image id without annotation or with any illegal annotation,same rules as COCO object loop
+            annot_rows = np.arange(len(self.annotation_store.annot_id))
+            illegal_annot_rows = annot_rows[
+                ~self.annotation_store.get_keep_annot_mask(
+                    annot_rows, self.cat_ids)]
+            image_illegal_annot_num = np.bincount(
+                self.annotation_store.annot_image_row[illegal_annot_rows],
+                minlength=self.annotation_store.get_image_num())
+            self.image_rows = np.nonzero(
+                (self.annotation_store.image_annot_num > 0)
+                & (image_illegal_annot_num == 0))[0]
+            self.image_ids = self.annotation_store.image_id[
+                self.image_rows].tolist()
+
+            self.cats = sorted(self.annotation_store.categories,
+                               key=lambda x: x['id'])
+        else:
+            self.coco = COCO(self.annot_dir)
+            self.annotation_store = None
+
+            self.image_ids = self.coco.getImgIds()
+            self.cat_ids = self.coco.getCatIds()
+
+            # filter image id without annotation,from 118287 ids to 117266 ids
+            ids = []
+            for image_id in self.image_ids:
+                annot_ids = self.coco.getAnnIds(imgIds=image_id)
+                annots = self.coco.loadAnns(annot_ids)
+                if len(annots) == 0:
                     continue
 
-                if bbox[2] * bbox[3] < 1 or bbox[2] < 1 or bbox[3] < 1:
-                    illegal_flag = True
+                image_info = self.coco.loadImgs(image_id)[0]
+                image_h, image_w = image_info['height'], image_info['width']
+
+                illegal_flag = False
+                for annot in annots:
+                    if 'ignore' in annot.keys():
+                        illegal_flag = True
+                        continue
+
+                    # bbox format:[x_min, y_min, w, h]
+                    bbox = annot['bbox']
+
+                    inter_w = max(
+                        0,
+                        min(bbox[0] + bbox[2], image_w) - max(bbox[0], 0))
+                    inter_h = max(
+                        0,
+                        min(bbox[1] + bbox[3], image_h) - max(bbox[1], 0))
+                    if inter_w * inter_h == 0:
+                        illegal_flag = True
+                        continue
+
+                    if bbox[2] * bbox[3] < 1 or bbox[2] < 1 or bbox[3] < 1:
+                        illegal_flag = True
+                        continue
+                    if annot['category_id'] not in self.cat_ids:
+                        illegal_flag = True
+                        continue
+
+                if illegal_flag:
                     continue
-                if annot['category_id'] not in self.cat_ids:
-                    illegal_flag = True
-                    continue
-
-            if illegal_flag:
-                continue
 
-            ids.append(image_id)
+                ids.append(image_id)
 
-        self.image_ids = ids
+            self.image_ids = ids
 
-        self.cats = sorted(self.coco.loadCats(self.cat_ids),
-                           key=lambda x: x['id'])
+            self.cats = sorted(self.coco.loadCats(self.cat_ids),
+                               key=lambda x: x['id'])
         self.num_classes = len(self.cats)
 
         # cat_id is an original cat id,coco_label is set from 0 to 79
@@ -279,8 +324,15 @@ class CocoInstanceSegmentation(Dataset):
 
         return sample
 
+    def get_image_file_name(self, idx):
+        if self.annotation_store:
+            return self.annotation_store.get_image_file_name(
+                self.image_rows[idx])
+
+        return self.coco.loadImgs(self.image_ids[idx])[0]['file_name']
+
     def load_image(self, idx):
-        file_name = self.coco.loadImgs(self.image_ids[idx])[0]['file_name']
+        file_name = self.get_image_file_name(idx)
         image = cv2.imdecode(
             np.fromfile(os.path.join(self.image_dir, file_name),
                         dtype=np.uint8), cv2.IMREAD_COLOR)
@@ -289,6 +341,9 @@ class CocoInstanceSegmentation(Dataset):
         return image.astype(np.float32)
 
     def load_mask(self, idx):
+        if self.annotation_store:
+            return self.load_store_mask(idx)
+
         annot_ids = self.coco.getAnnIds(imgIds=self.image_ids[idx])
         annots = self.coco.loadAnns(annot_ids)
 
@@ -337,6 +392,37 @@ class CocoInstanceSegmentation(Dataset):
 
         return target_boxes.astype(np.float32), target_masks.astype(np.float32)
 
+    def load_store_mask(self, idx):
+        # same filter rules and outputs as load_mask,all kept annot masks are decoded in one call
+        image_row = self.image_rows[idx]
+        image_h, image_w = self.annotation_store.get_image_size(image_row)
+
+        annot_rows = self.annotation_store.get_image_annot_rows(image_row)
+        annot_rows = annot_rows[self.annotation_store.get_keep_annot_mask(
+            annot_rows, self.cat_ids)]
+
+        if annot_rows.shape[0] == 0:
+            return np.zeros((0, 5), dtype=np.float32), np.zeros(
+                (image_h, image_w, 0), dtype=np.float32)
+
+        target_boxes = np.zeros((annot_rows.shape[0], 5))
+        target_boxes[:, :4] = self.annotation_store.annot_bbox[annot_rows]
+        target_boxes[:, 4] = [
+            self.cat_id_to_coco_label[per_cat_id] for per_cat_id in
+            self.annotation_store.annot_category_id[annot_rows].tolist()
+        ]
+
+        target_masks = self.annotation_store.get_masks(annot_rows).astype(
+            np.float32)
+
+        # transform bbox targets from [x_min, y_min, w, h] to [x_min, y_min, x_max, y_max]
+        target_boxes[:, 2] = target_boxes[:, 0] + target_boxes[:, 2]
+        target_boxes[:, 3] = target_boxes[:, 1] + target_boxes[:, 3]
+
+        assert target_boxes.shape[0] == target_masks.shape[-1]
+
+        return target_boxes.astype(np.float32), target_masks
+
 
 if __name__ == '__main__':
     import os
@@ -0,0 +1,711 @@
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import numpy as np
+
+import torch
+
+
+class SAMBatchPromptSampler:
+    '''
+    sample point/box/mask prompts for a batch of gt masks with tensor ops on device of masks,
+    same distributions as SAM datasets(points from np.argwhere+np.random.choice,noise_bbox,noise_mask) followed by
+    SAMCollater/SAMMultiMaskCollater(random point num per image).
+    use it in train loop after batch_masks.cuda(),datasets can skip numpy prompts generation in workers by
+    positive_points_num=0,negative_points_num=0,box_noise_pixel=0,mask_noise_pixel=0.
+    box_noise_pixel/mask_noise_pixel are pixels at original image resolution as datasets,they are scaled by resize factor
+    of every image,eroded masks are sampled at resized resolution,points are sampled at original pixel grid and scaled
+    by resize factor as dataset points after SamResize.
+    per_image_mask_num:None for SAMCollater batches(batch_masks:[B,1,H,W]),
+    K for SAMMultiMaskCollater batches(batch_masks:[B*K,1,H,W]).
+    '''
+
+    def __init__(self,
+                 resize=1024,
+                 positive_points_num=9,
+                 negative_points_num=9,
+                 area_filter_ratio=0.0025,
+                 box_noise_pixel=50,
+                 mask_noise_pixel=50,
+                 positive_point_num_range=[1, 9],
+                 negative_point_num_range=[1, 9],
+                 batch_align_random_point_num=False,
+                 positive_negative_point_num_ratio=None,
+                 per_image_mask_num=None):
+        assert resize % 64 == 0
+        assert isinstance(positive_point_num_range, (int, list))
+        assert isinstance(negative_point_num_range, (int, list))
+        assert per_image_mask_num is None or per_image_mask_num >= 1
+
+        self.resize = resize
+        self.prompt_mask_size = resize // 4
+        self.positive_points_num = positive_points_num
+        self.negative_points_num = negative_points_num
+        self.area_filter_ratio = area_filter_ratio
+        self.box_noise_pixel = box_noise_pixel
+        self.mask_noise_pixel = mask_noise_pixel
+        self.positive_point_num_range = positive_point_num_range
+        self.negative_point_num_range = negative_point_num_range
+        self.batch_align_random_point_num = batch_align_random_point_num
+        self.positive_negative_point_num_ratio = positive_negative_point_num_ratio
+        self.per_image_mask_num = per_image_mask_num
+
+    def __call__(self, batch_masks, sizes, origin_sizes, boxes=None):
+        '''
+        batch_masks:[M,1,H,W] 0/1 gt masks padded at right/bottom,M=B or B*K
+        sizes:[B,2] resized h,w of every image,origin_sizes:[B,2] original h,w of every image
+        boxes:[M,4] gt boxes(x_min,y_min,x_max,y_max) at resized resolution,if None,boxes are computed from masks
+        '''
+        device = batch_masks.device
+        batch_size = sizes.shape[0]
+        per_image_mask_num = self.per_image_mask_num if self.per_image_mask_num else 1
+        assert batch_masks.shape[0] == batch_size * per_image_mask_num
+
+        masks = batch_masks[:, 0] > 0
+        sizes = sizes.to(device).float()
+        origin_sizes = origin_sizes.to(device).float()
+        # factor of SamResize for every image
+        factors = self.resize / origin_sizes.max(dim=1)[0]
+        mask_sizes = sizes.repeat_interleave(per_image_mask_num, dim=0)
+        mask_factors = factors.repeat_interleave(per_image_mask_num, dim=0)
+        mask_origin_sizes = origin_sizes.repeat_interleave(per_image_mask_num,
+                                                           dim=0)
+        valid_regions = self.get_valid_regions(masks, mask_sizes)
+
+        if boxes is None:
+            boxes = self.get_mask_boxes(masks)
+        boxes = boxes.to(device).float()
+
+        positive_points, positive_flag = self.sample_region_points(
+            masks, self.positive_points_num, 1, mask_factors, mask_sizes,
+            mask_origin_sizes)
+        negative_points, negative_flag = self.sample_region_points(
+            valid_regions & (~masks), self.negative_points_num, 0,
+            mask_factors, mask_sizes, mask_origin_sizes)
+
+        positive_point_nums, negative_point_nums = self.get_point_nums(
+            batch_size)
+        positive_point_nums = positive_point_nums.to(device).repeat_interleave(
+            per_image_mask_num, dim=0)
+        negative_point_nums = negative_point_nums.to(device).repeat_interleave(
+            per_image_mask_num, dim=0)
+        prompt_points, prompt_point_nums = self.pack_prompt_points(
+            positive_points, positive_flag, positive_point_nums,
+            negative_points, negative_flag, negative_point_nums)
+
+        prompt_boxes = boxes
+        if self.box_noise_pixel > 0:
+            prompt_boxes = self.noise_bbox(boxes, mask_sizes, mask_factors)
+
+        prompt_masks = masks.float()
+        if self.mask_noise_pixel > 1:
+            prompt_masks = self.noise_mask(masks, valid_regions, mask_sizes,
+                                           mask_factors)
+        prompt_masks = self.resize_prompt_masks(prompt_masks, mask_sizes)
+
+        batch_prompts = []
+        for i in range(batch_size):
+            start, end = i * per_image_mask_num, (i + 1) * per_image_mask_num
+            per_image_point_num = int(prompt_point_nums[start])
+            if prompt_points.shape[1] == 0:
+                per_image_prompt_points = None
+            elif self.per_image_mask_num:
+                # [K,positive_point_num+negative_point_num,3]
+                per_image_prompt_points = None if per_image_point_num == 0 else prompt_points[
+                    start:end, 0:per_image_point_num]
+            else:
+                # [1,positive_point_num+negative_point_num,3]
+                per_image_prompt_points = prompt_points[start:end,
+                                                        0:per_image_point_num]
+            batch_prompts.append({
+                'prompt_point': per_image_prompt_points,
+                'prompt_box': prompt_boxes[start:end],
+                'prompt_mask': prompt_masks[start:end].unsqueeze(1),
+            })
+
+        return {
+            'prompt_point': prompt_points,
+            'prompt_point_num': prompt_point_nums,
+            'prompt_box': prompt_boxes,
+            'prompt_mask': prompt_masks,
+            'batch_prompt': batch_prompts,
+        }
+
+    def get_valid_regions(self, masks, mask_sizes):
+        # True inside resized image of every mask:[M,H,W]
+        _, h, w = masks.shape
+        ys = torch.arange(h, device=masks.device).view(1, h, 1)
+        xs = torch.arange(w, device=masks.device).view(1, 1, w)
+
+        return (ys < mask_sizes[:, 0].view(-1, 1, 1)) & (
+            xs < mask_sizes[:, 1].view(-1, 1, 1))
+
+    def get_mask_boxes(self, masks):
+        # x_min,y_min,x_max+1,y_max+1 of mask pixels,0 for empty mask
+        _, h, w = masks.shape
+        xs = torch.arange(w, device=masks.device, dtype=torch.float32)
+        ys = torch.arange(h, device=masks.device, dtype=torch.float32)
+        x_flag, y_flag = masks.any(dim=1), masks.any(dim=2)
+        x_min = torch.where(x_flag, xs, torch.full_like(xs, w)).min(dim=1)[0]
+        x_max = torch.where(x_flag, xs + 1, torch.zeros_like(xs)).max(dim=1)[0]
+        y_min = torch.where(y_flag, ys, torch.full_like(ys, h)).min(dim=1)[0]
+        y_max = torch.where(y_flag, ys + 1, torch.zeros_like(ys)).max(dim=1)[0]
+        boxes = torch.stack([x_min, y_min, x_max, y_max], dim=1)
+        boxes = torch.where(x_flag.any(dim=1, keepdim=True), boxes,
+                            torch.zeros_like(boxes))
+
+        return boxes
+
+    def sample_region_points(self,
+                             regions,
+                             points_num,
+                             label,
+                             point_factors=None,
+                             point_sizes=None,
+                             point_origin_sizes=None):
+        '''
+        uniform sample points_num pixels with replacement in every region,same as np.random.choice on np.argwhere(region)
+        regions:[M,H,W] bool
+        point_factors:[M] SamResize factor,point_sizes:[M,2] resized h,w,point_origin_sizes:[M,2] original h,w.
+        if given,points are sampled at original pixel grid as datasets:cv2.INTER_NEAREST resized pixel q reads original
+        pixel floor(q*origin/size),so q stands for original pixels [floor(q*origin/size),floor((q+1)*origin/size)),
+        q is sampled with weight of its original pixel num and point is original pixel*factor.
+        otherwise points are resized pixels,which are biased from dataset points by 0.5*factor-0.5 on average.
+        return points:[M,points_num,3](x,y,label),flag:[M],False if region has less than points_num pixels
+        '''
+        mask_num, h, w = regions.shape
+        device = regions.device
+        if points_num <= 0:
+            return torch.zeros((mask_num, 0, 3), device=device), torch.zeros(
+                (mask_num, ), dtype=torch.bool, device=device)
+
+        flat_regions = regions.reshape(mask_num, -1).int()
+        if point_factors is not None:
+            origin_ys, y_nums = self.get_origin_pixels(h, point_sizes[:, 0],
+                                                       point_origin_sizes[:,
+                                                                          0])
+            origin_xs, x_nums = self.get_origin_pixels(w, point_sizes[:, 1],
+                                                       point_origin_sizes[:,
+                                                                          1])
+            flat_regions = flat_regions * (y_nums.unsqueeze(2) *
+                                           x_nums.unsqueeze(1)).reshape(
+                                               mask_num, -1)
+        region_cumsum = torch.cumsum(flat_regions, dim=1, dtype=torch.int32)
+        region_pixel_nums = region_cumsum[:, -1:]
+
+        # k-th(1-based) region pixel of every random rank,searchsorted finds first position where cumsum>=k
+        ranks = torch.floor(
+            torch.rand((mask_num, points_num), device=device) *
+            region_pixel_nums.float()).int()
+        ranks = torch.min(ranks, torch.clamp(region_pixel_nums - 1, min=0))
+        point_idxs = torch.searchsorted(region_cumsum, ranks + 1)
+        point_idxs = torch.clamp(point_idxs, max=h * w - 1)
+        point_xs = point_idxs % w
+        point_ys = torch.div(point_idxs, w, rounding_mode='floor')
+
+        if point_factors is not None:
+            # rank inside original pixels of sampled resized pixel,row major as np.argwhere
+            ranks = ranks - (torch.gather(region_cumsum, 1, point_idxs) -
+                             torch.gather(flat_regions, 1, point_idxs))
+            point_x_nums = torch.clamp(torch.gather(x_nums, 1, point_xs),
+                                       min=1)
+            point_xs = torch.gather(
+                origin_xs, 1, point_xs) + ranks % point_x_nums
+            point_ys = torch.gather(origin_ys, 1, point_ys) + torch.div(
+                ranks, point_x_nums, rounding_mode='floor')
+            point_xs = point_xs.float() * point_factors.view(-1, 1)
+            point_ys = point_ys.float() * point_factors.view(-1, 1)
+
+        points = torch.stack([
+            point_xs.float(),
+            point_ys.float(),
+            torch.full_like(point_xs, label).float(),
+        ],
+                             dim=2)
+        flag = region_pixel_nums[:, 0] >= points_num
+
+        return points, flag
+
+    def get_origin_pixels(self, length, sizes, origin_sizes):
+        '''
+        first original pixel and original pixel num of every resized pixel along one axis:[M,length]
+        cv2.INTER_NEAREST reads original pixel floor(q*origin/size) for resized pixel q
+        '''
+        qs = torch.arange(length + 1, device=sizes.device,
+                          dtype=torch.float64).view(1, -1)
+        scales = 1. / (sizes.double() / origin_sizes.double())
+        origin_pixels = torch.floor(qs * scales.view(-1, 1))
+        origin_pixels = torch.where(qs >= sizes.double().view(-1, 1),
+                                    origin_sizes.double().view(-1, 1),
+                                    origin_pixels).int()
+        origin_pixels = torch.min(origin_pixels,
+                                  origin_sizes.int().view(-1, 1))
+        origin_pixel_nums = origin_pixels[:, 1:] - origin_pixels[:, :-1]
+
+        return origin_pixels[:, :-1].long(), origin_pixel_nums
+
+    def get_point_nums(self, batch_size):
+        # random point num of every image,same as SAMMultiMaskCollater
+        def get_point_num(point_num_range, num):
+            if isinstance(point_num_range, list):
+                return torch.randint(point_num_range[0],
+                                     point_num_range[1] + 1, (num, ))
+
+            return torch.full((num, ), point_num_range, dtype=torch.int64)
+
+        num = 1 if self.batch_align_random_point_num else batch_size
+        positive_point_nums = get_point_num(self.positive_point_num_range, num)
+        if self.positive_negative_point_num_ratio:
+            max_negative_point_num = self.negative_point_num_range[
+                1] if isinstance(self.negative_point_num_range,
+                                 list) else self.negative_point_num_range
+            negative_point_nums = torch.clamp(torch.floor(
+                positive_point_nums.double() *
+                self.positive_negative_point_num_ratio).long(),
+                                              max=max_negative_point_num)
+        else:
+            negative_point_nums = get_point_num(self.negative_point_num_range,
+                                                num)
+
+        positive_point_nums = torch.clamp(positive_point_nums,
+                                          min=0,
+                                          max=self.positive_points_num)
+        negative_point_nums = torch.clamp(negative_point_nums,
+                                          min=0,
+                                          max=self.negative_points_num)
+
+        return positive_point_nums.expand(
+            batch_size), negative_point_nums.expand(batch_size)
+
+    def pack_prompt_points(self, positive_points, positive_flag,
+                           positive_point_nums, negative_points, negative_flag,
+                           negative_point_nums):
+        '''
+        pack first positive_point_num positive points and first negative_point_num negative points of every mask to front.
+        single mask:region without enough points has no points as SAMCollater.
+        multi masks:region without enough points has not a point(label -1) points as SAM1BDataset pad_prompt_points,
+        so K masks of one image have same point num.
+        '''
+        positive_points_num = positive_points.shape[1]
+        not_a_points = torch.zeros_like(positive_points)
+        not_a_points[:, :, 2] = -1
+        positive_points = torch.where(positive_flag.view(-1, 1, 1),
+                                      positive_points, not_a_points)
+        not_a_points = torch.zeros_like(negative_points)
+        not_a_points[:, :, 2] = -1
+        negative_points = torch.where(negative_flag.view(-1, 1, 1),
+                                      negative_points, not_a_points)
+
+        if not self.per_image_mask_num:
+            positive_point_nums = torch.where(
+                positive_flag, positive_point_nums,
+                torch.zeros_like(positive_point_nums))
+            negative_point_nums = torch.where(
+                negative_flag, negative_point_nums,
+                torch.zeros_like(negative_point_nums))
+
+        all_points = torch.cat([positive_points, negative_points], dim=1)
+        slot_idxs = torch.arange(all_points.shape[1],
+                                 device=all_points.device).view(1, -1)
+        src_idxs = torch.where(
+            slot_idxs < positive_point_nums.view(-1, 1), slot_idxs,
+            positive_points_num + slot_idxs - positive_point_nums.view(-1, 1))
+        src_idxs = torch.clamp(src_idxs, max=max(all_points.shape[1] - 1, 0))
+        prompt_points = torch.gather(all_points, 1,
+                                     src_idxs.unsqueeze(-1).expand(-1, -1, 3))
+        prompt_point_nums = positive_point_nums + negative_point_nums
+
+        # unused slots are not a point
+        not_a_points = torch.zeros_like(prompt_points)
+        not_a_points[:, :, 2] = -1
+        prompt_points = torch.where(
+            (slot_idxs < prompt_point_nums.view(-1, 1)).unsqueeze(-1),
+            prompt_points, not_a_points)
+
+        return prompt_points, prompt_point_nums
+
+    def noise_bbox(self, boxes, mask_sizes, mask_factors):
+        # same as noise_bbox in datasets,integer noise pixels at original resolution
+        noises = torch.randint(-self.box_noise_pixel,
+                               self.box_noise_pixel, (boxes.shape[0], 4),
+                               device=boxes.device).float()
+        noises = noises * mask_factors.view(-1, 1)
+        wh = (boxes[:, 2:4] - boxes[:, 0:2]).repeat(1, 2) / 2
+        noises = torch.max(torch.min(noises, wh), -wh)
+        noise_boxes = boxes + noises
+        noise_boxes[:, 2] = torch.min(noise_boxes[:, 2], mask_sizes[:, 1])
+        noise_boxes[:, 3] = torch.min(noise_boxes[:, 3], mask_sizes[:, 0])
+        invalid_flag = (noise_boxes[:, 0] >= noise_boxes[:, 2]) | (
+            noise_boxes[:, 1] >= noise_boxes[:, 3])
+        noise_boxes = torch.clamp(noise_boxes, min=0)
+        noise_boxes = torch.where(invalid_flag.view(-1, 1), boxes, noise_boxes)
+
+        return noise_boxes
+
+    def noise_mask(self, masks, valid_regions, mask_sizes, mask_factors):
+        '''
+        same as noise_mask in datasets,erode every mask with random kernel*kernel ones kernel(kernel in [1,mask_noise_pixel)
+        at original resolution),keep gt mask if eroded mask area ratio<=area_filter_ratio.
+        erosion of all masks with different kernels by separable window sums of non mask pixels,
+        outside image doesn't erode as cv2.erode.
+        '''
+        mask_num, h, w = masks.shape
+        device = masks.device
+        kernels = torch.randint(1,
+                                self.mask_noise_pixel, (mask_num, ),
+                                device=device).float()
+        kernels = torch.clamp(torch.round(kernels * mask_factors), min=1).long()
+
+        # cv2 anchor is kernel//2,window of pixel y is [y-anchor,y-anchor+kernel-1]
+        anchors = torch.div(kernels, 2, rounding_mode='floor').view(-1, 1)
+        ys = torch.arange(h, device=device).view(1, -1)
+        xs = torch.arange(w, device=device).view(1, -1)
+        y1 = torch.clamp(ys - anchors, min=0, max=h)
+        y2 = torch.clamp(ys - anchors + kernels.view(-1, 1), min=0, max=h)
+        x1 = torch.clamp(xs - anchors, min=0, max=w)
+        x2 = torch.clamp(xs - anchors + kernels.view(-1, 1), min=0, max=w)
+
+        holes = (valid_regions & (~masks)).int()
+        # row window sums,then column window sums of row window sums
+        cumsum = torch.zeros((mask_num, h, w + 1),
+                             dtype=torch.int32,
+                             device=device)
+        cumsum[:, :, 1:] = holes.cumsum(dim=2, dtype=torch.int32)
+        row_hole_nums = torch.gather(
+            cumsum, 2,
+            x2.view(mask_num, 1, w).expand(-1, h, -1)) - torch.gather(
+                cumsum, 2,
+                x1.view(mask_num, 1, w).expand(-1, h, -1))
+        cumsum = torch.zeros((mask_num, h + 1, w),
+                             dtype=torch.int32,
+                             device=device)
+        cumsum[:, 1:, :] = row_hole_nums.cumsum(dim=1, dtype=torch.int32)
+        window_hole_nums = torch.gather(
+            cumsum, 1,
+            y2.view(mask_num, h, 1).expand(-1, -1, w)) - torch.gather(
+                cumsum, 1,
+                y1.view(mask_num, h, 1).expand(-1, -1, w))
+        eroded_masks = masks & (window_hole_nums == 0)
+
+        area_ratios = eroded_masks.flatten(1).sum(dim=1).float() / (
+            mask_sizes[:, 0] * mask_sizes[:, 1])
+        prompt_masks = torch.where(
+            (area_ratios > self.area_filter_ratio).view(-1, 1, 1),
+            eroded_masks, masks)
+
+        return prompt_masks.float()
+
+    def resize_prompt_masks(self, prompt_masks, mask_sizes):
+        # same as SAMCollater prompt mask resize(cv2.INTER_NEAREST) and pad:[M,H//4,W//4]
+        mask_num, h, w = prompt_masks.shape
+        device = prompt_masks.device
+        factors = self.prompt_mask_size / mask_sizes.max(dim=1)[0]
+        resize_h = torch.round(mask_sizes[:, 0].double() * factors.double())
+        resize_w = torch.round(mask_sizes[:, 1].double() * factors.double())
+
+        dst = torch.arange(self.prompt_mask_size,
+                           device=device,
+                           dtype=torch.float64).view(1, -1)
+        src_ys = torch.clamp(torch.floor(
+            dst * (mask_sizes[:, 0].double() / resize_h).view(-1, 1)),
+                             max=h - 1).long()
+        src_xs = torch.clamp(torch.floor(
+            dst * (mask_sizes[:, 1].double() / resize_w).view(-1, 1)),
+                             max=w - 1).long()
+        idxs = src_ys.unsqueeze(2) * w + src_xs.unsqueeze(1)
+        resized_masks = torch.gather(prompt_masks.view(mask_num, -1), 1,
+                                     idxs.view(mask_num, -1)).view(
+                                         mask_num, self.prompt_mask_size,
+                                         self.prompt_mask_size)
+        valid_flag = (dst.view(1, -1, 1) < resize_h.view(-1, 1, 1)) & (
+            dst.view(1, 1, -1) < resize_w.view(-1, 1, 1))
+        resized_masks = resized_masks * valid_flag
+
+        return resized_masks
+
+    def sample_correction_points(self, pred_masks, gt_masks, mask_sizes=None):
+        '''
+        iterative correction point for every mask:one point sampled uniformly from error region between previous
+        mask prediction and gt mask,positive(label 1) on false negative pixel,negative(label 0) on false positive pixel,
+        not a point(label -1) if prediction has no error.
+        pred_masks:[M,1,H,W] binary mask prediction(e.g. mask logits>mask_threshold),gt_masks:[M,1,H,W]
+        mask_sizes:[M,2] resized h,w,pixels outside resized image are not error pixels
+        return [M,1,3],append it to previous prompt points for next iteration
+        '''
+        pred_masks, gt_masks = pred_masks[:, 0] > 0, gt_masks[:, 0] > 0
+        error_regions = pred_masks ^ gt_masks
+        if mask_sizes is not None:
+            error_regions = error_regions & self.get_valid_regions(
+                gt_masks, mask_sizes.to(gt_masks.device).float())
+
+        points, flag = self.sample_region_points(error_regions, 1, 0)
+        _, h, w = gt_masks.shape
+        point_idxs = (points[:, :, 1] * w + points[:, :, 0]).long()
+        labels = torch.gather(gt_masks.reshape(gt_masks.shape[0], -1), 1,
+                              point_idxs).float()
+        labels = torch.where(flag.view(-1, 1), labels,
+                             -torch.ones_like(labels))
+        points = torch.cat([points[:, :, 0:2], labels.unsqueeze(-1)], dim=2)
+
+        return points
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.path.append(BASE_DIR)
+
+    import copy
+    import time
+    import cv2
+
+    from simpleAICV.interactive_segmentation.common import SamResize, SAMCollater
+    from simpleAICV.interactive_segmentation.datasets.sam1bdataset import SAM1BDataset
+
+    # statistical parity:numpy dataset prompts+SamResize+SAMCollater vs batch sampler on same gt masks
+    resize, draw_num = 512, 512
+    origin_h, origin_w = 600, 800
+    positive_points_num, negative_points_num = 9, 9
+    area_filter_ratio, box_noise_pixel, mask_noise_pixel = 0.0025, 50, 50
+
+    # numpy prompts of SAM1BDataset.get_mask_prompts without loading dataset
+    dataset = SAM1BDataset.__new__(SAM1BDataset)
+    dataset.positive_points_num = positive_points_num
+    dataset.negative_points_num = negative_points_num
+    dataset.area_filter_ratio = area_filter_ratio
+    dataset.box_noise_pixel = box_noise_pixel
+    dataset.mask_noise_pixel = mask_noise_pixel
+    dataset.mask_index_dir = None
+    dataset.all_image_mask_path_list = [[
+        None, None, None, None, origin_h, origin_w
+    ]]
+    sam_resize = SamResize(resize=resize)
+    collater = SAMCollater(resize=resize,
+                           positive_point_num_range=[1, 9],
+                           negative_point_num_range=[1, 9],
+                           batch_align_random_point_num=False,
+                           positive_negative_point_num_ratio=None)
+    sampler = SAMBatchPromptSampler(resize=resize,
+                                    positive_points_num=positive_points_num,
+                                    negative_points_num=negative_points_num,
+                                    area_filter_ratio=area_filter_ratio,
+                                    box_noise_pixel=box_noise_pixel,
+                                    mask_noise_pixel=mask_noise_pixel,
+                                    positive_point_num_range=[1, 9],
+                                    negative_point_num_range=[1, 9])
+
+    gt_mask_dict = {}
+    gt_mask = np.zeros((origin_h, origin_w), dtype=np.float32)
+    cv2.ellipse(gt_mask, (300, 250), (180, 120), 30, 0, 360, 1, -1)
+    gt_mask_dict['ellipse'] = gt_mask
+    gt_mask = np.zeros((origin_h, origin_w), dtype=np.float32)
+    cv2.rectangle(gt_mask, (500, 400), (780, 590), 1, -1)
+    cv2.circle(gt_mask, (600, 450), 40, 0, -1)
+    gt_mask_dict['border_rectangle'] = gt_mask
+    gt_mask = np.zeros((origin_h, origin_w), dtype=np.float32)
+    cv2.circle(gt_mask, (100, 100), 12, 1, -1)
+    gt_mask_dict['small_circle'] = gt_mask
+
+    def get_stats(positive_points, negative_points, point_nums, boxes,
+                  prompt_masks, gt_prompt_mask):
+        # [name,samples] pairs for z-test of means
+        prompt_masks = prompt_masks.reshape(prompt_masks.shape[0], -1)
+        gt_prompt_mask = gt_prompt_mask.reshape(1, -1)
+        inter = (prompt_masks * gt_prompt_mask).sum(axis=1)
+        stats = [
+            ['positive_x', positive_points[:, 0]],
+            ['positive_y', positive_points[:, 1]],
+            ['negative_x', negative_points[:, 0]],
+            ['negative_y', negative_points[:, 1]],
+            ['point_num', point_nums],
+            ['box_x1', boxes[:, 0]],
+            ['box_y1', boxes[:, 1]],
+            ['box_x2', boxes[:, 2]],
+            ['box_y2', boxes[:, 3]],
+            ['mask_area', prompt_masks.sum(axis=1)],
+            ['mask_recall', inter / gt_prompt_mask.sum()],
+        ]
+
+        return stats
+
+    max_abs_z = 0.
+    for mask_name, gt_mask in gt_mask_dict.items():
+        ys, xs = np.nonzero(gt_mask)
+        gt_box = np.array([xs.min(), ys.min(),
+                           xs.max() + 1,
+                           ys.max() + 1, 0],
+                          dtype=np.float32)
+
+        samples = []
+        for _ in range(draw_num):
+            positive_prompt_point, negative_prompt_point, prompt_box, prompt_mask = dataset.get_mask_prompts(
+                copy.deepcopy(gt_box), copy.deepcopy(gt_mask),
+                np.array([origin_h, origin_w], dtype=np.float32), 0)
+            samples.append(
+                sam_resize({
+                    'origin_image':
+                    None,
+                    'origin_bbox':
+                    None,
+                    'origin_mask':
+                    None,
+                    'origin_size':
+                    np.array([origin_h, origin_w], dtype=np.float32),
+                    'image':
+                    np.zeros((origin_h, origin_w, 3), dtype=np.float32),
+                    'box':
+                    copy.deepcopy(gt_box),
+                    'mask':
+                    copy.deepcopy(gt_mask),
+                    'size':
+                    np.array([origin_h, origin_w], dtype=np.float32),
+                    'positive_prompt_point':
+                    positive_prompt_point,
+                    'negative_prompt_point':
+                    negative_prompt_point,
+                    'prompt_box':
+                    prompt_box,
+                    'prompt_mask':
+                    prompt_mask,
+                }))
+
+        numpy_positive_points, numpy_negative_points, numpy_point_nums = [], [], []
+        numpy_boxes, numpy_prompt_masks = [], []
+        for start in range(0, draw_num, 64):
+            data = collater(samples[start:start + 64])
+            for per_points, per_box, per_mask in zip(data['prompt_point'],
+                                                     data['prompt_box'],
+                                                     data['prompt_mask']):
+                per_points = per_points.numpy()
+                numpy_positive_points.append(per_points[per_points[:, 2] == 1])
+                numpy_negative_points.append(per_points[per_points[:, 2] == 0])
+                numpy_point_nums.append(per_points.shape[0])
+                numpy_boxes.append(per_box.numpy())
+                numpy_prompt_masks.append(per_mask.numpy())
+            batch_masks = data['batch_mask']
+            sizes = torch.from_numpy(data['size'])
+            origin_sizes = torch.from_numpy(
+                np.array(data['origin_size'], dtype=np.float32))
+            boxes = torch.stack(data['box'], dim=0)
+
+        # same gt masks,batch sampler draws draw_num prompts in one call
+        batch_size = 64
+        batch_masks = batch_masks[0:1].repeat(batch_size, 1, 1, 1)
+        all_outs = []
+        start_time = time.time()
+        for _ in range(draw_num // batch_size):
+            all_outs.append(
+                sampler(batch_masks, sizes[0:1].repeat(batch_size, 1),
+                        origin_sizes[0:1].repeat(batch_size, 1),
+                        boxes[0:1].repeat(batch_size, 1)))
+        batch_time = (time.time() - start_time) / (draw_num // batch_size)
+        outs = {
+            key: torch.cat([per_outs[key] for per_outs in all_outs], dim=0)
+            for key in
+            ['prompt_point', 'prompt_point_num', 'prompt_box', 'prompt_mask']
+        }
+        batch_points = outs['prompt_point'].numpy()
+        batch_point_nums = outs['prompt_point_num'].numpy()
+        batch_point_flag = np.arange(
+            batch_points.shape[1]).reshape(1, -1) < batch_point_nums.reshape(
+                -1, 1)
+        batch_points = batch_points[batch_point_flag]
+
+        resized_gt_mask = data['batch_mask'][0, 0].numpy()
+        gt_prompt_mask = sampler.resize_prompt_masks(
+            data['batch_mask'][0:1, 0], sizes[0:1])[0].numpy()
+        numpy_stats = get_stats(np.concatenate(numpy_positive_points, axis=0),
+                                np.concatenate(numpy_negative_points, axis=0),
+                                np.array(numpy_point_nums),
+                                np.stack(numpy_boxes, axis=0),
+                                np.stack(numpy_prompt_masks, axis=0),
+                                gt_prompt_mask.astype(np.float32))
+        batch_stats = get_stats(batch_points[batch_points[:, 2] == 1],
+                                batch_points[batch_points[:, 2] == 0],
+                                batch_point_nums, outs['prompt_box'].numpy(),
+                                outs['prompt_mask'].numpy(),
+                                gt_prompt_mask.astype(np.float32))
+
+        # positive points must be inside gt mask
+        positive_points = batch_points[batch_points[:, 2] == 1].astype(np.int64)
+        positive_inside = resized_gt_mask[positive_points[:, 1],
+                                          positive_points[:, 0]].mean()
+        print(
+            f'1111 {mask_name},batch sampler time:{batch_time*1000:.2f}ms per {batch_size} masks,positive points inside mask:{positive_inside:.4f}'
+        )
+        for (name, numpy_values), (_, batch_values) in zip(numpy_stats,
+                                                           batch_stats):
+            numpy_values, batch_values = numpy_values.astype(
+                np.float64), batch_values.astype(np.float64)
+            std_error = np.sqrt(
+                numpy_values.var() / len(numpy_values) +
+                batch_values.var() / len(batch_values)) + 1e-8
+            z = (batch_values.mean() - numpy_values.mean()) / std_error
+            max_abs_z = max(max_abs_z, abs(z))
+            print(
+                f'    {name:<12s} numpy mean/std:{numpy_values.mean():9.3f}/{numpy_values.std():9.3f},batch mean/std:{batch_values.mean():9.3f}/{batch_values.std():9.3f},z:{z:6.2f}'
+            )
+    # remaining positive point bias of small_circle is mask boundary lost by cv2.INTER_NEAREST resize itself,
+    # exact expectation is 64.17 vs 64.00 of dataset points,it is 0.27 more with resized pixel points
+    print('2222 max abs z:', max_abs_z)
+
+    # multi mask batches:K masks per image,masks without enough points get not a point prompts
+    multi_mask_sampler = SAMBatchPromptSampler(resize=resize,
+                                               positive_points_num=9,
+                                               negative_points_num=9,
+                                               positive_point_num_range=[1, 9],
+                                               negative_point_num_range=[1, 9],
+                                               per_image_mask_num=3)
+    multi_masks = torch.zeros((2 * 3, 1, resize, resize))
+    multi_masks[0, :, 10:200, 10:300] = 1
+    multi_masks[1, :, 100:103, 100:102] = 1
+    multi_masks[3:6, :, 50:400, 60:200] = 1
+    outs = multi_mask_sampler(multi_masks,
+                              torch.tensor([[384., 512.], [512., 384.]]),
+                              torch.tensor([[600., 800.], [800., 600.]]))
+    print('3333', [
+        per_image_prompt['prompt_point'].shape
+        for per_image_prompt in outs['batch_prompt']
+    ], outs['batch_prompt'][0]['prompt_point'][:, :, 2],
+          outs['batch_prompt'][0]['prompt_box'].shape,
+          outs['batch_prompt'][0]['prompt_mask'].shape)
+
+    # iterative correction points:uniform in error region,label is gt label of sampled pixel
+    gt_masks = torch.zeros((4096, 1, 64, 64))
+    gt_masks[:, :, 16:48, 16:48] = 1
+    pred_masks = torch.zeros((4096, 1, 64, 64))
+    pred_masks[:, :, 16:48, 24:56] = 1
+    pred_masks[-1] = gt_masks[-1]
+    correction_points = sampler.sample_correction_points(
+        pred_masks, gt_masks)
+    error_region = (pred_masks[0, 0] > 0) ^ (gt_masks[0, 0] > 0)
+    points = correction_points[:-1, 0]
+    point_in_error = error_region[points[:, 1].long(),
+                                  points[:, 0].long()].float().mean()
+    # false negative and false positive regions have same area
+    print('4444', correction_points.shape,
+          f'in error region:{point_in_error:.4f}',
+          f'positive ratio:{(points[:, 2] == 1).float().mean():.4f}(0.5)',
+          f'no error label:{correction_points[-1, 0, 2]:.0f}')
@@ -13,11 +13,32 @@ import torch
 from simpleAICV.classification.common import AverageMeter, load_state_dict
 
 
+def resize_masks(masks, resize_w, resize_h):
+    '''
+    masks:[H,W] single mask or [K,H,W] image grouped multi masks
+    '''
+    if len(masks.shape) == 2:
+        return cv2.resize(masks, (resize_w, resize_h),
+                          interpolation=cv2.INTER_NEAREST)
+
+    mask_num = masks.shape[0]
+    masks = cv2.resize(np.ascontiguousarray(masks.transpose(1, 2, 0)),
+                       (resize_w, resize_h),
+                       interpolation=cv2.INTER_NEAREST)
+    masks = masks.reshape(resize_h, resize_w, mask_num).transpose(2, 0, 1)
+
+    return masks
+
+
 class SamResize:
 
     def __init__(self, resize=1024):
         self.resize = resize
 
+    def get_reduced_decode_factor(self, image_h, image_w):
+        # longer side is resized to resize
+        return max(image_h, image_w) / self.resize
+
     def __call__(self, sample):
         origin_image, origin_bbox, origin_mask, origin_size = sample[
             'origin_image'], sample['origin_bbox'], sample[
@@ -35,17 +56,16 @@ class SamResize:
         resize_h, resize_w = int(round(h * factor)), int(round(w * factor))
         image = cv2.resize(image, (resize_w, resize_h))
 
-        box[0:4] *= factor
-        mask = cv2.resize(mask, (resize_w, resize_h),
-                          interpolation=cv2.INTER_NEAREST)
+        # box/mask/prompts also support image grouped multi masks:[K,4]/[K,H,W]/[K,N,3]
+        box[..., 0:4] *= factor
+        mask = resize_masks(mask, resize_w, resize_h)
 
         size = np.array([image.shape[0], image.shape[1]]).astype(np.float32)
 
-        positive_prompt_point[:, 0:2] *= factor
-        negative_prompt_point[:, 0:2] *= factor
-        prompt_box[0:4] *= factor
-        prompt_mask = cv2.resize(prompt_mask, (resize_w, resize_h),
-                                 interpolation=cv2.INTER_NEAREST)
+        positive_prompt_point[..., 0:2] *= factor
+        negative_prompt_point[..., 0:2] *= factor
+        prompt_box[..., 0:4] *= factor
+        prompt_mask = resize_masks(prompt_mask, resize_w, resize_h)
 
         return {
             'origin_image': origin_image,
@@ -82,31 +102,28 @@ class SamRandomHorizontalFlip:
 
         if np.random.uniform(0, 1) < self.prob:
             image = image[:, ::-1, :]
-            mask = mask[:, ::-1]
+            mask = mask[..., ::-1]
 
-            prompt_mask = prompt_mask[:, ::-1]
+            prompt_mask = prompt_mask[..., ::-1]
 
             _, w, _ = image.shape
 
-            x1 = box[0].copy()
-            x2 = box[2].copy()
+            x1 = box[..., 0].copy()
+            x2 = box[..., 2].copy()
 
-            box[0] = w - x2
-            box[2] = w - x1
+            box[..., 0] = w - x2
+            box[..., 2] = w - x1
 
-            x1 = prompt_box[0].copy()
-            x2 = prompt_box[2].copy()
+            x1 = prompt_box[..., 0].copy()
+            x2 = prompt_box[..., 2].copy()
 
-            prompt_box[0] = w - x2
-            prompt_box[2] = w - x1
+            prompt_box[..., 0] = w - x2
+            prompt_box[..., 2] = w - x1
 
             _, w, _ = image.shape
 
-            for i in range(len(positive_prompt_point)):
-                positive_prompt_point[i][0] = w - positive_prompt_point[i][0]
-
-            for i in range(len(negative_prompt_point)):
-                negative_prompt_point[i][0] = w - negative_prompt_point[i][0]
+            positive_prompt_point[..., 0] = w - positive_prompt_point[..., 0]
+            negative_prompt_point[..., 0] = w - negative_prompt_point[..., 0]
 
         return {
             'origin_image': origin_image,
@@ -434,3 +451,208 @@ class SAMCollater:
             'batch_mask': batch_masks,
             'batch_prompt': batch_prompts,
         }
+
+
+class SAMMultiMaskCollater:
+    '''
+    collater for image grouped multi masks samples(SAM1BDataset with per_image_mask_num).
+    every image has K masks,batch_prompts[i] has K prompts for image i,
+    so image encoder runs once for K masks and batch_mask is [B*K,1,H,W] in same order as model outputs.
+    '''
+
+    def __init__(self,
+                 resize,
+                 positive_point_num_range=[1, 9],
+                 negative_point_num_range=[1, 9],
+                 batch_align_random_point_num=False,
+                 positive_negative_point_num_ratio=None):
+        self.resize = resize
+        assert resize % 64 == 0
+
+        self.prompt_mask_size = resize // 4
+
+        assert isinstance(positive_point_num_range, (int, list))
+        assert isinstance(negative_point_num_range, (int, list))
+        if isinstance(positive_point_num_range, list):
+            assert isinstance(positive_point_num_range[0], int)
+            assert isinstance(positive_point_num_range[1], int)
+            assert positive_point_num_range[0] <= positive_point_num_range[1]
+            assert positive_point_num_range[0] >= 1
+        if isinstance(negative_point_num_range, list):
+            assert isinstance(negative_point_num_range[0], int)
+            assert isinstance(negative_point_num_range[1], int)
+            assert negative_point_num_range[0] <= negative_point_num_range[1]
+            assert negative_point_num_range[0] >= 1
+        if isinstance(positive_point_num_range, int):
+            assert positive_point_num_range >= 0
+        if isinstance(negative_point_num_range, int):
+            assert negative_point_num_range >= 0
+
+        self.positive_point_num_range = positive_point_num_range
+        self.negative_point_num_range = negative_point_num_range
+        self.batch_align_random_point_num = batch_align_random_point_num
+        self.positive_negative_point_num_ratio = positive_negative_point_num_ratio
+
+    def get_point_num(self, point_num_range):
+        if isinstance(point_num_range, list):
+            return np.random.randint(point_num_range[0],
+                                     point_num_range[1] + 1)
+
+        return point_num_range
+
+    def get_negative_point_num(self, positive_point_num):
+        if self.positive_negative_point_num_ratio:
+            max_negative_point_num = self.negative_point_num_range[1] if isinstance(
+                self.negative_point_num_range,
+                list) else self.negative_point_num_range
+            return min(
+                int(positive_point_num *
+                    self.positive_negative_point_num_ratio),
+                max_negative_point_num)
+
+        return self.get_point_num(self.negative_point_num_range)
+
+    def __call__(self, data):
+        origin_images = [s['origin_image'] for s in data]
+        origin_bboxes = [s['origin_bbox'] for s in data]
+        origin_masks = [s['origin_mask'] for s in data]
+        origin_sizes = [s['origin_size'] for s in data]
+
+        images = [s['image'] for s in data]
+        boxes = [x['box'] for x in data]
+        masks = [x['mask'] for x in data]
+        sizes = [x['size'] for x in data]
+
+        positive_prompt_points = [x['positive_prompt_point'] for x in data]
+        negative_prompt_points = [s['negative_prompt_point'] for s in data]
+        prompt_boxs = [x['prompt_box'] for x in data]
+        prompt_masks = [x['prompt_mask'] for x in data]
+
+        input_images = []
+        for i, per_image in enumerate(images):
+            per_input_image = np.zeros((self.resize, self.resize, 3),
+                                       dtype=np.float32)
+            per_input_image[0:per_image.shape[0],
+                            0:per_image.shape[1], :] = per_image
+            per_input_image = torch.from_numpy(per_input_image)
+            # [3,H,W]
+            per_input_image = per_input_image.permute(2, 0, 1)
+            input_images.append(per_input_image)
+
+        batch_images = torch.stack(
+            [per_input_image for per_input_image in input_images], dim=0)
+
+        input_boxes = []
+        for i, per_box in enumerate(boxes):
+            # [K,4]
+            per_input_box = torch.from_numpy(
+                np.ascontiguousarray(per_box[:, 0:4], dtype=np.float32))
+            input_boxes.append(per_input_box)
+
+        input_masks = []
+        for i, per_mask in enumerate(masks):
+            per_input_mask = np.zeros(
+                (per_mask.shape[0], self.resize, self.resize),
+                dtype=np.float32)
+            per_input_mask[:, 0:per_mask.shape[1],
+                           0:per_mask.shape[2]] = per_mask
+            # [K,H,W]
+            per_input_mask = torch.from_numpy(per_input_mask)
+            input_masks.append(per_input_mask)
+
+        # [B*K,1,H,W]
+        batch_masks = torch.cat(
+            [per_input_mask for per_input_mask in input_masks], dim=0)
+        batch_masks = batch_masks.unsqueeze(1)
+
+        assert len(input_images) == len(input_boxes) == len(input_masks)
+
+        sizes = np.array(sizes, dtype=np.float32)
+
+        if self.batch_align_random_point_num:
+            batch_positive_point_num = self.get_point_num(
+                self.positive_point_num_range)
+            batch_negative_point_num = self.get_negative_point_num(
+                batch_positive_point_num)
+
+        input_prompt_points = []
+        for per_positive_prompt_points, per_negative_prompt_points in zip(
+                positive_prompt_points, negative_prompt_points):
+            if self.batch_align_random_point_num:
+                positive_point_num, negative_point_num = batch_positive_point_num, batch_negative_point_num
+            else:
+                positive_point_num = self.get_point_num(
+                    self.positive_point_num_range)
+                negative_point_num = self.get_negative_point_num(
+                    positive_point_num)
+
+            # [K,positive_point_num+negative_point_num,3]
+            per_input_prompt_points = np.concatenate([
+                per_positive_prompt_points[:, 0:positive_point_num, :],
+                per_negative_prompt_points[:, 0:negative_point_num, :],
+            ],
+                                                     axis=1)
+            if per_input_prompt_points.shape[1] == 0:
+                per_input_prompt_points = None
+            else:
+                per_input_prompt_points = torch.from_numpy(
+                    np.ascontiguousarray(per_input_prompt_points,
+                                         dtype=np.float32))
+            input_prompt_points.append(per_input_prompt_points)
+
+        input_prompt_boxs = []
+        for i, per_prompt_box in enumerate(prompt_boxs):
+            # [K,4]
+            per_input_prompt_box = torch.from_numpy(
+                np.ascontiguousarray(per_prompt_box[:, 0:4], dtype=np.float32))
+            input_prompt_boxs.append(per_input_prompt_box)
+
+        input_prompt_masks = []
+        for i, per_prompt_mask in enumerate(prompt_masks):
+            _, h, w = per_prompt_mask.shape
+            factor = self.prompt_mask_size / max(h, w)
+            resize_h, resize_w = int(round(h * factor)), int(round(w * factor))
+            per_prompt_mask = resize_masks(per_prompt_mask, resize_w,
+                                           resize_h)
+
+            per_input_prompt_mask = np.zeros(
+                (per_prompt_mask.shape[0], self.prompt_mask_size,
+                 self.prompt_mask_size),
+                dtype=np.float32)
+            per_input_prompt_mask[:, 0:per_prompt_mask.shape[1],
+                                  0:per_prompt_mask.shape[2]] = per_prompt_mask
+            # [K,H//4,W//4]
+            per_input_prompt_mask = torch.from_numpy(per_input_prompt_mask)
+            input_prompt_masks.append(per_input_prompt_mask)
+
+        batch_prompts = []
+        for per_input_prompt_points, per_input_prompt_box, per_input_prompt_mask in zip(
+                input_prompt_points, input_prompt_boxs, input_prompt_masks):
+            per_image_prompts = {
+                'prompt_point': per_input_prompt_points,
+                'prompt_box': per_input_prompt_box,
+                'prompt_mask': per_input_prompt_mask.unsqueeze(1),
+            }
+            batch_prompts.append(per_image_prompts)
+
+        assert len(input_images) == len(input_boxes) == len(
+            input_masks) == len(input_prompt_points) == len(
+                input_prompt_boxs) == len(input_prompt_masks) == len(
+                    batch_prompts)
+
+        return {
+            'origin_image': origin_images,
+            'origin_bbox': origin_bboxes,
+            'origin_mask': origin_masks,
+            'origin_size': origin_sizes,
+            'image': input_images,
+            'box': input_boxes,
+            'mask': input_masks,
+            'size': sizes,
+            'prompt_point': input_prompt_points,
+            'prompt_box': input_prompt_boxs,
+            'prompt_mask': input_prompt_masks,
+            'batch_image': batch_images,
+            'batch_mask': batch_masks,
+            'batch_prompt': batch_prompts,
+        }
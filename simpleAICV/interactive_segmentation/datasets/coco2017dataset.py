@@ -279,7 +279,10 @@ class COCO2017dataset(Dataset):
                          origin_image.shape[1]]).astype(np.float32)
         origin_size = copy.deepcopy(size)
 
-        image_mask_all_points_coords = np.argwhere(image_mask)
+        # no argwhere without points,e.g. prompts are sampled on device by SAMBatchPromptSampler
+        image_mask_all_points_coords = np.argwhere(
+            image_mask) if self.positive_points_num > 0 else np.zeros(
+                (0, 2), dtype=np.int64)
         image_mask_all_points_num = len(image_mask_all_points_coords)
 
         if image_mask_all_points_num < self.positive_points_num:
@@ -299,7 +302,9 @@ class COCO2017dataset(Dataset):
             else:
                 positive_prompt_point = np.zeros((0, 3), dtype=np.float32)
 
-        image_not_mask_all_points_coords = np.argwhere(1. - image_mask)
+        image_not_mask_all_points_coords = np.argwhere(
+            1. - image_mask) if self.negative_points_num > 0 else np.zeros(
+                (0, 2), dtype=np.int64)
         image_not_mask_all_points_num = len(image_not_mask_all_points_coords)
 
         if image_not_mask_all_points_num < self.negative_points_num:
@@ -406,6 +411,10 @@ class COCO2017dataset(Dataset):
             return post_properties_bbox.astype(np.float32)
 
     def noise_mask(self, properties_mask, idx):
+        # mask_noise_pixel<=1 keeps gt mask,e.g. prompts are sampled on device by SAMBatchPromptSampler
+        if self.mask_noise_pixel <= 1:
+            return properties_mask.astype(np.float32)
+
         image_info = self.coco.loadImgs(self.all_image_mask_ids[idx][0])[0]
         image_h, image_w = image_info['height'], image_info['width']
 
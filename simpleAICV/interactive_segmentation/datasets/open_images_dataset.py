@@ -122,7 +122,10 @@ class OpenImagesV7Dataset(Dataset):
 
         image_mask = np.where(mask > 0.5, 1.0, 0.0).astype(np.float32)
 
-        image_mask_all_points_coords = np.argwhere(image_mask)
+        # no argwhere without points,e.g. prompts are sampled on device by SAMBatchPromptSampler
+        image_mask_all_points_coords = np.argwhere(
+            image_mask) if self.positive_points_num > 0 else np.zeros(
+                (0, 2), dtype=np.int64)
         image_mask_all_points_num = len(image_mask_all_points_coords)
 
         if image_mask_all_points_num < self.positive_points_num:
@@ -142,7 +145,9 @@ class OpenImagesV7Dataset(Dataset):
             else:
                 positive_prompt_point = np.zeros((0, 3), dtype=np.float32)
 
-        image_not_mask_all_points_coords = np.argwhere(1. - image_mask)
+        image_not_mask_all_points_coords = np.argwhere(
+            1. - image_mask) if self.negative_points_num > 0 else np.zeros(
+                (0, 2), dtype=np.int64)
         image_not_mask_all_points_num = len(image_not_mask_all_points_coords)
 
         if image_not_mask_all_points_num < self.negative_points_num:
@@ -235,6 +240,10 @@ class OpenImagesV7Dataset(Dataset):
             return post_properties_bbox.astype(np.float32)
 
     def noise_mask(self, properties_mask, mask_np_shape):
+        # mask_noise_pixel<=1 keeps gt mask,e.g. prompts are sampled on device by SAMBatchPromptSampler
+        if self.mask_noise_pixel <= 1:
+            return properties_mask.astype(np.float32)
+
         image_h, image_w = mask_np_shape[0], mask_np_shape[1]
 
         kernel = np.random.randint(1, self.mask_noise_pixel)
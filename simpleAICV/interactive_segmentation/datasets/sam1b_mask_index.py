@@ -0,0 +1,423 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from multiprocessing import Pool
+from tqdm import tqdm
+
+from simpleAICV.cache_dir import get_temp_cache_dir, replace_cache_dir, build_cache_dir_if_stale
+
+# every array is saved as a single .npy file and loaded by mmap,so all dataloader workers share same pages
+# and no per mask python object is created.
+# image table(one row per image):
+#   image_path_blob/image_path_offset:utf-8 bytes of image paths
+#   image_h/image_w:image size in json
+#   image_mask_offset:masks of image i are mask rows image_mask_offset[i]:image_mask_offset[i+1]
+# mask table(one row per mask,grouped by image):
+#   mask_image_id:image row of mask
+#   mask_list_idx:index of mask in json annotations list
+#   mask_area:area in json
+#   mask_bbox:[x_min, y_min, w, h] bbox in json
+#   mask_rle_offset:mask rle counts bytes are rle_blob[mask_rle_offset[i]:mask_rle_offset[i+1]]
+# rle_blob:compressed rle counts bytes of all masks,masks of one image are contiguous
+sam1b_mask_index_array_name_list = [
+    'image_path_blob',
+    'image_path_offset',
+    'image_h',
+    'image_w',
+    'image_mask_offset',
+    'mask_image_id',
+    'mask_list_idx',
+    'mask_area',
+    'mask_bbox',
+    'mask_rle_offset',
+    'rle_blob',
+]
+
+
+def get_sam1b_image_json_path_list(root_dir):
+    image_path_list = []
+    for root, folders, files in os.walk(root_dir):
+        for file_name in files:
+            if '.jpg' in file_name:
+                per_image_path = os.path.join(root, file_name)
+                json_name = file_name.split('.')[0] + '.json'
+                per_json_path = os.path.join(root, json_name)
+                if os.path.exists(per_image_path) and os.path.exists(
+                        per_json_path):
+                    image_path_list.append(
+                        [file_name, per_image_path, per_json_path])
+    image_path_list = sorted(image_path_list)
+
+    return image_path_list
+
+
+def get_sam1b_root_dir_fingerprint(root_dir):
+    '''
+    cheap fingerprint checked at every dataset init:names and mtimes of root_dir entries,
+    adding or removing files in root_dir or its direct sub dirs(SA-1B sa_xxxxxx dirs) changes their mtime.
+    json files modified in place are not detected,use rebuild=True to check full source fingerprint.
+    '''
+    root_dir_entries = sorted([[per_entry.name,
+                                per_entry.stat().st_mtime_ns]
+                               for per_entry in os.scandir(root_dir)])
+    fingerprint = hashlib.md5(
+        json.dumps(root_dir_entries).encode('utf-8')).hexdigest()
+
+    return fingerprint
+
+
+def get_sam1b_source_fingerprint(image_path_list):
+    '''
+    full fingerprint by os.walk+os.stat of every json,only checked with rebuild=True:
+    changes when image/json pairs are added,removed or json files are modified
+    '''
+    source_mtime_ns = max([
+        os.stat(per_json_path).st_mtime_ns
+        for _, _, per_json_path in image_path_list
+    ],
+                          default=0)
+    fingerprint = f'{len(image_path_list)}_{source_mtime_ns}'
+
+    return fingerprint
+
+
+def parse_sam1b_image_json(args):
+    _, per_image_path, per_json_path = args
+    with open(per_json_path, encoding='utf-8') as f:
+        per_image_json_data = json.load(f)
+
+    per_image_h, per_image_w = per_image_json_data['image'][
+        'height'], per_image_json_data['image']['width']
+
+    mask_area_list, mask_bbox_list, rle_counts_list = [], [], []
+    for per_annot in per_image_json_data['annotations']:
+        mask_area_list.append(per_annot['area'])
+        mask_bbox_list.append(per_annot['bbox'])
+        per_rle_counts = per_annot['segmentation']['counts']
+        if isinstance(per_rle_counts, str):
+            per_rle_counts = per_rle_counts.encode('utf-8')
+        rle_counts_list.append(per_rle_counts)
+
+    return per_image_path, per_image_h, per_image_w, mask_area_list, mask_bbox_list, rle_counts_list
+
+
+def build_sam1b_mask_index(root_dir,
+                           index_dir,
+                           num_processes=16,
+                           image_path_list=None):
+    '''
+    parse every SAM1B json once and save image table/mask table/rle blob to index_dir.
+    index is written to a temporary dir then renamed,so a half-written index is never loaded.
+    '''
+    # root dir fingerprint before walk,so files added during build make index stale
+    root_dir_fingerprint = get_sam1b_root_dir_fingerprint(root_dir)
+    if image_path_list is None:
+        image_path_list = get_sam1b_image_json_path_list(root_dir)
+    fingerprint = get_sam1b_source_fingerprint(image_path_list)
+
+    image_path_bytes_list, image_h_list, image_w_list = [], [], []
+    image_mask_num_list = []
+    mask_area_list, mask_bbox_list = [], []
+    rle_length_list = []
+
+    index_dir = os.path.normpath(index_dir)
+    temp_index_dir = get_temp_cache_dir(index_dir)
+    os.makedirs(temp_index_dir) if not os.path.exists(
+        temp_index_dir) else None
+    rle_blob_path = os.path.join(temp_index_dir, 'rle_blob.bin')
+    with open(rle_blob_path, 'wb') as rle_blob_f, Pool(
+            processes=num_processes) as pool:
+        for per_image_path, per_image_h, per_image_w, per_mask_area_list, per_mask_bbox_list, per_rle_counts_list in tqdm(
+                pool.imap(parse_sam1b_image_json, image_path_list,
+                          chunksize=16),
+                total=len(image_path_list)):
+            image_path_bytes_list.append(per_image_path.encode('utf-8'))
+            image_h_list.append(per_image_h)
+            image_w_list.append(per_image_w)
+            image_mask_num_list.append(len(per_mask_area_list))
+
+            mask_area_list.extend(per_mask_area_list)
+            mask_bbox_list.extend(per_mask_bbox_list)
+            for per_rle_counts in per_rle_counts_list:
+                rle_blob_f.write(per_rle_counts)
+                rle_length_list.append(len(per_rle_counts))
+
+    image_path_offset = np.zeros(len(image_path_bytes_list) + 1,
+                                 dtype=np.int64)
+    image_path_offset[1:] = np.cumsum(
+        [len(per_image_path) for per_image_path in image_path_bytes_list])
+
+    image_mask_offset = np.zeros(len(image_mask_num_list) + 1, dtype=np.int64)
+    image_mask_offset[1:] = np.cumsum(image_mask_num_list)
+
+    image_mask_num = np.array(image_mask_num_list, dtype=np.int64)
+    mask_image_id = np.repeat(np.arange(len(image_mask_num),
+                                        dtype=np.int32), image_mask_num)
+    mask_list_idx = (np.arange(len(mask_image_id), dtype=np.int64) -
+                     np.repeat(image_mask_offset[:-1],
+                               image_mask_num)).astype(np.int32)
+
+    mask_rle_offset = np.zeros(len(rle_length_list) + 1, dtype=np.int64)
+    mask_rle_offset[1:] = np.cumsum(rle_length_list)
+
+    sam1b_mask_index = {
+        'image_path_blob':
+        np.frombuffer(b''.join(image_path_bytes_list), dtype=np.uint8),
+        'image_path_offset':
+        image_path_offset,
+        'image_h':
+        np.array(image_h_list, dtype=np.int32),
+        'image_w':
+        np.array(image_w_list, dtype=np.int32),
+        'image_mask_offset':
+        image_mask_offset,
+        'mask_image_id':
+        mask_image_id,
+        'mask_list_idx':
+        mask_list_idx,
+        'mask_area':
+        np.array(mask_area_list, dtype=np.float64),
+        'mask_bbox':
+        np.array(mask_bbox_list, dtype=np.float64).reshape(-1, 4),
+        'mask_rle_offset':
+        mask_rle_offset,
+    }
+    for per_array_name, per_array in sam1b_mask_index.items():
+        np.save(os.path.join(temp_index_dir, f'{per_array_name}.npy'),
+                per_array)
+
+    with open(os.path.join(temp_index_dir, 'meta.json'), 'w') as f:
+        json.dump(
+            {
+                'root_dir': root_dir,
+                'root_dir_fingerprint': root_dir_fingerprint,
+                'fingerprint': fingerprint,
+                'image_num': len(image_mask_num_list),
+                'mask_num': len(mask_area_list),
+            }, f)
+
+    replace_cache_dir(temp_index_dir, index_dir)
+
+    print(
+        f'Build SAM1B Mask Index:{index_dir}, Image Num:{len(image_mask_num_list)}, Mask Num:{len(mask_area_list)}'
+    )
+
+
+def is_sam1b_mask_index_stale(root_dir, index_dir, image_path_list=None):
+    '''
+    image_path_list is None:cheap check by root dir fingerprint
+    image_path_list is not None:full check by source fingerprint of image_path_list
+    '''
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return True
+
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+
+    if meta['root_dir'] != root_dir:
+        return True
+
+    if image_path_list is None:
+        return meta.get('root_dir_fingerprint'
+                        ) != get_sam1b_root_dir_fingerprint(root_dir)
+
+    return meta.get('fingerprint') != get_sam1b_source_fingerprint(
+        image_path_list)
+
+
+def build_sam1b_mask_index_if_stale(root_dir,
+                                    index_dir,
+                                    num_processes=16,
+                                    rebuild=False):
+    # check and build under file lock,see build_cache_dir_if_stale
+    # rebuild:walk root_dir and check full source fingerprint,so only first process rebuilds a changed index
+    image_path_list = get_sam1b_image_json_path_list(
+        root_dir) if rebuild else None
+
+    return build_cache_dir_if_stale(
+        index_dir, lambda: is_sam1b_mask_index_stale(root_dir, index_dir,
+                                                     image_path_list),
+        lambda: build_sam1b_mask_index(root_dir,
+                                       index_dir,
+                                       num_processes=num_processes,
+                                       image_path_list=image_path_list))
+
+
+class SAM1BMaskIndex:
+    '''
+    mmap loaded SAM1B image/mask tables and rle blob store,built by build_sam1b_mask_index.
+    get_rle returns a single mask rle for pycocotools mask decode without json parsing.
+    index is checked by cheap root dir fingerprint at init without walking root_dir,stale index is rebuilt automatically.
+    rebuild:walk root_dir and check full source fingerprint(image/json pair num and latest json mtime),
+    e.g. after json files are modified in place.
+    '''
+
+    def __init__(self, root_dir, index_dir, num_processes=16, rebuild=False):
+        if rebuild or is_sam1b_mask_index_stale(root_dir, index_dir):
+            build_sam1b_mask_index_if_stale(root_dir,
+                                            index_dir,
+                                            num_processes=num_processes,
+                                            rebuild=rebuild)
+
+        for per_array_name in sam1b_mask_index_array_name_list:
+            if per_array_name == 'rle_blob':
+                continue
+            setattr(
+                self, per_array_name,
+                np.load(os.path.join(index_dir, f'{per_array_name}.npy'),
+                        mmap_mode='r'))
+
+        rle_blob_path = os.path.join(index_dir, 'rle_blob.bin')
+        self.rle_blob = np.memmap(
+            rle_blob_path, dtype=np.uint8,
+            mode='r') if os.path.getsize(rle_blob_path) > 0 else np.zeros(
+                (0), dtype=np.uint8)
+
+    def get_image_num(self):
+        return len(self.image_h)
+
+    def get_mask_num(self):
+        return len(self.mask_image_id)
+
+    def get_image_path(self, image_id):
+        image_path = self.image_path_blob[self.image_path_offset[image_id]:self
+                                          .image_path_offset[image_id + 1]]
+        image_path = image_path.tobytes().decode('utf-8')
+
+        return image_path
+
+    def get_image_mask_ids(self, image_id):
+        return np.arange(self.image_mask_offset[image_id],
+                         self.image_mask_offset[image_id + 1])
+
+    def get_rle(self, mask_id):
+        image_id = self.mask_image_id[mask_id]
+        rle_counts = self.rle_blob[self.mask_rle_offset[mask_id]:self.
+                                   mask_rle_offset[mask_id + 1]].tobytes()
+        rle = {
+            'size': [int(self.image_h[image_id]),
+                     int(self.image_w[image_id])],
+            'counts': rle_counts,
+        }
+
+        return rle
+
+    def get_keep_mask_ids(self, area_filter_ratio):
+        '''
+        same mask filter rules as SAM1BDataset json walking,vectorized on mask table
+        '''
+        mask_bbox = np.asarray(self.mask_bbox)
+        mask_image_id = np.asarray(self.mask_image_id)
+        image_h = np.asarray(self.image_h)[mask_image_id].astype(np.float64)
+        image_w = np.asarray(self.image_w)[mask_image_id].astype(np.float64)
+
+        inter_w = np.maximum(
+            0,
+            np.minimum(mask_bbox[:, 0] + mask_bbox[:, 2], image_w) -
+            np.maximum(mask_bbox[:, 0], 0))
+        inter_h = np.maximum(
+            0,
+            np.minimum(mask_bbox[:, 1] + mask_bbox[:, 3], image_h) -
+            np.maximum(mask_bbox[:, 1], 0))
+
+        keep_mask = (inter_w * inter_h != 0)
+        keep_mask &= ~((mask_bbox[:, 2] * mask_bbox[:, 3] < 1) |
+                       (mask_bbox[:, 2] < 1) | (mask_bbox[:, 3] < 1))
+        keep_mask &= ~(np.asarray(self.mask_area) /
+                       (image_h * image_w) < area_filter_ratio)
+
+        return np.nonzero(keep_mask)[0].astype(np.int64)
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    sys.path.append(BASE_DIR)
+
+    from tools.path import sam1b_dataset_path, sam1b_mask_index_path
+
+    import time
+    from torch.utils.data import DataLoader
+
+    from simpleAICV.interactive_segmentation.datasets.sam1bdataset import SAM1BDataset
+
+    def get_private_memory_mb():
+        # private pages of this process,copy-on-write duplicated pages are counted here
+        private_memory = 0
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for per_line in f:
+                if per_line.startswith('Private_Clean') or per_line.startswith(
+                        'Private_Dirty'):
+                    private_memory += int(per_line.split()[1])
+
+        return private_memory / 1024
+
+    class LoadMaskBenchmarkDataset:
+
+        def __init__(self, dataset):
+            self.dataset = dataset
+
+        def __len__(self):
+            return len(self.dataset)
+
+        def __getitem__(self, idx):
+            _, _ = self.dataset.load_mask(idx)
+
+            return idx
+
+    def memory_collater(data):
+        return len(data), get_private_memory_mb()
+
+    # benchmark:per worker private memory after one pass and load_mask samples/sec
+    for mask_index_dir in [None, sam1b_mask_index_path]:
+        start_time = time.time()
+        sam1bdataset = SAM1BDataset(sam1b_dataset_path,
+                                    positive_points_num=9,
+                                    negative_points_num=9,
+                                    area_filter_ratio=0.0025,
+                                    box_noise_pixel=50,
+                                    mask_noise_pixel=100,
+                                    transform=None,
+                                    mask_index_dir=mask_index_dir)
+        init_time = time.time() - start_time
+        main_process_memory = get_private_memory_mb()
+
+        loader = DataLoader(LoadMaskBenchmarkDataset(sam1bdataset),
+                            batch_size=64,
+                            shuffle=True,
+                            num_workers=4,
+                            collate_fn=memory_collater)
+        start_time = time.time()
+        sample_num, max_worker_memory = 0, 0
+        for per_batch_sample_num, per_worker_memory in loader:
+            sample_num += per_batch_sample_num
+            max_worker_memory = max(max_worker_memory, per_worker_memory)
+            if sample_num >= 20000:
+                break
+        used_time = time.time() - start_time
+
+        print(
+            f'mask_index_dir:{mask_index_dir}, init:{init_time:.3f}s, main process private memory:{main_process_memory:.1f}MB, max worker private memory:{max_worker_memory:.1f}MB, load_mask:{sample_num / used_time:.1f} samples/s'
+        )
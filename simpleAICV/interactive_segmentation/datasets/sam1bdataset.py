@@ -1,4 +1,11 @@
 import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
 import copy
 import collections
 import cv2
@@ -11,8 +18,22 @@ from pycocotools import mask as mask_utils
 
 from torch.utils.data import Dataset
 
+from simpleAICV.classification.common import decode_image_with_reduced_resolution
+from simpleAICV.interactive_segmentation.common import resize_masks
+from simpleAICV.interactive_segmentation.datasets.sam1b_mask_index import SAM1BMaskIndex
+
 
 class SAM1BDataset(Dataset):
+    '''
+    mask_index_dir:if not None,use mmap SAM1BMaskIndex flat arrays instead of per mask python lists,
+    and read single mask rle from rle blob instead of parsing whole image json for every sample.
+    index is built in mask_index_dir when it doesn't exist or root_dir listing changes,
+    mask_index_rebuild:walk root_dir and rebuild index if any json is added,removed or modified.
+    per_image_mask_num:if not None,each item is one image with per_image_mask_num masks and their prompts,
+    so the image is decoded and transformed once for per_image_mask_num masks.
+    reduced_resolution_decode:if True,decode image at 1/2,1/4,1/8 resolution when first resize transform allows it,
+    prompts are generated at original resolution,then boxes/masks/prompts are rescaled to decoded image resolution.
+    '''
 
     def __init__(self,
                  root_dir,
@@ -21,7 +42,40 @@ class SAM1BDataset(Dataset):
                  area_filter_ratio=0.0025,
                  box_noise_pixel=50,
                  mask_noise_pixel=50,
-                 transform=None):
+                 transform=None,
+                 mask_index_dir=None,
+                 mask_index_num_processes=16,
+                 mask_index_rebuild=False,
+                 per_image_mask_num=None,
+                 reduced_resolution_decode=False):
+        assert per_image_mask_num is None or per_image_mask_num >= 1
+        self.per_image_mask_num = per_image_mask_num
+        self.reduced_resolution_decode = reduced_resolution_decode
+        self.positive_points_num = positive_points_num
+        self.negative_points_num = negative_points_num
+        self.area_filter_ratio = area_filter_ratio
+        self.box_noise_pixel = box_noise_pixel
+        self.mask_noise_pixel = mask_noise_pixel
+        self.transform = transform
+
+        self.mask_index_dir = mask_index_dir
+        if self.mask_index_dir:
+            self.mask_index = SAM1BMaskIndex(
+                root_dir,
+                self.mask_index_dir,
+                num_processes=mask_index_num_processes,
+                rebuild=mask_index_rebuild)
+            self.sample_mask_ids = self.mask_index.get_keep_mask_ids(
+                self.area_filter_ratio)
+
+            sample_image_ids = self.mask_index.mask_image_id[
+                self.sample_mask_ids]
+            self.build_image_group(sample_image_ids)
+
+            print(f'Image Size:{self.mask_index.get_image_num()}')
+            print(f'Dataset Size:{len(self)}')
+
+            return
 
         self.image_path_list = []
         for root, folders, files in os.walk(root_dir):
@@ -81,21 +135,55 @@ class SAM1BDataset(Dataset):
                         per_image_w,
                     ])
 
-        self.positive_points_num = positive_points_num
-        self.negative_points_num = negative_points_num
-        self.area_filter_ratio = area_filter_ratio
-        self.box_noise_pixel = box_noise_pixel
-        self.mask_noise_pixel = mask_noise_pixel
-        self.transform = transform
+        image_name_to_id = {
+            per_image_name: i
+            for i, (per_image_name, _, _) in enumerate(self.image_path_list)
+        }
+        sample_image_ids = np.array([
+            image_name_to_id[per_image_name]
+            for per_image_name, _, _, _, _, _ in self.all_image_mask_path_list
+        ],
+                                    dtype=np.int64)
+        self.build_image_group(sample_image_ids)
 
         print(f'Image Size:{len(self.image_path_list)}')
-        print(f'Dataset Size:{len(self.all_image_mask_path_list)}')
+        print(f'Dataset Size:{len(self)}')
+
+    def build_image_group(self, sample_image_ids):
+        '''
+        samples of image group i are samples image_group_offset[i]:image_group_offset[i+1],
+        samples of same image are contiguous.
+        '''
+        if self.per_image_mask_num is None:
+            return
+
+        sample_image_ids = np.asarray(sample_image_ids)
+        group_start_ids = np.nonzero(
+            np.diff(sample_image_ids, prepend=-1) != 0)[0]
+        self.image_group_offset = np.append(group_start_ids,
+                                            len(sample_image_ids)).astype(
+                                                np.int64)
+
+        print(f'Image Group Size:{len(self.image_group_offset) - 1}')
+
+    def get_sample_num(self):
+        if self.mask_index_dir:
+            return len(self.sample_mask_ids)
 
-    def __len__(self):
         return len(self.all_image_mask_path_list)
 
+    def __len__(self):
+        if self.per_image_mask_num:
+            return len(self.image_group_offset) - 1
+
+        return self.get_sample_num()
+
     def __getitem__(self, idx):
-        image = self.load_image(idx)
+        if self.per_image_mask_num:
+            return self.get_image_group_item(idx)
+
+        image = self.load_reduced_resolution_image(
+            idx) if self.reduced_resolution_decode else self.load_image(idx)
         # image_mask:[0,1]二值化mask
         image_box, image_mask = self.load_mask(idx)
         origin_image = copy.deepcopy(image)
@@ -106,7 +194,151 @@ class SAM1BDataset(Dataset):
                          origin_image.shape[1]]).astype(np.float32)
         origin_size = copy.deepcopy(size)
 
-        image_mask_all_points_coords = np.argwhere(image_mask)
+        positive_prompt_point, negative_prompt_point, prompt_box, prompt_mask = self.get_mask_prompts(
+            image_box, image_mask, self.get_prompt_size(origin_size,
+                                                        image_mask), idx)
+
+        sample = {
+            'origin_image': origin_image,
+            'origin_bbox': origin_box,
+            'origin_mask': origin_mask,
+            'origin_size': origin_size,
+            'image': image,
+            'box': image_box,
+            'mask': image_mask,
+            'size': size,
+            'positive_prompt_point': positive_prompt_point,
+            'negative_prompt_point': negative_prompt_point,
+            'prompt_box': prompt_box,
+            'prompt_mask': prompt_mask,
+        }
+
+        if self.reduced_resolution_decode:
+            sample = self.rescale_sample_to_image_size(sample)
+
+        if self.transform:
+            sample = self.transform(sample)
+
+        return sample
+
+    def get_image_group_item(self, group_idx):
+        group_start, group_end = self.image_group_offset[
+            group_idx], self.image_group_offset[group_idx + 1]
+        group_sample_num = group_end - group_start
+        # sample with replacement only when image has less masks than per_image_mask_num
+        sample_idxs = group_start + np.random.choice(
+            group_sample_num,
+            self.per_image_mask_num,
+            replace=bool(group_sample_num < self.per_image_mask_num))
+
+        image = self.load_reduced_resolution_image(
+            sample_idxs[0]
+        ) if self.reduced_resolution_decode else self.load_image(
+            sample_idxs[0])
+        origin_image = copy.deepcopy(image)
+
+        size = np.array([origin_image.shape[0],
+                         origin_image.shape[1]]).astype(np.float32)
+        origin_size = copy.deepcopy(size)
+
+        image_boxes, image_masks = [], []
+        positive_prompt_points, negative_prompt_points = [], []
+        prompt_boxes, prompt_masks = [], []
+        for per_sample_idx in sample_idxs:
+            # image_mask:[0,1]二值化mask
+            image_box, image_mask = self.load_mask(per_sample_idx)
+            positive_prompt_point, negative_prompt_point, prompt_box, prompt_mask = self.get_mask_prompts(
+                image_box, image_mask,
+                self.get_prompt_size(origin_size, image_mask), per_sample_idx)
+
+            image_boxes.append(image_box)
+            image_masks.append(image_mask)
+            positive_prompt_points.append(
+                self.pad_prompt_points(positive_prompt_point,
+                                       self.positive_points_num))
+            negative_prompt_points.append(
+                self.pad_prompt_points(negative_prompt_point,
+                                       self.negative_points_num))
+            prompt_boxes.append(prompt_box)
+            prompt_masks.append(prompt_mask)
+
+        # [K,4],[K,H,W],[K,positive_points_num,3],[K,negative_points_num,3]
+        image_boxes = np.stack(image_boxes, axis=0)
+        image_masks = np.stack(image_masks, axis=0)
+        positive_prompt_points = np.stack(positive_prompt_points, axis=0)
+        negative_prompt_points = np.stack(negative_prompt_points, axis=0)
+        prompt_boxes = np.stack(prompt_boxes, axis=0)
+        prompt_masks = np.stack(prompt_masks, axis=0)
+
+        sample = {
+            'origin_image': origin_image,
+            'origin_bbox': copy.deepcopy(image_boxes),
+            'origin_mask': copy.deepcopy(image_masks),
+            'origin_size': origin_size,
+            'image': image,
+            'box': image_boxes,
+            'mask': image_masks,
+            'size': size,
+            'positive_prompt_point': positive_prompt_points,
+            'negative_prompt_point': negative_prompt_points,
+            'prompt_box': prompt_boxes,
+            'prompt_mask': prompt_masks,
+        }
+
+        if self.reduced_resolution_decode:
+            sample = self.rescale_sample_to_image_size(sample)
+
+        if self.transform:
+            sample = self.transform(sample)
+
+        return sample
+
+    def pad_prompt_points(self, prompt_point, points_num):
+        # mask without enough points gets not a point(label -1) prompts,so K masks can be stacked
+        if prompt_point.shape[0] == points_num:
+            return prompt_point
+
+        padded_prompt_point = np.zeros((points_num, 3), dtype=np.float32)
+        padded_prompt_point[:, 2] = -1
+
+        return padded_prompt_point
+
+    def get_prompt_size(self, origin_size, image_mask):
+        # with reduced resolution decode,mask is still at original resolution
+        if self.reduced_resolution_decode:
+            return np.array([image_mask.shape[-2],
+                             image_mask.shape[-1]]).astype(np.float32)
+
+        return origin_size
+
+    def rescale_sample_to_image_size(self, sample):
+        '''
+        rescale original resolution boxes/masks/prompts to reduced resolution decoded image size,
+        support single mask and image grouped multi masks samples.
+        '''
+        image_h, image_w = sample['image'].shape[0], sample['image'].shape[1]
+        mask_h, mask_w = sample['mask'].shape[-2], sample['mask'].shape[-1]
+        factor_w, factor_h = image_w / mask_w, image_h / mask_h
+
+        box_factor = np.array([factor_w, factor_h, factor_w, factor_h],
+                              dtype=np.float32)
+        for key in ['origin_bbox', 'box', 'prompt_box']:
+            sample[key] = sample[key] * box_factor
+
+        point_factor = np.array([factor_w, factor_h, 1.], dtype=np.float32)
+        for key in ['positive_prompt_point', 'negative_prompt_point']:
+            sample[key] = sample[key] * point_factor
+
+        for key in ['origin_mask', 'mask', 'prompt_mask']:
+            sample[key] = resize_masks(sample[key], image_w, image_h)
+
+        return sample
+
+    def get_mask_prompts(self, image_box, image_mask, origin_size, idx):
+        # no argwhere without points,e.g. prompts are sampled on device by SAMBatchPromptSampler
+        image_mask_all_points_coords = np.argwhere(
+            image_mask) if self.positive_points_num > 0 else np.zeros(
+                (0, 2), dtype=np.int64)
         image_mask_all_points_num = len(image_mask_all_points_coords)
 
         if image_mask_all_points_num < self.positive_points_num:
@@ -126,7 +358,9 @@ class SAM1BDataset(Dataset):
             else:
                 positive_prompt_point = np.zeros((0, 3), dtype=np.float32)
 
-        image_not_mask_all_points_coords = np.argwhere(1. - image_mask)
+        image_not_mask_all_points_coords = np.argwhere(
+            1. - image_mask) if self.negative_points_num > 0 else np.zeros(
+                (0, 2), dtype=np.int64)
         image_not_mask_all_points_num = len(image_not_mask_all_points_coords)
 
         if image_not_mask_all_points_num < self.negative_points_num:
@@ -155,28 +389,26 @@ class SAM1BDataset(Dataset):
         prompt_mask = copy.deepcopy(image_mask)
         prompt_mask = self.noise_mask(prompt_mask, idx)
 
-        sample = {
-            'origin_image': origin_image,
-            'origin_bbox': origin_box,
-            'origin_mask': origin_mask,
-            'origin_size': origin_size,
-            'image': image,
-            'box': image_box,
-            'mask': image_mask,
-            'size': size,
-            'positive_prompt_point': positive_prompt_point,
-            'negative_prompt_point': negative_prompt_point,
-            'prompt_box': prompt_box,
-            'prompt_mask': prompt_mask,
-        }
+        return positive_prompt_point, negative_prompt_point, prompt_box, prompt_mask
 
-        if self.transform:
-            sample = self.transform(sample)
+    def get_image_path(self, idx):
+        if self.mask_index_dir:
+            per_image_path = self.mask_index.get_image_path(
+                self.mask_index.mask_image_id[self.sample_mask_ids[idx]])
+        else:
+            _, _, per_image_path, _, _, _ = self.all_image_mask_path_list[idx]
 
-        return sample
+        return per_image_path
+
+    def load_reduced_resolution_image(self, idx):
+        image, _, _ = decode_image_with_reduced_resolution(
+            np.fromfile(self.get_image_path(idx), dtype=np.uint8),
+            self.transform)
+
+        return image
 
     def load_image(self, idx):
-        _, _, per_image_path, _, _, _ = self.all_image_mask_path_list[idx]
+        per_image_path = self.get_image_path(idx)
         image = cv2.imdecode(np.fromfile(per_image_path, dtype=np.uint8),
                              cv2.IMREAD_COLOR)
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
@@ -184,6 +416,19 @@ class SAM1BDataset(Dataset):
         return image.astype(np.float32)
 
     def load_mask(self, idx):
+        if self.mask_index_dir:
+            mask_id = self.sample_mask_ids[idx]
+            target_box = np.array(self.mask_index.mask_bbox[mask_id])
+
+            # transform bbox targets from [x_min, y_min, w, h] to [x_min, y_min, x_max, y_max]
+            target_box[2] = target_box[0] + target_box[2]
+            target_box[3] = target_box[1] + target_box[3]
+
+            target_mask = mask_utils.decode(self.mask_index.get_rle(mask_id))
+
+            return target_box.astype(np.float32), target_mask.astype(
+                np.float32)
+
         _, mask_list_idx, _, per_json_path, _, _ = self.all_image_mask_path_list[
             idx]
         with open(per_json_path, encoding='utf-8') as f:
@@ -227,7 +472,16 @@ class SAM1BDataset(Dataset):
             return post_properties_bbox.astype(np.float32)
 
     def noise_mask(self, properties_mask, idx):
-        _, _, _, _, image_h, image_w = self.all_image_mask_path_list[idx]
+        # mask_noise_pixel<=1 keeps gt mask,e.g. prompts are sampled on device by SAMBatchPromptSampler
+        if self.mask_noise_pixel <= 1:
+            return properties_mask.astype(np.float32)
+
+        if self.mask_index_dir:
+            image_id = self.mask_index.mask_image_id[self.sample_mask_ids[idx]]
+            image_h, image_w = int(self.mask_index.image_h[image_id]), int(
+                self.mask_index.image_w[image_id])
+        else:
+            _, _, _, _, image_h, image_w = self.all_image_mask_path_list[idx]
 
         kernel = np.random.randint(1, self.mask_noise_pixel)
         erode_kernel = np.ones((kernel, kernel), np.uint8)
@@ -1006,3 +1260,77 @@ if __name__ == '__main__':
             count += 1
         else:
             break
+
+    import time
+
+    from simpleAICV.interactive_segmentation.common import SAMMultiMaskCollater
+
+    # single mask per item vs image grouped multi masks per item:
+    # decoded images per mask and masks/s with same transforms
+    def benchmark_masks_per_second(dataset,
+                                   collater,
+                                   batch_size,
+                                   num_workers=4,
+                                   max_batch_num=50):
+        loader = DataLoader(dataset,
+                            batch_size=batch_size,
+                            shuffle=True,
+                            num_workers=num_workers,
+                            collate_fn=collater)
+        start_time = time.time()
+        image_num, mask_num = 0, 0
+        for batch_idx, data in enumerate(loader):
+            image_num += data['batch_image'].shape[0]
+            mask_num += data['batch_mask'].shape[0]
+            if batch_idx + 1 >= max_batch_num:
+                break
+        used_time = time.time() - start_time
+
+        return image_num / mask_num, mask_num / used_time
+
+    benchmark_transform = transforms.Compose([
+        SamResize(resize=1024),
+        SamRandomHorizontalFlip(prob=0.5),
+        SamNormalize(mean=[123.675, 116.28, 103.53],
+                     std=[58.395, 57.12, 57.375]),
+    ])
+    single_mask_dataset = SAM1BDataset(sam1b_dataset_path,
+                                       positive_points_num=9,
+                                       negative_points_num=9,
+                                       area_filter_ratio=0.0025,
+                                       box_noise_pixel=50,
+                                       mask_noise_pixel=100,
+                                       transform=benchmark_transform)
+    single_image_per_mask, single_masks_per_second = benchmark_masks_per_second(
+        single_mask_dataset,
+        SAMCollater(resize=1024,
+                    positive_point_num_range=[1, 9],
+                    negative_point_num_range=[1, 9],
+                    batch_align_random_point_num=True,
+                    positive_negative_point_num_ratio=1),
+        batch_size=16)
+    print(
+        f'single mask, decoded images per mask:{single_image_per_mask:.3f}, masks/s:{single_masks_per_second:.1f}'
+    )
+
+    for per_image_mask_num in [4, 16]:
+        multi_mask_dataset = SAM1BDataset(
+            sam1b_dataset_path,
+            positive_points_num=9,
+            negative_points_num=9,
+            area_filter_ratio=0.0025,
+            box_noise_pixel=50,
+            mask_noise_pixel=100,
+            transform=benchmark_transform,
+            per_image_mask_num=per_image_mask_num)
+        multi_image_per_mask, multi_masks_per_second = benchmark_masks_per_second(
+            multi_mask_dataset,
+            SAMMultiMaskCollater(resize=1024,
+                                 positive_point_num_range=[1, 9],
+                                 negative_point_num_range=[1, 9],
+                                 batch_align_random_point_num=True,
+                                 positive_negative_point_num_ratio=1),
+            batch_size=max(1, 16 // per_image_mask_num))
+        print(
+            f'per_image_mask_num:{per_image_mask_num}, decoded images per mask:{multi_image_per_mask:.3f}, masks/s:{multi_masks_per_second:.1f}'
+        )
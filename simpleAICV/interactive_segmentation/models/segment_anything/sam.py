@@ -89,11 +89,17 @@ class SAM(nn.Module):
             for param in self.mask_decoder.parameters():
                 param.requires_grad = False
 
-    def forward(self, batch_images, batch_prompts, mask_out_idxs=[1, 2, 3]):
+    def forward(self,
+                batch_images,
+                batch_prompts,
+                mask_out_idxs=[1, 2, 3],
+                batch_image_embeddings=None):
         device = batch_images.device
 
-        # [4, 256, 64, 64]
-        batch_image_embeddings = self.image_encoder(batch_images)
+        # precomputed batch_image_embeddings(e.g. shared with correction prompts iterations) skip image encoder
+        if batch_image_embeddings is None:
+            # [4, 256, 64, 64]
+            batch_image_embeddings = self.image_encoder(batch_images)
 
         batch_mask_outputs, batch_iou_outputs = [], []
         for per_image_prompt, per_image_embedding in zip(
@@ -1,17 +1,45 @@
-import copy
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
 import numpy as np
 
 import torch
 import torchvision.transforms as transforms
 
+from simpleAICV.masked_image_modeling.models.vit_mae import images_to_patch
+
 
 class MAESelfSupervisedPretrainCollater:
+    '''
+    label_on_device:if True,collater only returns images,patch labels are computed by get_labels(images) in train loop
+    after images.cuda(),so workers don't ship a second copy of every batch.
+    '''
 
-    def __init__(self, image_size=224, patch_size=16, norm_label=True):
+    def __init__(self,
+                 image_size=224,
+                 patch_size=16,
+                 norm_label=True,
+                 label_on_device=False):
         assert image_size % patch_size == 0
         self.patch_size = patch_size
         self.patch_nums = image_size // patch_size
         self.norm_label = norm_label
+        self.label_on_device = label_on_device
+
+    def get_labels(self, images):
+        # images:B 3 H W ->labels:B L patch_size*patch_size*3
+        unmasked_labels = images_to_patch(images, self.patch_size)
+
+        if self.norm_label:
+            mean = unmasked_labels.mean(dim=-1, keepdim=True)
+            var = unmasked_labels.var(dim=-1, keepdim=True)
+            unmasked_labels = (unmasked_labels - mean) / (var + 1e-4)**0.5
+
+        return unmasked_labels
 
     def __call__(self, data):
         images = [s['image'] for s in data]
@@ -22,23 +50,100 @@ class MAESelfSupervisedPretrainCollater:
         # B H W 3 ->B 3 H W
         images = images.permute(0, 3, 1, 2)
 
+        if self.label_on_device:
+            return {
+                'image': images,
+            }
+
+        unmasked_labels = self.get_labels(images)
+
+        return {
+            'image': images,
+            'label': unmasked_labels,
+        }
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import numpy as np
+    import torch
+    seed = 0
+    # for hash
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    # for python and numpy
+    random.seed(seed)
+    np.random.seed(seed)
+    # for cpu gpu
+    torch.manual_seed(seed)
+    torch.cuda.manual_seed(seed)
+    torch.cuda.manual_seed_all(seed)
+
+    import os
+    import sys
+
+    BASE_DIR = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.path.append(BASE_DIR)
+
+    import copy
+
+    from simpleAICV.masked_image_modeling.models.vit_mae import vit_tiny_patch16_224_mae_pretrain_model
+
+    def old_collater_labels(data, patch_size, patch_nums, norm_label):
+        # previous collater label computation,deepcopy images then patchify on cpu
+        images = [s['image'] for s in data]
+        images = np.array(images, dtype=np.float32)
+        images = torch.from_numpy(images)
+        images = images.permute(0, 3, 1, 2)
         unmasked_labels = copy.deepcopy(images)
         unmasked_labels = unmasked_labels.reshape(unmasked_labels.shape[0], 3,
-                                                  self.patch_nums,
-                                                  self.patch_size,
-                                                  self.patch_nums,
-                                                  self.patch_size)
+                                                  patch_nums, patch_size,
+                                                  patch_nums, patch_size)
         unmasked_labels = torch.einsum('nchpwq->nhwpqc', unmasked_labels)
         unmasked_labels = unmasked_labels.reshape(
-            shape=(unmasked_labels.shape[0], self.patch_nums * self.patch_nums,
-                   self.patch_size * self.patch_size * 3))
-
-        if self.norm_label:
+            shape=(unmasked_labels.shape[0], patch_nums * patch_nums,
+                   patch_size * patch_size * 3))
+        if norm_label:
             mean = unmasked_labels.mean(dim=-1, keepdim=True)
             var = unmasked_labels.var(dim=-1, keepdim=True)
             unmasked_labels = (unmasked_labels - mean) / (var + 1e-4)**0.5
 
-        return {
-            'image': images,
-            'label': unmasked_labels,
-        }
\ No newline at end of file
+        return unmasked_labels
+
+    data = [{
+        'image':
+        np.random.randn(224, 224, 3).astype(np.float32),
+        'label':
+        0,
+    } for _ in range(8)]
+
+    for norm_label in [True, False]:
+        old_labels = old_collater_labels(data, 16, 14, norm_label)
+
+        collater = MAESelfSupervisedPretrainCollater(image_size=224,
+                                                     patch_size=16,
+                                                     norm_label=norm_label)
+        outs = collater(data)
+        print('1111', norm_label, outs['image'].shape, outs['label'].shape,
+              torch.equal(outs['label'], old_labels))
+
+        device_collater = MAESelfSupervisedPretrainCollater(
+            image_size=224,
+            patch_size=16,
+            norm_label=norm_label,
+            label_on_device=True)
+        outs = device_collater(data)
+        # same as train loop:labels are computed from images after images.cuda()
+        images = outs['image'].cuda() if torch.cuda.is_available(
+        ) else outs['image']
+        labels = device_collater.get_labels(images)
+        print('2222', norm_label, outs.keys(), labels.shape,
+              torch.equal(labels.cpu(), old_labels),
+              torch.abs(labels.cpu() - old_labels).max().item())
+
+    # model images_to_patch is same patchify
+    net = vit_tiny_patch16_224_mae_pretrain_model()
+    print('3333',
+          torch.equal(net.images_to_patch(outs['image']),
+                      old_collater_labels(data, 16, 14, False)))
@@ -22,6 +22,22 @@ __all__ = [
 ]
 
 
+def images_to_patch(images, patch_size):
+    """
+    images: (N, 3, H, W)
+    x: (N, L, patch_size**2 *3)
+    """
+    patch_h_nums = images.shape[2] // patch_size
+    patch_w_nums = images.shape[3] // patch_size
+    x = images.reshape(images.shape[0], 3, patch_h_nums, patch_size,
+                       patch_w_nums, patch_size)
+    x = torch.einsum('nchpwq->nhwpqc', x)
+    x = x.reshape(shape=(x.shape[0], patch_h_nums * patch_w_nums,
+                         patch_size * patch_size * 3))
+
+    return x
+
+
 class VITMAEPretrainModelEncoder(nn.Module):
 
     def __init__(self,
@@ -422,14 +438,7 @@ class VITMAEPretrainModel(nn.Module):
         images: (N, 3, H, W)
         x: (N, L, patch_size**2 *3)
         """
-        patch_nums = self.image_size // self.patch_size
-        x = images.reshape(images.shape[0], 3, patch_nums, self.patch_size,
-                           patch_nums, self.patch_size)
-        x = torch.einsum('nchpwq->nhwpqc', x)
-        x = x.reshape(shape=(x.shape[0], patch_nums * patch_nums,
-                             self.patch_size * self.patch_size * 3))
-
-        return x
+        return images_to_patch(images, self.patch_size)
 
     def patch_to_images(self, x):
         """
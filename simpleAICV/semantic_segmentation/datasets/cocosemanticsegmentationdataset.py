@@ -1,4 +1,11 @@
 import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
 import cv2
 import copy
 import numpy as np
@@ -6,6 +13,8 @@ import numpy as np
 from pycocotools.coco import COCO
 from torch.utils.data import Dataset
 
+from simpleAICV.detection.datasets.coco_annotation_store import CocoAnnotationStore
+
 COCO_CLASSES = [
     'person',
     'bicycle',
@@ -174,34 +183,59 @@ COCO_CLASSES_COLOR = [
 
 
 class CocoSemanticSegmentation(Dataset):
+    '''
+    annotation_store_dir:if not None,use mmap loaded CocoAnnotationStore instead of pycocotools COCO object,
+    store is built in annotation_store_dir on first use,self.coco is None.
+    '''
 
     def __init__(self,
                  root_dir,
                  set_name='train2017',
                  reduce_zero_label=False,
-                 transform=None):
+                 transform=None,
+                 annotation_store_dir=None,
+                 annotation_store_num_processes=16):
         assert set_name in ['train2017', 'val2017'], 'Wrong set name!'
 
         self.image_dir = os.path.join(root_dir, 'images', set_name)
         self.annot_dir = os.path.join(root_dir, 'annotations',
                                       f'instances_{set_name}.json')
-        self.coco = COCO(self.annot_dir)
 
-        self.image_ids = self.coco.getImgIds()
+        if annotation_store_dir:
+            self.coco = None
+            self.annotation_store = CocoAnnotationStore(
+                self.annot_dir,
+                annotation_store_dir,
+                num_processes=annotation_store_num_processes)
+
+            # filter image id without annotation,from 118287 ids to 117266 ids
+            self.image_rows = np.nonzero(
+                self.annotation_store.image_annot_num > 0)[0]
+            self.image_ids = self.annotation_store.image_id[
+                self.image_rows].tolist()
+
+            self.cat_ids = self.annotation_store.get_cat_ids()
+            self.cats = sorted(self.annotation_store.categories,
+                               key=lambda x: x['id'])
+        else:
+            self.coco = COCO(self.annot_dir)
+            self.annotation_store = None
 
-        # filter image id without annotation,from 118287 ids to 117266 ids
-        ids = []
-        for image_id in self.image_ids:
-            annot_ids = self.coco.getAnnIds(imgIds=image_id)
-            annots = self.coco.loadAnns(annot_ids)
-            if len(annots) == 0:
-                continue
-            ids.append(image_id)
-        self.image_ids = ids
+            self.image_ids = self.coco.getImgIds()
+
+            # filter image id without annotation,from 118287 ids to 117266 ids
+            ids = []
+            for image_id in self.image_ids:
+                annot_ids = self.coco.getAnnIds(imgIds=image_id)
+                annots = self.coco.loadAnns(annot_ids)
+                if len(annots) == 0:
+                    continue
+                ids.append(image_id)
+            self.image_ids = ids
 
-        self.cat_ids = self.coco.getCatIds()
-        self.cats = sorted(self.coco.loadCats(self.cat_ids),
-                           key=lambda x: x['id'])
+            self.cat_ids = self.coco.getCatIds()
+            self.cats = sorted(self.coco.loadCats(self.cat_ids),
+                               key=lambda x: x['id'])
         self.num_classes = len(self.cats)
 
         # cat_id is an original cat id,coco_label is set from 1 to 80,background is 0
@@ -247,8 +281,15 @@ class CocoSemanticSegmentation(Dataset):
 
         return sample
 
+    def get_image_file_name(self, idx):
+        if self.annotation_store:
+            return self.annotation_store.get_image_file_name(
+                self.image_rows[idx])
+
+        return self.coco.loadImgs(self.image_ids[idx])[0]['file_name']
+
     def load_image(self, idx):
-        file_name = self.coco.loadImgs(self.image_ids[idx])[0]['file_name']
+        file_name = self.get_image_file_name(idx)
         image = cv2.imdecode(
             np.fromfile(os.path.join(self.image_dir, file_name),
                         dtype=np.uint8), cv2.IMREAD_COLOR)
@@ -257,26 +298,29 @@ class CocoSemanticSegmentation(Dataset):
         return image.astype(np.float32)
 
     def load_mask(self, idx):
-        annot_ids = self.coco.getAnnIds(imgIds=self.image_ids[idx])
-        annots = self.coco.loadAnns(annot_ids)
+        if self.annotation_store:
+            mask = self.load_store_mask(idx)
+        else:
+            annot_ids = self.coco.getAnnIds(imgIds=self.image_ids[idx])
+            annots = self.coco.loadAnns(annot_ids)
 
-        image_info = self.coco.loadImgs(self.image_ids[idx])[0]
-        image_h, image_w = image_info['height'], image_info['width']
+            image_info = self.coco.loadImgs(self.image_ids[idx])[0]
+            image_h, image_w = image_info['height'], image_info['width']
 
-        mask = np.zeros((image_h, image_w))
-        # filter annots
-        for annot in annots:
-            if 'ignore' in annot.keys():
-                continue
+            mask = np.zeros((image_h, image_w))
+            # filter annots
+            for annot in annots:
+                if 'ignore' in annot.keys():
+                    continue
 
-            per_binary_mask = self.coco.annToMask(annot)
-            per_mask_coco_label = self.cat_id_to_coco_label[
-                annot['category_id']]
-            # 先保留新mask之外区域原来的mask类别赋值
-            keep_mask = mask * (1 - per_binary_mask)
-            # 新mask区域用新的mask类别代替原来的mask类别
-            per_new_mask = per_binary_mask * per_mask_coco_label
-            mask = keep_mask + per_new_mask
+                per_binary_mask = self.coco.annToMask(annot)
+                per_mask_coco_label = self.cat_id_to_coco_label[
+                    annot['category_id']]
+                # 先保留新mask之外区域原来的mask类别赋值
+                keep_mask = mask * (1 - per_binary_mask)
+                # 新mask区域用新的mask类别代替原来的mask类别
+                per_new_mask = per_binary_mask * per_mask_coco_label
+                mask = keep_mask + per_new_mask
 
         # If class 0 is the background class and you want to ignore it when calculating the evaluation index,
         # you need to set reduce_zero_label=True.
@@ -289,6 +333,33 @@ class CocoSemanticSegmentation(Dataset):
 
         return mask.astype(np.float32)
 
+    def load_store_mask(self, idx):
+        # decode all annot masks in one call,later annot covers earlier annot same as load_mask loop
+        image_row = self.image_rows[idx]
+        image_h, image_w = self.annotation_store.get_image_size(image_row)
+
+        annot_rows = self.annotation_store.get_image_annot_rows(image_row)
+        annot_rows = annot_rows[
+            self.annotation_store.annot_ignore[annot_rows] == 0]
+
+        mask = np.zeros((image_h, image_w))
+        if annot_rows.shape[0] == 0:
+            return mask
+
+        annot_masks = self.annotation_store.get_masks(annot_rows)
+        annot_coco_labels = np.array([
+            self.cat_id_to_coco_label[per_cat_id] for per_cat_id in
+            self.annotation_store.annot_category_id[annot_rows].tolist()
+        ])
+
+        # index of last annot covering each pixel
+        last_annot_idx = annot_masks.shape[2] - 1 - np.argmax(
+            annot_masks[:, :, ::-1], axis=2)
+        mask[:] = np.where(
+            np.any(annot_masks, axis=2), annot_coco_labels[last_annot_idx], 0)
+
+        return mask
+
 
 if __name__ == '__main__':
     import os
@@ -181,6 +181,10 @@ class Resize:
     def __init__(self, resize=960):
         self.resize = resize
 
+    def get_reduced_decode_factor(self, image_h, image_w):
+        # longer side is resized to resize
+        return max(image_h, image_w) / self.resize
+
     def __call__(self, sample):
         image, annots, scale, size = sample['image'], sample['annots'], sample[
             'scale'], sample['size']
@@ -271,18 +275,270 @@ class TextDetectionCollater:
 
 
 class GenerateProbabilityThresholdMask:
+    '''
+    threshold mask of all polygons in batch is rendered together with tensor ops,
+    max_chunk_elements:max edge-point pair num computed in one chunk.
+    '''
 
     def __init__(self,
                  min_box_size=3,
                  min_max_threshold=[0.3, 0.7],
-                 shrink_ratio=0.6):
+                 shrink_ratio=0.6,
+                 max_chunk_elements=2**20):
         self.min_box_size = min_box_size
         self.min_max_threshold = min_max_threshold
         self.shrink_ratio = shrink_ratio
+        self.max_chunk_elements = max_chunk_elements
 
     def __call__(self, images, annots, sizes):
         b, _, h, w = images.shape
 
+        probability_mask = np.zeros((b, h, w), dtype=np.float32)
+        probability_ignore_mask = np.ones((b, h, w), dtype=np.float32)
+        threshold_ignore_mask = np.zeros((b, h, w), dtype=np.float32)
+
+        # valid polygons for threshold mask
+        polygon_image_idxs, polygon_boxes, polygon_border_boxes, polygon_distances = [], [], [], []
+        for idx, per_image_annots in enumerate(annots):
+            for per_box_label in per_image_annots:
+                per_box, ignore = per_box_label['points'], per_box_label[
+                    'ignore']
+                per_box = np.array(per_box, dtype=np.float32)
+                height, width = max(per_box[:, 1]) - min(per_box[:, 1]), max(
+                    per_box[:, 0]) - min(per_box[:, 0])
+                per_box_area = cv2.contourArea(per_box)
+
+                if ignore or min(
+                        height, width
+                ) < self.min_box_size or per_box_area < self.min_box_size**2:
+                    cv2.fillPoly(probability_ignore_mask[idx],
+                                 [per_box.astype(np.int32)], 0.0)
+                    continue
+
+                shrinked_box, border_box, distance = self.get_shrink_border_polygon(
+                    per_box)
+                if shrinked_box is None:
+                    cv2.fillPoly(probability_ignore_mask[idx],
+                                 [per_box.astype(np.int32)], 0.0)
+                    continue
+
+                # cut超出边界的框，检测不合法多边形
+                per_image_h, per_image_w = sizes[idx]
+                image_matrix = np.array([[0, 0], [per_image_w, 0],
+                                         [per_image_w, per_image_h],
+                                         [0, per_image_h]])
+                border_box = self.cut_box_from_image_border([border_box],
+                                                            image_matrix)
+                if len(border_box) != 1:
+                    cv2.fillPoly(probability_ignore_mask[idx],
+                                 [per_box.astype(np.int32)], 0.0)
+                    continue
+                border_box = np.array(border_box[0])
+
+                cv2.fillPoly(probability_mask[idx],
+                             [shrinked_box.astype(np.int32)], 1.0)
+                cv2.fillPoly(threshold_ignore_mask[idx],
+                             [border_box.astype(np.int32)], 1.0)
+
+                polygon_image_idxs.append(idx)
+                polygon_boxes.append(per_box)
+                polygon_border_boxes.append(border_box)
+                polygon_distances.append(distance)
+
+        threshold_mask = self.draw_batch_threshold_mask(
+            polygon_image_idxs, polygon_boxes, polygon_border_boxes,
+            polygon_distances, [b, h, w])
+
+        threshold_mask = threshold_mask * (
+            self.min_max_threshold[1] -
+            self.min_max_threshold[0]) + self.min_max_threshold[0]
+
+        return probability_mask, probability_ignore_mask, threshold_mask, threshold_ignore_mask
+
+    def get_shrink_border_polygon(self, polygon_box):
+        '''
+        pyclipper shrink and border polygon of one polygon,return None,None,distance for invalid polygon
+        '''
+        shrinked_box, border_box, distance = self.generate_shrink_border_polygon_by_pyclipper(
+            polygon_box)
+        if len(shrinked_box) != 1 or len(border_box) != 1:
+            return None, None, distance
+
+        # 检测不合法多边形
+        shrinked_box = pyclipper.SimplifyPolygon(shrinked_box[0])
+        if len(shrinked_box) != 1:
+            return None, None, distance
+
+        shrinked_box, border_box = np.array(shrinked_box), np.array(border_box)
+        if shrinked_box.shape[2] != 2 or border_box.shape[2] != 2:
+            return None, None, distance
+
+        return shrinked_box[0], border_box[0], distance
+
+    def draw_batch_threshold_mask(self, polygon_image_idxs, polygon_boxes,
+                                  polygon_border_boxes, polygon_distances,
+                                  mask_shape):
+        '''
+        same as draw_threshold_mask for every polygon,but all polygon edges in batch are computed together:
+        1 - min(clip(distance/shrink_distance)) over edges == max over edges of 1 - clip(distance/shrink_distance),
+        and an edge only changes points nearer than shrink_distance,so each edge is only computed in its segment box
+        expanded by shrink_distance+1 inside polygon border box window,then amax over all edges.
+        '''
+        b, h, w = mask_shape
+        threshold_mask = torch.zeros((b * h * w), dtype=torch.float32)
+        if len(polygon_boxes) == 0:
+            return threshold_mask.view(b, h, w).numpy()
+
+        edge_params, edge_windows, polygon_edge_image_idxs = [], [], []
+        for idx, per_box, per_border_box, distance in zip(
+                polygon_image_idxs, polygon_boxes, polygon_border_boxes,
+                polygon_distances):
+            xmin, ymin = per_border_box[:, 0].min(), per_border_box[:,
+                                                                    1].min()
+            xmax, ymax = per_border_box[:, 0].max(), per_border_box[:,
+                                                                    1].max()
+            valid_xmin, valid_ymin = min(max(0, xmin),
+                                         w - 1), min(max(0, ymin), h - 1)
+            valid_xmax, valid_ymax = min(max(0, xmax),
+                                         w - 1), min(max(0, ymax), h - 1)
+
+            # box points relative to border box xmin,ymin(float32,same as draw_threshold_mask)
+            point1 = per_box - np.array([xmin, ymin], dtype=np.float32)
+            point2 = np.roll(point1, -1, axis=0)
+            square_line_distance = np.square(point1[:, 0] - point2[:, 0]) + np.square(
+                point1[:, 1] - point2[:, 1])
+            point_num = per_box.shape[0]
+            polygon_edge_image_idxs.append(np.full(point_num, idx))
+            edge_params.append(
+                np.stack([
+                    np.full(point_num, xmin),
+                    np.full(point_num, ymin), point1[:, 0], point1[:, 1],
+                    point2[:, 0], point2[:, 1], square_line_distance,
+                    np.full(point_num, distance)
+                ],
+                         axis=1).astype(np.float64))
+
+            segment_min = np.minimum(point1, point2) + [xmin, ymin]
+            segment_max = np.maximum(point1, point2) + [xmin, ymin]
+            edge_windows.append(
+                np.stack([
+                    np.maximum(valid_xmin,
+                               np.floor(segment_min[:, 0] - distance) - 1),
+                    np.maximum(valid_ymin,
+                               np.floor(segment_min[:, 1] - distance) - 1),
+                    np.minimum(valid_xmax,
+                               np.ceil(segment_max[:, 0] + distance) + 1),
+                    np.minimum(valid_ymax,
+                               np.ceil(segment_max[:, 1] + distance) + 1),
+                ],
+                         axis=1))
+
+        edge_params = np.concatenate(edge_params, axis=0)
+        edge_windows = np.concatenate(edge_windows, axis=0).astype(np.int64)
+        window_wh = np.maximum(edge_windows[:, 2:4] - edge_windows[:, 0:2] + 1,
+                               0)
+        # points relative to window top left point,exact in float64 so distances are same as draw_threshold_mask
+        window_offsets = edge_windows[:, 0:2] - edge_params[:, 0:2]
+        edge_params[:, 2:4] = edge_params[:, 2:4] - window_offsets
+        edge_params[:, 4:6] = edge_params[:, 4:6] - window_offsets
+        # point1_x,point1_y,point2_x,point2_y,square_line_distance,shrink_distance
+        edge_params = [
+            torch.from_numpy(np.ascontiguousarray(edge_params[:, i]))
+            for i in range(2, 8)
+        ]
+        window_point_nums = torch.from_numpy(window_wh[:, 0] * window_wh[:, 1])
+        window_w = torch.from_numpy(window_wh[:, 0])
+        # flat index of window top left point in threshold mask
+        window_bases = torch.from_numpy(
+            (np.concatenate(polygon_edge_image_idxs) * h + edge_windows[:, 1]) *
+            w + edge_windows[:, 0])
+
+        # chunk by edges,an edge with more points than max_chunk_elements is one chunk
+        chunk_ids = torch.div(torch.cumsum(window_point_nums, dim=0) -
+                              window_point_nums,
+                              self.max_chunk_elements,
+                              rounding_mode='floor')
+        chunk_ends = torch.searchsorted(chunk_ids,
+                                        torch.unique(chunk_ids),
+                                        right=True).tolist()
+        chunk_start = 0
+        for chunk_end in chunk_ends:
+            per_chunk_point_nums = window_point_nums[chunk_start:chunk_end]
+            point_num = int(per_chunk_point_nums.sum())
+            if point_num == 0:
+                chunk_start = chunk_end
+                continue
+
+            # every point gathers its edge params by edge index
+            point_edge_idxs = torch.repeat_interleave(
+                torch.arange(chunk_start, chunk_end),
+                per_chunk_point_nums,
+                output_size=point_num)
+            per_chunk_starts = torch.cumsum(per_chunk_point_nums,
+                                            dim=0) - per_chunk_point_nums
+            local_idxs = torch.arange(point_num) - torch.repeat_interleave(
+                per_chunk_starts, per_chunk_point_nums, output_size=point_num)
+            per_point_w = window_w.index_select(0, point_edge_idxs)
+            ys = torch.div(local_idxs, per_point_w, rounding_mode='floor')
+            xs = local_idxs - ys * per_point_w
+            flat_idxs = window_bases.index_select(0,
+                                                  point_edge_idxs) + ys * w + xs
+
+            point1_x, point1_y, point2_x, point2_y, square_line_distance, distance = [
+                per_param.index_select(0, point_edge_idxs)
+                for per_param in edge_params
+            ]
+            absolute_distance = self.compute_batch_distance(
+                xs.double(), ys.double(), point1_x, point1_y, point2_x,
+                point2_y, square_line_distance)
+            distance_map = torch.clamp(absolute_distance / distance, 0,
+                                       1).float()
+
+            # same as np.fmax,nan value doesn't change threshold mask
+            values = torch.nan_to_num(1 - distance_map, nan=0.)
+            threshold_mask.scatter_reduce_(0,
+                                           flat_idxs,
+                                           values,
+                                           reduce='amax',
+                                           include_self=True)
+            chunk_start = chunk_end
+
+        return threshold_mask.view(b, h, w).numpy()
+
+    def compute_batch_distance(self, xs, ys, point1_x, point1_y, point2_x,
+                               point2_y, square_line_distance):
+        '''
+        same as compute_distance,but every point has its own line,all inputs shape:[n]
+        '''
+        square_coords_point1_distance = (xs - point1_x)**2 + (ys - point1_y)**2
+        square_coords_point2_distance = (xs - point2_x)**2 + (ys - point2_y)**2
+        # 余弦定理
+        cosin = (square_line_distance - square_coords_point1_distance -
+                 square_coords_point2_distance) / (
+                     2 * torch.sqrt(square_coords_point1_distance *
+                                    square_coords_point2_distance) + 1e-4)
+        cosin = torch.clamp(cosin, -1, 1)
+        square_sin = 1 - cosin**2
+        square_sin = torch.nan_to_num(square_sin)
+
+        # 求三角形面积
+        result = torch.sqrt(square_coords_point1_distance *
+                            square_coords_point2_distance * square_sin /
+                            square_line_distance)
+        result = torch.where(
+            cosin < 0,
+            torch.sqrt(
+                torch.fmin(square_coords_point1_distance,
+                           square_coords_point2_distance)), result)
+
+        return result
+
+    def get_masks_per_polygon(self, images, annots, sizes):
+        '''
+        per polygon loop version of __call__,used as reference.
+        '''
+        b, _, h, w = images.shape
+
         probability_mask = np.zeros((b, h, w), dtype=np.float32)
         probability_ignore_mask = np.ones((b, h, w), dtype=np.float32)
 
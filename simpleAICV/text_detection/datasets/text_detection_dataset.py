@@ -1,5 +1,12 @@
-import collections
 import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
+import collections
 import cv2
 import copy
 import collections
@@ -10,8 +17,14 @@ from tqdm import tqdm
 
 from torch.utils.data import Dataset
 
+from simpleAICV.classification.common import decode_image_with_reduced_resolution
+
 
 class TextDetection(Dataset):
+    '''
+    reduced_resolution_decode:if True,decode image at 1/2,1/4,1/8 resolution when first resize transform allows it,
+    annots points and scale are multiplied by decode scale.
+    '''
 
     def __init__(self,
                  root_dir,
@@ -23,7 +36,8 @@ class TextDetection(Dataset):
                      'ICDAR2019ReCTS_text_detection',
                  ],
                  set_type='train',
-                 transform=None):
+                 transform=None,
+                 reduced_resolution_decode=False):
         assert set_type in ['train', 'test'], 'Wrong set name!'
 
         all_image_dirs_list = []
@@ -60,6 +74,7 @@ class TextDetection(Dataset):
                     self.image_label_dict[key] = per_image_label
 
         self.transform = transform
+        self.reduced_resolution_decode = reduced_resolution_decode
 
         print(f"Dataset Num:{len(self.image_path_list)}")
 
@@ -67,11 +82,23 @@ class TextDetection(Dataset):
         return len(self.image_path_list)
 
     def __getitem__(self, idx):
-        image = self.load_image(idx)
-        annots = self.load_annots(idx)
+        if self.reduced_resolution_decode:
+            image, decode_scale, size = decode_image_with_reduced_resolution(
+                np.fromfile(self.image_path_list[idx], dtype=np.uint8),
+                self.transform)
+            annots = copy.deepcopy(self.load_annots(idx))
+            # points:[x,y],decode_scale:[scale_h,scale_w],same value on both axes
+            for i in range(len(annots)):
+                annots[i]['points'] = annots[i]['points'] * decode_scale[::-1]
+            # size is original image size
+            scale = np.array(decode_scale[0]).astype(np.float32)
+        else:
+            image = self.load_image(idx)
+            annots = self.load_annots(idx)
 
-        scale = np.array(1.).astype(np.float32)
-        size = np.array([image.shape[0], image.shape[1]]).astype(np.float32)
+            scale = np.array(1.).astype(np.float32)
+            size = np.array([image.shape[0],
+                             image.shape[1]]).astype(np.float32)
 
         sample = {
             'image': image,
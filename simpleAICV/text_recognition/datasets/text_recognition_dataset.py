@@ -1,4 +1,11 @@
 import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(BASE_DIR)
+
 import cv2
 import collections
 import json
@@ -9,8 +16,14 @@ from tqdm import tqdm
 
 from torch.utils.data import Dataset
 
+from simpleAICV.text_recognition.datasets.text_recognition_index_cache import TextRecognitionIndexCache
+
 
 class CNENTextRecognition(Dataset):
+    '''
+    index_cache_dir:if not None,load image paths/labels/image sizes from mmap index cache instead of
+    walking label json files and reading every image size,stale cache is rebuilt automatically.
+    '''
 
     def __init__(self,
                  root_dir,
@@ -30,7 +43,9 @@ class CNENTextRecognition(Dataset):
                  ],
                  set_type='train',
                  str_max_length=80,
-                 transform=None):
+                 transform=None,
+                 index_cache_dir=None,
+                 index_cache_num_processes=16):
         assert set_type in ['train', 'test'], 'Wrong set name!'
 
         self.half_full_dict = {
@@ -43,6 +58,22 @@ class CNENTextRecognition(Dataset):
             "！": "!",
         }
 
+        self.index_cache_dir = index_cache_dir
+        if self.index_cache_dir:
+            self.load_index_cache(root_dir, set_name, set_type,
+                                  str_max_length, index_cache_num_processes)
+        else:
+            self.load_label_files(root_dir, set_name, set_type,
+                                  str_max_length)
+
+        self.chars_set = list(sorted(self.chars_set, reverse=False))
+
+        self.transform = transform
+
+        print(f"Dataset Num:{len(self)}")
+        print(f"Chars Num:{len(self.chars_set)}")
+
+    def load_label_files(self, root_dir, set_name, set_type, str_max_length):
         all_image_dirs_list = []
         for per_set_name in set_name:
             per_set_image_dir = os.path.join(
@@ -94,14 +125,41 @@ class CNENTextRecognition(Dataset):
                         for per_char in list_label:
                             self.chars_set.add(per_char)
 
-        self.chars_set = list(sorted(self.chars_set, reverse=False))
-
-        self.transform = transform
-
-        print(f"Dataset Num:{len(self.image_path_list)}")
-        print(f"Chars Num:{len(self.chars_set)}")
+    def load_index_cache(self, root_dir, set_name, set_type, str_max_length,
+                         num_processes):
+        # keep selected sample ids in numpy arrays,avoid tens of millions python objects in every worker
+        self.chars_set = set()
+        self.index_cache_list = []
+        all_cache_ids_list, all_sample_ids_list = [], []
+        for cache_id, per_set_name in enumerate(tqdm(set_name)):
+            per_index_cache = TextRecognitionIndexCache(
+                root_dir,
+                per_set_name,
+                set_type,
+                self.index_cache_dir,
+                num_processes=num_processes)
+
+            image_w = np.asarray(per_index_cache.image_w)
+            image_h = np.asarray(per_index_cache.image_h)
+            label_length = per_index_cache.label_length
+            keep_mask = (image_h >= 8) & (image_w >= 8) & (
+                image_h.astype(np.float64) / image_w <= 1.0) & (
+                    label_length >= 1) & (label_length <= str_max_length)
+            keep_ids = np.nonzero(keep_mask)[0]
+
+            self.chars_set |= per_index_cache.get_chars_set(keep_mask)
+            self.index_cache_list.append(per_index_cache)
+            all_cache_ids_list.append(
+                np.full(len(keep_ids), cache_id, dtype=np.int32))
+            all_sample_ids_list.append(keep_ids.astype(np.int64))
+
+        self.sample_cache_ids = np.concatenate(all_cache_ids_list, axis=0)
+        self.sample_ids = np.concatenate(all_sample_ids_list, axis=0)
 
     def __len__(self):
+        if self.index_cache_dir:
+            return len(self.sample_ids)
+
         return len(self.image_path_list)
 
     def __getitem__(self, idx):
@@ -127,9 +185,15 @@ class CNENTextRecognition(Dataset):
         """
         convert RGB image to gray image
         """
-        image = cv2.imdecode(
-            np.fromfile(self.image_path_list[idx], dtype=np.uint8),
-            cv2.IMREAD_COLOR)
+        if self.index_cache_dir:
+            image_path = self.index_cache_list[
+                self.sample_cache_ids[idx]].get_image_path(
+                    self.sample_ids[idx])
+        else:
+            image_path = self.image_path_list[idx]
+
+        image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8),
+                             cv2.IMREAD_COLOR)
 
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
@@ -137,6 +201,12 @@ class CNENTextRecognition(Dataset):
         return image.astype(np.float32)
 
     def load_label(self, idx):
+        if self.index_cache_dir:
+            label = self.index_cache_list[self.sample_cache_ids[idx]].get_label(
+                self.sample_ids[idx])
+
+            return label
+
         image_name = self.image_path_list[idx].split("/")[-1]
         label = self.image_label_dict[image_name]
 
@@ -167,7 +237,7 @@ if __name__ == '__main__':
             os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
     sys.path.append(BASE_DIR)
 
-    from tools.path import text_recognition_dataset_path
+    from tools.path import text_recognition_dataset_path, text_recognition_index_cache_path
 
     import torchvision.transforms as transforms
     from tqdm import tqdm
@@ -277,3 +347,30 @@ if __name__ == '__main__':
             count += 1
         else:
             break
+
+    # index cache:first run builds cache,later runs only load mmap arrays
+    import time
+    for _ in range(2):
+        start_time = time.time()
+        textrecognitiondataset = CNENTextRecognition(
+            text_recognition_dataset_path,
+            set_name=[
+                'aistudio_baidu_street',
+                'chinese_dataset',
+            ],
+            set_type='train',
+            str_max_length=80,
+            transform=None,
+            index_cache_dir=text_recognition_index_cache_path,
+            index_cache_num_processes=16)
+        print(f'init time:{time.time() - start_time:.3f}s')
+
+    count = 0
+    for per_sample in tqdm(textrecognitiondataset):
+        print(per_sample['image'].shape, per_sample['image'].dtype,
+              per_sample['label'])
+
+        if count < 10:
+            count += 1
+        else:
+            break
@@ -0,0 +1,252 @@
+import os
+import json
+import imagesize
+import numpy as np
+
+from multiprocessing import Pool
+from tqdm import tqdm
+
+from simpleAICV.cache_dir import get_temp_cache_dir, replace_cache_dir, build_cache_dir_if_stale
+
+half_full_dict = {
+    "，": ",",
+    "；": ";",
+    "：": ":",
+    "？": "?",
+    "（": "(",
+    "）": ")",
+    "！": "!",
+}
+
+# every array is saved as a single .npy file so it can be loaded by mmap and shared by all ranks/workers
+# image_name_blob/image_name_offset:utf-8 bytes of image names
+# label_blob/label_offset:unicode code points of half->full converted labels
+# image_w/image_h:image size read by imagesize
+index_cache_array_name_list = [
+    'image_name_blob',
+    'image_name_offset',
+    'label_blob',
+    'label_offset',
+    'image_w',
+    'image_h',
+]
+
+
+def get_label_file_fingerprint(label_path):
+    '''
+    fingerprint changes when label file is replaced or modified
+    '''
+    label_stat = os.stat(label_path)
+    fingerprint = f'{label_stat.st_size}_{label_stat.st_mtime_ns}'
+
+    return fingerprint
+
+
+def get_index_cache_dir(index_cache_dir, set_name, set_type):
+    return os.path.join(index_cache_dir, f'{set_name}_{set_type}')
+
+
+def convert_half_to_full_label(label):
+    convert_label = ""
+    for per_char in label:
+        if per_char in half_full_dict.keys():
+            per_char = half_full_dict[per_char]
+        convert_label += per_char
+
+    return convert_label
+
+
+def get_image_name_label_size(args):
+    image_dir, image_name_label_list = args
+
+    image_name_list, label_list, image_w_list, image_h_list = [], [], [], []
+    for per_image_name, per_image_label in image_name_label_list:
+        per_image_path = os.path.join(image_dir, per_image_name)
+
+        if not os.path.exists(per_image_path):
+            continue
+
+        text_image_w, text_image_h = imagesize.get(per_image_path)
+
+        image_name_list.append(per_image_name)
+        label_list.append(convert_half_to_full_label(per_image_label))
+        image_w_list.append(text_image_w)
+        image_h_list.append(text_image_h)
+
+    return image_name_list, label_list, image_w_list, image_h_list
+
+
+def build_text_recognition_index_cache(root_dir,
+                                       set_name,
+                                       set_type,
+                                       index_cache_dir,
+                                       num_processes=16,
+                                       chunk_size=10000):
+    '''
+    build index cache for one root_dir/set_name/{set_name}_{set_type}.json label file.
+    image existence check and imagesize.get are run in num_processes processes.
+    cache is written to a temporary dir then renamed,so a half-written cache is never loaded.
+    call it by build_text_recognition_index_cache_if_stale when several processes may build same cache.
+    '''
+    image_dir = os.path.join(os.path.join(root_dir, set_name), set_type)
+    label_path = os.path.join(os.path.join(root_dir, set_name),
+                              f"{set_name}_{set_type}.json")
+    fingerprint = get_label_file_fingerprint(label_path)
+
+    with open(label_path, 'r', encoding='UTF-8') as json_f:
+        per_set_label = json.load(json_f)
+    per_set_label = list(per_set_label.items())
+
+    chunk_list = [(image_dir, per_set_label[i:i + chunk_size])
+                  for i in range(0, len(per_set_label), chunk_size)]
+
+    image_name_list, label_list, image_w_list, image_h_list = [], [], [], []
+    with Pool(processes=num_processes) as pool:
+        for per_image_name_list, per_label_list, per_image_w_list, per_image_h_list in tqdm(
+                pool.imap(get_image_name_label_size, chunk_list),
+                total=len(chunk_list)):
+            image_name_list.extend(per_image_name_list)
+            label_list.extend(per_label_list)
+            image_w_list.extend(per_image_w_list)
+            image_h_list.extend(per_image_h_list)
+
+    image_name_bytes_list = [
+        per_image_name.encode('utf-8') for per_image_name in image_name_list
+    ]
+    image_name_offset = np.zeros(len(image_name_bytes_list) + 1,
+                                 dtype=np.int64)
+    image_name_offset[1:] = np.cumsum(
+        [len(per_image_name) for per_image_name in image_name_bytes_list])
+    image_name_blob = np.frombuffer(b''.join(image_name_bytes_list),
+                                    dtype=np.uint8)
+
+    label_offset = np.zeros(len(label_list) + 1, dtype=np.int64)
+    label_offset[1:] = np.cumsum([len(per_label) for per_label in label_list])
+    label_blob = np.frombuffer(''.join(label_list).encode('utf-32-le'),
+                               dtype=np.uint32)
+
+    index_cache = {
+        'image_name_blob': image_name_blob,
+        'image_name_offset': image_name_offset,
+        'label_blob': label_blob,
+        'label_offset': label_offset,
+        'image_w': np.array(image_w_list, dtype=np.int32),
+        'image_h': np.array(image_h_list, dtype=np.int32),
+    }
+
+    per_set_cache_dir = get_index_cache_dir(index_cache_dir, set_name,
+                                            set_type)
+    temp_cache_dir = get_temp_cache_dir(per_set_cache_dir)
+    os.makedirs(temp_cache_dir) if not os.path.exists(temp_cache_dir) else None
+    for per_array_name in index_cache_array_name_list:
+        np.save(os.path.join(temp_cache_dir, f'{per_array_name}.npy'),
+                index_cache[per_array_name])
+    with open(os.path.join(temp_cache_dir, 'meta.json'), 'w') as f:
+        json.dump(
+            {
+                'label_path': label_path,
+                'fingerprint': fingerprint,
+                'image_num': len(image_name_list),
+            }, f)
+
+    replace_cache_dir(temp_cache_dir, per_set_cache_dir)
+
+    print(f'Build Index Cache:{per_set_cache_dir}, Image Num:{len(image_name_list)}')
+
+    return per_set_cache_dir
+
+
+def is_index_cache_stale(root_dir, set_name, set_type, index_cache_dir):
+    per_set_cache_dir = get_index_cache_dir(index_cache_dir, set_name,
+                                            set_type)
+    meta_path = os.path.join(per_set_cache_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return True
+
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+
+    label_path = os.path.join(os.path.join(root_dir, set_name),
+                              f"{set_name}_{set_type}.json")
+
+    return meta['fingerprint'] != get_label_file_fingerprint(label_path)
+
+
+def build_text_recognition_index_cache_if_stale(root_dir,
+                                                set_name,
+                                                set_type,
+                                                index_cache_dir,
+                                                num_processes=16,
+                                                force=False):
+    # check and build under file lock,see build_cache_dir_if_stale,force rebuilds a fresh cache
+    return build_cache_dir_if_stale(
+        get_index_cache_dir(index_cache_dir, set_name, set_type),
+        lambda: force or is_index_cache_stale(root_dir, set_name, set_type,
+                                              index_cache_dir),
+        lambda: build_text_recognition_index_cache(
+            root_dir,
+            set_name,
+            set_type,
+            index_cache_dir,
+            num_processes=num_processes))
+
+
+class TextRecognitionIndexCache:
+    '''
+    mmap loaded index cache of one label file,built by build_text_recognition_index_cache
+    '''
+
+    def __init__(self,
+                 root_dir,
+                 set_name,
+                 set_type,
+                 index_cache_dir,
+                 num_processes=16):
+        if is_index_cache_stale(root_dir, set_name, set_type,
+                                index_cache_dir):
+            build_text_recognition_index_cache_if_stale(
+                root_dir,
+                set_name,
+                set_type,
+                index_cache_dir,
+                num_processes=num_processes)
+
+        self.image_dir = os.path.join(os.path.join(root_dir, set_name),
+                                      set_type)
+        per_set_cache_dir = get_index_cache_dir(index_cache_dir, set_name,
+                                                set_type)
+        for per_array_name in index_cache_array_name_list:
+            setattr(
+                self, per_array_name,
+                np.load(os.path.join(per_set_cache_dir,
+                                     f'{per_array_name}.npy'),
+                        mmap_mode='r'))
+
+        self.label_length = np.diff(self.label_offset)
+
+    def __len__(self):
+        return len(self.image_w)
+
+    def get_image_path(self, idx):
+        image_name = self.image_name_blob[self.image_name_offset[idx]:self.
+                                          image_name_offset[idx + 1]]
+        image_name = image_name.tobytes().decode('utf-8')
+
+        return os.path.join(self.image_dir, image_name)
+
+    def get_label(self, idx):
+        label = self.label_blob[self.label_offset[idx]:self.label_offset[idx +
+                                                                         1]]
+        label = np.ascontiguousarray(label).tobytes().decode('utf-32-le')
+
+        return label
+
+    def get_chars_set(self, keep_mask):
+        '''
+        unique chars of labels selected by keep_mask
+        '''
+        label_char_keep_mask = np.repeat(keep_mask, self.label_length)
+        chars_set = np.unique(self.label_blob[label_char_keep_mask])
+        chars_set = set(chr(per_char) for per_char in chars_set)
+
+        return chars_set
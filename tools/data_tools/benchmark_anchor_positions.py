@@ -0,0 +1,227 @@
+'''
+check and benchmark RetinaAnchors/FCOSPositions/TTFNetPositions:
+1.previous python loop grids vs vectorized numpy __call__ vs cached device grids,values must be equal.
+2.per iteration overhead of loss batch anchors/positions at multiple input resolutions:
+previous numpy loop+torch.tensor+copy to device path vs cached device grids path,and cache statistics.
+example:
+python benchmark_anchor_positions.py --device cpu --batch-size 8 --image-size-list 512 640 800 1024
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+import math
+import time
+import numpy as np
+
+import torch
+
+from simpleAICV.detection.models.anchor import RetinaAnchors, FCOSPositions, TTFNetPositions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark Anchors And Positions')
+    parser.add_argument('--device',
+                        type=str,
+                        default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='device of grids')
+    parser.add_argument('--batch-size', type=int, default=8, help='batch size')
+    parser.add_argument('--image-size-list',
+                        type=int,
+                        nargs='+',
+                        default=[512, 640, 800, 1024],
+                        help='input image size')
+    parser.add_argument('--repeat-num',
+                        type=int,
+                        default=20,
+                        help='repeat num for timing')
+
+    return parser.parse_args()
+
+
+def old_generate_anchors_on_feature_map(base_anchors, feature_map_size,
+                                        stride):
+    # previous RetinaAnchors python loop version
+    shifts_x = (np.arange(0, feature_map_size[0]) + 0.5) * stride
+    shifts_y = (np.arange(0, feature_map_size[1]) + 0.5) * stride
+    shifts = np.array([[[shift_x, shift_y] for shift_y in shifts_y]
+                       for shift_x in shifts_x],
+                      dtype=np.float32)
+    shifts = np.expand_dims(np.tile(shifts, (1, 1, 2)), axis=2)
+    base_anchors = np.expand_dims(base_anchors, axis=0)
+    base_anchors = np.expand_dims(base_anchors, axis=0)
+    feature_map_anchors = np.transpose(base_anchors + shifts,
+                                       axes=(1, 0, 2, 3))
+    feature_map_anchors = np.ascontiguousarray(feature_map_anchors,
+                                               dtype=np.float32)
+
+    return feature_map_anchors
+
+
+def old_generate_positions_on_feature_map(feature_map_size, stride):
+    # previous FCOSPositions/TTFNetPositions python loop version
+    shifts_x = (np.arange(0, feature_map_size[0]) + 0.5) * stride
+    shifts_y = (np.arange(0, feature_map_size[1]) + 0.5) * stride
+    feature_map_positions = np.array([[[shift_x, shift_y]
+                                       for shift_y in shifts_y]
+                                      for shift_x in shifts_x],
+                                     dtype=np.float32)
+    feature_map_positions = np.transpose(feature_map_positions,
+                                         axes=(1, 0, 2))
+    feature_map_positions = np.ascontiguousarray(feature_map_positions,
+                                                 dtype=np.float32)
+
+    return feature_map_positions
+
+
+def old_retina_batch_anchors(anchors, feature_size, batch_size, device):
+    one_image_anchors = [
+        old_generate_anchors_on_feature_map(base_anchors, feature_size[index],
+                                            anchors.strides[index])
+        for index, base_anchors in enumerate(anchors.base_anchors)
+    ]
+    one_image_anchors = torch.cat([
+        torch.tensor(per_level_anchor).view(-1, per_level_anchor.shape[-1])
+        for per_level_anchor in one_image_anchors
+    ],
+                                  dim=0)
+
+    return one_image_anchors.unsqueeze(0).repeat(batch_size, 1, 1).to(device)
+
+
+def new_retina_batch_anchors(anchors, feature_size, batch_size, device):
+    one_image_anchors = anchors.get_device_anchors(feature_size, device)
+    one_image_anchors = torch.cat([
+        per_level_anchor.view(-1, per_level_anchor.shape[-1])
+        for per_level_anchor in one_image_anchors
+    ],
+                                  dim=0)
+
+    return one_image_anchors.unsqueeze(0).repeat(batch_size, 1, 1)
+
+
+def old_fcos_batch_positions(positions, feature_size, batch_size, device):
+    return [
+        torch.tensor(
+            old_generate_positions_on_feature_map(fpn_feature_size,
+                                                  stride)).unsqueeze(0).repeat(
+                                                      batch_size, 1, 1,
+                                                      1).to(device)
+        for stride, fpn_feature_size in zip(positions.strides, feature_size)
+    ]
+
+
+def new_fcos_batch_positions(positions, feature_size, batch_size, device):
+    return [
+        per_level_position.unsqueeze(0).repeat(batch_size, 1, 1, 1)
+        for per_level_position in positions.get_device_positions(
+            feature_size, device)
+    ]
+
+
+def old_ttfnet_batch_positions(positions, feature_map_size, batch_size,
+                               device):
+    return torch.tensor(
+        old_generate_positions_on_feature_map(
+            feature_map_size, 1)).unsqueeze(0).repeat(batch_size, 1, 1,
+                                                      1).to(device)
+
+
+def new_ttfnet_batch_positions(positions, feature_map_size, batch_size,
+                               device):
+    return positions.get_device_positions(feature_map_size,
+                                          device).unsqueeze(0).repeat(
+                                              batch_size, 1, 1, 1)
+
+
+def timing(func, inputs, repeat_num, device):
+    outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start_time = time.time()
+    for _ in range(repeat_num):
+        outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+    return outs, (time.time() - start_time) / repeat_num
+
+
+def is_all_equal(outs1, outs2):
+    if isinstance(outs1, torch.Tensor):
+        outs1, outs2 = [outs1], [outs2]
+
+    return all(
+        torch.equal(per_out1.cpu(), per_out2.cpu())
+        for per_out1, per_out2 in zip(outs1, outs2))
+
+
+def main():
+    args = parse_args()
+    device = torch.device(args.device)
+
+    anchors = RetinaAnchors()
+    fcos_positions = FCOSPositions()
+    ttfnet_positions = TTFNetPositions()
+
+    for image_size in args.image_size_list:
+        feature_size = [[
+            math.ceil(image_size / stride),
+            math.ceil(image_size / stride)
+        ] for stride in anchors.strides]
+        ttfnet_feature_map_size = [image_size // 4, image_size // 4]
+
+        # numpy __call__ must be same as previous loop version
+        numpy_equal = all(
+            np.array_equal(
+                per_anchors,
+                old_generate_anchors_on_feature_map(base_anchors,
+                                                    feature_size[index],
+                                                    anchors.strides[index]))
+            for index, (per_anchors, base_anchors) in enumerate(
+                zip(anchors(feature_size), anchors.base_anchors))) and all(
+                    np.array_equal(
+                        per_positions,
+                        old_generate_positions_on_feature_map(
+                            per_size, stride)) for per_positions, per_size,
+                    stride in zip(fcos_positions(feature_size), feature_size,
+                                  fcos_positions.strides)) and np.array_equal(
+                                      ttfnet_positions(ttfnet_feature_map_size),
+                                      old_generate_positions_on_feature_map(
+                                          ttfnet_feature_map_size, 1))
+
+        for name, old_func, new_func, grid_generator, per_feature_size in [
+            [
+                'RetinaAnchors', old_retina_batch_anchors,
+                new_retina_batch_anchors, anchors, feature_size
+            ],
+            [
+                'FCOSPositions', old_fcos_batch_positions,
+                new_fcos_batch_positions, fcos_positions, feature_size
+            ],
+            [
+                'TTFNetPositions', old_ttfnet_batch_positions,
+                new_ttfnet_batch_positions, ttfnet_positions,
+                ttfnet_feature_map_size
+            ],
+        ]:
+            inputs = (grid_generator, per_feature_size, args.batch_size,
+                      device)
+            old_outs, old_time = timing(old_func, inputs, args.repeat_num,
+                                        device)
+            new_outs, new_time = timing(new_func, inputs, args.repeat_num,
+                                        device)
+            print(
+                f'{name:<16s} image_size:{image_size:<5d} old:{old_time*1000:.3f}ms, cached:{new_time*1000:.3f}ms, speedup:{old_time/new_time:.2f}x, numpy equal:{numpy_equal}, device equal:{is_all_equal(old_outs, new_outs)}, cache:{grid_generator.get_cache_info()}'
+            )
+
+    return
+
+
+if __name__ == '__main__':
+    main()
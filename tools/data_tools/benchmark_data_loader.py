@@ -0,0 +1,806 @@
+'''
+benchmark train data loading pipeline of one experiment without building model:
+per stage samples/sec(read bytes,decode,each transform in Compose chain,collate) in main process,
+and end to end DataLoader samples/sec for each num_workers.
+only train_dataset/train_collater and the config attributes they depend on are executed from train_config.py.
+by default train_dataset root dirs are replaced by a small synthetic dataset generated with same layout as dataset class,
+use --real-data to benchmark on real dataset paths in tools/path.py.
+example:
+python benchmark_data_loader.py --work-dir ../../classification_training/imagenet/resnet50 --num-workers-list 0 2 4 8 --output-json ./resnet50_data_loader.json --output-csv ./resnet50_data_loader.csv
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+import ast
+import collections
+import cv2
+import csv
+import inspect
+import json
+import pickle
+import shutil
+import tempfile
+import time
+import numpy as np
+import xml.etree.ElementTree as ET
+
+import pycocotools.mask as mask_utils
+import torchvision.transforms as transforms
+
+from torch.utils.data import DataLoader
+
+from simpleAICV.detection.datasets.cocodataset import COCO_CLASSES
+from simpleAICV.detection.datasets.vocdataset import VOC_CLASSES
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark Data Loader')
+    parser.add_argument('--work-dir',
+                        type=str,
+                        help='experiment folder include train_config.py')
+    parser.add_argument('--real-data',
+                        action='store_true',
+                        help='use real dataset paths instead of synthetic data')
+    parser.add_argument(
+        '--synthetic-dir',
+        type=str,
+        default=None,
+        help='synthetic dataset dir,if None,use a temporary dir and delete it')
+    parser.add_argument('--synthetic-sample-num',
+                        type=int,
+                        default=256,
+                        help='synthetic dataset image num')
+    parser.add_argument('--synthetic-image-size',
+                        type=int,
+                        default=512,
+                        help='synthetic image max side')
+    parser.add_argument('--profile-sample-num',
+                        type=int,
+                        default=64,
+                        help='sample num for per stage profile')
+    parser.add_argument('--batch-size',
+                        type=int,
+                        default=None,
+                        help='per process batch size,default config.batch_size')
+    parser.add_argument('--num-workers-list',
+                        type=int,
+                        nargs='+',
+                        default=[0, 2, 4],
+                        help='num_workers values for DataLoader benchmark')
+    parser.add_argument('--max-batches',
+                        type=int,
+                        default=20,
+                        help='max batches for each DataLoader benchmark')
+    parser.add_argument('--warmup-batches',
+                        type=int,
+                        default=2,
+                        help='first batches not counted,include worker start')
+    parser.add_argument('--output-json', type=str, default=None)
+    parser.add_argument('--output-csv', type=str, default=None)
+
+    return parser.parse_args()
+
+
+def get_assigned_name_set(node):
+    return set(per_node.id for per_node in ast.walk(node)
+               if isinstance(per_node, ast.Name)
+               and isinstance(per_node.ctx, ast.Store))
+
+
+def get_loaded_name_set(node):
+    return set(per_node.id for per_node in ast.walk(node)
+               if isinstance(per_node, ast.Name)
+               and isinstance(per_node.ctx, ast.Load))
+
+
+def slice_config_class(config_class_node, target_name_list):
+    '''
+    keep only config class statements which target names depend on,
+    so model/criterion/pretrained weight loading are never executed.
+    '''
+    needed_name_set = set(target_name_list)
+    keep_statement_list = []
+    for per_statement in reversed(config_class_node.body):
+        if get_assigned_name_set(per_statement) & needed_name_set:
+            keep_statement_list.insert(0, per_statement)
+            needed_name_set |= get_loaded_name_set(per_statement)
+
+    config_class_node.body = keep_statement_list
+
+    return config_class_node
+
+
+def get_dataset_call_node(config_class_node, dataset_attr_name):
+    for per_statement in config_class_node.body:
+        if isinstance(per_statement, ast.Assign) and any(
+                isinstance(per_target, ast.Name)
+                and per_target.id == dataset_attr_name
+                for per_target in per_statement.targets):
+            assert isinstance(per_statement.value,
+                              ast.Call), f'{dataset_attr_name} is not a call!'
+            return per_statement.value
+
+    raise ValueError(f'config has no {dataset_attr_name}!')
+
+
+def get_dataset_call_arguments(dataset_call_node, dataset_class):
+    '''
+    map dataset __init__ parameter name to call argument ast node
+    '''
+    parameter_name_list = [
+        per_name for per_name in inspect.signature(
+            dataset_class.__init__).parameters.keys() if per_name != 'self'
+    ]
+    argument_dict = collections.OrderedDict()
+    for per_parameter_name, per_argument in zip(parameter_name_list,
+                                                dataset_call_node.args):
+        argument_dict[per_parameter_name] = per_argument
+    for per_keyword in dataset_call_node.keywords:
+        argument_dict[per_keyword.arg] = per_keyword.value
+
+    return argument_dict
+
+
+def get_dataset_literal_kwargs(argument_dict, dataset_class):
+    '''
+    dataset __init__ default values updated by literal call arguments,used to generate synthetic layout
+    '''
+    literal_kwargs = {
+        per_name: per_parameter.default
+        for per_name, per_parameter in inspect.signature(
+            dataset_class.__init__).parameters.items()
+        if per_parameter.default is not inspect.Parameter.empty
+    }
+    for per_name, per_argument in argument_dict.items():
+        try:
+            literal_kwargs[per_name] = ast.literal_eval(per_argument)
+        except (ValueError, TypeError, SyntaxError):
+            continue
+
+    return literal_kwargs
+
+
+def get_synthetic_image(image_h, image_w):
+    # low frequency noise image,jpeg size and decode cost are closer to natural images than white noise
+    image = np.random.randint(0,
+                              256,
+                              (max(image_h // 32, 2), max(image_w // 32, 2), 3),
+                              dtype=np.uint8)
+    image = cv2.resize(image, (image_w, image_h),
+                       interpolation=cv2.INTER_CUBIC)
+    image = np.clip(
+        image.astype(np.int16) + np.random.randint(-8, 8, image.shape), 0,
+        255).astype(np.uint8)
+
+    return image
+
+
+def get_synthetic_image_size(image_size):
+    image_h = np.random.randint(int(image_size * 0.6), image_size + 1)
+    image_w = np.random.randint(int(image_size * 0.6), image_size + 1)
+
+    return image_h, image_w
+
+
+def get_synthetic_boxes(image_h, image_w, box_num):
+    # [x_min, y_min, w, h]
+    boxes = []
+    for _ in range(box_num):
+        box_w = np.random.randint(max(image_w // 10, 2), image_w // 2)
+        box_h = np.random.randint(max(image_h // 10, 2), image_h // 2)
+        x_min = np.random.randint(0, image_w - box_w)
+        y_min = np.random.randint(0, image_h - box_h)
+        boxes.append([x_min, y_min, box_w, box_h])
+
+    return boxes
+
+
+def get_ellipse_polygon(box, point_num=16):
+    x_min, y_min, box_w, box_h = box
+    angles = np.linspace(0, 2 * np.pi, point_num, endpoint=False)
+    xs = x_min + box_w / 2. + box_w / 2. * np.cos(angles)
+    ys = y_min + box_h / 2. + box_h / 2. * np.sin(angles)
+
+    return np.stack([xs, ys], axis=1).reshape(-1).tolist()
+
+
+def generate_image_folder_dataset(dataset_dir, dataset_kwargs, sample_num,
+                                  image_size):
+    # ILSVRC2012Dataset/CelebAHQDataset:root_dir/set_name/class folders/images
+    set_dir = os.path.join(dataset_dir, dataset_kwargs['set_name'])
+    class_num = 10
+    for i in range(sample_num):
+        per_class_dir = os.path.join(set_dir, f'class_{i % class_num:04d}')
+        os.makedirs(per_class_dir, exist_ok=True)
+        image_h, image_w = get_synthetic_image_size(image_size)
+        cv2.imwrite(os.path.join(per_class_dir, f'{i:08d}.JPEG'),
+                    get_synthetic_image(image_h, image_w))
+
+    return {'root_dir': dataset_dir}
+
+
+def generate_cifar100_dataset(dataset_dir, dataset_kwargs, sample_num,
+                              image_size):
+    os.makedirs(dataset_dir, exist_ok=True)
+    with open(os.path.join(dataset_dir, dataset_kwargs['set_name']),
+              'wb') as f:
+        pickle.dump(
+            {
+                'data':
+                np.random.randint(0, 256, (sample_num, 3072), dtype=np.uint8),
+                'fine_labels':
+                np.random.randint(0, 100, (sample_num)).tolist(),
+            }, f)
+    with open(os.path.join(dataset_dir, 'meta'), 'wb') as f:
+        pickle.dump({'fine_label_names': [f'class_{i}' for i in range(100)]},
+                    f)
+
+    return {'root_dir': dataset_dir}
+
+
+def generate_cifar10_dataset(dataset_dir, dataset_kwargs, sample_num,
+                             image_size):
+    os.makedirs(dataset_dir, exist_ok=True)
+    data_name_list = [f'data_batch_{i}' for i in range(1, 6)
+                      ] if dataset_kwargs['set_name'] == 'train' else [
+                          'test_batch'
+                      ]
+    per_file_sample_num = max(sample_num // len(data_name_list), 1)
+    for per_data_name in data_name_list:
+        with open(os.path.join(dataset_dir, per_data_name), 'wb') as f:
+            pickle.dump(
+                {
+                    'data':
+                    np.random.randint(0,
+                                      256, (per_file_sample_num, 3072),
+                                      dtype=np.uint8),
+                    'labels':
+                    np.random.randint(0, 10, (per_file_sample_num)).tolist(),
+                }, f)
+    with open(os.path.join(dataset_dir, 'batches.meta'), 'wb') as f:
+        pickle.dump({'label_names': [f'class_{i}' for i in range(10)]}, f)
+
+    return {'root_dir': dataset_dir}
+
+
+def generate_coco_dataset(dataset_dir, dataset_kwargs, sample_num,
+                          image_size):
+    # CocoDetection/CocoInstanceSegmentation/CocoSemanticSegmentation
+    set_name = dataset_kwargs['set_name']
+    image_dir = os.path.join(dataset_dir, 'images', set_name)
+    annotation_dir = os.path.join(dataset_dir, 'annotations')
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(annotation_dir, exist_ok=True)
+
+    images, annotations = [], []
+    categories = [{
+        'id': i + 1,
+        'name': per_class_name,
+    } for i, per_class_name in enumerate(COCO_CLASSES)]
+    for i in range(sample_num):
+        image_h, image_w = get_synthetic_image_size(image_size)
+        file_name = f'{i:012d}.jpg'
+        cv2.imwrite(os.path.join(image_dir, file_name),
+                    get_synthetic_image(image_h, image_w))
+        images.append({
+            'id': i,
+            'file_name': file_name,
+            'height': image_h,
+            'width': image_w,
+        })
+        for per_box in get_synthetic_boxes(image_h, image_w,
+                                           np.random.randint(1, 9)):
+            annotations.append({
+                'id': len(annotations) + 1,
+                'image_id': i,
+                'category_id': int(np.random.randint(1,
+                                                     len(COCO_CLASSES) + 1)),
+                'bbox': [float(per_value) for per_value in per_box],
+                'area': float(per_box[2] * per_box[3]),
+                'iscrowd': 0,
+                'segmentation': [get_ellipse_polygon(per_box)],
+            })
+
+    with open(os.path.join(annotation_dir, f'instances_{set_name}.json'),
+              'w') as f:
+        json.dump(
+            {
+                'images': images,
+                'annotations': annotations,
+                'categories': categories,
+            }, f)
+
+    return {'root_dir': dataset_dir}
+
+
+def generate_voc_dataset(dataset_dir, dataset_kwargs, sample_num, image_size):
+    image_sets = dataset_kwargs['image_sets']
+    per_set_sample_num = max(sample_num // len(image_sets), 1)
+    for year, name in image_sets:
+        year_dir = os.path.join(dataset_dir, 'VOC' + year)
+        for per_sub_dir in ['Annotations', 'JPEGImages', 'ImageSets/Main']:
+            os.makedirs(os.path.join(year_dir, per_sub_dir), exist_ok=True)
+
+        image_name_list = []
+        for i in range(per_set_sample_num):
+            image_name = f'{year}_{i:06d}'
+            image_h, image_w = get_synthetic_image_size(image_size)
+            cv2.imwrite(os.path.join(year_dir, 'JPEGImages', f'{image_name}.jpg'),
+                        get_synthetic_image(image_h, image_w))
+
+            annotation = ET.Element('annotation')
+            size = ET.SubElement(annotation, 'size')
+            ET.SubElement(size, 'height').text = str(image_h)
+            ET.SubElement(size, 'width').text = str(image_w)
+            for per_box in get_synthetic_boxes(image_h, image_w,
+                                               np.random.randint(1, 6)):
+                per_object = ET.SubElement(annotation, 'object')
+                ET.SubElement(per_object, 'name').text = VOC_CLASSES[
+                    np.random.randint(0, len(VOC_CLASSES))]
+                ET.SubElement(per_object, 'difficult').text = '0'
+                bndbox = ET.SubElement(per_object, 'bndbox')
+                for per_name, per_value in zip(
+                    ['xmin', 'ymin', 'xmax', 'ymax'], [
+                        per_box[0], per_box[1], per_box[0] + per_box[2],
+                        per_box[1] + per_box[3]
+                    ]):
+                    ET.SubElement(bndbox, per_name).text = str(per_value)
+            ET.ElementTree(annotation).write(
+                os.path.join(year_dir, 'Annotations', f'{image_name}.xml'))
+            image_name_list.append(image_name)
+
+        with open(os.path.join(year_dir, 'ImageSets/Main', f'{name}.txt'),
+                  'w') as f:
+            f.write('\n'.join(image_name_list) + '\n')
+
+    return {'root_dir': dataset_dir}
+
+
+def generate_ade20k_dataset(dataset_dir, dataset_kwargs, sample_num,
+                            image_size):
+    image_sets = dataset_kwargs['image_sets']
+    image_dir = os.path.join(dataset_dir, 'images', image_sets)
+    annotation_dir = os.path.join(dataset_dir, 'annotations', image_sets)
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(annotation_dir, exist_ok=True)
+    for i in range(sample_num):
+        image_name = f'ADE_{image_sets}_{i:08d}'
+        image_h, image_w = get_synthetic_image_size(image_size)
+        cv2.imwrite(os.path.join(image_dir, f'{image_name}.jpg'),
+                    get_synthetic_image(image_h, image_w))
+        mask = np.random.randint(0, 151, (max(image_h // 32, 2),
+                                          max(image_w // 32, 2)),
+                                 dtype=np.uint8)
+        mask = cv2.resize(mask, (image_w, image_h),
+                          interpolation=cv2.INTER_NEAREST)
+        cv2.imwrite(os.path.join(annotation_dir, f'{image_name}.png'), mask)
+
+    return {'root_dir': dataset_dir}
+
+
+def generate_ffhq_dataset(dataset_dir, dataset_kwargs, sample_num,
+                          image_size):
+    image_dir = os.path.join(dataset_dir, 'images')
+    os.makedirs(image_dir, exist_ok=True)
+    label_info = {}
+    for i in range(sample_num):
+        image_name = f'{i:05d}.png'
+        cv2.imwrite(os.path.join(image_dir, image_name),
+                    get_synthetic_image(image_size, image_size))
+        label_info[str(i)] = {
+            'category': dataset_kwargs['set_name'],
+            'image': {
+                'file_path': f'images1024x1024/00000/{image_name}',
+            },
+        }
+    with open(os.path.join(dataset_dir, 'ffhq-dataset-v2.json'), 'w') as f:
+        json.dump(label_info, f)
+
+    return {'root_dir': dataset_dir}
+
+
+def generate_image_inpainting_dataset(dataset_dir, dataset_kwargs, sample_num,
+                                      image_size):
+    image_root_dir = os.path.join(dataset_dir, 'images')
+    mask_root_dir = os.path.join(dataset_dir, 'masks')
+    image_dir = os.path.join(
+        image_root_dir, dataset_kwargs['image_set_name']
+    ) if dataset_kwargs['image_set_name'] is not None else image_root_dir
+    mask_dir = os.path.join(
+        mask_root_dir, dataset_kwargs['mask_set_name']
+    ) if dataset_kwargs['mask_set_name'] is not None else mask_root_dir
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(mask_dir, exist_ok=True)
+    for i in range(sample_num):
+        image_h, image_w = get_synthetic_image_size(image_size)
+        cv2.imwrite(os.path.join(image_dir, f'{i:08d}.jpg'),
+                    get_synthetic_image(image_h, image_w))
+
+        # free-form stroke mask
+        mask = np.zeros((image_size, image_size), dtype=np.uint8)
+        for _ in range(np.random.randint(2, 6)):
+            points = np.random.randint(0, image_size, (4, 2)).astype(np.int32)
+            cv2.polylines(mask, [points],
+                          isClosed=False,
+                          color=255,
+                          thickness=int(np.random.randint(10, 40)))
+        cv2.imwrite(os.path.join(mask_dir, f'{i:08d}.png'), mask)
+
+    return {'image_root_dir': image_root_dir, 'mask_root_dir': mask_root_dir}
+
+
+def generate_sam1b_dataset(dataset_dir, dataset_kwargs, sample_num,
+                           image_size):
+    image_dir = os.path.join(dataset_dir, 'sa_000000')
+    os.makedirs(image_dir, exist_ok=True)
+    for i in range(sample_num):
+        image_h, image_w = get_synthetic_image_size(image_size)
+        cv2.imwrite(os.path.join(image_dir, f'sa_{i}.jpg'),
+                    get_synthetic_image(image_h, image_w))
+
+        annotations = []
+        for per_box in get_synthetic_boxes(image_h, image_w,
+                                           np.random.randint(4, 16)):
+            mask = np.zeros((image_h, image_w), dtype=np.uint8)
+            cv2.fillPoly(mask, [
+                np.array(get_ellipse_polygon(per_box)).reshape(
+                    -1, 2).astype(np.int32)
+            ], 1)
+            rle = mask_utils.encode(np.asfortranarray(mask))
+            rle['counts'] = rle['counts'].decode('utf-8')
+            annotations.append({
+                'id': len(annotations),
+                'segmentation': rle,
+                'bbox': [float(per_value) for per_value in per_box],
+                'area': int(mask.sum()),
+            })
+
+        with open(os.path.join(image_dir, f'sa_{i}.json'), 'w') as f:
+            json.dump(
+                {
+                    'image': {
+                        'image_id': i,
+                        'height': image_h,
+                        'width': image_w,
+                        'file_name': f'sa_{i}.jpg',
+                    },
+                    'annotations': annotations,
+                }, f)
+
+    return {'root_dir': dataset_dir}
+
+
+# dataset class name -> synthetic layout generator,generator returns {dataset __init__ path parameter: path}
+synthetic_dataset_generator_dict = {
+    'ILSVRC2012Dataset': generate_image_folder_dataset,
+    'CelebAHQDataset': generate_image_folder_dataset,
+    'CIFAR10Dataset': generate_cifar10_dataset,
+    'CIFAR100Dataset': generate_cifar100_dataset,
+    'CocoDetection': generate_coco_dataset,
+    'MosaicResizeCocoDetection': generate_coco_dataset,
+    'CocoInstanceSegmentation': generate_coco_dataset,
+    'CocoSemanticSegmentation': generate_coco_dataset,
+    'VocDetection': generate_voc_dataset,
+    'ADE20KSemanticSegmentation': generate_ade20k_dataset,
+    'FFHQDataset': generate_ffhq_dataset,
+    'ImageInpaintingDataset': generate_image_inpainting_dataset,
+    'SAM1BDataset': generate_sam1b_dataset,
+}
+
+
+def load_train_data_config(work_dir, synthetic_dir, synthetic_sample_num,
+                           synthetic_image_size):
+    '''
+    execute train_config.py module level statements and only the config class statements
+    train_dataset/train_collater depend on.
+    if synthetic_dir is not None,train_dataset path arguments are replaced by synthetic dataset dirs.
+    '''
+    config_path = os.path.join(work_dir, 'train_config.py')
+    with open(config_path, 'r') as f:
+        config_module_node = ast.parse(f.read(), filename=config_path)
+
+    config_class_node = None
+    module_statement_list = []
+    for per_statement in config_module_node.body:
+        if isinstance(per_statement,
+                      ast.ClassDef) and per_statement.name == 'config':
+            config_class_node = per_statement
+        else:
+            module_statement_list.append(per_statement)
+    assert config_class_node is not None, 'train_config.py has no config class!'
+    config_class_node = slice_config_class(
+        config_class_node, ['train_dataset', 'train_collater', 'batch_size'])
+
+    namespace = {
+        '__file__': os.path.abspath(config_path),
+        '__name__': 'train_config',
+    }
+    exec(
+        compile(ast.Module(body=module_statement_list, type_ignores=[]),
+                config_path, 'exec'), namespace)
+
+    dataset_call_node = get_dataset_call_node(config_class_node,
+                                              'train_dataset')
+    dataset_class_name = ast.unparse(dataset_call_node.func)
+
+    if synthetic_dir is not None:
+        assert dataset_class_name in synthetic_dataset_generator_dict.keys(
+        ), f'no synthetic generator for {dataset_class_name},use --real-data!'
+        dataset_class = eval(dataset_class_name, namespace)
+        argument_dict = get_dataset_call_arguments(dataset_call_node,
+                                                   dataset_class)
+        dataset_kwargs = get_dataset_literal_kwargs(argument_dict,
+                                                    dataset_class)
+
+        dataset_dir = os.path.join(synthetic_dir, dataset_class_name)
+        if os.path.exists(dataset_dir):
+            shutil.rmtree(dataset_dir)
+        synthetic_path_dict = synthetic_dataset_generator_dict[
+            dataset_class_name](dataset_dir, dataset_kwargs,
+                                synthetic_sample_num, synthetic_image_size)
+
+        path_name_set = set()
+        for per_statement in module_statement_list:
+            if isinstance(per_statement, ast.ImportFrom
+                          ) and per_statement.module == 'tools.path':
+                path_name_set |= set(per_alias.asname or per_alias.name
+                                     for per_alias in per_statement.names)
+        for per_name, per_argument in argument_dict.items():
+            if per_name in synthetic_path_dict.keys():
+                assert isinstance(
+                    per_argument, ast.Name
+                ), f'{per_name} argument must be a tools.path variable!'
+                namespace[per_argument.id] = synthetic_path_dict[per_name]
+                path_name_set.discard(per_argument.id)
+        # other paths train_dataset uses(index/cache dirs) point to synthetic dir,never write into real dataset dirs
+        for per_path_name in path_name_set:
+            namespace[per_path_name] = os.path.join(synthetic_dir,
+                                                    per_path_name)
+
+    exec(
+        compile(ast.Module(body=[config_class_node], type_ignores=[]),
+                config_path, 'exec'), namespace)
+
+    return namespace['config'], dataset_class_name
+
+
+class StageTimer:
+
+    def __init__(self):
+        self.stage_time_dict = collections.OrderedDict()
+        self.stage_sample_num_dict = collections.OrderedDict()
+
+    def add(self, stage_name, used_time, sample_num=0):
+        if stage_name not in self.stage_time_dict.keys():
+            self.stage_time_dict[stage_name] = 0.
+            self.stage_sample_num_dict[stage_name] = 0
+        self.stage_time_dict[stage_name] += used_time
+        self.stage_sample_num_dict[stage_name] += sample_num
+
+    def get_stage_time(self, stage_name):
+        return self.stage_time_dict.get(stage_name, 0.)
+
+
+class TimedFunction:
+
+    def __init__(self, function, stage_name, stage_timer):
+        self.function = function
+        self.stage_name = stage_name
+        self.stage_timer = stage_timer
+
+    def __call__(self, *args, **kwargs):
+        start_time = time.perf_counter()
+        outputs = self.function(*args, **kwargs)
+        self.stage_timer.add(self.stage_name,
+                             time.perf_counter() - start_time)
+
+        return outputs
+
+
+def get_dataset_compose_dict(dataset):
+    # transform/image_transform/mask_transform ...
+    return collections.OrderedDict(
+        (per_attr_name, per_attr)
+        for per_attr_name, per_attr in vars(dataset).items()
+        if isinstance(per_attr, transforms.Compose))
+
+
+def profile_stages(dataset, collater, profile_sample_num, batch_size):
+    '''
+    run dataset __getitem__ and collater in main process,
+    np.fromfile/cv2.imdecode/mask decode and every Compose transform are wrapped by timers.
+    '''
+    stage_timer = StageTimer()
+
+    patch_list = [
+        (np, 'fromfile', 'read_bytes'),
+        (cv2, 'imdecode', 'decode_image'),
+        (mask_utils, 'decode', 'decode_mask'),
+    ]
+    origin_function_list = []
+    for per_module, per_function_name, per_stage_name in patch_list:
+        origin_function = getattr(per_module, per_function_name)
+        origin_function_list.append(origin_function)
+        setattr(per_module, per_function_name,
+                TimedFunction(origin_function, per_stage_name, stage_timer))
+
+    compose_dict = get_dataset_compose_dict(dataset)
+    origin_transforms_dict = {}
+    transform_stage_name_list = []
+    for per_attr_name, per_compose in compose_dict.items():
+        origin_transforms_dict[per_attr_name] = per_compose.transforms
+        timed_transform_list = []
+        for i, per_transform in enumerate(per_compose.transforms):
+            per_stage_name = f'{per_attr_name}.{i}.{per_transform.__class__.__name__}'
+            transform_stage_name_list.append(per_stage_name)
+            timed_transform_list.append(
+                TimedFunction(per_transform, per_stage_name, stage_timer))
+        per_compose.transforms = timed_transform_list
+
+    try:
+        sample_idx_list = np.random.permutation(
+            len(dataset))[:profile_sample_num].tolist()
+        sample_list = []
+        for per_idx in sample_idx_list:
+            start_time = time.perf_counter()
+            sample_list.append(dataset[per_idx])
+            stage_timer.add('getitem_total',
+                            time.perf_counter() - start_time)
+
+        for i in range(0, len(sample_list) - batch_size + 1, batch_size):
+            start_time = time.perf_counter()
+            _ = collater(sample_list[i:i + batch_size])
+            stage_timer.add('collate',
+                            time.perf_counter() - start_time, batch_size)
+    finally:
+        for (per_module, per_function_name,
+             _), origin_function in zip(patch_list, origin_function_list):
+            setattr(per_module, per_function_name, origin_function)
+        for per_attr_name, per_compose in compose_dict.items():
+            per_compose.transforms = origin_transforms_dict[per_attr_name]
+
+    sample_num = len(sample_list)
+    inner_stage_name_list = [
+        'read_bytes',
+        'decode_image',
+        'decode_mask',
+    ] + transform_stage_name_list
+    other_time = stage_timer.get_stage_time('getitem_total') - sum(
+        stage_timer.get_stage_time(per_stage_name)
+        for per_stage_name in inner_stage_name_list)
+
+    stage_result_list = []
+    for per_stage_name, per_stage_time, per_sample_num in [
+        (per_stage_name, stage_timer.get_stage_time(per_stage_name),
+         sample_num) for per_stage_name in inner_stage_name_list
+            if per_stage_name in stage_timer.stage_time_dict.keys()
+    ] + [
+        ('getitem_other', other_time, sample_num),
+        ('getitem_total', stage_timer.get_stage_time('getitem_total'),
+         sample_num),
+        ('collate', stage_timer.get_stage_time('collate'),
+         stage_timer.stage_sample_num_dict.get('collate', 0)),
+    ]:
+        if per_sample_num == 0:
+            continue
+        stage_result_list.append({
+            'stage':
+            per_stage_name,
+            'ms_per_sample':
+            per_stage_time / per_sample_num * 1000,
+            'samples_per_sec':
+            per_sample_num / per_stage_time if per_stage_time > 0 else 0.,
+        })
+
+    return stage_result_list
+
+
+def benchmark_loader(dataset, collater, batch_size, num_workers, max_batches,
+                     warmup_batches):
+    loader = DataLoader(dataset,
+                        batch_size=batch_size,
+                        shuffle=True,
+                        num_workers=num_workers,
+                        collate_fn=collater,
+                        drop_last=True)
+
+    batch_num = min(max_batches, len(loader))
+    assert batch_num > warmup_batches, 'dataset too small for batch size!'
+
+    start_time = time.perf_counter()
+    for i, _ in enumerate(loader):
+        if i + 1 == warmup_batches:
+            start_time = time.perf_counter()
+        if i + 1 == batch_num:
+            break
+    used_time = time.perf_counter() - start_time
+    sample_num = (batch_num - warmup_batches) * batch_size
+
+    return {
+        'num_workers': num_workers,
+        'batch_size': batch_size,
+        'batch_num': batch_num - warmup_batches,
+        'ms_per_sample': used_time / sample_num * 1000,
+        'samples_per_sec': sample_num / used_time,
+    }
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    synthetic_dir = None
+    if not args.real_data:
+        synthetic_dir = args.synthetic_dir if args.synthetic_dir else tempfile.mkdtemp(
+            prefix='data_loader_benchmark_')
+        os.makedirs(synthetic_dir, exist_ok=True)
+
+    try:
+        config, dataset_class_name = load_train_data_config(
+            args.work_dir, synthetic_dir, args.synthetic_sample_num,
+            args.synthetic_image_size)
+        dataset, collater = config.train_dataset, config.train_collater
+        batch_size = args.batch_size if args.batch_size else config.batch_size
+        batch_size = min(batch_size, len(dataset) // (args.warmup_batches + 1))
+
+        stage_result_list = profile_stages(dataset, collater,
+                                           args.profile_sample_num,
+                                           batch_size)
+
+        loader_result_list = []
+        for per_num_workers in args.num_workers_list:
+            loader_result_list.append(
+                benchmark_loader(dataset, collater, batch_size,
+                                 per_num_workers, args.max_batches,
+                                 args.warmup_batches))
+    finally:
+        if synthetic_dir is not None and not args.synthetic_dir:
+            shutil.rmtree(synthetic_dir, ignore_errors=True)
+
+    result = {
+        'work_dir': args.work_dir,
+        'dataset': dataset_class_name,
+        'synthetic_data': not args.real_data,
+        'dataset_size': len(dataset),
+        'stages': stage_result_list,
+        'loaders': loader_result_list,
+    }
+
+    print(f'dataset:{dataset_class_name}, dataset size:{len(dataset)}, synthetic data:{not args.real_data}')
+    for per_result in stage_result_list:
+        print(
+            f'stage:{per_result["stage"]:<48s} {per_result["ms_per_sample"]:10.3f}ms/sample {per_result["samples_per_sec"]:12.1f}samples/s'
+        )
+    for per_result in loader_result_list:
+        print(
+            f'loader num_workers:{per_result["num_workers"]:<3d} batch_size:{per_result["batch_size"]:<4d} {per_result["ms_per_sample"]:10.3f}ms/sample {per_result["samples_per_sec"]:12.1f}samples/s'
+        )
+
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(result, f, indent=4)
+
+    if args.output_csv:
+        with open(args.output_csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([
+                'type', 'name', 'num_workers', 'batch_size', 'ms_per_sample',
+                'samples_per_sec'
+            ])
+            for per_result in stage_result_list:
+                writer.writerow([
+                    'stage', per_result['stage'], 0, '',
+                    f'{per_result["ms_per_sample"]:.4f}',
+                    f'{per_result["samples_per_sec"]:.2f}'
+                ])
+            for per_result in loader_result_list:
+                writer.writerow([
+                    'loader', 'end_to_end', per_result['num_workers'],
+                    per_result['batch_size'],
+                    f'{per_result["ms_per_sample"]:.4f}',
+                    f'{per_result["samples_per_sec"]:.2f}'
+                ])
@@ -0,0 +1,144 @@
+'''
+check and benchmark DBNet probability/threshold targets on synthetic text polygons:
+1.batched GenerateProbabilityThresholdMask __call__ vs per polygon loop get_masks_per_polygon,same augmented annots,masks must be equal.
+2.per batch time of loop and batched.
+example:
+python benchmark_dbnet_targets.py --batch-size 8 --polygon-num-list 10 50 200 --resize 960
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+import time
+import numpy as np
+
+import torchvision.transforms as transforms
+
+from simpleAICV.text_detection.common import RandomRotate, MainDirectionRandomRotate, Resize, DBNetTextDetectionCollater
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark DBNet Targets')
+    parser.add_argument('--batch-size', type=int, default=8, help='batch size')
+    parser.add_argument('--polygon-num-list',
+                        type=int,
+                        nargs='+',
+                        default=[10, 50, 200],
+                        help='polygon num per image')
+    parser.add_argument('--resize',
+                        type=int,
+                        default=960,
+                        help='collater resize')
+    parser.add_argument('--repeat-num',
+                        type=int,
+                        default=3,
+                        help='repeat num for timing')
+
+    return parser.parse_args()
+
+
+def get_synthetic_sample(polygon_num, resize):
+    # dataset resolution image is 1.5x~2.5x larger than resize,polygons are rotated quads and curved 14 points polygons
+    image_h, image_w = (np.random.uniform(1.5, 2.5, 2) * resize).astype(int)
+    annots = []
+    for i in range(polygon_num):
+        ctr = np.random.uniform(0, 1, 2) * [image_w, image_h]
+        w, h = np.exp(np.random.uniform(np.log(8), np.log(image_w / 3))), np.exp(
+            np.random.uniform(np.log(4), np.log(image_h / 10)))
+        if i % 3 == 2:
+            # curved text polygon
+            xs = np.linspace(-w / 2, w / 2, 7)
+            bend = np.sin(np.linspace(0, np.pi, 7)) * h
+            points = np.concatenate([
+                np.stack([xs, bend - h / 2], axis=1),
+                np.stack([xs[::-1], bend[::-1] + h / 2], axis=1)
+            ],
+                                    axis=0)
+        else:
+            points = np.array([[-w / 2, -h / 2], [w / 2, -h / 2],
+                               [w / 2, h / 2], [-w / 2, h / 2]])
+        rad = np.deg2rad(np.random.uniform(-30, 30))
+        rad_matrix = np.array([[np.cos(rad), -np.sin(rad)],
+                               [np.sin(rad), np.cos(rad)]])
+        points = np.dot(points, rad_matrix.T) + ctr
+        annots.append({
+            'points': points.astype(np.float32),
+            'label': 0,
+            'ignore': bool(np.random.uniform(0, 1) < 0.1),
+        })
+
+    return {
+        'image': np.zeros((image_h, image_w, 3), dtype=np.float32),
+        'annots': annots,
+        'scale': np.array(1.).astype(np.float32),
+        'size': np.array([image_h, image_w]).astype(np.float32),
+    }
+
+
+def timing(func, inputs, repeat_num):
+    outs = func(*inputs)
+    start_time = time.time()
+    for _ in range(repeat_num):
+        outs = func(*inputs)
+
+    return outs, (time.time() - start_time) / repeat_num
+
+
+def main():
+    args = parse_args()
+    np.random.seed(0)
+
+    collater = DBNetTextDetectionCollater(resize=args.resize,
+                                          min_box_size=3,
+                                          min_max_threshold=[0.3, 0.7],
+                                          shrink_ratio=0.6)
+    generate_mask = collater.generate_mask
+    transform = transforms.Compose([
+        RandomRotate(angle=[-30, 30], prob=0.5),
+        MainDirectionRandomRotate(angle=[0, 90, 180, 270],
+                                  prob=[0.7, 0.1, 0.1, 0.1]),
+        Resize(resize=args.resize),
+    ])
+    mask_names = [
+        'probability_mask', 'probability_ignore_mask', 'threshold_mask',
+        'threshold_ignore_mask'
+    ]
+
+    for polygon_num in args.polygon_num_list:
+        samples = [
+            get_synthetic_sample(polygon_num, args.resize)
+            for _ in range(args.batch_size)
+        ]
+        augmented_samples = [transform(per_sample) for per_sample in samples]
+
+        data = collater(augmented_samples)
+        images, annots, sizes = data['image'], [
+            per_sample['annots'] for per_sample in augmented_samples
+        ], data['size']
+
+        loop_masks, loop_time = timing(generate_mask.get_masks_per_polygon,
+                                       (images, annots, sizes),
+                                       args.repeat_num)
+        batch_masks, batch_time = timing(generate_mask,
+                                         (images, annots, sizes),
+                                         args.repeat_num)
+
+        equal_info = ','.join([
+            f'{per_name}:{np.array_equal(per_loop_mask, per_batch_mask)}'
+            for per_name, per_loop_mask, per_batch_mask in zip(
+                mask_names, loop_masks, batch_masks)
+        ])
+        print(
+            f'polygon_num:{polygon_num:<4d} loop:{loop_time*1000:.2f}ms, batch:{batch_time*1000:.2f}ms, speedup:{loop_time/batch_time:.2f}x'
+        )
+        print(f'    batch equal to loop:[{equal_info}]')
+
+    return
+
+
+if __name__ == '__main__':
+    main()
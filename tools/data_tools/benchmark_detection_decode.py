@@ -0,0 +1,227 @@
+'''
+check and benchmark RetinaDecoder/FCOSDecoder:
+1.previous numpy per image decode path vs batched tensor decode path on coco-style random head outputs,outputs must be same.
+2.class aware batched nms vs numpy per image per class nms.
+3.decode time of two paths.
+example:
+python benchmark_detection_decode.py --device cpu --batch-size 8 --image-size 640
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+import math
+import time
+import numpy as np
+
+import torch
+
+from simpleAICV.detection.decode import RetinaDecoder, FCOSDecoder
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark Detection Decode')
+    parser.add_argument('--device',
+                        type=str,
+                        default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='device of head outputs')
+    parser.add_argument('--batch-size', type=int, default=8, help='batch size')
+    parser.add_argument('--image-size',
+                        type=int,
+                        default=640,
+                        help='input image size')
+    parser.add_argument('--num-classes',
+                        type=int,
+                        default=80,
+                        help='class num')
+    parser.add_argument('--repeat-num',
+                        type=int,
+                        default=5,
+                        help='repeat num for timing')
+    parser.add_argument('--seed', type=int, default=0, help='seed')
+
+    return parser.parse_args()
+
+
+def get_head_outputs(batch_size, image_size, num_classes, anchor_num,
+                     strides, device):
+    # sigmoid scores,about 6% points large than 0.05,neighbour points give overlapped boxes for nms
+    cls_heads, reg_heads, center_heads = [], [], []
+    for stride in strides:
+        feature_size = math.ceil(image_size / stride)
+        shape = [batch_size, feature_size, feature_size]
+        if anchor_num > 0:
+            shape.append(anchor_num)
+        cls_heads.append(
+            torch.sigmoid(
+                torch.randn(shape + [num_classes], device=device) * 2 - 6))
+        if anchor_num > 0:
+            reg_heads.append(torch.randn(shape + [4], device=device) * 0.2)
+        else:
+            reg_heads.append(
+                torch.randn(shape + [4], device=device) * 0.5 +
+                math.log(stride * 2))
+        center_heads.append(
+            torch.sigmoid(torch.randn(shape + [1], device=device) + 2))
+
+    return cls_heads, reg_heads, center_heads
+
+
+def class_aware_numpy_decode(decode_function, cls_scores, cls_classes,
+                             pred_bboxes):
+    # reference:DecodeMethod score threshold+topn,then numpy nms for every class of every image
+    batch_size = cls_scores.shape[0]
+    max_object_num = decode_function.max_object_num
+    batch_scores = np.ones((batch_size, max_object_num), dtype=np.float32) * (-1)
+    batch_classes = np.ones(
+        (batch_size, max_object_num), dtype=np.float32) * (-1)
+    batch_bboxes = np.zeros((batch_size, max_object_num, 4), dtype=np.float32)
+    for i, (per_image_scores, per_image_classes,
+            per_image_bboxes) in enumerate(
+                zip(cls_scores, cls_classes, pred_bboxes)):
+        score_mask = per_image_scores > decode_function.min_score_threshold
+        scores = per_image_scores[score_mask].astype(np.float32)
+        classes = per_image_classes[score_mask].astype(np.float32)
+        bboxes = per_image_bboxes[score_mask].astype(np.float32)
+
+        sorted_indexes = np.argsort(-scores)[0:decode_function.topn]
+        scores, classes, bboxes = scores[sorted_indexes], classes[
+            sorted_indexes], bboxes[sorted_indexes]
+
+        keep = []
+        for per_class in np.unique(classes):
+            class_indexes = np.where(classes == per_class)[0]
+            class_keep = decode_function.nms_function(bboxes[class_indexes],
+                                                      scores[class_indexes])
+            keep.append(class_indexes[class_keep])
+        keep = np.sort(np.concatenate(keep))[0:max_object_num] if len(
+            keep) > 0 else np.zeros((0), dtype=np.int64)
+
+        batch_scores[i, 0:keep.shape[0]] = scores[keep]
+        batch_classes[i, 0:keep.shape[0]] = classes[keep]
+        batch_bboxes[i, 0:keep.shape[0]] = bboxes[keep]
+
+    return [batch_scores, batch_classes, batch_bboxes]
+
+
+def retina_numpy_inputs(decoder, preds):
+    # same cls_scores/cls_classes/pred_bboxes as RetinaDecoder numpy path
+    cls_preds, reg_preds = preds
+    feature_size = [[per_cls_pred.shape[2], per_cls_pred.shape[1]]
+                    for per_cls_pred in cls_preds]
+    one_image_anchors = np.concatenate([
+        per_level_anchor.reshape(-1, 4)
+        for per_level_anchor in decoder.anchors(feature_size)
+    ],
+                                       axis=0)
+    cls_preds = np.concatenate([
+        per_cls_pred.cpu().numpy().reshape(per_cls_pred.shape[0], -1,
+                                           per_cls_pred.shape[-1])
+        for per_cls_pred in cls_preds
+    ],
+                               axis=1)
+    reg_preds = np.concatenate([
+        per_reg_pred.cpu().numpy().reshape(per_reg_pred.shape[0], -1, 4)
+        for per_reg_pred in reg_preds
+    ],
+                               axis=1)
+    batch_anchors = np.repeat(np.expand_dims(one_image_anchors, axis=0),
+                              cls_preds.shape[0],
+                              axis=0)
+    cls_classes = np.argmax(cls_preds, axis=2)
+    cls_scores = np.take_along_axis(cls_preds,
+                                    np.expand_dims(cls_classes, axis=2),
+                                    axis=2).squeeze(-1)
+    pred_bboxes = decoder.snap_txtytwth_to_x1y1x2y2(reg_preds, batch_anchors)
+
+    return cls_scores, cls_classes, pred_bboxes
+
+
+def compare_outputs(numpy_outs, tensor_outs):
+    numpy_scores, numpy_classes, numpy_bboxes = numpy_outs
+    tensor_scores, tensor_classes, tensor_bboxes, valid_nums = [
+        per_out.cpu().numpy() for per_out in tensor_outs
+    ]
+    numpy_valid_nums = (numpy_classes != -1).sum(axis=1)
+    image_equal_num = sum(
+        np.array_equal(numpy_scores[i], tensor_scores[i])
+        and np.array_equal(numpy_classes[i], tensor_classes[i])
+        and np.array_equal(numpy_bboxes[i], tensor_bboxes[i])
+        for i in range(numpy_scores.shape[0]))
+
+    return {
+        'equal_images': f'{image_equal_num}/{numpy_scores.shape[0]}',
+        'valid_nums_equal': bool(np.array_equal(numpy_valid_nums,
+                                                valid_nums)),
+        'max_score_diff': float(np.abs(numpy_scores - tensor_scores).max()),
+        'max_bbox_diff': float(np.abs(numpy_bboxes - tensor_bboxes).max()),
+        'mean_valid_num': float(valid_nums.mean()),
+    }
+
+
+def timing(func, inputs, repeat_num, device):
+    outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start_time = time.time()
+    for _ in range(repeat_num):
+        outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+    return outs, (time.time() - start_time) / repeat_num
+
+
+def main():
+    args = parse_args()
+    device = torch.device(args.device)
+    torch.manual_seed(args.seed)
+
+    for name, decoder_class, anchor_num, nms_type, nms_threshold in [
+        ['RetinaDecoder', RetinaDecoder, 9, 'python_nms', 0.5],
+        ['RetinaDecoder', RetinaDecoder, 9, 'torch_nms', 0.5],
+        ['RetinaDecoder', RetinaDecoder, 9, 'diou_python_nms', 0.5],
+        ['FCOSDecoder', FCOSDecoder, 0, 'python_nms', 0.6],
+        ['FCOSDecoder', FCOSDecoder, 0, 'torch_nms', 0.6],
+        ['FCOSDecoder', FCOSDecoder, 0, 'diou_python_nms', 0.6],
+    ]:
+        decoder = decoder_class(topn=1000,
+                                min_score_threshold=0.05,
+                                nms_type=nms_type,
+                                nms_threshold=nms_threshold,
+                                max_object_num=100)
+        strides = [8, 16, 32, 64, 128]
+        cls_heads, reg_heads, center_heads = get_head_outputs(
+            args.batch_size, args.image_size, args.num_classes, anchor_num,
+            strides, device)
+        preds = [cls_heads, reg_heads
+                 ] if anchor_num > 0 else [cls_heads, reg_heads, center_heads]
+
+        numpy_outs, numpy_time = timing(decoder, [preds], args.repeat_num,
+                                        device)
+        tensor_outs, tensor_time = timing(decoder.batch_decode, [preds],
+                                          args.repeat_num, device)
+        print(
+            f'{name:<14s} {nms_type:<10s} numpy:{numpy_time*1000:.3f}ms, batch:{tensor_time*1000:.3f}ms, speedup:{numpy_time/tensor_time:.2f}x, {compare_outputs(numpy_outs, tensor_outs)}'
+        )
+
+        if name == 'RetinaDecoder':
+            decoder.batch_decode_function.class_aware_nms = True
+            class_aware_outs = decoder.batch_decode(preds)
+            decoder.batch_decode_function.class_aware_nms = False
+            class_aware_numpy_outs = class_aware_numpy_decode(
+                decoder.decode_function,
+                *retina_numpy_inputs(decoder, preds))
+            print(
+                f'{name:<14s} {nms_type:<10s} class aware nms, {compare_outputs(class_aware_numpy_outs, class_aware_outs)}'
+            )
+
+    return
+
+
+if __name__ == '__main__':
+    main()
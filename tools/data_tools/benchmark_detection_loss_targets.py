@@ -0,0 +1,271 @@
+'''
+check and benchmark batched loss target generation of detection losses on synthetic annotations:
+for every object num per image,compare batched get_batch_targets with per image loop get_batch_targets_per_image
+(max abs diff of every target tensor) and report time of both.
+for FCOSLoss,compare batched get_batch_position_annotations with get_batch_position_annotations_per_image
+(targets must be equal) and report time and peak memory(cuda only) of both.
+for RetinaLoss,compare batched get_batch_anchors_annotations with get_batch_anchors_annotations_per_image
+(positive/negative/ignore labels and box targets must be equal) and report time and peak memory(cuda only) of both.
+example:
+python benchmark_detection_loss_targets.py --device cpu --batch-size 8 --object-num-list 1 10 50 100 --image-size 512
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+import time
+import numpy as np
+
+import torch
+
+from simpleAICV.detection.losses import CenterNetLoss, TTFNetLoss, FCOSLoss, RetinaLoss
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark Detection Loss Targets')
+    parser.add_argument('--device',
+                        type=str,
+                        default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='device for targets generation')
+    parser.add_argument('--batch-size', type=int, default=8, help='batch size')
+    parser.add_argument('--object-num-list',
+                        type=int,
+                        nargs='+',
+                        default=[1, 10, 50, 100],
+                        help='object num per image')
+    parser.add_argument('--image-size',
+                        type=int,
+                        default=512,
+                        help='input image size')
+    parser.add_argument('--num-classes',
+                        type=int,
+                        default=80,
+                        help='class num')
+    parser.add_argument('--repeat-num',
+                        type=int,
+                        default=3,
+                        help='repeat num for timing')
+
+    return parser.parse_args()
+
+
+def get_synthetic_annotations(batch_size, object_num, image_size, num_classes,
+                              device):
+    # object box size is log uniform in [4,image_size/2],some images have less objects,padded with -1
+    annotations = np.ones((batch_size, object_num, 5), dtype=np.float32) * -1
+    for i in range(batch_size):
+        per_image_object_num = object_num if i % 2 == 0 else np.random.randint(
+            0, object_num + 1)
+        if per_image_object_num == 0:
+            continue
+        wh = np.exp(
+            np.random.uniform(np.log(4), np.log(image_size / 2),
+                              (per_image_object_num, 2)))
+        x1y1 = np.random.uniform(0, 1, (per_image_object_num, 2)) * (
+            image_size - wh)
+        annotations[i, 0:per_image_object_num, 0:2] = x1y1
+        annotations[i, 0:per_image_object_num, 2:4] = x1y1 + wh
+        annotations[i, 0:per_image_object_num,
+                    4] = np.random.randint(0, num_classes,
+                                           per_image_object_num)
+
+    return torch.from_numpy(annotations).to(device)
+
+
+def timing(func, inputs, repeat_num, device):
+    outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats(device)
+    start_time = time.time()
+    for _ in range(repeat_num):
+        outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        peak_memory = torch.cuda.max_memory_allocated(device) / 1024**2
+    else:
+        peak_memory = 0.
+
+    return outs, (time.time() - start_time) / repeat_num, peak_memory
+
+
+def compare_and_time(loss, heatmap_heads, annotations, repeat_num):
+    device = annotations.device
+    inputs = (heatmap_heads, annotations)
+
+    loop_outs, loop_time, _ = timing(loss.get_batch_targets_per_image, inputs,
+                                     repeat_num, device)
+    batch_outs, batch_time, _ = timing(loss.get_batch_targets, inputs,
+                                       repeat_num, device)
+
+    max_diff_list = [
+        torch.abs(per_batch_out.float() - per_loop_out.float()).max().item()
+        for per_batch_out, per_loop_out in zip(batch_outs, loop_outs)
+    ]
+
+    return max_diff_list, loop_time, batch_time
+
+
+def get_fcos_inputs(loss, batch_size, image_size, num_classes, device):
+    cls_heads, reg_heads, center_heads, feature_size = [], [], [], []
+    for stride in loss.strides:
+        per_level_size = int(np.ceil(image_size / stride))
+        feature_size.append([per_level_size, per_level_size])
+        cls_heads.append(
+            torch.zeros((batch_size, per_level_size, per_level_size,
+                         num_classes),
+                        device=device))
+        reg_heads.append(
+            torch.zeros((batch_size, per_level_size, per_level_size, 4),
+                        device=device))
+        center_heads.append(
+            torch.zeros((batch_size, per_level_size, per_level_size, 1),
+                        device=device))
+    batch_positions = [
+        torch.tensor(per_level_position).unsqueeze(0).repeat(
+            batch_size, 1, 1, 1).to(device)
+        for per_level_position in loss.positions(feature_size)
+    ]
+
+    return cls_heads, reg_heads, center_heads, batch_positions
+
+
+def compare_and_time_fcos(loss, fcos_inputs, annotations, repeat_num):
+    device = annotations.device
+    inputs = (*fcos_inputs, annotations, loss.use_center_sample)
+
+    loop_outs, loop_time, loop_memory = timing(
+        loss.get_batch_position_annotations_per_image, inputs, repeat_num,
+        device)
+    batch_outs, batch_time, batch_memory = timing(
+        loss.get_batch_position_annotations, inputs, repeat_num, device)
+
+    # batch_targets 8:l,t,r,b,class_index,center-ness_gt,point_ctr_x,point_ctr_y
+    loop_targets, batch_targets = loop_outs[-1], batch_outs[-1]
+    is_equal = torch.equal(
+        torch.nan_to_num(loop_targets, nan=-1.),
+        torch.nan_to_num(batch_targets, nan=-1.)) and all(
+            torch.equal(per_batch_out, per_loop_out)
+            for per_batch_out, per_loop_out in zip(batch_outs[:-1],
+                                                   loop_outs[:-1]))
+    positive_num = (batch_targets[:, :, 4] > 0).sum().item()
+
+    return is_equal, positive_num, loop_time, batch_time, loop_memory, batch_memory
+
+
+def get_retina_batch_anchors(loss, batch_size, image_size, device):
+    feature_size = []
+    for stride in loss.anchors.strides:
+        per_level_size = int(np.ceil(image_size / stride))
+        feature_size.append([per_level_size, per_level_size])
+    one_image_anchors = torch.cat([
+        torch.tensor(per_level_anchor).view(-1, per_level_anchor.shape[-1])
+        for per_level_anchor in loss.anchors(feature_size)
+    ],
+                                  dim=0)
+    batch_anchors = one_image_anchors.unsqueeze(0).repeat(batch_size, 1,
+                                                          1).to(device)
+
+    return batch_anchors
+
+
+def compare_and_time_retina(loss, batch_anchors, annotations, repeat_num):
+    device = annotations.device
+    inputs = (batch_anchors, annotations)
+
+    loop_outs, loop_time, loop_memory = timing(
+        loss.get_batch_anchors_annotations_per_image, inputs, repeat_num,
+        device)
+    batch_outs, batch_time, batch_memory = timing(
+        loss.get_batch_anchors_annotations, inputs, repeat_num, device)
+
+    # anchors annotations 5:box targets,class_index(-1:ignore,0:negative,>0:positive)
+    is_equal = torch.equal(torch.nan_to_num(loop_outs, nan=-1.),
+                           torch.nan_to_num(batch_outs, nan=-1.))
+    label_nums = [(batch_outs[:, :, 4] > 0).sum().item(),
+                  (batch_outs[:, :, 4] == 0).sum().item(),
+                  (batch_outs[:, :, 4] < 0).sum().item()]
+
+    return is_equal, label_nums, loop_time, batch_time, loop_memory, batch_memory
+
+
+def main():
+    args = parse_args()
+    device = torch.device(args.device)
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    feature_size = args.image_size // 4
+    heatmap_heads = torch.zeros(
+        (args.batch_size, args.num_classes, feature_size, feature_size),
+        device=device)
+
+    loss_dict = {
+        'CenterNetLoss':
+        CenterNetLoss(max_object_num=max(100, max(args.object_num_list))),
+        'TTFNetLoss':
+        TTFNetLoss(gaussian_alpha=0.54, gaussian_beta=0.54),
+        'TTFNetLoss_beta':
+        TTFNetLoss(gaussian_alpha=0.54, gaussian_beta=0.8),
+    }
+    fcos_loss_dict = {
+        'FCOSLoss':
+        FCOSLoss(use_center_sample=True),
+        'FCOSLoss_nocs':
+        FCOSLoss(use_center_sample=False),
+        # small chunk to check chunked assign
+        'FCOSLoss_chunk':
+        FCOSLoss(use_center_sample=True, assign_max_chunk_elements=2**14),
+    }
+    retina_loss_dict = {
+        'RetinaLoss':
+        RetinaLoss(box_loss_type='CIoU'),
+        'RetinaLoss_sl1':
+        RetinaLoss(box_loss_type='SmoothL1'),
+        # small chunk to check chunked assign
+        'RetinaLoss_chunk':
+        RetinaLoss(box_loss_type='CIoU', assign_max_chunk_elements=2**14),
+    }
+    batch_anchors = get_retina_batch_anchors(retina_loss_dict['RetinaLoss'],
+                                             args.batch_size, args.image_size,
+                                             device)
+    fcos_inputs = get_fcos_inputs(fcos_loss_dict['FCOSLoss'], args.batch_size,
+                                  args.image_size, args.num_classes, device)
+    for object_num in args.object_num_list:
+        annotations = get_synthetic_annotations(args.batch_size, object_num,
+                                                args.image_size,
+                                                args.num_classes, device)
+        for loss_name, loss in loss_dict.items():
+            max_diff_list, loop_time, batch_time = compare_and_time(
+                loss, heatmap_heads, annotations, args.repeat_num)
+            max_diff_info = ','.join(
+                [f'{per_diff:.6f}' for per_diff in max_diff_list])
+            print(
+                f'{loss_name:<16s} object_num:{object_num:<4d} loop:{loop_time*1000:.2f}ms, batch:{batch_time*1000:.2f}ms, speedup:{loop_time/batch_time:.2f}x, targets max_diff:[{max_diff_info}]'
+            )
+
+        for loss_name, loss in fcos_loss_dict.items():
+            is_equal, positive_num, loop_time, batch_time, loop_memory, batch_memory = compare_and_time_fcos(
+                loss, fcos_inputs, annotations, args.repeat_num)
+            print(
+                f'{loss_name:<16s} object_num:{object_num:<4d} loop:{loop_time*1000:.2f}ms, batch:{batch_time*1000:.2f}ms, speedup:{loop_time/batch_time:.2f}x, peak memory loop:{loop_memory:.1f}MB, batch:{batch_memory:.1f}MB, positive_num:{positive_num}, targets equal:{is_equal}'
+            )
+
+        for loss_name, loss in retina_loss_dict.items():
+            is_equal, label_nums, loop_time, batch_time, loop_memory, batch_memory = compare_and_time_retina(
+                loss, batch_anchors, annotations, args.repeat_num)
+            print(
+                f'{loss_name:<16s} object_num:{object_num:<4d} loop:{loop_time*1000:.2f}ms, batch:{batch_time*1000:.2f}ms, speedup:{loop_time/batch_time:.2f}x, peak memory loop:{loop_memory:.1f}MB, batch:{batch_memory:.1f}MB, positive/negative/ignore num:{label_nums}, targets equal:{is_equal}'
+            )
+
+    return
+
+
+if __name__ == '__main__':
+    main()
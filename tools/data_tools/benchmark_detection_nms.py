@@ -0,0 +1,219 @@
+'''
+check and benchmark DetNMSMethod batch_nms engine:
+1.per image keep indexes of batch_nms must be same as numpy python_nms/diou_python_nms loop(and per class loop for class aware nms).
+2.nms time over candidate nums:numpy per image loop vs one matrix vs blockwise matrix vs default batch_nms,
+default batch_nms uses matrix nms for at most matrix_nms_max_box_num valid boxes per image,
+torchvision nms(python_nms) or per image chunked cluster nms(diou_python_nms) for more boxes.
+example:
+python benchmark_detection_nms.py --device cpu --batch-size 8 --box-num-list 100 300 1000 3000
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+import time
+import numpy as np
+
+import torch
+
+from simpleAICV.detection.decode import DetNMSMethod
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark Detection NMS')
+    parser.add_argument('--device',
+                        type=str,
+                        default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='device of boxes')
+    parser.add_argument('--batch-size', type=int, default=8, help='batch size')
+    parser.add_argument('--box-num-list',
+                        type=int,
+                        nargs='+',
+                        default=[100, 300, 1000, 3000],
+                        help='padded candidate box num per image')
+    parser.add_argument('--num-classes',
+                        type=int,
+                        default=80,
+                        help='class num')
+    parser.add_argument('--nms-block-size',
+                        type=int,
+                        default=512,
+                        help='blockwise batch_nms block size')
+    parser.add_argument('--matrix-nms-max-box-num',
+                        type=int,
+                        default=200,
+                        help='default batch_nms max valid box num for matrix nms')
+    parser.add_argument('--repeat-num',
+                        type=int,
+                        default=3,
+                        help='repeat num for timing')
+    parser.add_argument('--seed', type=int, default=0, help='seed')
+
+    return parser.parse_args()
+
+
+def get_padded_boxes(batch_size, box_num, num_classes, image_size=640):
+    # coco-style boxes:jittered copies around some objects,integer coords like decoder outputs
+    batch_bboxes = np.zeros((batch_size, box_num, 4), dtype=np.float32)
+    batch_scores = np.ones((batch_size, box_num), dtype=np.float32) * (-1)
+    batch_classes = np.ones((batch_size, box_num), dtype=np.float32) * (-1)
+    valid_mask = np.zeros((batch_size, box_num), dtype=bool)
+    for i in range(batch_size):
+        valid_num = np.random.randint(box_num // 2, box_num + 1)
+        object_num = max(valid_num // 20, 1)
+        object_ctrs = np.random.uniform(0, image_size, (object_num, 2))
+        object_whs = np.random.uniform(16, image_size / 3, (object_num, 2))
+        object_classes = np.random.randint(0, num_classes, (object_num))
+        object_indexes = np.random.randint(0, object_num, (valid_num))
+        ctrs = object_ctrs[object_indexes] + np.random.normal(
+            0, 0.15, (valid_num, 2)) * object_whs[object_indexes]
+        whs = object_whs[object_indexes] * np.exp(
+            np.random.normal(0, 0.2, (valid_num, 2)))
+        bboxes = np.concatenate([ctrs - whs / 2, ctrs + whs / 2], axis=1)
+        batch_bboxes[i, 0:valid_num] = bboxes.astype(np.int32)
+        batch_scores[i, 0:valid_num] = np.random.uniform(
+            0.05, 1, (valid_num))
+        # some boxes change to another class
+        classes = object_classes[object_indexes]
+        change_mask = np.random.uniform(0, 1, (valid_num)) < 0.2
+        classes[change_mask] = np.random.randint(0, num_classes,
+                                                 (change_mask.sum()))
+        batch_classes[i, 0:valid_num] = classes
+        valid_mask[i, 0:valid_num] = True
+
+    return batch_bboxes, batch_scores, batch_classes, valid_mask
+
+
+def numpy_nms(nms_function, batch_bboxes, batch_scores, batch_classes,
+              valid_mask, class_aware):
+    # reference:DetNMSMethod numpy loop for every image(and every class)
+    batch_keep = []
+    for per_image_bboxes, per_image_scores, per_image_classes, per_image_valid_mask in zip(
+            batch_bboxes, batch_scores, batch_classes, valid_mask):
+        valid_indexes = np.where(per_image_valid_mask)[0]
+        sorted_indexes = valid_indexes[np.argsort(
+            -per_image_scores[valid_indexes], kind='stable')]
+        if not class_aware:
+            keep = sorted_indexes[nms_function(
+                per_image_bboxes[sorted_indexes],
+                per_image_scores[sorted_indexes])]
+        else:
+            keep = []
+            for per_class in np.unique(per_image_classes[sorted_indexes]):
+                class_indexes = sorted_indexes[
+                    per_image_classes[sorted_indexes] == per_class]
+                keep.append(class_indexes[nms_function(
+                    per_image_bboxes[class_indexes],
+                    per_image_scores[class_indexes])])
+            keep = np.concatenate(keep)
+            keep = keep[np.argsort(-per_image_scores[keep], kind='stable')]
+        batch_keep.append(keep.astype(np.int64))
+
+    return batch_keep
+
+
+def timing(func, inputs, repeat_num, device):
+    outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start_time = time.time()
+    for _ in range(repeat_num):
+        outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+    return outs, (time.time() - start_time) / repeat_num
+
+
+def main():
+    args = parse_args()
+    device = torch.device(args.device)
+    np.random.seed(args.seed)
+
+    for box_num in args.box_num_list:
+        batch_bboxes, batch_scores, batch_classes, valid_mask = get_padded_boxes(
+            args.batch_size, box_num, args.num_classes)
+        tensor_inputs = [
+            torch.from_numpy(batch_bboxes).to(device),
+            torch.from_numpy(batch_scores).to(device),
+            torch.from_numpy(batch_classes).to(device),
+            torch.from_numpy(valid_mask).to(device),
+        ]
+        for nms_type, nms_threshold in [
+            ['python_nms', 0.5],
+            ['diou_python_nms', 0.5],
+            ['torch_nms', 0.5],
+        ]:
+            for class_aware in [False, True]:
+                numpy_nms_function = DetNMSMethod(nms_type=nms_type,
+                                                  nms_threshold=nms_threshold)
+                matrix_nms_function = DetNMSMethod(
+                    nms_type=nms_type,
+                    nms_threshold=nms_threshold,
+                    nms_block_size=box_num,
+                    matrix_nms_max_box_num=box_num)
+                block_nms_function = DetNMSMethod(
+                    nms_type=nms_type,
+                    nms_threshold=nms_threshold,
+                    nms_block_size=args.nms_block_size,
+                    matrix_nms_max_box_num=box_num)
+                default_nms_function = DetNMSMethod(
+                    nms_type=nms_type,
+                    nms_threshold=nms_threshold,
+                    nms_block_size=args.nms_block_size,
+                    matrix_nms_max_box_num=args.matrix_nms_max_box_num)
+
+                numpy_keep, numpy_time = timing(
+                    numpy_nms, [
+                        numpy_nms_function, batch_bboxes, batch_scores,
+                        batch_classes, valid_mask, class_aware
+                    ], args.repeat_num, device)
+
+                def matrix_func():
+                    return matrix_nms_function.batch_nms(
+                        *tensor_inputs, class_aware=class_aware)
+
+                def block_func():
+                    return block_nms_function.batch_nms(
+                        *tensor_inputs, class_aware=class_aware)
+
+                def default_func():
+                    return default_nms_function.batch_nms(
+                        *tensor_inputs, class_aware=class_aware)
+
+                matrix_keep, matrix_time = timing(matrix_func, [],
+                                                  args.repeat_num, device)
+                block_keep, block_time = timing(block_func, [],
+                                                args.repeat_num, device)
+                default_keep, default_time = timing(default_func, [],
+                                                    args.repeat_num, device)
+                matrix_equal = all(
+                    np.array_equal(per_numpy_keep,
+                                   per_matrix_keep.cpu().numpy())
+                    for per_numpy_keep, per_matrix_keep in zip(
+                        numpy_keep, matrix_keep))
+                block_equal = all(
+                    np.array_equal(per_numpy_keep,
+                                   per_block_keep.cpu().numpy())
+                    for per_numpy_keep, per_block_keep in zip(
+                        numpy_keep, block_keep))
+                default_equal = all(
+                    np.array_equal(per_numpy_keep,
+                                   per_default_keep.cpu().numpy())
+                    for per_numpy_keep, per_default_keep in zip(
+                        numpy_keep, default_keep))
+                keep_num = np.mean(
+                    [per_numpy_keep.shape[0] for per_numpy_keep in numpy_keep])
+                print(
+                    f'box_num:{box_num:<5d} {nms_type:<15s} class_aware:{str(class_aware):<5s} numpy:{numpy_time*1000:.3f}ms, matrix:{matrix_time*1000:.3f}ms, block:{block_time*1000:.3f}ms, default:{default_time*1000:.3f}ms, matrix equal:{matrix_equal}, block equal:{block_equal}, default equal:{default_equal}, mean keep num:{keep_num:.1f}'
+                )
+
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+'''
+check and benchmark DETRLoss/DINODETRLoss hungarian matching:
+1.previous per image cost+serial scipy matching vs batched cost matrices with serial/pool match backend,
+serial and pool assignments must be same as previous.
+2.matching time of one training step(DETR:last layer,DINO:last+aux+interm layers).
+example:
+python benchmark_hungarian_matcher.py --device cpu --batch-size 8 --num-workers 4
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+import time
+import numpy as np
+
+import torch
+import torch.nn.functional as F
+
+from simpleAICV.detection.losses import DETRLoss, DINODETRLoss
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark Hungarian Matcher')
+    parser.add_argument('--device',
+                        type=str,
+                        default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='device of preds')
+    parser.add_argument('--batch-size', type=int, default=8, help='batch size')
+    parser.add_argument('--max-gt-num',
+                        type=int,
+                        default=40,
+                        help='max gt num per image')
+    parser.add_argument('--num-workers',
+                        type=int,
+                        default=4,
+                        help='pool backend worker num')
+    parser.add_argument('--repeat-num',
+                        type=int,
+                        default=3,
+                        help='repeat num for timing')
+    parser.add_argument('--seed', type=int, default=0, help='seed')
+
+    return parser.parse_args()
+
+
+def get_annotations(batch_size, max_gt_num, num_classes, device):
+    # coco-style normalized [cx,cy,w,h,class] annots,padded by -1
+    annotations = torch.ones((batch_size, max_gt_num, 5)) * (-1)
+    for i in range(batch_size):
+        gt_num = np.random.randint(0, max_gt_num + 1)
+        if gt_num == 0:
+            continue
+        wh = torch.rand((gt_num, 2)) * 0.5 + 0.02
+        ctr = wh / 2 + torch.rand((gt_num, 2)) * (1 - wh)
+        annotations[i, 0:gt_num, 0:2] = ctr
+        annotations[i, 0:gt_num, 2:4] = wh
+        annotations[i, 0:gt_num, 4] = torch.randint(0, num_classes,
+                                                    (gt_num, )).float()
+
+    return annotations.to(device)
+
+
+def old_get_matched_pred_target_idxs(loss, cls_preds, reg_preds, annotations):
+    # previous DETRLoss/DINODETRLoss version:cost between all queries and all gts of batch,per image cpu copy and solve
+    batch_size, query_nums = cls_preds.shape[0], cls_preds.shape[1]
+    cls_preds = cls_preds.flatten(0, 1)
+    if isinstance(loss, DINODETRLoss):
+        cls_preds = torch.sigmoid(cls_preds)
+    else:
+        cls_preds = F.softmax(cls_preds, dim=-1)
+    cls_preds = torch.clamp(cls_preds, min=1e-4, max=1. - 1e-4)
+
+    reg_preds = reg_preds.flatten(0, 1)
+    if isinstance(loss, DINODETRLoss):
+        reg_preds = torch.clamp(reg_preds, min=1e-4, max=1. - 1e-4)
+
+    batch_gt_boxes_annot = []
+    per_image_gt_boxes_num = []
+    for per_image_boxes_annot in annotations:
+        per_image_boxes_annot = per_image_boxes_annot[
+            per_image_boxes_annot[:, 4] >= 0]
+        batch_gt_boxes_annot.append(per_image_boxes_annot)
+        per_image_gt_boxes_num.append(per_image_boxes_annot.shape[0])
+    batch_gt_boxes_annot = torch.cat(batch_gt_boxes_annot, dim=0)
+    batch_gt_boxes = batch_gt_boxes_annot[:, 0:4]
+    batch_gt_boxes_label = batch_gt_boxes_annot[:, 4]
+
+    if isinstance(loss, DINODETRLoss):
+        neg_cls_cost = (1 - loss.alpha) * (cls_preds**loss.gamma) * (
+            -torch.log(1 - cls_preds + 1e-4))
+        pos_cls_cost = loss.alpha * (
+            (1 - cls_preds)**loss.gamma) * (-torch.log(cls_preds + 1e-4))
+        cls_cost = pos_cls_cost[:, batch_gt_boxes_label.long(
+        )] - neg_cls_cost[:, batch_gt_boxes_label.long()]
+    else:
+        cls_cost = -cls_preds[:, batch_gt_boxes_label.long()]
+
+    box_cost = torch.cdist(reg_preds, batch_gt_boxes, p=1)
+
+    reg_preds = loss.transform_cxcywh_box_to_xyxy_box(reg_preds)
+    batch_gt_boxes = loss.transform_cxcywh_box_to_xyxy_box(batch_gt_boxes)
+
+    giou_cost = -loss.compute_box_giou(reg_preds, batch_gt_boxes)
+    total_cost = loss.cls_match_cost * cls_cost + loss.box_match_cost * box_cost + loss.giou_match_cost * giou_cost
+    total_cost = total_cost.view(batch_size, query_nums, -1)
+
+    indices = []
+    for idx, per_image_cost in enumerate(
+            total_cost.split(per_image_gt_boxes_num, -1)):
+        indices.append(
+            loss.linear_sum_assignment_with_inf(
+                per_image_cost[idx].cpu().numpy()))
+
+    indices = [(torch.as_tensor(i, dtype=torch.int64),
+                torch.as_tensor(j, dtype=torch.int64)) for i, j in indices]
+
+    return indices
+
+
+def old_match_step(loss, preds_list, annotations):
+    return [
+        old_get_matched_pred_target_idxs(loss, cls_preds, reg_preds,
+                                         annotations)
+        for cls_preds, reg_preds in preds_list
+    ]
+
+
+def new_match_step(loss, preds_list, annotations):
+    if isinstance(loss, DINODETRLoss):
+        return loss.get_all_matched_pred_target_idxs(preds_list, annotations)
+
+    return [
+        loss.get_matched_pred_target_idxs(cls_preds, reg_preds, annotations)
+        for cls_preds, reg_preds in preds_list
+    ]
+
+
+def compare_indices(loss, preds_list, annotations, old_indices, new_indices):
+    equal_num, total_num, max_cost_gap = 0, 0, 0.
+    for (cls_preds, reg_preds), per_layer_old_indices, per_layer_new_indices in zip(
+            preds_list, old_indices, new_indices):
+        gt_boxes, gt_labels, gt_nums = get_padded_targets(annotations)
+        batch_cost = loss.get_batch_match_cost(cls_preds, reg_preds, gt_boxes,
+                                               gt_labels).cpu()
+        for per_cost, (old_i, old_j), (new_i, new_j) in zip(
+                batch_cost, per_layer_old_indices, per_layer_new_indices):
+            total_num += 1
+            if torch.equal(old_i, new_i) and torch.equal(old_j, new_j):
+                equal_num += 1
+            old_cost = per_cost[old_i, old_j].double().sum()
+            new_cost = per_cost[new_i, new_j].double().sum()
+            max_cost_gap = max(max_cost_gap, float(new_cost - old_cost))
+
+    return f'equal:{equal_num}/{total_num}, max cost gap:{max_cost_gap:.2e}'
+
+
+def get_padded_targets(annotations):
+    from simpleAICV.detection.hungarian_matcher import get_batch_padded_targets
+    return get_batch_padded_targets(annotations)
+
+
+def timing(func, inputs, repeat_num, device):
+    outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start_time = time.time()
+    for _ in range(repeat_num):
+        outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+    return outs, (time.time() - start_time) / repeat_num
+
+
+def main():
+    args = parse_args()
+    device = torch.device(args.device)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    num_classes = 80
+    annotations = get_annotations(args.batch_size, args.max_gt_num,
+                                  num_classes, device)
+    print(
+        f'gt nums:{(annotations[:, :, 4] >= 0).sum(dim=1).cpu().tolist()}')
+
+    # DETR:100 queries,81 cls logits,match last layer
+    # DINO:900 queries,80 cls logits,match last+5 aux+interm layers
+    for name, loss_class, query_nums, cls_nums, layer_nums in [
+        ['DETRLoss', DETRLoss, 100, num_classes + 1, 1],
+        ['DINODETRLoss', DINODETRLoss, 900, num_classes, 7],
+    ]:
+        preds_list = [[
+            torch.randn((args.batch_size, query_nums, cls_nums),
+                        device=device) * 2,
+            torch.rand((args.batch_size, query_nums, 4), device=device) *
+            0.6 + 0.05
+        ] for _ in range(layer_nums)]
+
+        old_loss = loss_class(num_classes=num_classes)
+        old_indices, old_time = timing(old_match_step,
+                                       [old_loss, preds_list, annotations],
+                                       args.repeat_num, device)
+        print(f'{name:<13s} previous serial: {old_time*1000:.3f}ms')
+
+        for match_backend in ['serial', 'pool']:
+            loss = loss_class(num_classes=num_classes,
+                              match_backend=match_backend,
+                              match_num_workers=args.num_workers)
+            new_indices, new_time = timing(new_match_step,
+                                           [loss, preds_list, annotations],
+                                           args.repeat_num, device)
+            print(
+                f'{name:<13s} batch cost+{match_backend:<8s}: {new_time*1000:.3f}ms, speedup:{old_time/new_time:.2f}x, {compare_indices(loss, preds_list, annotations, old_indices, new_indices)}'
+            )
+            loss.matcher.close()
+
+    return
+
+
+if __name__ == '__main__':
+    main()
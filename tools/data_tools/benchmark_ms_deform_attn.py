@@ -0,0 +1,192 @@
+'''
+check and benchmark ms_deform_attn_core_pytorch:
+1.per level grid_sample version(training/jit trace) vs level-fused embedding_bag version(eager inference) vs level-fused gather version(onnx export only),outputs and traced grads must be close.
+2.forward time at multiple query nums(decoder queries and encoder tokens),traced version must run grid_sample.
+3.torch.onnx.export(if onnx is installed) check for level-fused gather version.
+example:
+python benchmark_ms_deform_attn.py --device cpu --batch-size 2 --query-num-list 300 900 5000 --image-size 640
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+import io
+import math
+import time
+
+import torch
+import torch.nn.functional as F
+
+from simpleAICV.detection.models.multiscale_deformable_attention import ms_deform_attn_core_pytorch_grid_sample, ms_deform_attn_core_pytorch_gather, ms_deform_attn_core_pytorch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark Multi Scale Deformable Attention')
+    parser.add_argument('--device',
+                        type=str,
+                        default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help='device')
+    parser.add_argument('--batch-size', type=int, default=2, help='batch size')
+    parser.add_argument('--image-size',
+                        type=int,
+                        default=640,
+                        help='input image size')
+    parser.add_argument('--query-num-list',
+                        type=int,
+                        nargs='+',
+                        default=[300, 900, 3000, 9000],
+                        help='query num')
+    parser.add_argument('--head-num', type=int, default=8, help='head num')
+    parser.add_argument('--head-dim', type=int, default=32, help='head dim')
+    parser.add_argument('--point-num', type=int, default=4, help='point num')
+    parser.add_argument('--repeat-num',
+                        type=int,
+                        default=10,
+                        help='repeat num for timing')
+    parser.add_argument('--seed', type=int, default=0, help='seed')
+
+    return parser.parse_args()
+
+
+def get_inputs(args, query_num, device):
+    value_spatial_shapes = torch.tensor(
+        [[math.ceil(args.image_size / stride),
+          math.ceil(args.image_size / stride)] for stride in [8, 16, 32, 64]],
+        dtype=torch.int64,
+        device=device)
+    level_num = value_spatial_shapes.shape[0]
+    value_num = int(
+        (value_spatial_shapes[:, 0] * value_spatial_shapes[:, 1]).sum())
+
+    value = torch.randn(args.batch_size,
+                        value_num,
+                        args.head_num,
+                        args.head_dim,
+                        device=device)
+    # include sampling locations out of feature map to check zero padding
+    sampling_locations = torch.rand(args.batch_size,
+                                    query_num,
+                                    args.head_num,
+                                    level_num,
+                                    args.point_num,
+                                    2,
+                                    device=device) * 1.2 - 0.1
+    attention_weights = torch.rand(args.batch_size,
+                                   query_num,
+                                   args.head_num,
+                                   level_num,
+                                   args.point_num,
+                                   device=device)
+    attention_weights = attention_weights / attention_weights.sum(
+        dim=(-2, -1), keepdim=True)
+
+    return value, value_spatial_shapes, sampling_locations, attention_weights
+
+
+def forward_backward(func, value, value_spatial_shapes, sampling_locations,
+                     attention_weights):
+    value = value.detach().requires_grad_(True)
+    sampling_locations = sampling_locations.detach().requires_grad_(True)
+    attention_weights = attention_weights.detach().requires_grad_(True)
+    output = func(value, value_spatial_shapes, sampling_locations,
+                  attention_weights)
+    output.sum().backward()
+
+    return [
+        output.detach(), value.grad, sampling_locations.grad,
+        attention_weights.grad
+    ]
+
+
+def timing(func, inputs, repeat_num, device):
+    outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start_time = time.time()
+    for _ in range(repeat_num):
+        outs = func(*inputs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+    return outs, (time.time() - start_time) / repeat_num
+
+
+def get_max_diff(outs1, outs2):
+    return max((per_out1 - per_out2).abs().max().item()
+               for per_out1, per_out2 in zip(outs1, outs2))
+
+
+def get_max_relative_diff(outs1, outs2):
+    return max(((per_out1 - per_out2).abs().max() /
+                per_out1.abs().max().clamp(min=1e-12)).item()
+               for per_out1, per_out2 in zip(outs1, outs2))
+
+
+def onnx_export_check(inputs):
+    try:
+        import onnx
+    except ImportError:
+        return 'onnx export:skip(onnx is not installed)'
+
+    class MSDeformAttnCore(torch.nn.Module):
+
+        def forward(self, value, value_spatial_shapes, sampling_locations,
+                    attention_weights):
+            return ms_deform_attn_core_pytorch(value, value_spatial_shapes,
+                                               sampling_locations,
+                                               attention_weights)
+
+    onnx_file = io.BytesIO()
+    torch.onnx.export(MSDeformAttnCore(),
+                      inputs,
+                      onnx_file,
+                      opset_version=16,
+                      dynamo=False,
+                      input_names=[
+                          'value', 'value_spatial_shapes',
+                          'sampling_locations', 'attention_weights'
+                      ],
+                      output_names=['output'])
+    onnx.checker.check_model(onnx.load_from_string(onnx_file.getvalue()))
+
+    return 'onnx export:ok'
+
+
+def main():
+    args = parse_args()
+    torch.manual_seed(args.seed)
+    device = torch.device(args.device)
+
+    for query_num in args.query_num_list:
+        inputs = get_inputs(args, query_num, device)
+        traced_func = torch.jit.trace(ms_deform_attn_core_pytorch, inputs)
+        with torch.no_grad():
+            old_outs, old_time = timing(
+                ms_deform_attn_core_pytorch_grid_sample, inputs,
+                args.repeat_num, device)
+            new_outs, new_time = timing(ms_deform_attn_core_pytorch, inputs,
+                                        args.repeat_num, device)
+            traced_outs, traced_time = timing(traced_func, inputs,
+                                              args.repeat_num, device)
+            gather_outs, gather_time = timing(
+                ms_deform_attn_core_pytorch_gather, inputs, args.repeat_num,
+                device)
+        old_grads = forward_backward(ms_deform_attn_core_pytorch_grid_sample,
+                                     *inputs)
+        traced_grads = forward_backward(traced_func, *inputs)
+        print(
+            f'query_num:{query_num:<6d} forward grid_sample:{old_time*1000:.3f}ms, fused:{new_time*1000:.3f}ms, speedup:{old_time/new_time:.2f}x, traced:{traced_time*1000:.3f}ms, speedup:{old_time/traced_time:.2f}x, export gather:{gather_time*1000:.3f}ms, speedup:{old_time/gather_time:.2f}x, fused max diff:{get_max_diff([old_outs], [new_outs]):.2e}, gather max diff:{get_max_diff([old_outs], [gather_outs]):.2e}, traced max diff:{get_max_diff([old_outs], [traced_outs]):.2e}, traced grad max relative diff:{get_max_relative_diff(old_grads[1:], traced_grads[1:]):.2e}'
+        )
+
+    print(onnx_export_check(get_inputs(args, args.query_num_list[0], device)))
+
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''
+benchmark full resolution decode vs reduced resolution decode(cv2.IMREAD_REDUCED_COLOR_2/4/8) on sample images
+example:
+python benchmark_reduced_resolution_decode.py --image-dir /root/autodl-tmp/SAM1B/sa_000000 --resize 1024 --resize-type sam
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+import cv2
+import time
+import numpy as np
+
+from simpleAICV.classification.common import TorchResize, TorchRandomResizedCrop, decode_image_with_reduced_resolution
+from simpleAICV.detection.common import DetectionResize
+from simpleAICV.interactive_segmentation.common import SamResize
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark Reduced Resolution Decode')
+    parser.add_argument('--image-dir', type=str, help='sample images dir')
+    parser.add_argument('--image-num',
+                        type=int,
+                        default=200,
+                        help='max sample image num')
+    parser.add_argument('--resize',
+                        type=int,
+                        default=224,
+                        help='resize transform target size')
+    parser.add_argument(
+        '--resize-type',
+        type=str,
+        default='classification_resize',
+        help=
+        'classification_resize,classification_random_resized_crop,detection or sam'
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    transform_dict = {
+        'classification_resize': TorchResize(resize=args.resize),
+        'classification_random_resized_crop':
+        TorchRandomResizedCrop(resize=args.resize),
+        'detection': DetectionResize(resize=args.resize),
+        'sam': SamResize(resize=args.resize),
+    }
+    transform = transform_dict[args.resize_type]
+
+    image_bytes_list = []
+    for per_image_name in sorted(os.listdir(args.image_dir)):
+        if per_image_name.split('.')[-1].lower() not in ['jpg', 'jpeg']:
+            continue
+        image_bytes_list.append(
+            np.fromfile(os.path.join(args.image_dir, per_image_name),
+                        dtype=np.uint8))
+        if len(image_bytes_list) >= args.image_num:
+            break
+
+    start_time = time.time()
+    full_pixel_num = 0
+    for per_image_bytes in image_bytes_list:
+        image = cv2.imdecode(per_image_bytes, cv2.IMREAD_COLOR)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32)
+        full_pixel_num += image.shape[0] * image.shape[1]
+    full_decode_time = (time.time() -
+                        start_time) / len(image_bytes_list) * 1000
+
+    start_time = time.time()
+    reduced_pixel_num = 0
+    for per_image_bytes in image_bytes_list:
+        image, _, _ = decode_image_with_reduced_resolution(
+            per_image_bytes, transform)
+        reduced_pixel_num += image.shape[0] * image.shape[1]
+    reduced_decode_time = (time.time() -
+                           start_time) / len(image_bytes_list) * 1000
+
+    print(
+        f'image num:{len(image_bytes_list)}, resize type:{args.resize_type}, resize:{args.resize}'
+    )
+    print(
+        f'full decode:{full_decode_time:.3f}ms/image, reduced decode:{reduced_decode_time:.3f}ms/image, decoded pixels ratio:{reduced_pixel_num / full_pixel_num:.3f}'
+    )
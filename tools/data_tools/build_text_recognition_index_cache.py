@@ -0,0 +1,59 @@
+'''
+build CNENTextRecognition index cache before training,so all ranks only load mmap index cache
+example:
+python build_text_recognition_index_cache.py --root-dir /root/autodl-tmp/text_recognition_dataset --index-cache-dir /root/autodl-tmp/text_recognition_dataset_index_cache --set-type train --set-name aistudio_baidu_street chinese_dataset
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+
+from simpleAICV.text_recognition.datasets.text_recognition_index_cache import build_text_recognition_index_cache_if_stale
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Build Text Recognition Index Cache')
+    parser.add_argument('--root-dir',
+                        type=str,
+                        help='text recognition dataset root dir')
+    parser.add_argument('--index-cache-dir',
+                        type=str,
+                        help='dir for saving index cache')
+    parser.add_argument('--set-name',
+                        type=str,
+                        nargs='+',
+                        help='sub dataset names')
+    parser.add_argument('--set-type',
+                        type=str,
+                        default='train',
+                        help='train or test')
+    parser.add_argument('--num-processes',
+                        type=int,
+                        default=16,
+                        help='processes for checking images and reading image size')
+    # store_true即命令行有这个参数时，值为True,没有这个参数时，默认值为False
+    parser.add_argument('--force',
+                        default=False,
+                        action='store_true',
+                        help='rebuild index cache even if it is not stale')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for per_set_name in args.set_name:
+        # same file lock as datasets,so building while training ranks load cache is safe
+        if not build_text_recognition_index_cache_if_stale(
+                args.root_dir,
+                per_set_name,
+                args.set_type,
+                args.index_cache_dir,
+                num_processes=args.num_processes,
+                force=args.force):
+            print(f'{per_set_name}_{args.set_type} index cache is up to date')
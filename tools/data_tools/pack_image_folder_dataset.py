@@ -0,0 +1,51 @@
+'''
+pack ILSVRC2012/ImageNet21K style image folder dataset into shard files for PackedImageDataset
+example:
+python pack_image_folder_dataset.py --root-dir /root/autodl-tmp/ILSVRC2012 --packed-dir /root/autodl-tmp/ILSVRC2012_packed --set-name train
+'''
+import os
+import sys
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(BASE_DIR)
+
+import argparse
+
+from simpleAICV.classification.datasets.imagenet21kdataset import filter_image_name_list
+from simpleAICV.classification.datasets.packedimagedataset import pack_image_folder_dataset
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Pack Image Folder Dataset')
+    parser.add_argument('--root-dir',
+                        type=str,
+                        help='dataset root dir,root_dir/set_name/class_name')
+    parser.add_argument('--packed-dir',
+                        type=str,
+                        help='dir for saving shard files and index file')
+    parser.add_argument('--set-name',
+                        type=str,
+                        default='train',
+                        help='train or val')
+    parser.add_argument('--shard-size',
+                        type=int,
+                        default=1024,
+                        help='max shard file size(MB)')
+    # store_true即命令行有这个参数时，值为True,没有这个参数时，默认值为False
+    parser.add_argument('--imagenet21k',
+                        default=False,
+                        action='store_true',
+                        help='filter ImageNet21K broken images')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    pack_image_folder_dataset(args.root_dir,
+                              args.packed_dir,
+                              set_name=args.set_name,
+                              shard_size=args.shard_size * 1024 * 1024,
+                              filter_image_name_list=filter_image_name_list
+                              if args.imagenet21k else [])
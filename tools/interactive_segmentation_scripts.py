@@ -1,4 +1,5 @@
 import collections
+import math
 import numpy as np
 import time
 from tqdm import tqdm
@@ -57,6 +58,76 @@ class EvalMeter:
         self.iou_average = self.iou_list / self.sample_num
 
 
+def get_binary_pred_masks(pred_masks, mask_threshold, config):
+    # mask outputs are binary masks,sigmoid probs or logits depend on binary_mask_out/sigmoid_out
+    if config.binary_mask_out:
+        return pred_masks.float()
+    elif config.sigmoid_out:
+        mask_threshold = 1. / (1. + math.exp(-mask_threshold))
+
+    return (pred_masks.float() > mask_threshold).float()
+
+
+def get_correction_batch_prompts(model, batch_image_embeddings, batch_masks,
+                                 sizes, batch_prompts, correction_point_iters,
+                                 config):
+    '''
+    iterative correction prompts:every iteration predicts masks with previous prompts,appends one correction point
+    from error region of best iou mask to point prompts of every mask and uses binary best iou mask as mask prompt.
+    iterations run without gradient on batch_image_embeddings of training forward,loss is computed on prompts of
+    last iteration.
+    '''
+    per_image_mask_num = batch_masks.shape[0] // len(batch_prompts)
+    mask_sizes = sizes.repeat_interleave(per_image_mask_num, dim=0)
+    prompt_mask_size = (batch_masks.shape[2] // 4, batch_masks.shape[3] // 4)
+
+    batch_image_embeddings = batch_image_embeddings.detach()
+    with torch.no_grad():
+        with autocast(enabled=config.use_amp):
+            for _ in range(correction_point_iters):
+                pred_masks = []
+                for per_image_embedding, per_image_prompt in zip(
+                        batch_image_embeddings, batch_prompts):
+                    [per_mask_outputs], [
+                        per_iou_outputs
+                    ] = model.module.forward_per_image_prompt_encoder_mask_decoder(
+                        per_image_embedding.unsqueeze(0), [per_image_prompt],
+                        config.mask_out_idxs)
+                    best_idxs = per_iou_outputs.argmax(dim=1)
+                    pred_masks.append(per_mask_outputs[
+                        torch.arange(per_mask_outputs.shape[0]),
+                        best_idxs].unsqueeze(1))
+                pred_masks = get_binary_pred_masks(
+                    torch.cat(pred_masks, dim=0),
+                    model.module.mask_threshold, config)
+
+                correction_points = config.train_prompt_sampler.sample_correction_points(
+                    pred_masks, batch_masks, mask_sizes)
+                prompt_masks = F.interpolate(pred_masks,
+                                             size=prompt_mask_size,
+                                             mode='nearest')
+
+                new_batch_prompts = []
+                for image_idx, per_image_prompt in enumerate(batch_prompts):
+                    start, end = image_idx * per_image_mask_num, (
+                        image_idx + 1) * per_image_mask_num
+                    per_image_points = correction_points[start:end]
+                    if per_image_prompt['prompt_point'] is not None:
+                        per_image_points = torch.cat([
+                            per_image_prompt['prompt_point'].to(
+                                per_image_points.device), per_image_points
+                        ],
+                                                     dim=1)
+                    new_batch_prompts.append({
+                        'prompt_point': per_image_points,
+                        'prompt_box': per_image_prompt['prompt_box'],
+                        'prompt_mask': prompt_masks[start:end],
+                    })
+                batch_prompts = new_batch_prompts
+
+    return batch_prompts
+
+
 def train_sam(train_loader, model, criterion, optimizer, scheduler, epoch,
               logger, config):
     '''
@@ -84,6 +155,18 @@ def train_sam(train_loader, model, criterion, optimizer, scheduler, epoch,
             'batch_mask'], data['batch_prompt']
         batch_images, batch_masks = batch_images.cuda(), batch_masks.cuda()
 
+        if hasattr(config,
+                   'train_prompt_sampler') and config.train_prompt_sampler:
+            # prompts are sampled on device for whole batch,dataset prompts are not used
+            sizes = torch.from_numpy(data['size']).cuda()
+            origin_sizes = torch.from_numpy(
+                np.array(data['origin_size'], dtype=np.float32)).cuda()
+            boxes = torch.cat(
+                [per_box.view(-1, 4) for per_box in data['box']],
+                dim=0).cuda()
+            batch_prompts = config.train_prompt_sampler(
+                batch_masks, sizes, origin_sizes, boxes)['batch_prompt']
+
         prompt_points_prob = config.train_prompt_probs['prompt_point']
         prompt_boxs_prob = config.train_prompt_probs['prompt_box']
         prompt_masks_prob = config.train_prompt_probs['prompt_mask']
@@ -172,32 +255,63 @@ def train_sam(train_loader, model, criterion, optimizer, scheduler, epoch,
         if torch.sum(batch_images) == 0:
             continue
 
+        batch_image_embeddings = None
+        if hasattr(config, 'train_correction_point_iters'
+                   ) and config.train_correction_point_iters > 0:
+            assert hasattr(
+                config, 'train_prompt_sampler'
+            ) and config.train_prompt_sampler, 'correction points need train_prompt_sampler!'
+            # random iterations,model also learns from prompts without correction points
+            correction_point_iters = np.random.randint(
+                0, config.train_correction_point_iters + 1)
+            if correction_point_iters > 0:
+                # image encoder runs once with gradient,embeddings are shared by correction iterations and loss forward
+                with autocast(enabled=config.use_amp):
+                    batch_image_embeddings = model.module.forward_per_image_encoder(
+                        batch_images)
+                batch_prompts = get_correction_batch_prompts(
+                    model, batch_image_embeddings, batch_masks,
+                    torch.from_numpy(data['size']).cuda(), batch_prompts,
+                    correction_point_iters, config)
+
         if config.use_amp:
             with autocast():
                 if iter_index % config.accumulation_steps == 0:
                     batch_mask_outputs, batch_iou_outputs = model(
-                        batch_images, batch_prompts, config.mask_out_idxs)
+                        batch_images,
+                        batch_prompts,
+                        config.mask_out_idxs,
+                        batch_image_embeddings=batch_image_embeddings)
                     loss_value = criterion(
                         [batch_mask_outputs, batch_iou_outputs], batch_masks)
                 else:
                     # not reduce gradient while iter_index % config.accumulation_steps != 0
                     with model.no_sync():
                         batch_mask_outputs, batch_iou_outputs = model(
-                            batch_images, batch_prompts, config.mask_out_idxs)
+                            batch_images,
+                            batch_prompts,
+                            config.mask_out_idxs,
+                            batch_image_embeddings=batch_image_embeddings)
                         loss_value = criterion(
                             [batch_mask_outputs, batch_iou_outputs],
                             batch_masks)
         else:
             if iter_index % config.accumulation_steps == 0:
                 batch_mask_outputs, batch_iou_outputs = model(
-                    batch_images, batch_prompts, config.mask_out_idxs)
+                    batch_images,
+                    batch_prompts,
+                    config.mask_out_idxs,
+                    batch_image_embeddings=batch_image_embeddings)
                 loss_value = criterion([batch_mask_outputs, batch_iou_outputs],
                                        batch_masks)
             else:
                 # not reduce gradient while iter_index % config.accumulation_steps != 0
                 with model.no_sync():
                     batch_mask_outputs, batch_iou_outputs = model(
-                        batch_images, batch_prompts, config.mask_out_idxs)
+                        batch_images,
+                        batch_prompts,
+                        config.mask_out_idxs,
+                        batch_image_embeddings=batch_image_embeddings)
                     loss_value = criterion(
                         [batch_mask_outputs, batch_iou_outputs], batch_masks)
 
@@ -2,7 +2,10 @@ CIFAR10_path = '/root/autodl-tmp/CIFAR10'
 CIFAR100_path = '/root/autodl-tmp/CIFAR100'
 ILSVRC2012_path = '/root/autodl-tmp/ILSVRC2012'
 ImageNet21K_path = '/root/autodl-tmp/ImageNet21K'
+ILSVRC2012_packed_path = '/root/autodl-tmp/ILSVRC2012_packed'
+ImageNet21K_packed_path = '/root/autodl-tmp/ImageNet21K_packed'
 COCO2017_path = '/root/autodl-tmp/COCO2017'
+coco_annotation_store_path = '/root/autodl-tmp/COCO2017_annotation_store'
 SAMA_COCO_path = '/root/autodl-tmp/SAMA-COCO'
 Objects365_path = '/root/autodl-tmp/objects365_2020'
 VOCdataset_path = '/root/autodl-tmp/VOCdataset'
@@ -11,13 +14,16 @@ ImageNet_S_path = '/root/autodl-tmp/ImageNet-S'
 CelebAHQ_path = '/root/autodl-tmp/CelebA-HQ'
 FFHQ_path = '/root/autodl-tmp/FFHQ'
 NVIDIA_Irregular_Mask_Dataset_test_mask_path = '/root/autodl-tmp/NVIDIA_Irregular_Mask_Dataset/test_mask/'
+mask_bank_path = '/dev/shm/NVIDIA_Irregular_Mask_Dataset_mask_bank'
 Places365_Standard_High_resolution_images_path = '/root/autodl-tmp/Places365-Standard/high_resolution_images/'
 Places365_Challenge_High_resolution_images_path = '/root/autodl-tmp/Places365-Challenge-2016/high_resolution_images/'
 accv2022_dataset_path = '/root/autodl-tmp/ACCV2022'
 accv2022_broken_list_path = '/root/autodl-tmp/ACCV2022/accv2022_broken_list.json'
 text_detection_dataset_path = '/root/autodl-tmp/text_detection_dataset'
 text_recognition_dataset_path = '/root/autodl-tmp/text_recognition_dataset'
+text_recognition_index_cache_path = '/root/autodl-tmp/text_recognition_dataset_index_cache'
 sam1b_dataset_path = '/root/autodl-tmp/SAM1B'
+sam1b_mask_index_path = '/root/autodl-tmp/SAM1B_mask_index'
 human_matting_dataset_path = '/root/autodl-tmp/human_matting'
 salient_object_detection_dataset_path = '/root/autodl-tmp/salient_object_detection_resize1920'
 open_images_v7_dataset_path = '/root/autodl-tmp/open_images_v7'
@@ -16,6 +16,7 @@ from torch.utils.data import DataLoader
 from torch.cuda.amp import autocast
 
 import pycocotools.mask as mask_util
+from pycocotools.coco import COCO
 from pycocotools.cocoeval import COCOeval
 
 from simpleAICV.classification.common import AverageMeter, AccMeter
@@ -63,6 +64,10 @@ def test_classification(test_loader, model, criterion, config):
             if model_on_cuda:
                 images, labels = images.cuda(), labels.cuda()
 
+            # uint8 images from ClassificationUint8Collater are normalized on device
+            if images.dtype == torch.uint8:
+                images = config.uint8_image_normalize(images)
+
             torch.cuda.synchronize()
             data_time.update(time.time() - end)
             end = time.time()
@@ -140,7 +145,25 @@ def train_classification(train_loader, model, criterion, optimizer, scheduler,
 
     for _, data in enumerate(train_loader):
         images, labels = data['image'], data['label']
-        images, labels = images.cuda(), labels.cuda()
+        images, labels = images.cuda(non_blocking=True), labels.cuda(
+            non_blocking=True)
+
+        # post-collate batch augmentation on device,output float normalized images
+        if hasattr(config, 'train_batch_transform'
+                   ) and config.train_batch_transform:
+            # origin image sizes from Uint8ResizeWithOriginSize,crop boxes are sampled on origin sizes
+            sizes = data['size'].cuda(
+                non_blocking=True) if 'size' in data.keys() else None
+            images = config.train_batch_transform(images, sizes)
+
+        # uint8 images from ClassificationUint8Collater are normalized on device
+        if images.dtype == torch.uint8:
+            images = config.uint8_image_normalize(images)
+
+        # mixup/cutmix on device,labels become soft labels
+        if hasattr(config,
+                   'train_mixup_cutmix') and config.train_mixup_cutmix:
+            images, labels = config.train_mixup_cutmix(images, labels)
 
         if torch.any(torch.isinf(images)) or torch.any(torch.isinf(labels)):
             continue
@@ -757,7 +780,9 @@ def evaluate_coco_detection(test_loader, model, criterion, decoder, config):
             return result_dict
 
         # load results in COCO evaluation tool
-        coco_true = test_dataset.coco
+        # dataset using annotation store has no pycocotools COCO object
+        coco_true = test_dataset.coco if test_dataset.coco is not None else COCO(
+            test_dataset.annot_dir)
         coco_pred = coco_true.loadRes(results)
 
         coco_eval = COCOeval(coco_true, coco_pred, 'bbox')
@@ -808,6 +833,12 @@ def train_detection(train_loader, model, criterion, optimizer, scheduler,
         images, targets = data['image'], data['annots']
         images, targets = images.cuda(), targets.cuda()
 
+        if hasattr(config, 'train_batch_transform'
+                   ) and config.train_batch_transform:
+            scaled_sizes = torch.from_numpy(data['scaled_size']).cuda()
+            data = config.train_batch_transform(images, targets, scaled_sizes)
+            images, targets = data['image'], data['annots']
+
         if 'detr' in config.network:
             targets = data['scaled_annots']
             targets = targets.cuda()
@@ -1389,7 +1420,9 @@ def evaluate_coco_instance_segmentation(test_loader, model, criterion, decoder,
             return result_dict
 
         # load results in COCO evaluation tool
-        coco_true = test_dataset.coco
+        # dataset using annotation store has no pycocotools COCO object
+        coco_true = test_dataset.coco if test_dataset.coco is not None else COCO(
+            test_dataset.annot_dir)
         coco_pred = coco_true.loadRes(results)
 
         coco_eval = COCOeval(coco_true, coco_pred, 'segm')
@@ -1582,8 +1615,15 @@ def train_mae_self_supervised_learning(train_loader, model, criterion,
     assert config.accumulation_steps >= 1, 'illegal accumulation_steps!'
 
     for _, data in enumerate(train_loader):
-        images, labels = data['image'], data['label']
-        images, labels = images.cuda(), labels.cuda()
+        images = data['image']
+        images = images.cuda()
+
+        if 'label' in data.keys():
+            labels = data['label']
+            labels = labels.cuda()
+        else:
+            # collater with label_on_device=True only ships images,compute patch labels on device
+            labels = config.train_collater.get_labels(images)
 
         if torch.any(torch.isinf(images)) or torch.any(torch.isinf(labels)):
             continue
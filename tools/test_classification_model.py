@@ -82,6 +82,8 @@ def main():
     logger.info(log_info) if local_rank == 0 else None
 
     model = model.cuda()
+    if hasattr(config, 'channels_last') and config.channels_last:
+        model = model.to(memory_format=torch.channels_last)
     test_criterion = test_criterion.cuda()
 
     model = nn.parallel.DistributedDataParallel(model,
@@ -7,7 +7,6 @@ sys.path.append(BASE_DIR)
 warnings.filterwarnings('ignore')
 
 import argparse
-import functools
 import re
 import time
 
@@ -15,7 +14,8 @@ import torch
 from torch.utils.data import DataLoader
 
 from tools.scripts import train_detection, test_detection
-from tools.utils import (get_logger, set_seed, worker_seed_init_fn,
+from tools.utils import (get_logger, set_seed, WorkerSeedInitFn,
+                         get_all_rank_rng_state, load_rank_rng_state,
                          build_optimizer, Scheduler, build_training_mode)
 
 
@@ -65,10 +65,9 @@ def main():
     batch_size = int(config.batch_size // config.gpus_num)
     num_workers = int(config.num_workers // config.gpus_num)
 
-    init_fn = functools.partial(worker_seed_init_fn,
-                                num_workers=num_workers,
-                                local_rank=local_rank,
-                                seed=config.seed)
+    init_fn = WorkerSeedInitFn(num_workers=num_workers,
+                               local_rank=local_rank,
+                               seed=config.seed)
     train_sampler = torch.utils.data.distributed.DistributedSampler(
         config.train_dataset, shuffle=True)
     train_loader = DataLoader(config.train_dataset,
@@ -136,6 +135,9 @@ def main():
     best_metric, metric, test_loss = 0, 0, 0
     if os.path.exists(resume_model):
         checkpoint = torch.load(resume_model, map_location=torch.device('cpu'))
+        if 'rng_state_list' in checkpoint.keys():
+            load_rank_rng_state(checkpoint['rng_state_list'], local_rank,
+                                train_sampler)
         model.load_state_dict(checkpoint['model_state_dict'])
         optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
         scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
@@ -185,6 +187,7 @@ def main():
         torch.cuda.empty_cache()
 
         train_sampler.set_epoch(epoch)
+        init_fn.set_epoch(epoch)
         train_loss = train_detection(train_loader, model, train_criterion,
                                      optimizer, scheduler, epoch, logger,
                                      config)
@@ -211,6 +214,9 @@ def main():
 
         train_time += (time.time() - per_epoch_start_time) / 3600
 
+        # all ranks rng state,saved in latest.pth for reproducible resume
+        rng_state_list = get_all_rank_rng_state(train_sampler)
+
         if local_rank == 0:
             # save best metric model and each epoch checkpoint
             if metric > best_metric and metric <= 100:
@@ -252,6 +258,8 @@ def main():
                         optimizer.state_dict(),
                         'scheduler_state_dict':
                         scheduler.state_dict(),
+                        'rng_state_list':
+                        rng_state_list,
                     }, os.path.join(checkpoint_dir, 'latest.pth'))
             else:
                 torch.save(
@@ -264,6 +272,7 @@ def main():
                         'model_state_dict': save_checkpoint_model,
                         'optimizer_state_dict': optimizer.state_dict(),
                         'scheduler_state_dict': scheduler.state_dict(),
+                        'rng_state_list': rng_state_list,
                     }, os.path.join(checkpoint_dir, 'latest.pth'))
 
         log_info = f'until epoch: {epoch:0>3d}, best_metric: {best_metric:.3f}%'
@@ -11,7 +11,6 @@ sys.path.append(BASE_DIR)
 warnings.filterwarnings('ignore')
 
 import argparse
-import functools
 import math
 import re
 import time
@@ -20,7 +19,8 @@ import torch
 from torch.utils.data import DataLoader
 
 from tools.scripts import train_dino_self_supervised_learning
-from tools.utils import (get_logger, set_seed, worker_seed_init_fn,
+from tools.utils import (get_logger, set_seed, WorkerSeedInitFn,
+                         get_all_rank_rng_state, load_rank_rng_state,
                          build_optimizer, build_training_mode)
 
 
@@ -160,10 +160,9 @@ def main():
     batch_size = int(config.batch_size // config.gpus_num)
     num_workers = int(config.num_workers // config.gpus_num)
 
-    init_fn = functools.partial(worker_seed_init_fn,
-                                num_workers=num_workers,
-                                local_rank=local_rank,
-                                seed=config.seed)
+    init_fn = WorkerSeedInitFn(num_workers=num_workers,
+                               local_rank=local_rank,
+                               seed=config.seed)
     train_sampler = torch.utils.data.distributed.DistributedSampler(
         config.train_dataset, shuffle=True)
     train_loader = DataLoader(config.train_dataset,
@@ -252,6 +251,9 @@ def main():
     best_loss, train_loss = 1e9, 0
     if os.path.exists(resume_model):
         checkpoint = torch.load(resume_model, map_location=torch.device('cpu'))
+        if 'rng_state_list' in checkpoint.keys():
+            load_rank_rng_state(checkpoint['rng_state_list'], local_rank,
+                                train_sampler)
         teacher_model.load_state_dict(checkpoint['teacher_model_state_dict'])
         student_model.load_state_dict(checkpoint['student_model_state_dict'])
         student_optimizer.load_state_dict(
@@ -306,6 +308,7 @@ def main():
         torch.cuda.empty_cache()
 
         train_sampler.set_epoch(epoch)
+        init_fn.set_epoch(epoch)
         train_loss = train_dino_self_supervised_learning(
             train_loader, teacher_model, student_model, train_criterion,
             student_optimizer, lr_scheduler, weight_decay_scheduler,
@@ -317,6 +320,9 @@ def main():
 
         train_time += (time.time() - per_epoch_start_time) / 3600
 
+        # all ranks rng state,saved in latest.pth for reproducible resume
+        rng_state_list = get_all_rank_rng_state(train_sampler)
+
         if local_rank == 0:
             # save best acc1 model and each epoch checkpoint
             if train_loss < best_loss:
@@ -373,6 +379,8 @@ def main():
                     weight_decay_scheduler.state_dict(),
                     'momentum_teacher_scheduler_state_dict':
                     momentum_teacher_scheduler.state_dict(),
+                    'rng_state_list':
+                    rng_state_list,
                 }, os.path.join(checkpoint_dir, 'latest.pth'))
 
         log_info = f'until epoch: {epoch:0>3d}, best_loss: {best_loss:.4f}'
@@ -7,7 +7,6 @@ sys.path.append(BASE_DIR)
 warnings.filterwarnings('ignore')
 
 import argparse
-import functools
 import re
 import time
 
@@ -17,7 +16,8 @@ from torch.utils.data import DataLoader
 from torch.cuda.amp import GradScaler
 
 from tools.interactive_segmentation_scripts import train_sam
-from tools.utils import (get_logger, set_seed, worker_seed_init_fn,
+from tools.utils import (get_logger, set_seed, WorkerSeedInitFn,
+                         get_all_rank_rng_state, load_rank_rng_state,
                          build_optimizer, Scheduler, EmaModel)
 
 
@@ -93,10 +93,20 @@ def main():
     batch_size = int(config.batch_size // config.gpus_num)
     num_workers = int(config.num_workers // config.gpus_num)
 
-    init_fn = functools.partial(worker_seed_init_fn,
-                                num_workers=num_workers,
-                                local_rank=local_rank,
-                                seed=config.seed)
+    if hasattr(config,
+               'train_prompt_sampler') and config.train_prompt_sampler:
+        # prompts are sampled on device by train_prompt_sampler,train_dataset in train_config should skip numpy prompts generation in workers
+        for key in [
+                'positive_points_num', 'negative_points_num',
+                'box_noise_pixel', 'mask_noise_pixel'
+        ]:
+            assert getattr(
+                config.train_dataset, key, 0
+            ) == 0, f'train_prompt_sampler needs train_dataset with {key}=0!'
+
+    init_fn = WorkerSeedInitFn(num_workers=num_workers,
+                               local_rank=local_rank,
+                               seed=config.seed)
     train_sampler = torch.utils.data.distributed.DistributedSampler(
         config.train_dataset, shuffle=True)
     train_loader = DataLoader(config.train_dataset,
@@ -155,6 +165,9 @@ def main():
     best_loss, train_loss = 1e9, 0
     if os.path.exists(resume_model):
         checkpoint = torch.load(resume_model, map_location=torch.device('cpu'))
+        if 'rng_state_list' in checkpoint.keys():
+            load_rank_rng_state(checkpoint['rng_state_list'], local_rank,
+                                train_sampler)
         model.load_state_dict(checkpoint['model_state_dict'])
         optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
         scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
@@ -204,6 +217,7 @@ def main():
         torch.cuda.empty_cache()
 
         train_sampler.set_epoch(epoch)
+        init_fn.set_epoch(epoch)
         train_loss = train_sam(train_loader, model, train_criterion, optimizer,
                                scheduler, epoch, logger, config)
         log_info = f'train: epoch {epoch:0>3d}, train_loss: {train_loss:.4f}'
@@ -224,6 +238,9 @@ def main():
                 torch.save(save_model,
                            os.path.join(checkpoint_dir, f'epoch_{epoch}.pth'))
 
+        # all ranks rng state,saved in latest.pth for reproducible resume
+        rng_state_list = get_all_rank_rng_state(train_sampler)
+
         if local_rank == 0:
             # save best acc1 model and each epoch checkpoint
             if train_loss < best_loss:
@@ -265,6 +282,8 @@ def main():
                         optimizer.state_dict(),
                         'scheduler_state_dict':
                         scheduler.state_dict(),
+                        'rng_state_list':
+                        rng_state_list,
                     }, os.path.join(checkpoint_dir, 'latest.pth'))
             else:
                 torch.save(
@@ -277,6 +296,7 @@ def main():
                         'model_state_dict': save_checkpoint_model,
                         'optimizer_state_dict': optimizer.state_dict(),
                         'scheduler_state_dict': scheduler.state_dict(),
+                        'rng_state_list': rng_state_list,
                     }, os.path.join(checkpoint_dir, 'latest.pth'))
 
         log_info = f'until epoch: {epoch:0>3d}, best_loss: {best_loss:.4f}'
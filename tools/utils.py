@@ -14,7 +14,6 @@ import math
 import numpy as np
 import os
 import random
-import time
 
 from thop import profile
 from thop import clever_format
@@ -106,13 +105,112 @@ def set_seed(seed):
     cudnn.deterministic = True
 
 
-def worker_seed_init_fn(worker_id, num_workers, local_rank, seed):
-    # worker_seed_init_fn function will be called at the beginning of each epoch
-    # for each epoch the same worker has same seed value,so we add the current time to the seed
-    worker_seed = num_workers * local_rank + worker_id + seed + int(
-        time.time())
-    np.random.seed(worker_seed)
-    random.seed(worker_seed)
+class WorkerSeedInitFn:
+    '''
+    dataloader worker_init_fn,worker seed is derived from base seed,epoch,rank and worker id,
+    so every epoch has different augmentation random stream but two runs with same seed are same.
+    call set_epoch before each epoch like DistributedSampler.set_epoch,workers are recreated
+    at the beginning of each epoch(persistent_workers=False) and get the new epoch value.
+    '''
+
+    def __init__(self, num_workers, local_rank, seed):
+        self.num_workers = num_workers
+        self.local_rank = local_rank
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __call__(self, worker_id):
+        worker_seed = get_worker_seed(self.seed, self.epoch, self.local_rank,
+                                      worker_id)
+        np.random.seed(worker_seed)
+        random.seed(worker_seed)
+        torch.manual_seed(worker_seed)
+
+
+def get_worker_seed(seed, epoch, local_rank, worker_id):
+    # SeedSequence mixes all inputs,so nearby (epoch,rank,worker_id) don't get nearby seeds
+    worker_seed = np.random.SeedSequence([seed, epoch, local_rank,
+                                          worker_id]).generate_state(1)[0]
+
+    return int(worker_seed)
+
+
+def get_rng_state(train_sampler=None):
+    '''
+    main process python/numpy/torch/cuda rng state and train sampler state,
+    only contain tensors and python objects,so it can be saved in checkpoint and loaded with weights_only.
+    '''
+    numpy_state = np.random.get_state()
+    rng_state = {
+        'python': random.getstate(),
+        'numpy': {
+            'key': torch.from_numpy(numpy_state[1].astype(np.int64)),
+            'pos': int(numpy_state[2]),
+            'has_gauss': int(numpy_state[3]),
+            'cached_gaussian': float(numpy_state[4]),
+        },
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        # only current device,avoid creating cuda context on other gpus
+        rng_state['cuda'] = torch.cuda.get_rng_state()
+    if train_sampler is not None:
+        rng_state['sampler'] = {
+            'seed': train_sampler.seed,
+            'epoch': train_sampler.epoch,
+        }
+
+    return rng_state
+
+
+def set_rng_state(rng_state, train_sampler=None):
+    random.setstate(rng_state['python'])
+    np.random.set_state((
+        'MT19937',
+        rng_state['numpy']['key'].numpy().astype(np.uint32),
+        rng_state['numpy']['pos'],
+        rng_state['numpy']['has_gauss'],
+        rng_state['numpy']['cached_gaussian'],
+    ))
+    torch.set_rng_state(rng_state['torch'])
+    if 'cuda' in rng_state.keys() and torch.cuda.is_available():
+        torch.cuda.set_rng_state(rng_state['cuda'])
+    if train_sampler is not None and 'sampler' in rng_state.keys():
+        train_sampler.seed = rng_state['sampler']['seed']
+        train_sampler.set_epoch(rng_state['sampler']['epoch'])
+
+
+def get_all_rank_rng_state(train_sampler=None):
+    '''
+    gather rng state of all ranks,must be called by all ranks,list index is rank.
+    '''
+    rng_state = get_rng_state(train_sampler)
+    if not (torch.distributed.is_available()
+            and torch.distributed.is_initialized()):
+        return [rng_state]
+
+    rng_state_list = [None for _ in range(torch.distributed.get_world_size())]
+    torch.distributed.all_gather_object(rng_state_list, rng_state)
+
+    return rng_state_list
+
+
+def load_rank_rng_state(rng_state_list, local_rank, train_sampler=None):
+    '''
+    restore rng state of current rank,return False if checkpoint is saved with different gpu num.
+    '''
+    world_size = torch.distributed.get_world_size() if (
+        torch.distributed.is_available()
+        and torch.distributed.is_initialized()) else 1
+    if len(rng_state_list) != world_size:
+        return False
+
+    set_rng_state(rng_state_list[local_rank], train_sampler)
+
+    return True
 
 
 def compute_macs_and_params(config, model):
@@ -588,3 +686,77 @@ def build_optimizer(config, model):
         return Lion(model_params_weight_decay_list,
                     lr=lr,
                     betas=(beta1, beta2)), model_layer_weight_decay_list
+
+
+if __name__ == '__main__':
+    # cpu check:two runs with same seed produce bit-identical batches,
+    # and a run resumed from saved rng state replays the same epoch
+    from torch.utils.data import Dataset, DataLoader
+
+    class RandomAugmentDataset(Dataset):
+
+        def __len__(self):
+            return 64
+
+        def __getitem__(self, idx):
+            return torch.tensor([
+                idx,
+                np.random.uniform(0, 1),
+                random.uniform(0, 1),
+                torch.rand(1).item(),
+            ],
+                                dtype=torch.float64)
+
+    def run_epochs(seed, start_epoch, end_epoch, rng_state_list=None):
+        set_seed(seed)
+        dataset = RandomAugmentDataset()
+        init_fn = WorkerSeedInitFn(num_workers=2, local_rank=0, seed=seed)
+        train_sampler = torch.utils.data.distributed.DistributedSampler(
+            dataset, num_replicas=1, rank=0, shuffle=True)
+        train_loader = DataLoader(dataset,
+                                  batch_size=8,
+                                  shuffle=False,
+                                  drop_last=True,
+                                  num_workers=2,
+                                  sampler=train_sampler,
+                                  worker_init_fn=init_fn)
+        # model init consumes main process rng
+        _ = torch.rand(100)
+        if rng_state_list is not None:
+            load_rank_rng_state(rng_state_list, 0, train_sampler)
+
+        epoch_batches, epoch_rng_state_list = {}, {}
+        for epoch in range(start_epoch, end_epoch + 1):
+            train_sampler.set_epoch(epoch)
+            init_fn.set_epoch(epoch)
+            batches = []
+            for per_batch in train_loader:
+                # main process random op,like dropout/mixup
+                per_batch = torch.cat(
+                    [per_batch, torch.rand(per_batch.shape[0], 1).double()],
+                    dim=1)
+                batches.append(per_batch)
+            epoch_batches[epoch] = torch.cat(batches, dim=0)
+            epoch_rng_state_list[epoch] = get_all_rank_rng_state(
+                train_sampler)
+
+        return epoch_batches, epoch_rng_state_list
+
+    seed = 0
+    batches1, rng_state_lists = run_epochs(seed, 1, 3)
+    batches2, _ = run_epochs(seed, 1, 3)
+    for epoch in range(1, 4):
+        assert torch.equal(batches1[epoch], batches2[epoch])
+    assert not torch.equal(batches1[1][:, 1:], batches1[2][:, 1:])
+    print('two runs produce bit-identical batches')
+
+    # save rng state in checkpoint and resume from epoch 3
+    checkpoint_path = '/tmp/worker_seed_rng_state_check.pth'
+    torch.save({'rng_state_list': rng_state_lists[2]}, checkpoint_path)
+    checkpoint = torch.load(checkpoint_path,
+                            map_location=torch.device('cpu'),
+                            weights_only=True)
+    os.remove(checkpoint_path)
+    resume_batches, _ = run_epochs(seed, 3, 3, checkpoint['rng_state_list'])
+    assert torch.equal(batches1[3], resume_batches[3])
+    print('resumed run replays same epoch batches')